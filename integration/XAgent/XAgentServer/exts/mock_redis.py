@@ -1,43 +1,1715 @@
 """
 Mock Redis client for development without Redis server
+
+Keys honour ``ex``/``px`` expiry: expired keys are dropped lazily when they
+are read and by a background sweep driven by a heap of expiry times. An
+optional memory cap evicts keys with an LRU or LFU policy, so the store
+can stay up as the no-Redis backend of a long-running server.
+
+The keyspace is split across shards, each with its own lock, so threads
+working on different keys rarely contend. AsyncMockRedisClient exposes
+the same operations as coroutines that never block the event loop.
+
+With a data directory the store persists itself: writes go to per-shard
+append-only logs and a background snapshot compacts them, so a restart
+reloads the previous state instead of starting cold.
+
+Besides strings a key can hold a hash, list, sorted set or stream (see
+mock_redis_types). These are updated in place, so hset, rpush, zadd or
+xadd cost O(1) or O(log n) rather than rewriting a serialized blob, and
+are logged as the operation instead of the whole value. Their fields,
+members and elements are stored as bytes, as redis-py sends them, so
+in-process and network clients see the same data.
+
+publish/pubsub and blpop/brpop deliver to listeners as soon as a message
+or element arrives (see mock_redis_pubsub), so progress can be pushed to
+a websocket instead of polled for with get_key.
+
+dump/restore copy a key between stores, and enable_slot_index keeps the
+keys of every Redis Cluster hash slot at hand for resharding (see
+mock_redis_cluster).
 """
 
-class MockRedisClient:
-    """Mock Redis client that simulates Redis operations"""
-    
+import asyncio
+import fnmatch
+import functools
+import heapq
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+try:
+    from .mock_redis_cluster import key_slot
+    from .mock_redis_persistence import (
+        AppendOnlyFile, aof_path, dump_payload, list_aof_files, load_payload, load_snapshot,
+        read_aof, write_snapshot
+    )
+    from .mock_redis_pubsub import PUBSUB_MAX_PENDING, AsyncPubSub, PubSub, PubSubHub, Waiter
+    from .mock_redis_types import (
+        COLLECTION_TYPES, MAX_STREAM_ID, RedisCollection, RedisHash, RedisList,
+        RedisSortedSet, RedisStream, format_stream_id, parse_stream_id
+    )
+except ImportError:
+    from mock_redis_cluster import key_slot
+    from mock_redis_persistence import (
+        AppendOnlyFile, aof_path, dump_payload, list_aof_files, load_payload, load_snapshot,
+        read_aof, write_snapshot
+    )
+    from mock_redis_pubsub import PUBSUB_MAX_PENDING, AsyncPubSub, PubSub, PubSubHub, Waiter
+    from mock_redis_types import (
+        COLLECTION_TYPES, MAX_STREAM_ID, RedisCollection, RedisHash, RedisList,
+        RedisSortedSet, RedisStream, format_stream_id, parse_stream_id
+    )
+
+# Rough per-key bookkeeping cost on top of the key and value themselves
+ENTRY_OVERHEAD = 64
+
+EVICTION_POLICIES = ("noeviction", "allkeys-lru", "allkeys-lfu")
+
+APPENDFSYNC_POLICIES = ("always", "everysec", "no")
+
+# SCAN buckets per shard: a power of two, doubled past SCAN_BUCKET_KEYS
+# keys per bucket and halved below one key per two buckets
+SCAN_MIN_BUCKETS = 16
+SCAN_BUCKET_KEYS = 4
+
+
+class MockRedisOOMError(MemoryError):
+    """Raised on writes over max_memory when the policy is noeviction"""
+
+
+class MockRedisWrongTypeError(TypeError):
+    """Raised when a command is used on a key holding another type"""
+
+    def __init__(self):
+        super().__init__("WRONGTYPE Operation against a key holding the wrong kind of value")
+
+
+class MockRedisBusyKeyError(ValueError):
+    """Raised by restore() on an existing key without replace"""
+
+    def __init__(self):
+        super().__init__("BUSYKEY Target key name already exists.")
+
+
+def _sizeof(key, value):
+    """Approximate memory used by one entry"""
+    if isinstance(value, RedisCollection):
+        return sys.getsizeof(key) + value.memory_usage() + ENTRY_OVERHEAD
+    return sys.getsizeof(key) + sys.getsizeof(value) + ENTRY_OVERHEAD
+
+
+def _encode(value):
+    """A field, member or element as bytes, encoded the way redis-py does"""
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode()
+    if isinstance(value, float):
+        return repr(value).encode()
+    return str(value).encode()
+
+
+def _score_bound(bound):
+    """(score, exclusive) from a ZRANGEBYSCORE bound: 1.5, "(1.5" for exclusive, "-inf" """
+    if isinstance(bound, bytes):
+        bound = bound.decode()
+    if isinstance(bound, str):
+        exclusive = bound.startswith("(")
+        try:
+            return float(bound[1:] if exclusive else bound), exclusive
+        except ValueError:
+            raise ValueError("min or max is not a float") from None
+    return float(bound), False
+
+
+def _stream_bound(bound, end):
+    """(ms, seq) from an XRANGE bound: "-", "+", "ms", "ms-seq" or "(ms-seq" """
+    if isinstance(bound, bytes):
+        bound = bound.decode()
+    if bound == "-":
+        return (0, 0)
+    if bound == "+":
+        return MAX_STREAM_ID
+    exclusive = bound.startswith("(")
+    entry_id = parse_stream_id(bound[1:] if exclusive else bound, MAX_STREAM_ID[1] if end else 0)
+    if exclusive:
+        ms, seq = entry_id
+        if end:
+            entry_id = (ms, seq - 1) if seq else (ms - 1, MAX_STREAM_ID[1])
+        else:
+            entry_id = (ms, seq + 1) if seq < MAX_STREAM_ID[1] else (ms + 1, 0)
+    return entry_id
+
+
+def _stream_entries(entries):
+    return [(format_stream_id(entry_id), _pairs_to_dict(fields)) for entry_id, fields in entries]
+
+
+def _pairs_to_dict(flat):
+    return dict(zip(flat[::2], flat[1::2]))
+
+
+class _LFUTracker:
+    """O(1) least-frequently-used bookkeeping with frequency buckets"""
+
     def __init__(self):
+        self.freq = {}
+        self.buckets = {}
+        self.min_freq = 0
+
+    def add(self, key):
+        self.freq[key] = 1
+        self.buckets.setdefault(1, OrderedDict())[key] = None
+        self.min_freq = 1
+
+    def touch(self, key):
+        f = self.freq[key]
+        bucket = self.buckets[f]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[f]
+            if self.min_freq == f:
+                self.min_freq = f + 1
+        self.freq[key] = f + 1
+        self.buckets.setdefault(f + 1, OrderedDict())[key] = None
+
+    def remove(self, key):
+        f = self.freq.pop(key, None)
+        if f is None:
+            return
+        bucket = self.buckets[f]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[f]
+            if self.min_freq == f:
+                self.min_freq = min(self.buckets) if self.buckets else 0
+
+    def victim(self):
+        if not self.buckets:
+            return None
+        if self.min_freq not in self.buckets:
+            self.min_freq = min(self.buckets)
+        return next(iter(self.buckets[self.min_freq]))
+
+    def clear(self):
+        self.freq.clear()
+        self.buckets.clear()
+        self.min_freq = 0
+
+
+class _Shard:
+    """
+    One lock-protected slice of the keyspace
+
+    Methods assume the caller holds ``lock``; MockRedisClient takes it.
+    """
+
+    def __init__(self, max_memory, eviction_policy):
+        self.lock = threading.RLock()
+        self.max_memory = max_memory
+        self.eviction_policy = eviction_policy
+
         self.data = {}
+        self.expires = {}
+        self.expiry_heap = []
+        self.sizes = {}
+        self.lru = OrderedDict()
+        self.lfu = _LFUTracker()
+
+        self.used_memory = 0
+        self.keys_evicted = 0
+        self.expired_keys = 0
+
+        # BLPOP/BRPOP callers per list key: deque of (Waiter, pop from the left)
+        self.waiters = {}
+
+        # Hash slot -> set of keys, once enable_slot_index() is called
+        self.slots = None
+
+        # SCAN bucket (_scan_hash(key) & scan_mask) -> keys
+        self.scan_mask = SCAN_MIN_BUCKETS - 1
+        self.scan_buckets = {}
+
+        # Append-only log, set while persistence is enabled
+        self.aof = None
+        self.appendfsync = "everysec"
+        self.writes = 0
+
+    def log(self, record):
+        self.writes += 1
+        if self.aof is None:
+            return
+        self.aof.append(record)
+        if self.appendfsync == "always":
+            self.aof.fsync()
+        elif self.appendfsync == "everysec":
+            self.aof.flush()
+
+    def load_section(self, data, expires, sizes):
+        """Adopt a snapshot section; only valid on an empty shard"""
+        self.data = data
+        self.expires = expires
+        self.sizes = sizes
+        self.used_memory = sum(sizes.values())
+        self.expiry_heap = [(t, k) for k, t in expires.items()]
+        heapq.heapify(self.expiry_heap)
+        if self.slots is not None:
+            self.index_slots()
+        buckets = SCAN_MIN_BUCKETS
+        while len(data) > SCAN_BUCKET_KEYS * buckets:
+            buckets *= 2
+        self.resize_scan(buckets)
+        if self.eviction_policy == "allkeys-lru":
+            self.lru = OrderedDict.fromkeys(data)
+        elif self.eviction_policy == "allkeys-lfu":
+            self.lfu.freq = dict.fromkeys(data, 1)
+            self.lfu.buckets = {1: OrderedDict.fromkeys(data)} if data else {}
+            self.lfu.min_freq = 1 if data else 0
+
+    def index_slots(self):
+        self.slots = {}
+        for key in self.data:
+            self.slots.setdefault(key_slot(key), set()).add(key)
+
+    def resize_scan(self, buckets):
+        self.scan_mask = buckets - 1
+        self.scan_buckets = {}
+        for key in self.data:
+            self.scan_buckets.setdefault(_scan_hash(key) & self.scan_mask, []).append(key)
+
+    def scan(self, cursor, count):
+        """
+        Keys of the SCAN buckets from cursor on, until at least count are
+        found, and the cursor to go on from, 0 once the shard is done
+
+        The cursor is advanced by incrementing its reversed bits, as in
+        Redis, so buckets split by a resize come right after the bucket
+        they were split from and no key present throughout is missed.
+        Like Redis, a call gives up after visiting count * 10 empty buckets.
+        """
+        keys = []
+        mask = self.scan_mask
+        empty = count * 10
+        while True:
+            bucket = self.scan_buckets.get(cursor & mask)
+            if bucket:
+                keys.extend(bucket)
+            else:
+                empty -= 1
+            cursor = _next_scan_cursor(cursor, mask)
+            if not cursor or len(keys) >= count or not empty:
+                return cursor, keys
+
+    def is_expired(self, key, now=None):
+        expires_at = self.expires.get(key)
+        return expires_at is not None and expires_at <= (now or time.time())
+
+    def remove(self, key):
+        self.log(("del", key))
+        del self.data[key]
+        bucket_index = _scan_hash(key) & self.scan_mask
+        bucket = self.scan_buckets[bucket_index]
+        bucket.remove(key)
+        if not bucket:
+            del self.scan_buckets[bucket_index]
+        if self.scan_mask >= SCAN_MIN_BUCKETS and 2 * len(self.data) < self.scan_mask + 1:
+            self.resize_scan((self.scan_mask + 1) // 2)
+        if self.slots is not None:
+            slot = key_slot(key)
+            self.slots[slot].discard(key)
+            if not self.slots[slot]:
+                del self.slots[slot]
+        self.used_memory -= self.sizes.pop(key)
+        self.expires.pop(key, None)
+        self.lru.pop(key, None)
+        self.lfu.remove(key)
+
+    def expire_if_needed(self, key):
+        if key in self.data and self.is_expired(key):
+            self.remove(key)
+            self.expired_keys += 1
+            return True
+        return False
+
+    def live(self, key):
+        """True if key exists and has not expired"""
+        return not self.expire_if_needed(key) and key in self.data
+
+    def touch(self, key):
+        if self.eviction_policy == "allkeys-lru":
+            self.lru.move_to_end(key)
+        elif self.eviction_policy == "allkeys-lfu":
+            self.lfu.touch(key)
+
+    def store(self, key, value, expires_at=None):
+        size = _sizeof(key, value)
+        existing = self.sizes.get(key, 0)
+
+        if self.max_memory and self.eviction_policy == "noeviction" \
+                and self.used_memory - existing + size > self.max_memory:
+            raise MockRedisOOMError(
+                "OOM command not allowed when used memory > 'maxmemory'"
+            )
+
+        if key in self.data:
+            self.touch(key)
+        elif self.eviction_policy == "allkeys-lru":
+            self.lru[key] = None
+        elif self.eviction_policy == "allkeys-lfu":
+            self.lfu.add(key)
+
+        self.log(("set", key, value, expires_at))
+        if key not in self.data:
+            if self.slots is not None:
+                self.slots.setdefault(key_slot(key), set()).add(key)
+            self.scan_buckets.setdefault(_scan_hash(key) & self.scan_mask, []).append(key)
+        self.data[key] = value
+        if len(self.data) > SCAN_BUCKET_KEYS * (self.scan_mask + 1):
+            self.resize_scan(2 * (self.scan_mask + 1))
+        self.sizes[key] = size
+        self.used_memory += size - existing
+
+        if expires_at is None:
+            self.expires.pop(key, None)
+        else:
+            self.track_expiry(key, expires_at)
+
+        self.evict(protect=key)
+
+    def track_expiry(self, key, expires_at):
+        self.expires[key] = expires_at
+        heapq.heappush(self.expiry_heap, (expires_at, key))
+
+    def set_expiry(self, key, expires_at):
+        self.log(("expire", key, expires_at))
+        self.track_expiry(key, expires_at)
+
+    def persist(self, key):
+        if self.expires.pop(key, None) is None:
+            return False
+        self.log(("persist", key))
+        return True
+
+    def collection(self, key, kind, create=False):
+        """
+        The collection of type kind at key
+
+        Returns None for a missing key unless create is set, in which case
+        an empty one is stored. Raises MockRedisWrongTypeError if the key
+        holds something else.
+        """
+        if not self.live(key):
+            if not create:
+                return None
+            value = kind()
+            self.store(key, value)
+            return value
+        value = self.data[key]
+        if type(value) is not kind:
+            raise MockRedisWrongTypeError()
+        self.touch(key)
+        return value
+
+    def check_memory(self):
+        """Refuse to grow a collection over max_memory under noeviction"""
+        if self.max_memory and self.eviction_policy == "noeviction" \
+                and self.used_memory > self.max_memory:
+            raise MockRedisOOMError(
+                "OOM command not allowed when used memory > 'maxmemory'"
+            )
+
+    def apply(self, key, value, method, args):
+        """Run a logged in-place update of the collection at key"""
+        try:
+            result = getattr(value, method)(*args)
+        finally:
+            if not len(value) and value.type_name != "stream":
+                # Like Redis, an emptied hash, list or sorted set is deleted
+                self.remove(key)
+                value = None
+        if value is not None:
+            self.log(("call", key, value.type_name, method, args))
+            size = _sizeof(key, value)
+            self.used_memory += size - self.sizes[key]
+            self.sizes[key] = size
+            self.evict(protect=key)
+        return result
+
+    def evict(self, protect=None):
+        """Evict keys until used_memory fits under max_memory"""
+        if not self.max_memory or self.eviction_policy == "noeviction":
+            return
+        while self.used_memory > self.max_memory and len(self.data) > 1:
+            if self.eviction_policy == "allkeys-lru":
+                victim = next(iter(self.lru))
+                if victim == protect:
+                    self.lru.move_to_end(victim)
+                    victim = next(iter(self.lru))
+            else:
+                victim = self.lfu.victim()
+                if victim == protect:
+                    # The key just written always survives its own eviction pass
+                    self.lfu.touch(victim)
+                    victim = self.lfu.victim()
+            self.remove(victim)
+            self.keys_evicted += 1
+
+    def sweep(self, now):
+        removed = 0
+        heap = self.expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            # Skip stale heap entries left by later writes or persist()
+            if self.expires.get(key) == expires_at and key in self.data:
+                self.remove(key)
+                self.expired_keys += 1
+                removed += 1
+        # Rebuild when stale entries dominate the heap
+        if len(heap) > 2 * len(self.expires) + 64:
+            self.expiry_heap = [(t, k) for k, t in self.expires.items()]
+            heapq.heapify(self.expiry_heap)
+        return removed
+
+    def clear(self):
+        self.data.clear()
+        self.expires.clear()
+        self.expiry_heap.clear()
+        self.sizes.clear()
+        self.lru.clear()
+        self.lfu.clear()
+        self.used_memory = 0
+        if self.slots is not None:
+            self.slots = {}
+        self.scan_mask = SCAN_MIN_BUCKETS - 1
+        self.scan_buckets = {}
+
+
+class MockRedisClient:
+    """Mock Redis client that simulates Redis operations"""
+
+    def __init__(
+        self,
+        max_memory=None,
+        eviction_policy=None,
+        sweep_interval=1.0,
+        shards=None,
+        data_dir=None,
+        snapshot_interval=None,
+        appendfsync="everysec"
+    ):
         print("Using Mock Redis Client (no Redis server required)")
-    
+
+        if max_memory is None:
+            max_memory = int(os.getenv("MOCK_REDIS_MAXMEMORY", "0"))
+        if eviction_policy is None:
+            eviction_policy = os.getenv("MOCK_REDIS_POLICY", "allkeys-lru")
+        if eviction_policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy: {eviction_policy}")
+        if shards is None:
+            shards = int(os.getenv("MOCK_REDIS_SHARDS", "16"))
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+
+        self.max_memory = max_memory
+        self.eviction_policy = eviction_policy
+        self.sweep_interval = sweep_interval
+
+        # Each shard gets an equal slice of the memory budget
+        shard_memory = max_memory // shards if max_memory else 0
+        self._shards = [_Shard(shard_memory, eviction_policy) for _ in range(shards)]
+        self._sweeper = None
+        self._sweeper_lock = threading.Lock()
+
+        # Optional persistence
+        if data_dir is None:
+            data_dir = os.getenv("MOCK_REDIS_DATA_DIR") or None
+        if snapshot_interval is None:
+            snapshot_interval = float(os.getenv("MOCK_REDIS_SNAPSHOT_INTERVAL", "300"))
+        if appendfsync not in APPENDFSYNC_POLICIES:
+            raise ValueError(f"Unknown appendfsync policy: {appendfsync}")
+        self.data_dir = data_dir
+        self.snapshot_interval = snapshot_interval
+        self.appendfsync = appendfsync
+        self.load_stats = {}
+        self._generation = 0
+        self._save_lock = threading.Lock()
+        self._saved_writes = 0
+        self._last_save = time.time()
+        self._closed = False
+        self._hub = PubSubHub()
+        if data_dir:
+            self._open_persistence()
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _all_locks(self):
+        """Hold every shard lock, always acquired in the same order"""
+        return _MultiLock([shard.lock for shard in self._shards])
+
+    def _locks_for(self, keys):
+        """Hold the locks of every shard that owns one of keys, in shard order"""
+        count = len(self._shards)
+        indexes = sorted({hash(key) % count for key in keys})
+        return _MultiLock([self._shards[i].lock for i in indexes])
+
+    # Persistence
+
+    def _open_persistence(self):
+        """Load the snapshot, replay the logs and start a new log generation"""
+        os.makedirs(self.data_dir, exist_ok=True)
+        started = time.perf_counter()
+
+        snapshot = load_snapshot(self.data_dir)
+        generation = 0
+        if snapshot is not None:
+            generation, same_seed, sections = snapshot
+            if same_seed and len(sections) == len(self._shards):
+                # Shard placement is unchanged: adopt each section wholesale
+                for shard, section in zip(self._shards, sections):
+                    shard.load_section(*section)
+            else:
+                for data, expires, _ in sections:
+                    for key, value in data.items():
+                        self._shard(key).store(key, value, expires.get(key))
+        loaded_at = time.perf_counter()
+
+        replayed = 0
+        latest = generation
+        for aof_generation, _, path in list_aof_files(self.data_dir):
+            latest = max(latest, aof_generation)
+            if aof_generation < generation:
+                continue
+            for record in read_aof(path):
+                self._replay(record)
+                replayed += 1
+
+        for shard in self._shards:
+            shard.writes = 0
+            shard.appendfsync = self.appendfsync
+        self._generation = latest + 1
+        self._open_aofs()
+
+        self.load_stats = {
+            "keys": sum(len(shard.data) for shard in self._shards),
+            "snapshot_seconds": loaded_at - started,
+            "replayed_records": replayed,
+            "total_seconds": time.perf_counter() - started,
+        }
+        threading.Thread(
+            target=self._persistence_loop, name="mock-redis-persistence", daemon=True
+        ).start()
+        if any(shard.expires for shard in self._shards):
+            self._ensure_sweeper()
+
+    def _replay(self, record):
+        op, key = record[0], record[1]
+        shard = self._shard(key)
+        if op == "set":
+            shard.store(key, record[2], record[3])
+        elif op == "del":
+            if key in shard.data:
+                shard.remove(key)
+        elif op == "expire":
+            if key in shard.data:
+                shard.track_expiry(key, record[2])
+        elif op == "persist":
+            shard.expires.pop(key, None)
+        elif op == "call":
+            value = shard.data.get(key)
+            if value is None:
+                value = COLLECTION_TYPES[record[2]]()
+                shard.store(key, value)
+            shard.apply(key, value, record[3], record[4])
+
+    def _open_aofs(self):
+        for index, shard in enumerate(self._shards):
+            shard.aof = AppendOnlyFile(aof_path(self.data_dir, self._generation, index))
+
+    def _rotate_aofs(self):
+        """Switch every shard to a new log generation; caller holds all locks"""
+        for shard in self._shards:
+            if shard.aof is not None:
+                shard.aof.close()
+        self._generation += 1
+        self._open_aofs()
+        return self._generation
+
+    def _drop_logs_before(self, generation):
+        for aof_generation, _, path in list_aof_files(self.data_dir):
+            if aof_generation < generation:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _persistence_loop(self):
+        while not self._closed:
+            time.sleep(1.0)
+            if self._closed:
+                break
+            if self.appendfsync == "everysec":
+                for shard in self._shards:
+                    with shard.lock:
+                        if shard.aof is not None:
+                            shard.aof.fsync()
+            due = time.time() - self._last_save >= self.snapshot_interval
+            if due and self.snapshot_interval and self._unsaved_writes():
+                self.bgsave()
+
+    def _unsaved_writes(self):
+        return sum(shard.writes for shard in self._shards) - self._saved_writes
+
+    def bgsave(self, wait=False):
+        """
+        Write a snapshot in the background and compact the logs
+
+        The shards are shallow-copied under their locks and written from a
+        thread. Forking is avoided: a child of this multithreaded process
+        could inherit a lock held by some other thread and hang. Returns
+        False if a save is already running.
+        """
+        if not self.data_dir:
+            raise RuntimeError("Persistence is not enabled (no data_dir)")
+        if not self._save_lock.acquire(blocking=False):
+            return False
+
+        try:
+            with self._all_locks():
+                generation = self._rotate_aofs()
+                writes = sum(shard.writes for shard in self._shards)
+                # Collections change in place, so they are copied too
+                sections = [
+                    (
+                        {
+                            key: value.copy() if isinstance(value, RedisCollection) else value
+                            for key, value in shard.data.items()
+                        },
+                        shard.expires.copy(),
+                        shard.sizes.copy()
+                    )
+                    for shard in self._shards
+                ]
+        except BaseException:
+            self._save_lock.release()
+            raise
+
+        def finish():
+            try:
+                write_snapshot(self.data_dir, generation, sections)
+                self._drop_logs_before(generation)
+                self._saved_writes = writes
+                self._last_save = time.time()
+            finally:
+                self._save_lock.release()
+
+        if wait:
+            finish()
+        else:
+            threading.Thread(target=finish, name="mock-redis-bgsave", daemon=True).start()
+        return True
+
+    def save(self):
+        """Write a snapshot and wait for it to finish"""
+        while not self.bgsave(wait=True):
+            time.sleep(0.01)
+        return True
+
+    def close(self):
+        """Flush and close the append-only logs"""
+        self._closed = True
+        with self._all_locks():
+            for shard in self._shards:
+                if shard.aof is not None:
+                    shard.aof.close()
+                    shard.aof = None
+
+    def _ensure_sweeper(self):
+        if self._sweeper is not None or not self.sweep_interval:
+            return
+        with self._sweeper_lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(
+                    target=self._sweep_loop, name="mock-redis-expiry", daemon=True
+                )
+                self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            self.sweep_expired()
+
+    def sweep_expired(self):
+        """Drop every key whose expiry time has passed"""
+        removed = 0
+        now = time.time()
+        for shard in self._shards:
+            with shard.lock:
+                removed += shard.sweep(now)
+        return removed
+
+    @staticmethod
+    def _expiry_time(ex=None, px=None):
+        if ex is not None:
+            return time.time() + ex
+        if px is not None:
+            return time.time() + px / 1000.0
+        return None
+
+    @property
+    def data(self):
+        """Snapshot of all stored keys and values"""
+        snapshot = {}
+        for shard in self._shards:
+            with shard.lock:
+                snapshot.update(shard.data)
+        return snapshot
+
+    @property
+    def used_memory(self):
+        return sum(shard.used_memory for shard in self._shards)
+
+    @property
+    def keys_evicted(self):
+        return sum(shard.keys_evicted for shard in self._shards)
+
+    @property
+    def expired_keys(self):
+        return sum(shard.expired_keys for shard in self._shards)
+
+    # Public API
+
     def delete_all_keys(self):
         """Mock delete all keys"""
-        self.data.clear()
-        return True
-    
-    def set_key(self, key, value, ex=None):
-        """Mock set key"""
-        self.data[key] = value
+        return self.flushdb()
+
+    def set_key(self, key, value, ex=None, px=None):
+        """Mock set key, expiring after ex seconds or px milliseconds"""
+        expires_at = self._expiry_time(ex, px)
+        shard = self._shard(key)
+        with shard.lock:
+            shard.store(key, value, expires_at)
+        if expires_at is not None:
+            self._ensure_sweeper()
         return True
-    
+
     def get_key(self, key):
         """Mock get key"""
-        return self.data.get(key)
-    
+        shard = self._shard(key)
+        with shard.lock:
+            if not shard.live(key):
+                return None
+            value = shard.data[key]
+            if isinstance(value, RedisCollection):
+                raise MockRedisWrongTypeError()
+            shard.touch(key)
+            return value
+
     def delete_key(self, key):
         """Mock delete key"""
-        if key in self.data:
-            del self.data[key]
+        shard = self._shard(key)
+        with shard.lock:
+            if not shard.live(key):
+                return False
+            shard.remove(key)
             return True
-        return False
-    
+
     def exists(self, key):
         """Mock exists"""
-        return key in self.data
-    
+        shard = self._shard(key)
+        with shard.lock:
+            return shard.live(key)
+
+    def expire(self, key, seconds):
+        """Set a key's time to live in seconds"""
+        shard = self._shard(key)
+        with shard.lock:
+            if not shard.live(key):
+                return False
+            shard.set_expiry(key, time.time() + seconds)
+        self._ensure_sweeper()
+        return True
+
+    def persist(self, key):
+        """Remove a key's expiry"""
+        shard = self._shard(key)
+        with shard.lock:
+            if not shard.live(key):
+                return False
+            return shard.persist(key)
+
+    def pttl(self, key):
+        """Remaining time to live in milliseconds, -1 without expiry, -2 if missing"""
+        shard = self._shard(key)
+        with shard.lock:
+            if not shard.live(key):
+                return -2
+            expires_at = shard.expires.get(key)
+            if expires_at is None:
+                return -1
+            return max(0, int((expires_at - time.time()) * 1000))
+
+    def ttl(self, key):
+        """Remaining time to live in seconds, -1 without expiry, -2 if missing"""
+        remaining = self.pttl(key)
+        return remaining if remaining < 0 else (remaining + 500) // 1000
+
+    def dbsize(self):
+        """Number of keys, not counting ones that have already expired"""
+        now = time.time()
+        total = 0
+        for shard in self._shards:
+            with shard.lock:
+                total += sum(1 for key in shard.data if not shard.is_expired(key, now))
+        return total
+
     def flushdb(self):
         """Mock flushdb"""
-        self.data.clear()
+        with self._all_locks():
+            for shard in self._shards:
+                shard.clear()
+            if self.data_dir and not self._closed:
+                # Start over with an empty snapshot instead of logging deletes
+                generation = self._rotate_aofs()
+                write_snapshot(self.data_dir, generation, [({}, {}, {}) for _ in self._shards])
+                self._drop_logs_before(generation)
         return True
 
+    def mget(self, keys):
+        """Get several keys at once; missing and non-string keys come back as None"""
+        keys = list(keys)
+        values = []
+        with self._locks_for(keys):
+            for key in keys:
+                try:
+                    values.append(self.get_key(key))
+                except MockRedisWrongTypeError:
+                    values.append(None)
+        return values
+
+    def mset(self, mapping, ex=None, px=None):
+        """Set several keys atomically"""
+        with self._locks_for(mapping):
+            for key, value in mapping.items():
+                self.set_key(key, value, ex=ex, px=px)
+        return True
+
+    def delete_many(self, *keys):
+        """Delete several keys and return how many existed"""
+        if len(keys) == 1 and isinstance(keys[0], (list, tuple, set)):
+            keys = tuple(keys[0])
+        with self._locks_for(keys):
+            return sum(1 for key in keys if self.delete_key(key))
+
+    def pipeline(self, transaction=True):
+        """Batch commands and run them atomically in one pass"""
+        return Pipeline(self)
+
+    def scan(self, cursor=0, match=None, count=10):
+        """
+        Incrementally walk the keyspace, returning (next_cursor, keys)
+
+        The cursor encodes a shard and a position among its SCAN buckets
+        (see _Shard.scan), so it stays valid when keys are added or
+        deleted and each call costs about count keys. As with Redis, keys
+        present for the whole scan are returned at least once, keys added
+        or removed meanwhile may or may not be, and cursor 0 ends it.
+        """
+        shard_index, position = divmod(cursor, 1 << 32)
+        keys = []
+        found = 0
+        while shard_index < len(self._shards) and found < count:
+            shard = self._shards[shard_index]
+            with shard.lock:
+                now = time.time()
+                position, batch = shard.scan(position, count - found)
+                keys.extend(
+                    key for key in batch
+                    if not shard.is_expired(key, now) and _matches(key, match)
+                )
+            found += len(batch)
+            if position:
+                break
+            shard_index += 1
+
+        if shard_index >= len(self._shards):
+            return 0, keys
+        return shard_index * (1 << 32) + position, keys
+
+    def scan_iter(self, match=None, count=10):
+        """
+        Yield matching keys batch by batch
+
+        Each shard is walked from a snapshot of its own key list, so at
+        most one shard's keys are copied at a time and no lock is held
+        between batches.
+        """
+        for shard in self._shards:
+            with shard.lock:
+                snapshot = list(shard.data)
+            for start in range(0, len(snapshot), count):
+                batch = snapshot[start:start + count]
+                with shard.lock:
+                    now = time.time()
+                    live = [
+                        key for key in batch
+                        if key in shard.data and not shard.is_expired(key, now)
+                    ]
+                for key in live:
+                    if _matches(key, match):
+                        yield key
+
+    # Hashes, lists, sorted sets and streams
+
+    def _read(self, key, kind, method, *args, default=None):
+        shard = self._shard(key)
+        with shard.lock:
+            value = shard.collection(key, kind)
+            if value is None:
+                return default
+            return getattr(value, method)(*args)
+
+    def _update(self, key, kind, method, *args, create=True, default=None):
+        shard = self._shard(key)
+        with shard.lock:
+            if create:
+                shard.check_memory()
+            value = shard.collection(key, kind, create=create)
+            if value is None:
+                return default
+            return shard.apply(key, value, method, args)
+
+    def type(self, key):
+        """Type of the value at key: string, hash, list, zset, stream or none"""
+        shard = self._shard(key)
+        with shard.lock:
+            if not shard.live(key):
+                return "none"
+            return getattr(shard.data[key], "type_name", "string")
+
+    def object_encoding(self, key):
+        """Encoding of the value at key, like OBJECT ENCODING; None if missing"""
+        shard = self._shard(key)
+        with shard.lock:
+            if not shard.live(key):
+                return None
+            value = shard.data[key]
+            if isinstance(value, RedisCollection):
+                return value.encoding
+            return "int" if isinstance(value, int) else "raw"
+
+    def memory_usage(self, key):
+        """Bytes accounted to key, like MEMORY USAGE; None if missing"""
+        shard = self._shard(key)
+        with shard.lock:
+            if not shard.live(key):
+                return None
+            return shard.sizes[key]
+
+    def dump(self, key):
+        """The key's value serialized for restore(), without its TTL; None if missing"""
+        shard = self._shard(key)
+        with shard.lock:
+            if not shard.live(key):
+                return None
+            value = shard.data[key]
+            if isinstance(value, RedisCollection):
+                return dump_payload((value.type_name, value.__getstate__()))
+            return dump_payload((None, value))
+
+    def restore(self, key, ttl, payload, replace=False):
+        """
+        Create key from a dump() payload, expiring after ttl milliseconds (0 for never)
+
+        Raises MockRedisBusyKeyError if key exists and replace is not set,
+        ValueError if the payload is damaged.
+        """
+        type_name, state = load_payload(payload)
+        if type_name is None:
+            value = state
+        elif type_name in COLLECTION_TYPES:
+            value = COLLECTION_TYPES[type_name]()
+            value.__setstate__(state)
+        else:
+            raise ValueError("Bad data format")
+        expires_at = time.time() + ttl / 1000 if ttl else None
+        shard = self._shard(key)
+        with shard.lock:
+            if shard.live(key) and not replace:
+                raise MockRedisBusyKeyError()
+            shard.store(key, value, expires_at)
+        if expires_at is not None:
+            self._ensure_sweeper()
+        return True
+
+    # Hash slots, for cluster mode
+
+    def enable_slot_index(self):
+        """Track which keys hash to each Redis Cluster slot from now on"""
+        with self._all_locks():
+            for shard in self._shards:
+                if shard.slots is None:
+                    shard.index_slots()
+
+    def keys_in_slot(self, slot, count):
+        """Up to count live keys hashing to slot; needs enable_slot_index()"""
+        keys = []
+        for shard in self._shards:
+            with shard.lock:
+                for key in list(shard.slots.get(slot, ())):
+                    if len(keys) == count:
+                        return keys
+                    if shard.live(key):
+                        keys.append(key)
+        return keys
+
+    def count_keys_in_slot(self, slot):
+        now = time.time()
+        total = 0
+        for shard in self._shards:
+            with shard.lock:
+                total += sum(
+                    1 for key in shard.slots.get(slot, ()) if not shard.is_expired(key, now)
+                )
+        return total
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        """Set hash fields; returns how many were added"""
+        mapping = {_encode(f): _encode(v) for f, v in (mapping or {}).items()}
+        if field is not None:
+            mapping[_encode(field)] = _encode(value)
+        return self._update(key, RedisHash, "set", mapping)
+
+    def hsetnx(self, key, field, value):
+        return self._update(key, RedisHash, "setnx", _encode(field), _encode(value))
+
+    def hget(self, key, field):
+        return self._read(key, RedisHash, "get", _encode(field))
+
+    def hmget(self, key, fields):
+        fields = [_encode(field) for field in fields]
+        shard = self._shard(key)
+        with shard.lock:
+            value = shard.collection(key, RedisHash)
+            return [value.get(field) if value is not None else None for field in fields]
+
+    def hgetall(self, key):
+        return dict(self._read(key, RedisHash, "items", default=()))
+
+    def hdel(self, key, *fields):
+        fields = [_encode(field) for field in fields]
+        return self._update(key, RedisHash, "delete", *fields, create=False, default=0)
+
+    def hlen(self, key):
+        return self._read(key, RedisHash, "__len__", default=0)
+
+    def hexists(self, key, field):
+        return self.hget(key, field) is not None
+
+    def hkeys(self, key):
+        return self._read(key, RedisHash, "keys", default=[])
+
+    def hvals(self, key):
+        return self._read(key, RedisHash, "values", default=[])
+
+    def hincrby(self, key, field, amount=1):
+        return self._update(key, RedisHash, "incrby", _encode(field), int(amount))
+
+    def _push(self, key, method, values):
+        shard = self._shard(key)
+        with shard.lock:
+            length = self._update(key, RedisList, method, *map(_encode, values))
+            if key in shard.waiters:
+                self._serve_blocked(shard, key)
+        return length
+
+    def lpush(self, key, *values):
+        """Push values onto the head of a list; returns its length"""
+        return self._push(key, "lpush", values)
+
+    def rpush(self, key, *values):
+        """Push values onto the tail of a list; returns its length"""
+        return self._push(key, "rpush", values)
+
+    def _serve_blocked(self, shard, key):
+        """Hand elements of a list just pushed to to its blocked callers, oldest first"""
+        waiters = shard.waiters[key]
+        while waiters:
+            value = shard.collection(key, RedisList)
+            if value is None:
+                break
+            waiter, left = waiters.popleft()
+            if waiter.claim():
+                popped = shard.apply(key, value, "lpop" if left else "rpop", (None,))
+                waiter.deliver((key, popped))
+        if not waiters:
+            del shard.waiters[key]
+
+    def _pop_or_wait(self, keys, left, waiter=None):
+        """
+        Pop from the first non-empty list of keys; (key, value) or None
+
+        With a waiter, each empty key registers it under the same lock, so
+        a push between the check and the registration cannot be missed.
+        """
+        for key in keys:
+            shard = self._shard(key)
+            with shard.lock:
+                if waiter is not None and waiter.done:
+                    return None
+                value = shard.collection(key, RedisList)
+                if value is not None and (waiter is None or waiter.claim()):
+                    popped = shard.apply(key, value, "lpop" if left else "rpop", (None,))
+                    if waiter is not None:
+                        waiter.deliver((key, popped))
+                    return key, popped
+                if waiter is not None:
+                    shard.waiters.setdefault(key, deque()).append((waiter, left))
+        return None
+
+    def _forget_waiter(self, keys, waiter):
+        for key in keys:
+            shard = self._shard(key)
+            with shard.lock:
+                waiters = shard.waiters.get(key)
+                if waiters is None:
+                    continue
+                kept = deque(entry for entry in waiters if entry[0] is not waiter)
+                if kept:
+                    shard.waiters[key] = kept
+                else:
+                    del shard.waiters[key]
+
+    def _blocking_pop(self, keys, timeout, left):
+        keys = [keys] if isinstance(keys, (str, bytes)) else list(keys)
+        waiter = Waiter()
+        try:
+            popped = self._pop_or_wait(keys, left, waiter)
+            if popped is not None:
+                return popped
+            # Also collects an element handed over while registering
+            return waiter.wait(timeout or None)
+        finally:
+            self._forget_waiter(keys, waiter)
+
+    def blpop(self, keys, timeout=0):
+        """
+        Pop the head of the first non-empty list of keys as (key, value),
+        waiting up to timeout seconds (0 for ever) for a push; None on timeout
+        """
+        return self._blocking_pop(keys, timeout, left=True)
+
+    def brpop(self, keys, timeout=0):
+        """blpop popping from the tail"""
+        return self._blocking_pop(keys, timeout, left=False)
+
+    def lpop(self, key, count=None):
+        return self._update(key, RedisList, "lpop", count, create=False)
+
+    def rpop(self, key, count=None):
+        return self._update(key, RedisList, "rpop", count, create=False)
+
+    def llen(self, key):
+        return self._read(key, RedisList, "__len__", default=0)
+
+    def lrange(self, key, start, end):
+        return self._read(key, RedisList, "range", start, end, default=[])
+
+    def lindex(self, key, index):
+        return self._read(key, RedisList, "index", index)
+
+    def lset(self, key, index, value):
+        shard = self._shard(key)
+        with shard.lock:
+            if shard.collection(key, RedisList) is None:
+                raise IndexError("no such key")
+            self._update(key, RedisList, "set", index, _encode(value))
+        return True
+
+    def lrem(self, key, count, value):
+        return self._update(key, RedisList, "remove", count, _encode(value), create=False, default=0)
+
+    def ltrim(self, key, start, end):
+        self._update(key, RedisList, "trim", start, end, create=False)
+        return True
+
+    def zadd(self, key, mapping, nx=False, xx=False, gt=False, lt=False, ch=False):
+        """Add members with scores; returns how many were added (or changed with ch)"""
+        if nx and (xx or gt or lt):
+            raise ValueError("GT, LT, and/or NX options at the same time are not compatible")
+        mapping = {_encode(member): float(score) for member, score in mapping.items()}
+        return self._update(
+            key, RedisSortedSet, "add", mapping, nx, xx, gt, lt, ch, create=not xx, default=0
+        )
+
+    def zincrby(self, key, amount, member):
+        return self._update(key, RedisSortedSet, "incrby", _encode(member), float(amount))
+
+    def zscore(self, key, member):
+        return self._read(key, RedisSortedSet, "score", _encode(member))
+
+    def zrem(self, key, *members):
+        members = [_encode(member) for member in members]
+        return self._update(key, RedisSortedSet, "remove", *members, create=False, default=0)
+
+    def zcard(self, key):
+        return self._read(key, RedisSortedSet, "__len__", default=0)
+
+    def zrank(self, key, member):
+        return self._read(key, RedisSortedSet, "rank", _encode(member))
+
+    def zrevrank(self, key, member):
+        return self._read(key, RedisSortedSet, "rank", _encode(member), True)
+
+    def zrange(self, key, start, end, desc=False, withscores=False):
+        """Members by rank, inclusive; (member, score) pairs with withscores"""
+        pairs = self._read(key, RedisSortedSet, "range", start, end, desc, default=[])
+        return pairs if withscores else [member for member, _ in pairs]
+
+    def zrangebyscore(self, key, min, max, start=None, num=None, withscores=False, desc=False):
+        """Members with min <= score <= max; a bound like "(1.5" is exclusive"""
+        low, low_exclusive = _score_bound(max if desc else min)
+        high, high_exclusive = _score_bound(min if desc else max)
+        pairs = self._read(
+            key, RedisSortedSet, "range_by_score", low, high, low_exclusive, high_exclusive,
+            desc, start or 0, num, default=[]
+        )
+        return pairs if withscores else [member for member, _ in pairs]
+
+    def zrevrangebyscore(self, key, max, min, start=None, num=None, withscores=False):
+        return self.zrangebyscore(key, max, min, start, num, withscores, desc=True)
+
+    def zcount(self, key, min, max):
+        low, low_exclusive = _score_bound(min)
+        high, high_exclusive = _score_bound(max)
+        return self._read(
+            key, RedisSortedSet, "count", low, high, low_exclusive, high_exclusive, default=0
+        )
+
+    def zpopmin(self, key, count=1):
+        return self._update(key, RedisSortedSet, "pop", count, False, create=False, default=[])
+
+    def zpopmax(self, key, count=1):
+        return self._update(key, RedisSortedSet, "pop", count, True, create=False, default=[])
+
+    def xadd(self, key, fields, id="*", maxlen=None):
+        """Append an entry to a stream, trimming it to maxlen; returns the new ID"""
+        flat = tuple(_encode(item) for pair in dict(fields).items() for item in pair)
+        shard = self._shard(key)
+        with shard.lock:
+            shard.check_memory()
+            stream = shard.collection(key, RedisStream)
+            # The ID is checked before an empty stream is created for it
+            entry_id = (stream or RedisStream()).next_id(id, int(time.time() * 1000))
+            if stream is None:
+                stream = shard.collection(key, RedisStream, create=True)
+            shard.apply(key, stream, "add", (entry_id, flat))
+            if maxlen is not None:
+                shard.apply(key, stream, "trim", (maxlen,))
+        return format_stream_id(entry_id)
+
+    def xlen(self, key):
+        return self._read(key, RedisStream, "__len__", default=0)
+
+    def xrange(self, key, min="-", max="+", count=None):
+        """Entries with min <= ID <= max, oldest first, as (id, fields) pairs"""
+        entries = self._read(
+            key, RedisStream, "range", _stream_bound(min, False), _stream_bound(max, True), count,
+            default=[]
+        )
+        return _stream_entries(entries)
+
+    def xrevrange(self, key, max="+", min="-", count=None):
+        entries = self._read(
+            key, RedisStream, "range", _stream_bound(min, False), _stream_bound(max, True), count,
+            True, default=[]
+        )
+        return _stream_entries(entries)
+
+    def xdel(self, key, *ids):
+        entry_ids = [parse_stream_id(entry_id) for entry_id in ids]
+        return self._update(key, RedisStream, "delete", *entry_ids, create=False, default=0)
+
+    def xtrim(self, key, maxlen):
+        return self._update(key, RedisStream, "trim", maxlen, create=False, default=0)
+
+    def xread(self, streams, count=None):
+        """
+        Entries newer than the given ID of each stream, as
+        [[key, [(id, fields), ...]], ...]; "$" means only new entries, so
+        without blocking it reads nothing
+        """
+        result = []
+        for key, last_id in streams.items():
+            if last_id in ("$", b"$"):
+                continue
+            entries = self._read(key, RedisStream, "after", parse_stream_id(last_id), count)
+            if entries:
+                result.append([key, _stream_entries(entries)])
+        return result
+
+    # Publish/subscribe
+
+    def publish(self, channel, message):
+        """
+        Send message to the channel's subscribers; returns how many got it
+
+        Waits while a subscriber with the "block" overflow policy is full.
+        """
+        return self._hub.publish(channel, message)
+
+    def pubsub(self, max_pending=PUBSUB_MAX_PENDING, overflow="block"):
+        """A new subscriber; see mock_redis_pubsub for the overflow policies"""
+        return PubSub(self._hub, max_pending, overflow)
+
+    def pubsub_channels(self, pattern=None):
+        return self._hub.channels(pattern)
+
+    def pubsub_numsub(self, *channels):
+        return self._hub.numsub(*channels)
+
+    def pubsub_numpat(self):
+        return self._hub.numpat()
+
+    def info(self):
+        """Memory and keyspace statistics, like Redis INFO"""
+        with self._all_locks():
+            return {
+                "used_memory": self.used_memory,
+                "maxmemory": self.max_memory,
+                "maxmemory_policy": self.eviction_policy,
+                "keys": sum(len(shard.data) for shard in self._shards),
+                "expires": sum(len(shard.expires) for shard in self._shards),
+                "keys_evicted": self.keys_evicted,
+                "expired_keys": self.expired_keys,
+                "shards": len(self._shards),
+            }
+
+
+def _scan_hash(key):
+    """32-bit hash choosing a key's SCAN bucket; stable for the life of the process"""
+    return hash(key) & 0xFFFFFFFF
+
+
+def _reverse_bits(value):
+    return int(f"{value:032b}"[::-1], 2)
+
+
+def _next_scan_cursor(cursor, mask):
+    """Next bucket after cursor in reverse binary order; 0 after the last"""
+    cursor |= ~mask & 0xFFFFFFFF
+    return _reverse_bits((_reverse_bits(cursor) + 1) & 0xFFFFFFFF)
+
+
+def _matches(key, pattern):
+    """Redis-style glob match for str or bytes keys"""
+    if pattern is None:
+        return True
+    if isinstance(key, bytes):
+        key = key.decode(errors="replace")
+    if isinstance(pattern, bytes):
+        pattern = pattern.decode(errors="replace")
+    return fnmatch.fnmatchcase(key, pattern)
+
+
+class Pipeline:
+    """
+    Queue of commands executed atomically with MockRedisClient.execute
+
+    Commands return the pipeline so they can be chained. execute() takes
+    the locks of every shard the queued commands touch, in shard order,
+    runs them all and returns their results in order.
+    """
+
+    # Commands that act on the whole keyspace instead of named keys
+    GLOBAL_COMMANDS = ("flushdb", "delete_all_keys", "dbsize", "info")
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.reset()
+        return False
+
+    def __len__(self):
+        return len(self.commands)
+
+    def _queue(self, method, keys, *args, **kwargs):
+        self.commands.append((method, keys, args, kwargs))
+        return self
+
+    def set_key(self, key, value, ex=None, px=None):
+        return self._queue("set_key", [key], key, value, ex=ex, px=px)
+
+    def get_key(self, key):
+        return self._queue("get_key", [key], key)
+
+    def delete_key(self, key):
+        return self._queue("delete_key", [key], key)
+
+    def exists(self, key):
+        return self._queue("exists", [key], key)
+
+    def expire(self, key, seconds):
+        return self._queue("expire", [key], key, seconds)
+
+    def persist(self, key):
+        return self._queue("persist", [key], key)
+
+    def ttl(self, key):
+        return self._queue("ttl", [key], key)
+
+    def pttl(self, key):
+        return self._queue("pttl", [key], key)
+
+    def mget(self, keys):
+        keys = list(keys)
+        return self._queue("mget", keys, keys)
+
+    def mset(self, mapping, ex=None, px=None):
+        return self._queue("mset", list(mapping), dict(mapping), ex=ex, px=px)
+
+    def delete_many(self, *keys):
+        return self._queue("delete_many", list(keys), *keys)
+
+    def dbsize(self):
+        return self._queue("dbsize", None)
+
+    def flushdb(self):
+        return self._queue("flushdb", None)
+
+    def reset(self):
+        self.commands = []
+
+    def execute(self, raise_on_error=True):
+        """Run every queued command atomically and return their results"""
+        commands, self.commands = self.commands, []
+        if not commands:
+            return []
+
+        if any(keys is None for _, keys, _, _ in commands):
+            locks = self.client._all_locks()
+        else:
+            locks = self.client._locks_for(
+                [key for _, keys, _, _ in commands for key in keys]
+            )
+
+        results = []
+        with locks:
+            for method, _, args, kwargs in commands:
+                try:
+                    results.append(getattr(self.client, method)(*args, **kwargs))
+                except Exception as e:
+                    results.append(e)
+
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+
+class _MultiLock:
+    """Context manager acquiring several locks in order"""
+
+    def __init__(self, locks):
+        self.locks = locks
+
+    def __enter__(self):
+        for lock in self.locks:
+            lock.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        for lock in reversed(self.locks):
+            lock.release()
+        return False
+
+
+class AsyncMockRedisClient:
+    """
+    Awaitable front-end for MockRedisClient
+
+    Single-key operations run inline when their shard lock is free, which
+    is the common case, and fall back to a thread when another thread holds
+    it, so the event loop never waits on a lock. Whole-keyspace operations
+    always run in a thread, and so does everything when the append-only log
+    is fsynced on every write (appendfsync="always"), since the loop would
+    otherwise wait on the disk.
+    """
+
+    def __init__(self, client=None, executor=None, **kwargs):
+        self.client = client or MockRedisClient(**kwargs)
+        self.executor = executor
+
+    def _syncs_writes(self):
+        return bool(self.client.data_dir) and self.client.appendfsync == "always"
+
+    async def _call(self, key, method, *args, **kwargs):
+        fn = getattr(self.client, method)
+        if key is not None and not self._syncs_writes():
+            lock = self.client._shard(key).lock
+            if lock.acquire(blocking=False):
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    lock.release()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def set_key(self, key, value, ex=None, px=None):
+        return await self._call(key, "set_key", key, value, ex=ex, px=px)
+
+    async def get_key(self, key):
+        return await self._call(key, "get_key", key)
+
+    async def delete_key(self, key):
+        return await self._call(key, "delete_key", key)
+
+    async def exists(self, key):
+        return await self._call(key, "exists", key)
+
+    async def expire(self, key, seconds):
+        return await self._call(key, "expire", key, seconds)
+
+    async def persist(self, key):
+        return await self._call(key, "persist", key)
+
+    async def ttl(self, key):
+        return await self._call(key, "ttl", key)
+
+    async def pttl(self, key):
+        return await self._call(key, "pttl", key)
+
+    async def dbsize(self):
+        return await self._call(None, "dbsize")
+
+    async def flushdb(self):
+        return await self._call(None, "flushdb")
+
+    async def delete_all_keys(self):
+        return await self._call(None, "delete_all_keys")
+
+    async def info(self):
+        return await self._call(None, "info")
+
+    async def mget(self, keys):
+        return await self._call(None, "mget", list(keys))
+
+    async def mset(self, mapping, ex=None, px=None):
+        return await self._call(None, "mset", dict(mapping), ex=ex, px=px)
+
+    async def delete_many(self, *keys):
+        return await self._call(None, "delete_many", *keys)
+
+    def pipeline(self, transaction=True):
+        """Pipeline whose execute() is awaitable"""
+        return AsyncPipeline(self)
+
+    async def scan_iter(self, match=None, count=10):
+        cursor = 0
+        while True:
+            cursor, keys = await self._call(None, "scan", cursor, match=match, count=count)
+            for key in keys:
+                yield key
+            if cursor == 0:
+                break
+
+    async def publish(self, channel, message):
+        """publish() that waits for full "block" subscribers without blocking the loop"""
+        return await self.client._hub.apublish(channel, message)
+
+    def pubsub(self, max_pending=PUBSUB_MAX_PENDING, overflow="block"):
+        """A subscriber whose get_message and listen are awaitable"""
+        return AsyncPubSub(self.client._hub, max_pending, overflow)
+
+    async def _blocking_pop(self, keys, timeout, left):
+        client = self.client
+        keys = [keys] if isinstance(keys, (str, bytes)) else list(keys)
+        waiter = Waiter(asyncio.get_running_loop())
+        try:
+            # Registering is short, so it can run inline like a single-key command
+            popped = await self._call(
+                keys[0] if len(keys) == 1 else None, "_pop_or_wait", keys, left, waiter
+            )
+            if popped is not None:
+                return popped
+            return await waiter.wait_async(timeout or None)
+        except asyncio.CancelledError:
+            if not waiter.claim():
+                # Handed an element after all: put it back where it came from
+                key, value = await waiter.wait_async()
+                (client.lpush if left else client.rpush)(key, value)
+            raise
+        finally:
+            client._forget_waiter(keys, waiter)
+
+    async def blpop(self, keys, timeout=0):
+        return await self._blocking_pop(keys, timeout, left=True)
+
+    async def brpop(self, keys, timeout=0):
+        return await self._blocking_pop(keys, timeout, left=False)
+
+
+class AsyncPipeline(Pipeline):
+    """Pipeline for AsyncMockRedisClient; execute() runs in a thread"""
+
+    def __init__(self, async_client):
+        super().__init__(async_client.client)
+        self.async_client = async_client
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.reset()
+        return False
+
+    async def execute(self, raise_on_error=True):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.async_client.executor,
+            functools.partial(Pipeline.execute, self, raise_on_error)
+        )
+
+
+# The collection commands all take their key first, so their Pipeline and
+# AsyncMockRedisClient versions are generated
+COLLECTION_COMMANDS = (
+    "type", "object_encoding", "memory_usage",
+    "hset", "hsetnx", "hget", "hmget", "hgetall", "hdel", "hlen", "hexists", "hkeys", "hvals",
+    "hincrby",
+    "lpush", "rpush", "lpop", "rpop", "llen", "lrange", "lindex", "lset", "lrem", "ltrim",
+    "zadd", "zincrby", "zscore", "zrem", "zcard", "zrank", "zrevrank", "zrange",
+    "zrangebyscore", "zrevrangebyscore", "zcount", "zpopmin", "zpopmax",
+    "xadd", "xlen", "xrange", "xrevrange", "xdel", "xtrim",
+)
+
+
+def _pipeline_command(name):
+    def queue(self, key, *args, **kwargs):
+        return self._queue(name, [key], key, *args, **kwargs)
+    queue.__name__ = name
+    return queue
+
+
+def _async_command(name):
+    async def call(self, key, *args, **kwargs):
+        return await self._call(key, name, key, *args, **kwargs)
+    call.__name__ = name
+    return call
+
+
+for _name in COLLECTION_COMMANDS:
+    setattr(Pipeline, _name, _pipeline_command(_name))
+    setattr(AsyncMockRedisClient, _name, _async_command(_name))
+
 # Create global instance
 mock_redis = MockRedisClient()
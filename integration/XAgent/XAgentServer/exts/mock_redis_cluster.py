@@ -0,0 +1,501 @@
+"""
+Redis Cluster mode for the mock Redis store
+
+The keyspace is split into 16384 hash slots as in Redis Cluster: a key's
+slot is the CRC16 of the key, or of its {hashtag} when it has one, so
+keys sharing a tag stay together and multi-key commands work on them.
+Every slot is served by one mock_redis_server process started with
+--cluster. A node answers requests for slots it does not serve with
+MOVED, and with ASK while the slot is being migrated, so stock
+redis.cluster.RedisCluster clients find the right node themselves and
+batch multi-key calls into one pipeline per node (mget_nonatomic,
+mset_nonatomic, pipelines).
+
+LocalCluster starts N node processes on this host and spreads the slots
+evenly over them. reshard() and rebalance() move slots while the nodes
+keep serving, the way redis-cli --cluster reshard does: the target
+imports the slot, the source migrates it, its keys are MIGRATEd in
+batches and the new owner is announced to every node. ClusterClient
+offers MockRedisClient's key/value calls on top of a RedisCluster.
+
+Slot ownership is not persisted: nodes given a data directory keep their
+keys, and LocalCluster assigns the slots again when it starts.
+"""
+
+import argparse
+import binascii
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+HASH_SLOTS = 16384
+
+# Keys moved per MIGRATE while resharding
+MIGRATE_BATCH = 100
+
+
+def key_slot(key):
+    """Hash slot of a str or bytes key, honouring {hashtags}"""
+    if isinstance(key, str):
+        key = key.encode("utf-8", "surrogateescape")
+    start = key.find(b"{")
+    if start != -1:
+        end = key.find(b"}", start + 1)
+        # An empty tag, as in "{}key", hashes the whole key
+        if end > start + 1:
+            key = key[start + 1:end]
+    # CRC16/XMODEM, the checksum Redis Cluster uses
+    return binascii.crc_hqx(key, 0) % HASH_SLOTS
+
+
+def even_slots(count):
+    """(first, last) slot range of each of count nodes sharing the slots evenly"""
+    return [
+        (HASH_SLOTS * i // count, HASH_SLOTS * (i + 1) // count - 1) for i in range(count)
+    ]
+
+
+class ClusterState:
+    """
+    One node's view of the cluster: the nodes it knows and who serves each slot
+
+    There is no cluster bus: whoever changes the configuration (LocalCluster,
+    reshard) sends the change to every node.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, node_id=None):
+        self.myid = node_id or os.urandom(20).hex()
+        self.nodes = {self.myid: (host, port)}
+        self.owners = [None] * HASH_SLOTS
+        # slot -> node id, while the slot moves to or from that node
+        self.migrating = {}
+        self.importing = {}
+
+    @property
+    def address(self):
+        return self.nodes[self.myid]
+
+    def set_address(self, host, port):
+        self.nodes[self.myid] = (host, port)
+
+    def add_node(self, node_id, host, port):
+        self.nodes[node_id] = (host, port)
+
+    def assign(self, slot, node_id):
+        self.owners[slot] = node_id
+        self.migrating.pop(slot, None)
+        self.importing.pop(slot, None)
+
+    def slots_of(self, node_id):
+        return [slot for slot, owner in enumerate(self.owners) if owner == node_id]
+
+    def ranges(self):
+        """(first, last, node id) for every run of slots served by one node"""
+        runs = []
+        for slot, owner in enumerate(self.owners):
+            if owner is None:
+                continue
+            if runs and runs[-1][2] == owner and runs[-1][1] == slot - 1:
+                runs[-1][1] = slot
+            else:
+                runs.append([slot, slot, owner])
+        return [tuple(run) for run in runs]
+
+    def _redirect(self, kind, slot, node_id):
+        host, port = self.nodes[node_id]
+        return f"{kind} {slot} {host}:{port}"
+
+    def route(self, slot, keys, asking, exists):
+        """
+        None if this node should run a request on keys of slot, otherwise
+        the error redirecting the client: MOVED to the slot's owner, ASK to
+        the node it is migrating to for keys already moved, TRYAGAIN when
+        only some of several keys have moved
+        """
+        owner = self.owners[slot]
+        if owner == self.myid:
+            target = self.migrating.get(slot)
+            if target is None:
+                return None
+            present = sum(1 for key in keys if exists(key))
+            if present == len(keys):
+                return None
+            if present:
+                return "TRYAGAIN Multiple keys request during rehashing of slot"
+            return self._redirect("ASK", slot, target)
+        if asking and slot in self.importing:
+            return None
+        if owner is None:
+            return "CLUSTERDOWN Hash slot not served"
+        return self._redirect("MOVED", slot, owner)
+
+    def info(self):
+        assigned = sum(1 for owner in self.owners if owner is not None)
+        return {
+            "cluster_enabled": 1,
+            "cluster_state": "ok" if assigned == HASH_SLOTS else "fail",
+            "cluster_slots_assigned": assigned,
+            "cluster_slots_ok": assigned,
+            "cluster_slots_pfail": 0,
+            "cluster_slots_fail": 0,
+            "cluster_known_nodes": len(self.nodes),
+            "cluster_size": len({owner for owner in self.owners if owner is not None}),
+        }
+
+    def nodes_lines(self):
+        """CLUSTER NODES: one line per known node"""
+        slots = {node_id: [] for node_id in self.nodes}
+        for first, last, owner in self.ranges():
+            slots[owner].append(str(first) if first == last else f"{first}-{last}")
+        for slot, target in self.migrating.items():
+            slots[self.myid].append(f"[{slot}->-{target}]")
+        for slot, source in self.importing.items():
+            slots[self.myid].append(f"[{slot}-<-{source}]")
+        lines = []
+        for node_id, (host, port) in self.nodes.items():
+            flags = "myself,master" if node_id == self.myid else "master"
+            fields = [node_id, f"{host}:{port}@{port + 10000}", flags, "-", "0", "0", "0",
+                      "connected", *slots[node_id]]
+            lines.append(" ".join(fields))
+        return lines
+
+
+def parse_nodes(text):
+    """{node id: ((host, port), slots, is myself)} from CLUSTER NODES output"""
+    if isinstance(text, bytes):
+        text = text.decode()
+    nodes = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        host, _, port = fields[1].split("@")[0].rpartition(":")
+        slots = []
+        for field in fields[8:]:
+            if field.startswith("["):
+                continue
+            first, _, last = field.partition("-")
+            slots.extend(range(int(first), int(last or first) + 1))
+        nodes[fields[0]] = ((host, int(port)), slots, "myself" in fields[2].split(","))
+    return nodes
+
+
+# Administration: plain connections to every node, as redis-cli --cluster uses
+
+class ClusterAdmin:
+    """Connections to every node of a cluster, by node id"""
+
+    def __init__(self, addresses):
+        import redis
+
+        self.connections = {}
+        self.addresses = {}
+        for host, port in addresses:
+            connection = redis.Redis(host=host, port=port)
+            node_id = connection.execute_command("CLUSTER", "MYID").decode()
+            self.connections[node_id] = connection
+            self.addresses[node_id] = (host, port)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.close()
+
+    def call(self, node_id, *args):
+        return self.connections[node_id].execute_command(*args)
+
+    def owners(self):
+        """{slot: node id} as the nodes themselves report it"""
+        owners = {}
+        for node_id in self.connections:
+            for owner, (_, slots, myself) in parse_nodes(self.call(node_id, "CLUSTER", "NODES")).items():
+                if myself:
+                    owners.update(dict.fromkeys(slots, owner))
+        return owners
+
+    def meet_all(self):
+        """Introduce every node to every other; each learns the others' slots"""
+        for node_id in self.connections:
+            pipe = self.connections[node_id].pipeline(transaction=False)
+            for other, (host, port) in self.addresses.items():
+                if other != node_id:
+                    pipe.execute_command("CLUSTER", "MEET", host, port)
+            pipe.execute()
+
+    def set_owner(self, slot, node_id):
+        """Announce slot's new owner: that node first, so redirects never loop back"""
+        order = [node_id] + [other for other in self.connections if other != node_id]
+        for other in order:
+            self.call(other, "CLUSTER", "SETSLOT", slot, "NODE", node_id)
+
+    def migrate_slot(self, slot, source, target, batch=MIGRATE_BATCH, timeout=5000):
+        """Move slot's keys from source to target while both keep serving requests"""
+        host, port = self.addresses[target]
+        self.call(target, "CLUSTER", "SETSLOT", slot, "IMPORTING", source)
+        self.call(source, "CLUSTER", "SETSLOT", slot, "MIGRATING", target)
+        while True:
+            keys = self.call(source, "CLUSTER", "GETKEYSINSLOT", slot, batch)
+            if not keys:
+                break
+            self.call(source, "MIGRATE", host, port, "", 0, timeout, "REPLACE", "KEYS", *keys)
+        self.set_owner(slot, target)
+
+    def reshard(self, slots, target):
+        """Move slots to the target node; returns how many changed owner"""
+        owners = self.owners()
+        moved = 0
+        for slot in slots:
+            source = owners.get(slot)
+            if source is None:
+                self.set_owner(slot, target)
+            elif source != target:
+                self.migrate_slot(slot, source, target)
+            else:
+                continue
+            moved += 1
+        return moved
+
+    def rebalance(self):
+        """Even out the slots across every node; returns how many moved"""
+        owners = self.owners()
+        held = {node_id: [] for node_id in self.connections}
+        for slot, owner in sorted(owners.items()):
+            held[owner].append(slot)
+        ids = sorted(held, key=lambda node_id: -len(held[node_id]))
+        quota = {
+            node_id: HASH_SLOTS // len(ids) + (1 if i < HASH_SLOTS % len(ids) else 0)
+            for i, node_id in enumerate(ids)
+        }
+        surplus = [
+            slot for node_id in ids for slot in held[node_id][quota[node_id]:]
+        ]
+        moved = 0
+        for node_id in ids:
+            wanted = quota[node_id] - len(held[node_id])
+            if wanted > 0:
+                moved += self.reshard(surplus[:wanted], node_id)
+                del surplus[:wanted]
+        return moved
+
+
+def create_cluster(addresses):
+    """
+    Join the nodes at addresses into one cluster with the slots spread evenly
+
+    Returns {node id: (host, port)}.
+    """
+    with ClusterAdmin(addresses) as admin:
+        for node_id, (first, last) in zip(admin.connections, even_slots(len(addresses))):
+            admin.call(node_id, "CLUSTER", "ADDSLOTSRANGE", first, last)
+        admin.meet_all()
+        return dict(admin.addresses)
+
+
+class ClusterClient:
+    """
+    MockRedisClient's key/value calls on a redis-py RedisCluster
+
+    Single-key calls go straight to the slot's node; mget, mset and
+    delete_many send one pipeline per node, and the client follows
+    MOVED and ASK while slots are resharded.
+    """
+
+    def __init__(self, addresses, **kwargs):
+        from redis.cluster import ClusterNode, RedisCluster
+
+        self.cluster = RedisCluster(
+            startup_nodes=[ClusterNode(host, port) for host, port in addresses], **kwargs
+        )
+
+    def close(self):
+        self.cluster.close()
+
+    def set_key(self, key, value, ex=None, px=None):
+        return bool(self.cluster.set(key, value, ex=ex, px=px))
+
+    def get_key(self, key):
+        return self.cluster.get(key)
+
+    def delete_key(self, key):
+        return bool(self.cluster.delete(key))
+
+    def exists(self, key):
+        return bool(self.cluster.exists(key))
+
+    def expire(self, key, seconds):
+        return bool(self.cluster.expire(key, seconds))
+
+    def persist(self, key):
+        return bool(self.cluster.persist(key))
+
+    def ttl(self, key):
+        return self.cluster.ttl(key)
+
+    def pttl(self, key):
+        return self.cluster.pttl(key)
+
+    def mget(self, keys):
+        return self.cluster.mget_nonatomic(list(keys))
+
+    def mset(self, mapping, ex=None, px=None):
+        if ex is None and px is None:
+            self.cluster.mset_nonatomic(mapping)
+            return True
+        pipe = self.cluster.pipeline()
+        for key, value in mapping.items():
+            pipe.set(key, value, ex=ex, px=px)
+        pipe.execute()
+        return True
+
+    def delete_many(self, *keys):
+        if len(keys) == 1 and isinstance(keys[0], (list, tuple, set)):
+            keys = tuple(keys[0])
+        by_slot = {}
+        for key in keys:
+            by_slot.setdefault(key_slot(key), []).append(key)
+        pipe = self.cluster.pipeline()
+        for slot_keys in by_slot.values():
+            pipe.delete(*slot_keys)
+        return sum(pipe.execute())
+
+    def dbsize(self):
+        # RedisCluster asks only its default node unless told otherwise
+        return self.cluster.dbsize(target_nodes=self.cluster.PRIMARIES)
+
+    def flushdb(self):
+        self.cluster.flushdb()
+        return True
+
+
+# Local node processes
+
+SERVER_SCRIPT = Path(__file__).parent / "mock_redis_server.py"
+
+
+class LocalCluster:
+    """
+    shards mock Redis cluster nodes running as child processes of this one
+
+    Ports come from base_port upwards, or are picked by the system when it
+    is 0. With data_dir each node persists to its own subdirectory.
+    """
+
+    def __init__(self, shards=3, host="127.0.0.1", base_port=0, data_dir=None, server_args=()):
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        self.shards = shards
+        self.host = host
+        self.base_port = base_port
+        self.data_dir = data_dir
+        self.server_args = list(server_args)
+        self.processes = []
+        self.nodes = {}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    @property
+    def addresses(self):
+        return list(self.nodes.values())
+
+    def _spawn(self):
+        index = len(self.processes)
+        port = self.base_port + index if self.base_port else 0
+        argv = [sys.executable, str(SERVER_SCRIPT), "--cluster",
+                "--host", self.host, "--port", str(port), *self.server_args]
+        if self.data_dir:
+            argv += ["--data-dir", os.path.join(self.data_dir, f"node-{index}")]
+        process = subprocess.Popen(argv, stdout=subprocess.PIPE, text=True)
+        self.processes.append(process)
+        # The server prints its address once it is listening
+        for line in process.stdout:
+            if "listening on" in line:
+                host, _, port = line.split()[-1].rpartition(":")
+                return host, int(port)
+        raise RuntimeError(f"Mock Redis cluster node exited with {process.wait()}")
+
+    def start(self):
+        try:
+            addresses = [self._spawn() for _ in range(self.shards)]
+            self.nodes = create_cluster(addresses)
+        except BaseException:
+            self.stop()
+            raise
+        return self
+
+    def add_node(self):
+        """Start one more node, owning no slots until rebalance() or reshard()"""
+        address = self._spawn()
+        with ClusterAdmin(self.addresses + [address]) as admin:
+            admin.meet_all()
+            node_id = next(i for i, a in admin.addresses.items() if a == address)
+        self.nodes[node_id] = address
+        return node_id
+
+    def admin(self):
+        return ClusterAdmin(self.addresses)
+
+    def reshard(self, slots, node_id):
+        with self.admin() as admin:
+            return admin.reshard(slots, node_id)
+
+    def rebalance(self):
+        with self.admin() as admin:
+            return admin.rebalance()
+
+    def client(self, **kwargs):
+        """A redis-py RedisCluster connected to these nodes"""
+        from redis.cluster import ClusterNode, RedisCluster
+
+        return RedisCluster(
+            startup_nodes=[ClusterNode(host, port) for host, port in self.addresses], **kwargs
+        )
+
+    def stop(self, timeout=5):
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            if process.stdout is not None:
+                process.stdout.close()
+        self.processes = []
+        self.nodes = {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local mock Redis cluster")
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=7000, help="0 picks free ports")
+    parser.add_argument("--data-dir", help="persist each node under this directory")
+    args = parser.parse_args(argv)
+
+    with LocalCluster(args.shards, args.host, args.base_port, args.data_dir) as cluster:
+        for node_id, (host, port) in cluster.nodes.items():
+            print(f"{node_id} {host}:{port}", flush=True)
+        try:
+            while all(process.poll() is None for process in cluster.processes):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Snapshot and append-only log files for the mock Redis store
+
+A data directory holds one snapshot (``dump.rdb``) plus per-shard
+append-only logs named ``appendonly.<generation>.<shard>.aof``. The
+snapshot records the generation it was taken at; on startup it is loaded
+and every log of that generation or later is replayed on top, oldest
+generation first.
+
+Snapshot layout (little endian):
+
+    magic    8 bytes  b"MOCKRDB1"
+    header   <QQqI    generation, created_at (ms), hash probe, shard count
+    table    <QQ      offset and length of each shard section
+    sections          pickled (data, expires, sizes) per shard
+
+Log records are a 4-byte length followed by a pickled command tuple.
+
+DUMP payloads, which MIGRATE and RESTORE carry between servers, are
+b"MOCKDMP1", a pickled (type name, state) pair and a CRC32 of the
+pickle. Only builtin values are unpickled from them.
+"""
+
+import io
+import mmap
+import os
+import pickle
+import re
+import struct
+import sys
+import time
+import zlib
+
+SNAPSHOT_NAME = "dump.rdb"
+SNAPSHOT_MAGIC = b"MOCKRDB1"
+_HEADER = struct.Struct("<QQqI")
+_SECTION = struct.Struct("<QQ")
+_RECORD = struct.Struct("<I")
+_AOF_PATTERN = re.compile(r"^appendonly\.(\d+)\.(\d+)\.aof$")
+DUMP_MAGIC = b"MOCKDMP1"
+_CHECKSUM = struct.Struct("<I")
+
+# Same value in two processes means str hashes, and so shard placement, agree
+HASH_PROBE = hash("mock-redis-shard-probe")
+
+
+def snapshot_path(data_dir):
+    return os.path.join(data_dir, SNAPSHOT_NAME)
+
+
+def aof_path(data_dir, generation, shard_index):
+    return os.path.join(data_dir, f"appendonly.{generation}.{shard_index}.aof")
+
+
+def list_aof_files(data_dir):
+    """(generation, shard, path) for every log, oldest generation first"""
+    files = []
+    for name in os.listdir(data_dir):
+        match = _AOF_PATTERN.match(name)
+        if match:
+            files.append((int(match.group(1)), int(match.group(2)), os.path.join(data_dir, name)))
+    return sorted(files)
+
+
+def _fsync_dir(data_dir):
+    if sys.platform.startswith("win"):
+        return
+    fd = os.open(data_dir, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_snapshot(data_dir, generation, sections):
+    """
+    Atomically write a snapshot
+
+    sections is a list of (data, expires, sizes) tuples, one per shard.
+    The file is written under a temporary name, fsynced and renamed over
+    the previous snapshot, so a crash leaves either the old or new one.
+    """
+    payloads = [pickle.dumps(section, protocol=pickle.HIGHEST_PROTOCOL) for section in sections]
+    header_size = len(SNAPSHOT_MAGIC) + _HEADER.size + _SECTION.size * len(payloads)
+
+    final_path = snapshot_path(data_dir)
+    tmp_path = f"{final_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(_HEADER.pack(generation, int(time.time() * 1000), HASH_PROBE, len(payloads)))
+        offset = header_size
+        for payload in payloads:
+            f.write(_SECTION.pack(offset, len(payload)))
+            offset += len(payload)
+        for payload in payloads:
+            f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, final_path)
+    _fsync_dir(data_dir)
+
+
+def load_snapshot(data_dir):
+    """
+    Read the snapshot through a memory map
+
+    Returns (generation, same_hash_seed, sections) or None when there is
+    no snapshot. Sections are unpickled straight from the mapped pages.
+    """
+    path = snapshot_path(data_dir)
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if mm[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a mock Redis snapshot")
+        position = len(SNAPSHOT_MAGIC)
+        generation, _, probe, count = _HEADER.unpack_from(mm, position)
+        position += _HEADER.size
+
+        view = memoryview(mm)
+        try:
+            sections = []
+            for i in range(count):
+                offset, length = _SECTION.unpack_from(mm, position + i * _SECTION.size)
+                sections.append(pickle.loads(view[offset:offset + length]))
+        finally:
+            view.release()
+
+    return generation, probe == HASH_PROBE, sections
+
+
+class AppendOnlyFile:
+    """Write side of one shard's append-only log"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "ab")
+        self.dirty = False
+
+    def append(self, record):
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.write(_RECORD.pack(len(payload)) + payload)
+        self.dirty = True
+
+    def flush(self):
+        self.file.flush()
+
+    def fsync(self):
+        if self.dirty:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.dirty = False
+
+    def close(self):
+        self.fsync()
+        self.file.close()
+
+
+def read_aof(path):
+    """Yield the records of a log, stopping at a torn final record"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            position = 0
+            while position + _RECORD.size <= size:
+                (length,) = _RECORD.unpack_from(mm, position)
+                start = position + _RECORD.size
+                if start + length > size:
+                    break
+                yield pickle.loads(mm[start:start + length])
+                position = start + length
+
+
+class _BuiltinUnpickler(pickle.Unpickler):
+    """Refuses every global, so a payload from the network cannot run code"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a DUMP payload")
+
+
+def dump_payload(value):
+    """Serialize a (type name, state) pair as DUMP returns it"""
+    body = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    return DUMP_MAGIC + body + _CHECKSUM.pack(zlib.crc32(body))
+
+
+def load_payload(payload):
+    """The (type name, state) pair of a DUMP payload; ValueError if it is damaged"""
+    if len(payload) < len(DUMP_MAGIC) + _CHECKSUM.size or not payload.startswith(DUMP_MAGIC):
+        raise ValueError("DUMP payload version or checksum are wrong")
+    body = payload[len(DUMP_MAGIC):-_CHECKSUM.size]
+    if _CHECKSUM.unpack(payload[-_CHECKSUM.size:])[0] != zlib.crc32(body):
+        raise ValueError("DUMP payload version or checksum are wrong")
+    try:
+        return _BuiltinUnpickler(io.BytesIO(body)).load()
+    except Exception:
+        raise ValueError("Bad data format") from None
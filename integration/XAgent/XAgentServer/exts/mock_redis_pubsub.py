@@ -0,0 +1,414 @@
+"""
+Publish/subscribe and blocking hand-off for the mock Redis store
+
+PubSubHub routes published messages to the PubSub objects subscribed to
+their channel, or to a glob pattern matching it. Every subscriber has a
+bounded queue of its own; what happens when it is full is the
+subscriber's overflow policy:
+
+* "block": the publisher waits for room, so a slow listener slows the
+  producer down instead of losing events (publish from a thread, or
+  await the async publish on an event loop)
+* "drop": the message is not queued for that subscriber and counted in
+  its ``dropped``
+* "close": the subscription is closed, as Redis disconnects pub/sub
+  clients over their output buffer limit
+
+Waiting listeners are woken directly by the publisher: a thread blocked
+in get_message by a condition variable, a coroutine by resolving its
+future on its own loop. Nothing polls.
+
+Waiter is the one-shot version of the same hand-off, used by BLPOP and
+BRPOP: a push hands its element to the oldest blocked caller.
+"""
+
+import asyncio
+import fnmatch
+import threading
+from collections import deque
+
+# Messages a subscriber may have waiting before its overflow policy applies
+PUBSUB_MAX_PENDING = 1000
+
+OVERFLOW_POLICIES = ("block", "drop", "close")
+
+
+def channel_name(channel):
+    """Channels and patterns are str; bytes are decoded as keys are"""
+    if isinstance(channel, bytes):
+        return channel.decode("utf-8", "surrogateescape")
+    return str(channel)
+
+
+def _wake(loop, future, value=None):
+    """Resolve future on loop, directly when already running on it"""
+    def resolve():
+        if not future.done():
+            future.set_result(value)
+
+    try:
+        on_loop = asyncio.get_running_loop() is loop
+    except RuntimeError:
+        on_loop = False
+    if on_loop:
+        resolve()
+    elif not loop.is_closed():
+        loop.call_soon_threadsafe(resolve)
+
+
+class Waiter:
+    """
+    One value handed to one blocked caller, in a thread or a coroutine
+
+    Whoever wins claim() delivers; the caller claims too when it gives up,
+    so a value is either delivered or never taken.
+    """
+
+    __slots__ = ("_lock", "_event", "_loop", "_future", "done", "value")
+
+    def __init__(self, loop=None):
+        self._lock = threading.Lock()
+        self._loop = loop
+        self._future = loop.create_future() if loop is not None else None
+        self._event = threading.Event() if loop is None else None
+        self.done = False
+        self.value = None
+
+    def claim(self):
+        with self._lock:
+            if self.done:
+                return False
+            self.done = True
+            return True
+
+    def deliver(self, value):
+        """Hand over value; only after a successful claim()"""
+        self.value = value
+        if self._event is not None:
+            self._event.set()
+        else:
+            _wake(self._loop, self._future)
+
+    def wait(self, timeout=None):
+        """The delivered value, or None after timeout seconds (None waits forever)"""
+        if not self._event.wait(timeout) and self.claim():
+            return None
+        # Claimed by a deliverer that is about to set the event
+        self._event.wait()
+        return self.value
+
+    async def wait_async(self, timeout=None):
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except asyncio.TimeoutError:
+            if self.claim():
+                return None
+            await self._future
+        return self.value
+
+
+class PubSubHub:
+    """Channel and pattern subscriptions of one store"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._patterns = {}
+
+    def _add(self, table, name, subscriber):
+        with self._lock:
+            table.setdefault(name, set()).add(subscriber)
+
+    def _remove(self, table, name, subscriber):
+        with self._lock:
+            subscribers = table.get(name)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del table[name]
+
+    def _deliveries(self, channel, message):
+        """(subscriber, message dict) for everyone who should get message"""
+        channel = channel_name(channel)
+        with self._lock:
+            deliveries = [
+                (subscriber, {"type": "message", "pattern": None, "channel": channel,
+                              "data": message})
+                for subscriber in self._channels.get(channel, ())
+            ]
+            for pattern, subscribers in self._patterns.items():
+                if fnmatch.fnmatchcase(channel, pattern):
+                    deliveries.extend(
+                        (subscriber, {"type": "pmessage", "pattern": pattern,
+                                      "channel": channel, "data": message})
+                        for subscriber in subscribers
+                    )
+        return deliveries
+
+    def publish(self, channel, message):
+        """Queue message for every subscriber; returns how many got it"""
+        return sum(
+            subscriber._put(item) for subscriber, item in self._deliveries(channel, message)
+        )
+
+    def try_publish(self, channel, message):
+        """
+        Queue message wherever there is room without waiting
+
+        Returns how many got it and the (subscriber, message) pairs still
+        waiting for room in a "block" subscriber.
+        """
+        received = 0
+        waiting = []
+        for subscriber, item in self._deliveries(channel, message):
+            with subscriber._lock:
+                taken = subscriber._offer(item)
+            if taken is None:
+                waiting.append((subscriber, item))
+            else:
+                received += taken
+        return received, waiting
+
+    async def apublish(self, channel, message):
+        """publish() whose "block" subscribers are waited for without blocking the loop"""
+        received, waiting = self.try_publish(channel, message)
+        for subscriber, item in waiting:
+            received += await subscriber._aput(item)
+        return received
+
+    def channels(self, pattern=None):
+        """Channels with at least one subscriber, like PUBSUB CHANNELS"""
+        with self._lock:
+            names = list(self._channels)
+        if pattern is None:
+            return names
+        pattern = channel_name(pattern)
+        return [name for name in names if fnmatch.fnmatchcase(name, pattern)]
+
+    def numsub(self, *channels):
+        with self._lock:
+            return [
+                (channel_name(c), len(self._channels.get(channel_name(c), ()))) for c in channels
+            ]
+
+    def numpat(self):
+        with self._lock:
+            return len(self._patterns)
+
+
+class PubSub:
+    """
+    A subscriber with a bounded queue, like redis-py's PubSub
+
+    Messages are dicts with "type" ("message" or "pmessage"), "pattern",
+    "channel" and "data". Subscribing is immediate and does not queue a
+    confirmation message.
+    """
+
+    def __init__(self, hub, max_pending=PUBSUB_MAX_PENDING, overflow="block"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown pub/sub overflow policy: {overflow}")
+        self.hub = hub
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.channels = set()
+        self.patterns = set()
+        self.dropped = 0
+        self.closed = False
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        # Futures of coroutines waiting for a message, or for room
+        self._getters = []
+        self._putters = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    @property
+    def subscribed(self):
+        return bool(self.channels or self.patterns)
+
+    @property
+    def pending(self):
+        return len(self._queue)
+
+    def subscribe(self, *channels):
+        for channel in map(channel_name, channels):
+            self.channels.add(channel)
+            self.hub._add(self.hub._channels, channel, self)
+
+    def psubscribe(self, *patterns):
+        for pattern in map(channel_name, patterns):
+            self.patterns.add(pattern)
+            self.hub._add(self.hub._patterns, pattern, self)
+
+    def unsubscribe(self, *channels):
+        """Leave channels, or every channel when none are given"""
+        for channel in list(map(channel_name, channels)) or list(self.channels):
+            self.channels.discard(channel)
+            self.hub._remove(self.hub._channels, channel, self)
+        self._release_listeners()
+
+    def punsubscribe(self, *patterns):
+        for pattern in list(map(channel_name, patterns)) or list(self.patterns):
+            self.patterns.discard(pattern)
+            self.hub._remove(self.hub._patterns, pattern, self)
+        self._release_listeners()
+
+    def _release_listeners(self):
+        # listen() ends once nothing is subscribed
+        if not self.subscribed:
+            with self._lock:
+                self._not_empty.notify_all()
+                self._wake_futures(self._getters)
+
+    def close(self):
+        """Unsubscribe from everything and release anyone waiting on this queue"""
+        # Not self.unsubscribe(): AsyncPubSub's are coroutines
+        PubSub.unsubscribe(self)
+        PubSub.punsubscribe(self)
+        with self._lock:
+            self.closed = True
+            self._wake_all()
+
+    # Queue
+
+    def _wake_futures(self, futures):
+        for loop, future in futures:
+            _wake(loop, future)
+        futures.clear()
+
+    def _wake_all(self):
+        self._not_empty.notify_all()
+        self._not_full.notify_all()
+        self._wake_futures(self._getters)
+        self._wake_futures(self._putters)
+
+    def _offer(self, item):
+        """Queue item if there is room; True, False if not taken, None if full"""
+        if self.closed:
+            return False
+        if len(self._queue) < self.max_pending:
+            self._queue.append(item)
+            self._not_empty.notify()
+            self._wake_futures(self._getters)
+            return True
+        if self.overflow == "drop":
+            self.dropped += 1
+            return False
+        if self.overflow == "close":
+            self.dropped += 1
+            self.closed = True
+            self._wake_all()
+            return False
+        return None
+
+    def _put(self, item):
+        with self._lock:
+            while True:
+                taken = self._offer(item)
+                if taken is not None:
+                    return taken
+                self._not_full.wait()
+
+    async def _aput(self, item):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                taken = self._offer(item)
+                if taken is not None:
+                    return taken
+                future = loop.create_future()
+                self._putters.append((loop, future))
+            await future
+
+    def _take(self):
+        """Next message, or None if the queue is empty; the lock must be held"""
+        if not self._queue:
+            return None
+        item = self._queue.popleft()
+        self._not_full.notify()
+        self._wake_futures(self._putters)
+        return item
+
+    def get_message(self, timeout=0.0):
+        """
+        Next message, or None if none arrives within timeout seconds
+
+        timeout=None waits until a message arrives or the PubSub is closed.
+        """
+        with self._lock:
+            item = self._take()
+            if item is None and timeout != 0 and not self.closed:
+                self._not_empty.wait_for(
+                    lambda: self._queue or self.closed or not self.subscribed, timeout
+                )
+                item = self._take()
+            return item
+
+    def listen(self):
+        """Messages as they arrive, until closed or unsubscribed from everything"""
+        while True:
+            item = self.get_message(timeout=None if self.subscribed else 0)
+            if item is not None:
+                yield item
+            elif self.closed or not self.subscribed:
+                return
+
+
+class AsyncPubSub(PubSub):
+    """PubSub whose get_message and listen wait without blocking the event loop"""
+
+    async def subscribe(self, *channels):
+        PubSub.subscribe(self, *channels)
+
+    async def psubscribe(self, *patterns):
+        PubSub.psubscribe(self, *patterns)
+
+    async def unsubscribe(self, *channels):
+        PubSub.unsubscribe(self, *channels)
+
+    async def punsubscribe(self, *patterns):
+        PubSub.punsubscribe(self, *patterns)
+
+    async def aclose(self):
+        PubSub.close(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        PubSub.close(self)
+        return False
+
+    async def get_message(self, timeout=0.0):
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            with self._lock:
+                item = self._take()
+                if item is not None or self.closed or not self.subscribed:
+                    return item
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                future = loop.create_future()
+                self._getters.append((loop, future))
+            try:
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                return None
+
+    async def listen(self):
+        while True:
+            item = await self.get_message(timeout=None if self.subscribed else 0)
+            if item is not None:
+                yield item
+            elif self.closed or not self.subscribed:
+                return
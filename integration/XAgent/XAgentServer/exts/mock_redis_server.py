@@ -0,0 +1,1799 @@
+"""
+RESP2 network server for the mock Redis store
+
+Several processes (uvicorn workers, XAgent children) only see the same
+keys if they share one store, so this asyncio server exposes a
+MockRedisClient over the Redis protocol and stock clients such as
+redis-py connect to it like to a real server:
+
+    python mock_redis_server.py --port 6379
+    redis.Redis(host="127.0.0.1", port=6379).set("k", "v")
+
+Every connection is an asyncio Protocol on one event loop, so thousands
+of idle or busy clients cost a parser and a buffer each, not a thread.
+All complete commands in a read are executed together and their replies
+go out in a single write, which is what makes pipelining cheap. Commands
+run inline on the loop: each holds a shard lock for one operation only,
+which is far cheaper than handing it to a thread.
+
+Keys are stored as str (decoded as UTF-8, with surrogateescape so any
+bytes round-trip) and values as the bytes the client sent, so a process
+using the same MockRedisClient directly sees keys written over the
+network and vice versa. MULTI/EXEC runs the queued commands under the
+locks of every shard they touch, like Pipeline.execute. The string,
+hash, list, sorted set and stream commands the store can back are
+implemented, plus keyspace, connection and server commands; anything
+else gets an "unknown command" error.
+
+BLPOP/BRPOP and SUBSCRIBE/PSUBSCRIBE share the store's pub/sub hub and
+list waiters with in-process users, so a message published or a job
+pushed from XAgent's own process reaches network listeners at once. A
+blocked connection holds back its own later requests only. Subscribers
+are closed when MOCK_REDIS_PUBSUB_MAX_PENDING messages pile up for them,
+as Redis does with its pub/sub output buffer limit.
+
+With --cluster the server is one node of a Redis Cluster (see
+mock_redis_cluster): requests for keys of hash slots it does not serve
+get MOVED or ASK, and CLUSTER, ASKING, MIGRATE, DUMP and RESTORE let the
+slots be assigned and moved between nodes.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import time
+from collections import deque
+
+try:
+    from .mock_redis import (
+        AsyncMockRedisClient, MockRedisBusyKeyError, MockRedisClient, MockRedisOOMError,
+        MockRedisWrongTypeError, mock_redis
+    )
+    from .mock_redis_cluster import HASH_SLOTS, ClusterState, key_slot, parse_nodes
+    from .mock_redis_pubsub import PUBSUB_MAX_PENDING, AsyncPubSub, PubSub
+except ImportError:
+    from mock_redis import (
+        AsyncMockRedisClient, MockRedisBusyKeyError, MockRedisClient, MockRedisOOMError,
+        MockRedisWrongTypeError, mock_redis
+    )
+    from mock_redis_cluster import HASH_SLOTS, ClusterState, key_slot, parse_nodes
+    from mock_redis_pubsub import PUBSUB_MAX_PENDING, AsyncPubSub, PubSub
+
+# Limits Redis also enforces on requests
+MAX_BULK_LENGTH = 512 * 1024 * 1024
+MAX_MULTIBULK_LENGTH = 1024 * 1024
+MAX_INLINE_LENGTH = 64 * 1024
+
+# Pause reading from a client whose replies pile up beyond this
+WRITE_HIGH_WATER = 4 * 1024 * 1024
+
+SERVER_VERSION = "7.0.0"
+
+# Commands whose keys COMMAND GETKEYS has to find in their arguments
+MOVABLE_KEYS = ("xread", "migrate")
+
+# Commands a connection may send while it has subscriptions
+SUBSCRIBED_COMMANDS = (
+    b"subscribe", b"psubscribe", b"unsubscribe", b"punsubscribe", b"ping", b"quit"
+)
+
+_OK = "OK"
+_NULL = b"$-1\r\n"
+
+
+class ProtocolError(Exception):
+    """Malformed request; the connection is closed after replying"""
+
+
+class CommandError(Exception):
+    """
+    Error reply for one command
+
+    The message starts with the Redis error code, e.g. "ERR ..." or
+    "EXECABORT ...", and is sent as is.
+    """
+
+
+class RespParser:
+    """Incremental RESP2 request parser; feed() bytes, then take commands()"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        self._buffer += data
+
+    def commands(self):
+        """Every complete command buffered so far, as lists of bytes"""
+        buffer = self._buffer
+        size = len(buffer)
+        position = 0
+        commands = []
+        while position < size:
+            if buffer[position] == 42:  # "*"
+                parsed = self._multibulk(buffer, position, size)
+            else:
+                parsed = self._inline(buffer, position, size)
+            if parsed is None:
+                break
+            args, position = parsed
+            if args:
+                commands.append(args)
+        del buffer[:position]
+        return commands
+
+    @staticmethod
+    def _multibulk(buffer, position, size):
+        end = buffer.find(b"\r\n", position)
+        if end < 0:
+            if size - position > MAX_INLINE_LENGTH:
+                raise ProtocolError("too big mbulk count string")
+            return None
+        count = _length(buffer[position + 1:end], "multibulk")
+        if count > MAX_MULTIBULK_LENGTH:
+            raise ProtocolError("invalid multibulk length")
+        position = end + 2
+        args = []
+        for _ in range(count):
+            if position >= size:
+                return None
+            if buffer[position] != 36:  # "$"
+                raise ProtocolError(f"expected '$', got '{chr(buffer[position])}'")
+            end = buffer.find(b"\r\n", position)
+            if end < 0:
+                return None
+            length = _length(buffer[position + 1:end], "bulk")
+            if length > MAX_BULK_LENGTH:
+                raise ProtocolError("invalid bulk length")
+            start = end + 2
+            if start + length + 2 > size:
+                return None
+            args.append(bytes(buffer[start:start + length]))
+            position = start + length + 2
+        return args, position
+
+    @staticmethod
+    def _inline(buffer, position, size):
+        # Plain "PING\r\n" style commands, as typed into telnet
+        end = buffer.find(b"\n", position)
+        if end < 0:
+            if size - position > MAX_INLINE_LENGTH:
+                raise ProtocolError("too big inline request")
+            return None
+        return bytes(buffer[position:end]).split(), end + 1
+
+
+def _length(text, kind):
+    try:
+        return int(text)
+    except ValueError:
+        raise ProtocolError(f"invalid {kind} length") from None
+
+
+def encode(value, out):
+    """
+    Append the RESP2 encoding of value to the list out
+
+    bytes are bulk strings, str simple strings, int integers, None the
+    null bulk string, lists arrays and exceptions error replies.
+    """
+    if value is None:
+        out.append(_NULL)
+    elif isinstance(value, bytes):
+        out.append(b"$%d\r\n%s\r\n" % (len(value), value))
+    elif isinstance(value, int):
+        out.append(b":%d\r\n" % value)
+    elif isinstance(value, str):
+        out.append(b"+%s\r\n" % value.encode())
+    elif isinstance(value, (list, tuple)):
+        out.append(b"*%d\r\n" % len(value))
+        for item in value:
+            encode(item, out)
+    elif isinstance(value, BaseException):
+        message = " ".join(str(value).split())
+        out.append(b"-%s\r\n" % message.encode(errors="replace"))
+    else:
+        raise TypeError(f"cannot encode {type(value).__name__}")
+
+
+def decode_key(key):
+    return key.decode("utf-8", "surrogateescape")
+
+
+def encode_key(key):
+    if isinstance(key, bytes):
+        return key
+    return str(key).encode("utf-8", "surrogateescape")
+
+
+def encode_value(value):
+    """Bulk string for a stored value; in-process users may store str or numbers"""
+    if value is None or isinstance(value, bytes):
+        return value
+    return str(value).encode("utf-8", "surrogateescape")
+
+
+def _integer(arg):
+    try:
+        return int(arg)
+    except ValueError:
+        raise CommandError("ERR value is not an integer or out of range") from None
+
+
+def _float(arg):
+    try:
+        return float(arg)
+    except ValueError:
+        raise CommandError("ERR value is not a valid float") from None
+
+
+def format_score(score):
+    """A score as Redis prints it: 1, 1.5, inf"""
+    if score != score or score in (float("inf"), float("-inf")):
+        return b"inf" if score > 0 else b"-inf" if score < 0 else b"nan"
+    if score == int(score) and abs(score) < 1e17:
+        return b"%d" % score
+    return repr(score).encode()
+
+
+def _with_scores(pairs, withscores):
+    if not withscores:
+        return [encode_value(member) for member, _ in pairs]
+    reply = []
+    for member, score in pairs:
+        reply.append(encode_value(member))
+        reply.append(format_score(score))
+    return reply
+
+
+def _stream_reply(entries):
+    return [
+        [entry_id.encode(), [encode_value(item) for pair in fields.items() for item in pair]]
+        for entry_id, fields in entries
+    ]
+
+
+def _count_option(args, start):
+    """Optional trailing COUNT argument of LPOP/RPOP/ZPOPMIN style commands"""
+    if len(args) == start:
+        return None
+    if len(args) != start + 1:
+        raise CommandError("ERR syntax error")
+    count = _integer(args[start])
+    if count < 0:
+        raise CommandError("ERR value is out of range, must be positive")
+    return count
+
+
+class Deferred:
+    """A reply the connection awaits before answering this or later requests"""
+
+    __slots__ = ("awaitable",)
+
+    def __init__(self, awaitable):
+        self.awaitable = awaitable
+
+
+class Replies(list):
+    """Several top-level replies to one request, as SUBSCRIBE sends"""
+
+
+class Command:
+    """A command's handler, arity and key positions, as in COMMAND INFO"""
+
+    __slots__ = ("name", "handler", "arity", "first_key", "last_key", "step", "keyspace")
+
+    def __init__(self, name, handler, arity, first_key=0, last_key=0, step=1, keyspace=False):
+        self.name = name
+        self.handler = handler
+        # Exact argument count including the name, or at least -arity
+        self.arity = arity
+        self.first_key = first_key
+        # Negative counts from the end, as in Redis
+        self.last_key = last_key
+        self.step = step
+        # Reads or writes the whole keyspace, so EXEC takes every lock
+        self.keyspace = keyspace
+
+    def check_arity(self, args):
+        if (self.arity > 0 and len(args) != self.arity) or len(args) < -self.arity:
+            raise CommandError(f"ERR wrong number of arguments for '{self.name}' command")
+
+    def key_indexes(self, args):
+        if not self.first_key:
+            return range(0)
+        last = self.last_key if self.last_key > 0 else len(args) + self.last_key
+        return range(self.first_key, last + 1, self.step)
+
+
+class Session:
+    """Per-connection state: MULTI queue, client name and subscriptions"""
+
+    __slots__ = (
+        "id", "name", "queued", "queue_failed", "in_exec", "closing", "pubsub", "asking"
+    )
+
+    def __init__(self, client_id):
+        self.id = client_id
+        self.name = None
+        # List of (command, args) between MULTI and EXEC, None outside
+        self.queued = None
+        self.queue_failed = False
+        # Blocking commands do not block inside EXEC
+        self.in_exec = False
+        self.closing = False
+        # AsyncPubSub, from the first SUBSCRIBE or PSUBSCRIBE on
+        self.pubsub = None
+        # Set by ASKING for the next command only
+        self.asking = False
+
+
+class CommandTable:
+    """Redis commands implemented on top of a MockRedisClient"""
+
+    def __init__(self, client, server=None, pubsub_max_pending=None, cluster=None):
+        self.client = client
+        self.server = server
+        # ClusterState in cluster mode, None for a standalone server
+        self.cluster = cluster
+        if cluster is not None:
+            client.enable_slot_index()
+        self.async_client = AsyncMockRedisClient(client)
+        if pubsub_max_pending is None:
+            pubsub_max_pending = int(
+                os.getenv("MOCK_REDIS_PUBSUB_MAX_PENDING", str(PUBSUB_MAX_PENDING))
+            )
+        self.pubsub_max_pending = pubsub_max_pending
+        self.commands = {}
+        for spec in (
+            ("ping", self.ping, -1),
+            ("echo", self.echo, 2),
+            ("quit", self.quit, -1),
+            ("select", self.select, 2),
+            ("hello", self.hello, -1),
+            ("client", self.client_command, -2),
+            ("command", self.command, -1),
+            ("time", self.time, 1),
+            ("info", self.info, -1, 0, 0, 1, True),
+            ("dbsize", self.dbsize, 1, 0, 0, 1, True),
+            ("flushdb", self.flushdb, -1, 0, 0, 1, True),
+            ("flushall", self.flushdb, -1, 0, 0, 1, True),
+            ("keys", self.keys, 2, 0, 0, 1, True),
+            ("scan", self.scan, -2, 0, 0, 1, True),
+            ("get", self.get, 2, 1, 1),
+            ("set", self.set, -3, 1, 1),
+            ("setex", self.setex, 4, 1, 1),
+            ("psetex", self.psetex, 4, 1, 1),
+            ("setnx", self.setnx, 3, 1, 1),
+            ("getdel", self.getdel, 2, 1, 1),
+            ("mget", self.mget, -2, 1, -1),
+            ("mset", self.mset, -3, 1, -1, 2),
+            ("del", self.delete, -2, 1, -1),
+            ("unlink", self.delete, -2, 1, -1),
+            ("exists", self.exists, -2, 1, -1),
+            ("type", self.type, 2, 1, 1),
+            ("expire", self.expire, 3, 1, 1),
+            ("pexpire", self.pexpire, 3, 1, 1),
+            ("persist", self.persist, 2, 1, 1),
+            ("ttl", self.ttl, 2, 1, 1),
+            ("pttl", self.pttl, 2, 1, 1),
+            ("incr", self.incr, 2, 1, 1),
+            ("decr", self.decr, 2, 1, 1),
+            ("incrby", self.incrby, 3, 1, 1),
+            ("decrby", self.decrby, 3, 1, 1),
+            ("object", self.object, 3, 2, 2),
+            ("memory", self.memory, -3, 2, 2),
+            ("hset", self.hset, -4, 1, 1),
+            ("hmset", self.hmset, -4, 1, 1),
+            ("hsetnx", self.hsetnx, 4, 1, 1),
+            ("hget", self.hget, 3, 1, 1),
+            ("hmget", self.hmget, -3, 1, 1),
+            ("hgetall", self.hgetall, 2, 1, 1),
+            ("hdel", self.hdel, -3, 1, 1),
+            ("hlen", self.hlen, 2, 1, 1),
+            ("hexists", self.hexists, 3, 1, 1),
+            ("hkeys", self.hkeys, 2, 1, 1),
+            ("hvals", self.hvals, 2, 1, 1),
+            ("hincrby", self.hincrby, 4, 1, 1),
+            ("lpush", self.lpush, -3, 1, 1),
+            ("rpush", self.rpush, -3, 1, 1),
+            ("lpop", self.lpop, -2, 1, 1),
+            ("rpop", self.rpop, -2, 1, 1),
+            ("llen", self.llen, 2, 1, 1),
+            ("lrange", self.lrange, 4, 1, 1),
+            ("lindex", self.lindex, 3, 1, 1),
+            ("lset", self.lset, 4, 1, 1),
+            ("lrem", self.lrem, 4, 1, 1),
+            ("ltrim", self.ltrim, 4, 1, 1),
+            ("zadd", self.zadd, -4, 1, 1),
+            ("zincrby", self.zincrby, 4, 1, 1),
+            ("zscore", self.zscore, 3, 1, 1),
+            ("zrem", self.zrem, -3, 1, 1),
+            ("zcard", self.zcard, 2, 1, 1),
+            ("zrank", self.zrank, 3, 1, 1),
+            ("zrevrank", self.zrevrank, 3, 1, 1),
+            ("zrange", self.zrange, -4, 1, 1),
+            ("zrevrange", self.zrevrange, -4, 1, 1),
+            ("zrangebyscore", self.zrangebyscore, -4, 1, 1),
+            ("zrevrangebyscore", self.zrevrangebyscore, -4, 1, 1),
+            ("zcount", self.zcount, 4, 1, 1),
+            ("zpopmin", self.zpopmin, -2, 1, 1),
+            ("zpopmax", self.zpopmax, -2, 1, 1),
+            ("xadd", self.xadd, -5, 1, 1),
+            ("xlen", self.xlen, 2, 1, 1),
+            ("xrange", self.xrange, -4, 1, 1),
+            ("xrevrange", self.xrevrange, -4, 1, 1),
+            ("xdel", self.xdel, -3, 1, 1),
+            ("xtrim", self.xtrim, -4, 1, 1),
+            # Its keys follow STREAMS, so EXEC simply takes every lock
+            ("xread", self.xread, -4, 0, 0, 1, True),
+            ("blpop", self.blpop, -3, 1, -2),
+            ("brpop", self.brpop, -3, 1, -2),
+            ("publish", self.publish, 3),
+            ("pubsub", self.pubsub, -2),
+            ("subscribe", self.subscribe, -2),
+            ("psubscribe", self.psubscribe, -2),
+            ("unsubscribe", self.unsubscribe, -1),
+            ("punsubscribe", self.punsubscribe, -1),
+            ("dump", self.dump, 2, 1, 1),
+            ("restore", self.restore, -4, 1, 1),
+            # RESTORE that a node importing the key's slot accepts, as if after ASKING
+            ("restore-asking", self.restore, -4, 1, 1),
+            # Its keys follow KEYS and are always local, so it is never redirected
+            ("migrate", self.migrate, -6, 0, 0, 1, True),
+            ("cluster", self.cluster_command, -2),
+            ("asking", self.asking, 1),
+            ("readonly", self.readonly, 1),
+            ("readwrite", self.readonly, 1),
+        ):
+            self.commands[spec[0].encode()] = Command(*spec)
+
+    def lookup(self, args):
+        """The Command for a request, with its key arguments decoded to str"""
+        name = args[0]
+        command = self.commands.get(name) or self.commands.get(name.lower())
+        if command is None:
+            start = " ".join(f"'{arg.decode(errors='replace')}'" for arg in args[1:4])
+            raise CommandError(
+                f"ERR unknown command '{name.decode(errors='replace')}', "
+                f"with args beginning with: {start}"
+            )
+        command.check_arity(args)
+        for index in command.key_indexes(args):
+            args[index] = decode_key(args[index])
+        return command
+
+    def execute(self, session, args):
+        """Reply value for one request, queueing it inside MULTI"""
+        name = args[0].lower()
+        if session.queued is not None and name not in (b"exec", b"discard", b"multi", b"quit"):
+            try:
+                command = self.lookup(args)
+                if self.cluster is not None:
+                    self._route(command, session, args)
+            except CommandError:
+                session.queue_failed = True
+                raise
+            session.queued.append((command, args))
+            return "QUEUED"
+        if (
+            session.pubsub is not None and session.pubsub.subscribed
+            and name not in SUBSCRIBED_COMMANDS
+        ):
+            raise CommandError(
+                f"ERR Can't execute '{name.decode(errors='replace')}': only (P)SUBSCRIBE / "
+                "(P)UNSUBSCRIBE / PING / QUIT are allowed in this context"
+            )
+        if name == b"multi":
+            if session.queued is not None:
+                raise CommandError("ERR MULTI calls can not be nested")
+            session.queued = []
+            session.queue_failed = False
+            return _OK
+        if name == b"exec":
+            return self.exec(session)
+        if name == b"discard":
+            if session.queued is None:
+                raise CommandError("ERR DISCARD without MULTI")
+            session.queued = None
+            return _OK
+        command = self.lookup(args)
+        if self.cluster is not None:
+            self._route(command, session, args)
+        return self._run(command, session, args)
+
+    def _route(self, command, session, args):
+        """Raise MOVED, ASK or CROSSSLOT unless this node serves the request's keys"""
+        asking = session.asking or command.name == "restore-asking"
+        if command.name != "asking":
+            session.asking = False
+        indexes = command.key_indexes(args)
+        if not indexes:
+            return
+        keys = [args[i] for i in indexes]
+        slot = key_slot(keys[0])
+        if any(key_slot(key) != slot for key in keys[1:]):
+            raise CommandError("CROSSSLOT Keys in request don't hash to the same slot")
+        error = self.cluster.route(slot, keys, asking, self.client.exists)
+        if error is not None:
+            raise CommandError(error)
+
+    def _run(self, command, session, args):
+        try:
+            return command.handler(session, args)
+        except CommandError:
+            raise
+        except (MockRedisOOMError, MockRedisWrongTypeError, MockRedisBusyKeyError) as e:
+            # Their messages already start with the error code
+            raise CommandError(str(e)) from e
+        except Exception as e:
+            raise CommandError(f"ERR {e}") from e
+
+    def exec(self, session):
+        queued, session.queued = session.queued, None
+        if queued is None:
+            raise CommandError("ERR EXEC without MULTI")
+        if session.queue_failed:
+            raise CommandError("EXECABORT Transaction discarded because of previous errors.")
+        if any(command.keyspace for command, _ in queued):
+            locks = self.client._all_locks()
+        else:
+            locks = self.client._locks_for(
+                [args[i] for command, args in queued for i in command.key_indexes(args)]
+            )
+        results = []
+        session.in_exec = True
+        try:
+            with locks:
+                for command, args in queued:
+                    try:
+                        results.append(self._run(command, session, args))
+                    except CommandError as e:
+                        results.append(e)
+        finally:
+            session.in_exec = False
+        if any(isinstance(result, Deferred) for result in results):
+            # A PUBLISH waiting for a full subscriber; the locks are released
+            return Deferred(self._gather(results))
+        return results
+
+    async def _gather(self, results):
+        gathered = []
+        for result in results:
+            if isinstance(result, Deferred):
+                try:
+                    result = await result.awaitable
+                except CommandError as e:
+                    result = e
+            gathered.append(result)
+        return gathered
+
+    # Connection and server
+
+    def ping(self, session, args):
+        if len(args) > 2:
+            raise CommandError("ERR wrong number of arguments for 'ping' command")
+        if session.pubsub is not None and session.pubsub.subscribed:
+            return [b"pong", args[1] if len(args) == 2 else b""]
+        return args[1] if len(args) == 2 else "PONG"
+
+    def echo(self, session, args):
+        return args[1]
+
+    def quit(self, session, args):
+        session.closing = True
+        return _OK
+
+    def select(self, session, args):
+        if _integer(args[1]) != 0:
+            raise CommandError("ERR DB index is out of range")
+        return _OK
+
+    def hello(self, session, args):
+        if len(args) > 1 and args[1] != b"2":
+            raise CommandError("NOPROTO unsupported protocol version")
+        return [
+            b"server", b"redis", b"version", SERVER_VERSION.encode(), b"proto", 2,
+            b"id", session.id, b"mode", b"standalone" if self.cluster is None else b"cluster",
+            b"role", b"master", b"modules", [],
+        ]
+
+    def client_command(self, session, args):
+        subcommand = args[1].lower()
+        if subcommand == b"setname" and len(args) == 3:
+            session.name = args[2]
+            return _OK
+        if subcommand == b"getname":
+            return session.name
+        if subcommand == b"id":
+            return session.id
+        if subcommand == b"setinfo":
+            return _OK
+        raise CommandError(f"ERR unknown subcommand '{args[1].decode(errors='replace')}'")
+
+    def command(self, session, args):
+        """COMMAND, COUNT and GETKEYS: what cluster clients use to find a request's keys"""
+        subcommand = args[1].lower() if len(args) > 1 else None
+        if subcommand == b"count":
+            return len(self.commands)
+        if subcommand == b"getkeys" and len(args) > 2:
+            request = args[2:]
+            command = self.lookup(request)
+            if command.name in MOVABLE_KEYS:
+                lowered = [arg.lower() for arg in request]
+                if command.name == "migrate" and request[3]:
+                    return [request[3]]
+                # XREAD ... STREAMS key ... id ..., MIGRATE ... KEYS key ...
+                marker = lowered.index(b"streams" if command.name == "xread" else b"keys") + 1
+                keys = request[marker:]
+                return keys[:len(keys) // 2] if command.name == "xread" else keys
+            return [encode_key(request[i]) for i in command.key_indexes(request)]
+        if subcommand is not None:
+            raise CommandError(f"ERR unknown subcommand '{args[1].decode(errors='replace')}'")
+        return [
+            [
+                name, command.arity,
+                [b"movablekeys"] if command.name in MOVABLE_KEYS else [],
+                command.first_key, command.last_key, command.step
+            ]
+            for name, command in self.commands.items()
+        ]
+
+    def time(self, session, args):
+        now = time.time()
+        return [b"%d" % int(now), b"%d" % int(now % 1 * 1_000_000)]
+
+    def info(self, session, args):
+        stats = self.client.info()
+        sections = {
+            "Server": {
+                "redis_version": SERVER_VERSION,
+                "redis_mode": "standalone" if self.cluster is None else "cluster",
+                "process_id": os.getpid(),
+                "tcp_port": self.server.port if self.server else 0,
+            },
+            "Clients": {
+                "connected_clients": len(self.server.connections) if self.server else 0,
+            },
+            "Memory": {
+                "used_memory": stats["used_memory"],
+                "maxmemory": stats["maxmemory"],
+                "maxmemory_policy": stats["maxmemory_policy"],
+            },
+            "Stats": {
+                "expired_keys": stats["expired_keys"],
+                "evicted_keys": stats["keys_evicted"],
+            },
+            "Cluster": {
+                "cluster_enabled": int(self.cluster is not None),
+            },
+            "Keyspace": {
+                "db0": f"keys={stats['keys']},expires={stats['expires']},avg_ttl=0",
+            },
+        }
+        lines = []
+        for section, fields in sections.items():
+            lines.append(f"# {section}")
+            lines.extend(f"{name}:{value}" for name, value in fields.items())
+            lines.append("")
+        return "\r\n".join(lines).encode()
+
+    def dbsize(self, session, args):
+        return self.client.dbsize()
+
+    def flushdb(self, session, args):
+        self.client.flushdb()
+        return _OK
+
+    def keys(self, session, args):
+        pattern = args[1].decode("utf-8", "surrogateescape")
+        return [encode_key(key) for key in self.client.scan_iter(match=pattern, count=1000)]
+
+    def scan(self, session, args):
+        cursor = _integer(args[1])
+        match = kind = None
+        count = 10
+        options = iter(args[2:])
+        for option in options:
+            option = option.lower()
+            value = next(options, None)
+            if value is None:
+                raise CommandError("ERR syntax error")
+            if option == b"match":
+                match = value.decode("utf-8", "surrogateescape")
+            elif option == b"count":
+                count = _integer(value)
+                if count < 1:
+                    raise CommandError("ERR syntax error")
+            elif option == b"type":
+                kind = value.decode().lower()
+            else:
+                raise CommandError("ERR syntax error")
+        cursor, keys = self.client.scan(cursor, match=match, count=count)
+        if kind is not None:
+            keys = [key for key in keys if self.client.type(key) == kind]
+        return [b"%d" % cursor, [encode_key(key) for key in keys]]
+
+    # Strings
+
+    def get(self, session, args):
+        return encode_value(self.client.get_key(args[1]))
+
+    def set(self, session, args):
+        key, value = args[1], args[2]
+        ex = px = None
+        nx = xx = keepttl = get = False
+        options = iter(args[3:])
+        for option in options:
+            option = option.lower()
+            if option in (b"ex", b"px"):
+                amount = next(options, None)
+                if amount is None or ex is not None or px is not None or keepttl:
+                    raise CommandError("ERR syntax error")
+                amount = _integer(amount)
+                if amount <= 0:
+                    raise CommandError("ERR invalid expire time in 'set' command")
+                if option == b"ex":
+                    ex = amount
+                else:
+                    px = amount
+            elif option == b"nx" and not xx:
+                nx = True
+            elif option == b"xx" and not nx:
+                xx = True
+            elif option == b"keepttl" and ex is None and px is None:
+                keepttl = True
+            elif option == b"get":
+                get = True
+            else:
+                raise CommandError("ERR syntax error")
+
+        client = self.client
+        with client._shard(key).lock:
+            old = encode_value(client.get_key(key)) if get or nx or xx else None
+            exists = old is not None
+            if (nx and exists) or (xx and not exists):
+                return old if get else None
+            if keepttl:
+                remaining = client.pttl(key)
+                px = remaining if remaining >= 0 else None
+            client.set_key(key, value, ex=ex, px=px)
+        return old if get else _OK
+
+    def setex(self, session, args):
+        return self.set(session, [b"set", args[1], args[3], b"ex", args[2]])
+
+    def psetex(self, session, args):
+        return self.set(session, [b"set", args[1], args[3], b"px", args[2]])
+
+    def setnx(self, session, args):
+        return int(self.set(session, [b"set", args[1], args[2], b"nx"]) is not None)
+
+    def getdel(self, session, args):
+        key = args[1]
+        with self.client._shard(key).lock:
+            value = self.client.get_key(key)
+            if value is not None:
+                self.client.delete_key(key)
+        return encode_value(value)
+
+    def mget(self, session, args):
+        return [encode_value(value) for value in self.client.mget(args[1:])]
+
+    def mset(self, session, args):
+        if len(args) % 2 == 0:
+            raise CommandError("ERR wrong number of arguments for 'mset' command")
+        self.client.mset(dict(zip(args[1::2], args[2::2])))
+        return _OK
+
+    def delete(self, session, args):
+        return self.client.delete_many(*args[1:])
+
+    def exists(self, session, args):
+        return sum(1 for key in args[1:] if self.client.exists(key))
+
+    def type(self, session, args):
+        return self.client.type(args[1])
+
+    def object(self, session, args):
+        if args[1].lower() != b"encoding":
+            raise CommandError(f"ERR unknown subcommand '{args[1].decode(errors='replace')}'")
+        encoding = self.client.object_encoding(args[2])
+        return encoding.encode() if encoding is not None else None
+
+    def memory(self, session, args):
+        if args[1].lower() != b"usage":
+            raise CommandError(f"ERR unknown subcommand '{args[1].decode(errors='replace')}'")
+        return self.client.memory_usage(args[2])
+
+    def expire(self, session, args):
+        return int(self.client.expire(args[1], _integer(args[2])))
+
+    def pexpire(self, session, args):
+        return int(self.client.expire(args[1], _integer(args[2]) / 1000))
+
+    def persist(self, session, args):
+        return int(self.client.persist(args[1]))
+
+    def ttl(self, session, args):
+        return self.client.ttl(args[1])
+
+    def pttl(self, session, args):
+        return self.client.pttl(args[1])
+
+    def _incr(self, key, amount):
+        client = self.client
+        with client._shard(key).lock:
+            value = client.get_key(key)
+            try:
+                number = int(value) if value is not None else 0
+            except (TypeError, ValueError):
+                raise CommandError("ERR value is not an integer or out of range") from None
+            number += amount
+            # INCR keeps the key's time to live
+            remaining = client.pttl(key)
+            client.set_key(key, b"%d" % number, px=remaining if remaining > 0 else None)
+        return number
+
+    def incr(self, session, args):
+        return self._incr(args[1], 1)
+
+    def decr(self, session, args):
+        return self._incr(args[1], -1)
+
+    def incrby(self, session, args):
+        return self._incr(args[1], _integer(args[2]))
+
+    def decrby(self, session, args):
+        return self._incr(args[1], -_integer(args[2]))
+
+    # Hashes
+
+    def hset(self, session, args):
+        if len(args) % 2:
+            raise CommandError("ERR wrong number of arguments for 'hset' command")
+        return self.client.hset(args[1], mapping=dict(zip(args[2::2], args[3::2])))
+
+    def hmset(self, session, args):
+        self.hset(session, args)
+        return _OK
+
+    def hsetnx(self, session, args):
+        return self.client.hsetnx(args[1], args[2], args[3])
+
+    def hget(self, session, args):
+        return encode_value(self.client.hget(args[1], args[2]))
+
+    def hmget(self, session, args):
+        return [encode_value(value) for value in self.client.hmget(args[1], args[2:])]
+
+    def hgetall(self, session, args):
+        return [encode_value(item) for pair in self.client.hgetall(args[1]).items() for item in pair]
+
+    def hdel(self, session, args):
+        return self.client.hdel(args[1], *args[2:])
+
+    def hlen(self, session, args):
+        return self.client.hlen(args[1])
+
+    def hexists(self, session, args):
+        return int(self.client.hexists(args[1], args[2]))
+
+    def hkeys(self, session, args):
+        return [encode_value(field) for field in self.client.hkeys(args[1])]
+
+    def hvals(self, session, args):
+        return [encode_value(value) for value in self.client.hvals(args[1])]
+
+    def hincrby(self, session, args):
+        try:
+            return self.client.hincrby(args[1], args[2], _integer(args[3]))
+        except ValueError as e:
+            raise CommandError(f"ERR {e}") from None
+
+    # Lists
+
+    def lpush(self, session, args):
+        return self.client.lpush(args[1], *args[2:])
+
+    def rpush(self, session, args):
+        return self.client.rpush(args[1], *args[2:])
+
+    def _pop(self, pop, args):
+        count = _count_option(args, 2)
+        popped = pop(args[1], count)
+        if count is None:
+            return encode_value(popped)
+        return [encode_value(value) for value in popped] if popped else None
+
+    def lpop(self, session, args):
+        return self._pop(self.client.lpop, args)
+
+    def rpop(self, session, args):
+        return self._pop(self.client.rpop, args)
+
+    def llen(self, session, args):
+        return self.client.llen(args[1])
+
+    def lrange(self, session, args):
+        values = self.client.lrange(args[1], _integer(args[2]), _integer(args[3]))
+        return [encode_value(value) for value in values]
+
+    def lindex(self, session, args):
+        return encode_value(self.client.lindex(args[1], _integer(args[2])))
+
+    def lset(self, session, args):
+        try:
+            self.client.lset(args[1], _integer(args[2]), args[3])
+        except IndexError as e:
+            raise CommandError(f"ERR {e}") from None
+        return _OK
+
+    def lrem(self, session, args):
+        return self.client.lrem(args[1], _integer(args[2]), args[3])
+
+    def ltrim(self, session, args):
+        self.client.ltrim(args[1], _integer(args[2]), _integer(args[3]))
+        return _OK
+
+    # Sorted sets
+
+    def zadd(self, session, args):
+        flags = set()
+        position = 2
+        while position < len(args) and args[position].lower() in (
+            b"nx", b"xx", b"gt", b"lt", b"ch", b"incr"
+        ):
+            flags.add(args[position].lower().decode())
+            position += 1
+        pairs = args[position:]
+        if not pairs or len(pairs) % 2:
+            raise CommandError("ERR syntax error")
+        if "nx" in flags and ("xx" in flags or "gt" in flags or "lt" in flags):
+            raise CommandError(
+                "ERR GT, LT, and/or NX options at the same time are not compatible"
+            )
+        mapping = {member: _float(score) for score, member in zip(pairs[::2], pairs[1::2])}
+        key = args[1]
+        if "incr" not in flags:
+            return self.client.zadd(
+                key, mapping, nx="nx" in flags, xx="xx" in flags,
+                gt="gt" in flags, lt="lt" in flags, ch="ch" in flags
+            )
+        if len(mapping) != 1:
+            raise CommandError("ERR INCR option supports a single increment-element pair")
+        (member, amount), = mapping.items()
+        with self.client._shard(key).lock:
+            current = self.client.zscore(key, member)
+            if ("nx" in flags and current is not None) or ("xx" in flags and current is None):
+                return None
+            score = (current or 0.0) + amount
+            if current is not None and (
+                ("gt" in flags and score <= current) or ("lt" in flags and score >= current)
+            ):
+                return None
+            return format_score(self.client.zincrby(key, amount, member))
+
+    def zincrby(self, session, args):
+        return format_score(self.client.zincrby(args[1], _float(args[2]), args[3]))
+
+    def zscore(self, session, args):
+        score = self.client.zscore(args[1], args[2])
+        return format_score(score) if score is not None else None
+
+    def zrem(self, session, args):
+        return self.client.zrem(args[1], *args[2:])
+
+    def zcard(self, session, args):
+        return self.client.zcard(args[1])
+
+    def zrank(self, session, args):
+        return self.client.zrank(args[1], args[2])
+
+    def zrevrank(self, session, args):
+        return self.client.zrevrank(args[1], args[2])
+
+    def _range_options(self, args, start, allowed):
+        """WITHSCORES, REV, BYSCORE and LIMIT options from args[start:]"""
+        options = {"withscores": False, "rev": False, "byscore": False, "limit": (0, None)}
+        position = start
+        while position < len(args):
+            option = args[position].lower().decode(errors="replace")
+            if option not in allowed:
+                raise CommandError("ERR syntax error")
+            if option == "limit":
+                if position + 2 >= len(args):
+                    raise CommandError("ERR syntax error")
+                options["limit"] = (_integer(args[position + 1]), _integer(args[position + 2]))
+                position += 3
+                continue
+            options[option] = True
+            position += 1
+        return options
+
+    def _by_score(self, key, low, high, options, reverse):
+        offset, count = options["limit"]
+        if offset < 0:
+            return []
+        try:
+            if reverse:
+                pairs = self.client.zrevrangebyscore(key, high, low, offset, count, True)
+            else:
+                pairs = self.client.zrangebyscore(key, low, high, offset, count, True)
+        except ValueError as e:
+            raise CommandError(f"ERR {e}") from None
+        return _with_scores(pairs, options["withscores"])
+
+    def zrange(self, session, args):
+        options = self._range_options(args, 4, ("withscores", "rev", "byscore", "limit"))
+        if options["byscore"]:
+            low, high = (args[3], args[2]) if options["rev"] else (args[2], args[3])
+            return self._by_score(args[1], low, high, options, options["rev"])
+        if options["limit"] != (0, None):
+            raise CommandError("ERR syntax error, LIMIT is only supported in combination with BYSCORE")
+        pairs = self.client.zrange(
+            args[1], _integer(args[2]), _integer(args[3]), desc=options["rev"], withscores=True
+        )
+        return _with_scores(pairs, options["withscores"])
+
+    def zrevrange(self, session, args):
+        options = self._range_options(args, 4, ("withscores",))
+        pairs = self.client.zrange(
+            args[1], _integer(args[2]), _integer(args[3]), desc=True, withscores=True
+        )
+        return _with_scores(pairs, options["withscores"])
+
+    def zrangebyscore(self, session, args):
+        options = self._range_options(args, 4, ("withscores", "limit"))
+        return self._by_score(args[1], args[2], args[3], options, False)
+
+    def zrevrangebyscore(self, session, args):
+        options = self._range_options(args, 4, ("withscores", "limit"))
+        return self._by_score(args[1], args[3], args[2], options, True)
+
+    def zcount(self, session, args):
+        try:
+            return self.client.zcount(args[1], args[2], args[3])
+        except ValueError as e:
+            raise CommandError(f"ERR {e}") from None
+
+    def _zpop(self, args, highest):
+        count = _count_option(args, 2)
+        pop = self.client.zpopmax if highest else self.client.zpopmin
+        return _with_scores(pop(args[1], 1 if count is None else count), True)
+
+    def zpopmin(self, session, args):
+        return self._zpop(args, False)
+
+    def zpopmax(self, session, args):
+        return self._zpop(args, True)
+
+    # Streams
+
+    def _maxlen(self, args, position):
+        """MAXLEN [=|~] n at args[position]; returns (maxlen, next position)"""
+        position += 1
+        if position < len(args) and args[position] in (b"=", b"~"):
+            # Trimming is always exact
+            position += 1
+        if position >= len(args):
+            raise CommandError("ERR syntax error")
+        maxlen = _integer(args[position])
+        if maxlen < 0:
+            raise CommandError("ERR The MAXLEN argument must be >= 0.")
+        return maxlen, position + 1
+
+    def xadd(self, session, args):
+        key = args[1]
+        position = 2
+        maxlen = None
+        nomkstream = False
+        while True:
+            option = args[position].lower()
+            if option == b"nomkstream":
+                nomkstream = True
+                position += 1
+            elif option == b"maxlen":
+                maxlen, position = self._maxlen(args, position)
+            else:
+                break
+            if position >= len(args):
+                raise CommandError("ERR syntax error")
+        entry_id = args[position]
+        fields = args[position + 1:]
+        if not fields or len(fields) % 2:
+            raise CommandError("ERR wrong number of arguments for 'xadd' command")
+        if nomkstream and not self.client.exists(key):
+            return None
+        try:
+            return self.client.xadd(
+                key, dict(zip(fields[::2], fields[1::2])), id=entry_id, maxlen=maxlen
+            ).encode()
+        except ValueError as e:
+            raise CommandError(f"ERR {e}") from None
+
+    def xlen(self, session, args):
+        return self.client.xlen(args[1])
+
+    def _xrange(self, args, reverse):
+        count = None
+        if len(args) > 4:
+            if len(args) != 6 or args[4].lower() != b"count":
+                raise CommandError("ERR syntax error")
+            count = _integer(args[5])
+        try:
+            if reverse:
+                entries = self.client.xrevrange(args[1], args[2], args[3], count)
+            else:
+                entries = self.client.xrange(args[1], args[2], args[3], count)
+        except ValueError as e:
+            raise CommandError(f"ERR {e}") from None
+        return _stream_reply(entries)
+
+    def xrange(self, session, args):
+        return self._xrange(args, False)
+
+    def xrevrange(self, session, args):
+        return self._xrange(args, True)
+
+    def xdel(self, session, args):
+        try:
+            return self.client.xdel(args[1], *args[2:])
+        except ValueError as e:
+            raise CommandError(f"ERR {e}") from None
+
+    def xtrim(self, session, args):
+        if args[2].lower() != b"maxlen":
+            raise CommandError("ERR syntax error")
+        maxlen, position = self._maxlen(args, 2)
+        if position != len(args):
+            raise CommandError("ERR syntax error")
+        return self.client.xtrim(args[1], maxlen)
+
+    def xread(self, session, args):
+        count = None
+        position = 1
+        while position < len(args) and args[position].lower() != b"streams":
+            option = args[position].lower()
+            if option == b"count" and position + 1 < len(args):
+                count = _integer(args[position + 1])
+            elif option == b"block":
+                raise CommandError("ERR XREAD BLOCK is not supported")
+            else:
+                raise CommandError("ERR syntax error")
+            position += 2
+        names = args[position + 1:]
+        if position >= len(args) or not names or len(names) % 2:
+            raise CommandError(
+                "ERR Unbalanced 'xread' list of streams: for each stream key an ID or '$' must be specified."
+            )
+        half = len(names) // 2
+        streams = {decode_key(name): last_id for name, last_id in zip(names[:half], names[half:])}
+        try:
+            result = self.client.xread(streams, count)
+        except ValueError as e:
+            raise CommandError(f"ERR {e}") from None
+        return [[encode_key(key), _stream_reply(entries)] for key, entries in result] or None
+
+    # Blocking list pops
+
+    def _blocking_pop(self, session, args, left):
+        keys = args[1:-1]
+        try:
+            timeout = float(args[-1])
+        except ValueError:
+            raise CommandError("ERR timeout is not a float or out of range") from None
+        if timeout < 0:
+            raise CommandError("ERR timeout is negative")
+        popped = self.client._pop_or_wait(keys, left)
+        if popped is not None:
+            return [encode_key(popped[0]), encode_value(popped[1])]
+        if session.in_exec:
+            return None
+        return Deferred(self._wait_pop(keys, timeout, left))
+
+    async def _wait_pop(self, keys, timeout, left):
+        popped = await self.async_client._blocking_pop(keys, timeout, left)
+        if popped is None:
+            return None
+        return [encode_key(popped[0]), encode_value(popped[1])]
+
+    def blpop(self, session, args):
+        return self._blocking_pop(session, args, left=True)
+
+    def brpop(self, session, args):
+        return self._blocking_pop(session, args, left=False)
+
+    # Publish/subscribe
+
+    def publish(self, session, args):
+        received, waiting = self.client._hub.try_publish(decode_key(args[1]), args[2])
+        if not waiting:
+            return received
+        return Deferred(self._finish_publish(received, waiting))
+
+    async def _finish_publish(self, received, waiting):
+        for subscriber, item in waiting:
+            received += await subscriber._aput(item)
+        return received
+
+    def pubsub(self, session, args):
+        subcommand = args[1].lower()
+        hub = self.client._hub
+        if subcommand == b"channels" and len(args) <= 3:
+            pattern = decode_key(args[2]) if len(args) == 3 else None
+            return [encode_key(channel) for channel in hub.channels(pattern)]
+        if subcommand == b"numsub":
+            counts = hub.numsub(*(decode_key(channel) for channel in args[2:]))
+            return [item for channel, count in counts for item in (encode_key(channel), count)]
+        if subcommand == b"numpat" and len(args) == 2:
+            return hub.numpat()
+        raise CommandError(f"ERR unknown subcommand '{args[1].decode(errors='replace')}'")
+
+    def _subscriptions(self, session):
+        if session.in_exec:
+            raise CommandError("ERR Command not allowed inside a transaction")
+        if session.pubsub is None:
+            session.pubsub = AsyncPubSub(
+                self.client._hub, self.pubsub_max_pending, overflow="close"
+            )
+        return session.pubsub
+
+    @staticmethod
+    def _confirm(kind, pubsub, change, names):
+        """One [kind, name, subscription count] reply per name"""
+        replies = Replies()
+        for name in names:
+            change(pubsub, name)
+            replies.append([kind, encode_key(name), len(pubsub.channels) + len(pubsub.patterns)])
+        return replies
+
+    def subscribe(self, session, args):
+        return self._confirm(
+            b"subscribe", self._subscriptions(session), PubSub.subscribe, args[1:]
+        )
+
+    def psubscribe(self, session, args):
+        return self._confirm(
+            b"psubscribe", self._subscriptions(session), PubSub.psubscribe, args[1:]
+        )
+
+    def _unsubscribe(self, session, args, kind, change, subscribed):
+        pubsub = self._subscriptions(session)
+        names = args[1:] or [encode_key(name) for name in subscribed(pubsub)]
+        if not names:
+            return [kind, None, len(pubsub.channels) + len(pubsub.patterns)]
+        return self._confirm(kind, pubsub, change, names)
+
+    def unsubscribe(self, session, args):
+        return self._unsubscribe(
+            session, args, b"unsubscribe", PubSub.unsubscribe, lambda pubsub: pubsub.channels
+        )
+
+    def punsubscribe(self, session, args):
+        return self._unsubscribe(
+            session, args, b"punsubscribe", PubSub.punsubscribe, lambda pubsub: pubsub.patterns
+        )
+
+    # Moving keys
+
+    def dump(self, session, args):
+        return self.client.dump(args[1])
+
+    def restore(self, session, args):
+        ttl = _integer(args[2])
+        if ttl < 0:
+            raise CommandError("ERR Invalid TTL value, must be >= 0")
+        replace = absttl = False
+        for option in args[4:]:
+            option = option.lower()
+            if option == b"replace":
+                replace = True
+            elif option == b"absttl":
+                absttl = True
+            else:
+                raise CommandError("ERR syntax error")
+        if absttl and ttl:
+            ttl = max(1, ttl - int(time.time() * 1000))
+        self.client.restore(args[1], ttl, args[3], replace=replace)
+        return _OK
+
+    def migrate(self, session, args):
+        # MIGRATE host port key|"" db timeout [COPY] [REPLACE] [KEYS key ...]
+        host = args[1].decode()
+        port = _integer(args[2])
+        timeout = _integer(args[5]) / 1000 or None
+        copy = replace = False
+        keys = [args[3]] if args[3] else []
+        for i in range(6, len(args)):
+            option = args[i].lower()
+            if option == b"copy":
+                copy = True
+            elif option == b"replace":
+                replace = True
+            elif option == b"keys" and not args[3]:
+                keys = args[i + 1:]
+                break
+            else:
+                raise CommandError("ERR syntax error")
+        keys = [decode_key(key) for key in keys]
+
+        client = self.client
+        # Like Redis, the node blocks until the target has the keys, so
+        # no write can slip in between copying and deleting them
+        with client._locks_for(keys):
+            moving = []
+            for key in keys:
+                payload = client.dump(key)
+                if payload is not None:
+                    moving.append((key, payload, client.pttl(key)))
+            if not moving:
+                return "NOKEY"
+            requests = []
+            for key, payload, ttl in moving:
+                request = [b"RESTORE-ASKING", encode_key(key), b"%d" % max(ttl, 0), payload]
+                if ttl == 0:
+                    # Expiring this very millisecond; 0 would mean never
+                    request[2] = b"1"
+                if replace:
+                    request.append(b"REPLACE")
+                requests.append(request)
+            try:
+                replies = _call_node(host, port, requests, timeout)
+            except OSError as e:
+                raise CommandError(f"IOERR error or timeout reading to target instance: {e}") from e
+            failed = next((reply for reply in replies if isinstance(reply, CommandError)), None)
+            if not copy:
+                for (key, _, _), reply in zip(moving, replies):
+                    if not isinstance(reply, CommandError):
+                        client.delete_key(key)
+        if failed is not None:
+            raise CommandError(f"ERR Target instance replied with error: {failed}")
+        return _OK
+
+    # Cluster
+
+    def asking(self, session, args):
+        if self.cluster is None:
+            raise CommandError("ERR This instance has cluster support disabled")
+        session.asking = True
+        return _OK
+
+    def readonly(self, session, args):
+        # There are no replicas to read from
+        if self.cluster is None:
+            raise CommandError("ERR This instance has cluster support disabled")
+        return _OK
+
+    def _slot(self, arg):
+        slot = _integer(arg)
+        if not 0 <= slot < HASH_SLOTS:
+            raise CommandError("ERR Invalid or out of range slot")
+        return slot
+
+    def _known_node(self, arg):
+        node_id = arg.decode(errors="replace")
+        if node_id not in self.cluster.nodes:
+            raise CommandError(f"ERR I don't know about node {node_id}")
+        return node_id
+
+    def cluster_command(self, session, args):
+        cluster = self.cluster
+        if cluster is None:
+            raise CommandError("ERR This instance has cluster support disabled")
+        subcommand = args[1].lower()
+        count = len(args)
+        if subcommand == b"myid" and count == 2:
+            return cluster.myid.encode()
+        if subcommand == b"keyslot" and count == 3:
+            return key_slot(args[2])
+        if subcommand == b"info" and count == 2:
+            return "".join(f"{name}:{value}\r\n" for name, value in cluster.info().items()).encode()
+        if subcommand == b"nodes" and count == 2:
+            return "".join(line + "\n" for line in cluster.nodes_lines()).encode()
+        if subcommand == b"slots" and count == 2:
+            return [
+                [first, last, [cluster.nodes[owner][0].encode(), cluster.nodes[owner][1],
+                               owner.encode()]]
+                for first, last, owner in cluster.ranges()
+            ]
+        if subcommand == b"countkeysinslot" and count == 3:
+            return self.client.count_keys_in_slot(self._slot(args[2]))
+        if subcommand == b"getkeysinslot" and count == 4:
+            keys = self.client.keys_in_slot(self._slot(args[2]), _integer(args[3]))
+            return [encode_key(key) for key in keys]
+        if subcommand in (b"addslots", b"addslotsrange") and count > 2:
+            if subcommand == b"addslots":
+                slots = [self._slot(arg) for arg in args[2:]]
+            elif count % 2:
+                raise CommandError("ERR wrong number of arguments for 'cluster|addslotsrange'")
+            else:
+                slots = [
+                    slot for first, last in zip(args[2::2], args[3::2])
+                    for slot in range(self._slot(first), self._slot(last) + 1)
+                ]
+            for slot in slots:
+                if cluster.owners[slot] is not None:
+                    raise CommandError(f"ERR Slot {slot} is already busy")
+            for slot in slots:
+                cluster.assign(slot, cluster.myid)
+            return _OK
+        if subcommand == b"setslot" and count >= 4:
+            return self._setslot(self._slot(args[2]), args[3].lower(), args[4:])
+        if subcommand == b"meet" and count in (4, 5):
+            return self._meet(args[2].decode(), _integer(args[3]))
+        raise CommandError(f"ERR unknown subcommand '{args[1].decode(errors='replace')}'")
+
+    def _setslot(self, slot, action, rest):
+        cluster = self.cluster
+        if action == b"stable" and not rest:
+            cluster.migrating.pop(slot, None)
+            cluster.importing.pop(slot, None)
+            return _OK
+        if len(rest) != 1:
+            raise CommandError("ERR syntax error")
+        node_id = self._known_node(rest[0])
+        owner = cluster.owners[slot]
+        if action == b"migrating":
+            if owner != cluster.myid:
+                raise CommandError(f"ERR I'm not the owner of hash slot {slot}")
+            cluster.migrating[slot] = node_id
+        elif action == b"importing":
+            if owner == cluster.myid:
+                raise CommandError(f"ERR I'm already the owner of hash slot {slot}")
+            cluster.importing[slot] = node_id
+        elif action == b"node":
+            if owner == cluster.myid and node_id != cluster.myid \
+                    and self.client.count_keys_in_slot(slot):
+                raise CommandError(
+                    f"ERR Can't assign hashslot {slot} to a different node while I still "
+                    "hold keys for this hash slot."
+                )
+            cluster.assign(slot, node_id)
+        else:
+            raise CommandError("ERR Invalid CLUSTER SETSLOT action or number of arguments")
+        return _OK
+
+    def _meet(self, host, port):
+        """Learn a node's id and the slots it serves, in place of a gossip handshake"""
+        cluster = self.cluster
+        if (host, port) == cluster.address:
+            return _OK
+        try:
+            (reply,) = _call_node(host, port, [[b"CLUSTER", b"NODES"]], timeout=5)
+        except OSError as e:
+            raise CommandError(f"ERR Unable to reach node {host}:{port}: {e}") from e
+        if isinstance(reply, CommandError):
+            raise reply
+        for node_id, (_, slots, myself) in parse_nodes(reply).items():
+            if myself:
+                cluster.add_node(node_id, host, port)
+                for slot in slots:
+                    if cluster.owners[slot] != cluster.myid:
+                        cluster.assign(slot, node_id)
+        return _OK
+
+
+def _read_reply(reader):
+    """One RESP2 reply from a file-like socket reader; errors come back as CommandError"""
+    line = reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("connection closed by the other node")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        return CommandError(rest.decode(errors="replace"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        return None if length < 0 else reader.read(length + 2)[:-2]
+    if kind == b"*":
+        length = int(rest)
+        return None if length < 0 else [_read_reply(reader) for _ in range(length)]
+    raise ConnectionError(f"unexpected reply from the other node: {line[:32]!r}")
+
+
+def _call_node(host, port, requests, timeout=None):
+    """Send pipelined requests to another server and wait for its replies"""
+    out = []
+    for request in requests:
+        encode(request, out)
+    with socket.create_connection((host, port), timeout) as sock:
+        sock.sendall(b"".join(out))
+        with sock.makefile("rb") as reader:
+            return [_read_reply(reader) for _ in requests]
+
+
+class _Connection(asyncio.Protocol):
+    """
+    One client connection
+
+    Requests are answered in order. A Deferred reply (a blocked BLPOP, a
+    PUBLISH waiting for room) stops reading until it resolves; messages
+    for a subscribed connection are written by a forwarder task.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.table = server.table
+        self.parser = RespParser()
+        self.session = None
+        self.transport = None
+        self._pending = deque()
+        self._blocked = None
+        self._forwarder = None
+        self._write_paused = False
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        server = self.server
+        if len(server.connections) >= server.max_clients:
+            transport.write(b"-ERR max number of clients reached\r\n")
+            transport.close()
+            return
+        server._next_id += 1
+        self.session = Session(server._next_id)
+        server.connections.add(self)
+        transport.set_write_buffer_limits(high=WRITE_HIGH_WATER)
+
+    def connection_lost(self, exc):
+        self.server.connections.discard(self)
+        for task in (self._blocked, self._forwarder):
+            if task is not None:
+                task.cancel()
+        if self.session is not None and self.session.pubsub is not None:
+            self.session.pubsub.close()
+        self._pending.clear()
+
+    def pause_writing(self):
+        # The client is not reading its replies; stop reading its requests
+        self._write_paused = True
+        self._writable.clear()
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self._write_paused = False
+        self._writable.set()
+        if self._blocked is None:
+            self.transport.resume_reading()
+
+    def data_received(self, data):
+        if self.session is None:
+            return
+        try:
+            self.parser.feed(data)
+            self._pending.extend(self.parser.commands())
+        except ProtocolError as e:
+            out = []
+            encode(CommandError(f"ERR Protocol error: {e}"), out)
+            self.transport.write(b"".join(out))
+            self.transport.close()
+            return
+        if self._blocked is None:
+            self._process()
+
+    def _process(self):
+        """Answer pending requests until one has to wait"""
+        out = []
+        session = self.session
+        table = self.table
+        pending = self._pending
+        while pending:
+            args = pending.popleft()
+            try:
+                reply = table.execute(session, args)
+            except CommandError as e:
+                reply = e
+            if isinstance(reply, Deferred):
+                self._blocked = asyncio.ensure_future(self._finish(reply.awaitable))
+                self.transport.pause_reading()
+                break
+            if isinstance(reply, Replies):
+                for item in reply:
+                    encode(item, out)
+            else:
+                encode(reply, out)
+            if session.closing:
+                break
+        if out:
+            self.transport.write(b"".join(out))
+        if session.closing:
+            self.transport.close()
+        elif session.pubsub is not None and session.pubsub.subscribed and self._forwarder is None:
+            self._forwarder = asyncio.ensure_future(self._forward(session.pubsub))
+
+    async def _finish(self, awaitable):
+        try:
+            reply = await awaitable
+        except CommandError as e:
+            reply = e
+        except Exception as e:
+            reply = CommandError(f"ERR {e}")
+        if self.transport.is_closing():
+            return
+        out = []
+        encode(reply, out)
+        self.transport.write(b"".join(out))
+        self._blocked = None
+        if not self._write_paused:
+            self.transport.resume_reading()
+        self._process()
+
+    async def _forward(self, pubsub):
+        """Write messages for the subscriptions until they all end"""
+        try:
+            while True:
+                message = await pubsub.get_message(timeout=None)
+                if message is None:
+                    break
+                if message["type"] == "pmessage":
+                    reply = [b"pmessage", encode_key(message["pattern"])]
+                else:
+                    reply = [b"message"]
+                reply += [encode_key(message["channel"]), encode_value(message["data"])]
+                out = []
+                encode(reply, out)
+                self.transport.write(b"".join(out))
+                if self._write_paused:
+                    await self._writable.wait()
+        finally:
+            self._forwarder = None
+        if pubsub.closed:
+            # Over its pending limit: dropped, like a Redis output buffer overflow
+            self.transport.close()
+
+
+class MockRedisServer:
+    """
+    asyncio RESP2 server for a MockRedisClient
+
+    Use ``await start()`` / ``await close()`` on a running loop, or
+    run_in_thread() / stop() to serve from a background thread of a
+    synchronous program. client defaults to the module-level mock_redis,
+    so network clients share keys with this process. With cluster=True
+    it is a Redis Cluster node that serves no slots until assigned some.
+    """
+
+    def __init__(
+        self, client=None, host="127.0.0.1", port=6379, max_clients=10000, backlog=511,
+        pubsub_max_pending=None, cluster=False
+    ):
+        self.client = client if client is not None else mock_redis
+        self.host = host
+        self.port = port
+        self.max_clients = max_clients
+        self.backlog = backlog
+        self.cluster = ClusterState(host, port) if cluster else None
+        self.table = CommandTable(self.client, self, pubsub_max_pending, self.cluster)
+        self.connections = set()
+        self._next_id = 0
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"redis://{self.host}:{self.port}/0"
+
+    async def start(self):
+        """Start listening; with port 0 the chosen port is stored in port"""
+        self._loop = asyncio.get_running_loop()
+        self._server = await self._loop.create_server(
+            lambda: _Connection(self), self.host, self.port, backlog=self.backlog
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.cluster is not None:
+            self.cluster.set_address(self.host, self.port)
+        return self
+
+    async def close(self):
+        """Stop listening and drop every client connection"""
+        if self._server is None:
+            return
+        self._server.close()
+        for connection in list(self.connections):
+            connection.transport.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    def run_in_thread(self):
+        """Serve from a daemon thread with its own event loop; returns once listening"""
+        import threading
+
+        started = threading.Event()
+        failure = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.start())
+            except BaseException as e:
+                failure.append(e)
+                started.set()
+                loop.close()
+                return
+            started.set()
+            try:
+                loop.run_forever()
+            finally:
+                loop.run_until_complete(self.close())
+                loop.close()
+
+        self._thread = threading.Thread(target=run, name="mock-redis-server", daemon=True)
+        self._thread.start()
+        started.wait()
+        if failure:
+            raise failure[0]
+        return self
+
+    def stop(self, timeout=5):
+        """Stop a server started with run_in_thread"""
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+
+
+def _raise_open_files_limit(wanted):
+    """Let the server hold wanted sockets, as far as the hard limit allows"""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY:
+        wanted = min(wanted, hard)
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the mock Redis store over RESP2")
+    parser.add_argument("--host", default=os.getenv("MOCK_REDIS_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MOCK_REDIS_PORT", "6379")),
+                        help="0 picks a free port")
+    parser.add_argument("--max-clients", type=int, default=10000)
+    parser.add_argument("--maxmemory", type=int, help="bytes; default MOCK_REDIS_MAXMEMORY")
+    parser.add_argument("--policy", help="eviction policy; default MOCK_REDIS_POLICY")
+    parser.add_argument("--data-dir", help="persistence directory; default MOCK_REDIS_DATA_DIR")
+    parser.add_argument("--cluster", action="store_true",
+                        help="run as a Redis Cluster node (see mock_redis_cluster)")
+    args = parser.parse_args(argv)
+
+    _raise_open_files_limit(args.max_clients + 32)
+    client = MockRedisClient(
+        max_memory=args.maxmemory, eviction_policy=args.policy, data_dir=args.data_dir
+    )
+    server = MockRedisServer(
+        client, args.host, args.port, max_clients=args.max_clients, cluster=args.cluster
+    )
+
+    async def serve():
+        import signal
+
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stopping.set)
+        await server.start()
+        print(f"Mock Redis server listening on {server.host}:{server.port}", flush=True)
+        await stopping.wait()
+        await server.close()
+
+    try:
+        asyncio.run(serve())
+    finally:
+        # Flushes the append-only logs when persistence is on
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
+
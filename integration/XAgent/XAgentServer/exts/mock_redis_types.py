@@ -0,0 +1,1050 @@
+"""
+Hash, list, sorted set and stream values for the mock Redis store
+
+Each type starts in a compact encoding and switches to a structure with
+better complexity once it outgrows it, as Redis does:
+
+* hash: fields and values alternating in a Listpack while it has at most
+  HASH_MAX_LISTPACK_ENTRIES fields of at most HASH_MAX_LISTPACK_VALUE
+  bytes, then a dict ("hashtable")
+* list: a Listpack up to LIST_MAX_LISTPACK_SIZE items, then a deque
+  ("quicklist") with O(1) pushes and pops at both ends
+* sorted set: a score array('d') and a member Listpack kept in (score,
+  member) order, then a dict plus an indexable skiplist ("skiplist")
+  with O(log n) updates and rank lookups
+* stream: nodes of up to STREAM_NODE_MAX_ENTRIES entries with the IDs in
+  array('Q') columns and the fields in a Listpack; appends only touch
+  the last node and range reads find their first node by bisection
+
+A Listpack packs its byte strings end to end in one bytearray with an
+array of their lengths, so an element costs its own bytes plus four
+instead of a Python object of 33 bytes or more and a pointer to it.
+Small collections are what sessions mostly hold, and searching a short
+contiguous buffer is about as fast as hashing into a table. Encodings
+are never downgraded.
+
+memory_usage() is kept up to date incrementally so the store can
+account for a collection after every update without walking it.
+Members, fields and values are bytes; the client encodes them before
+they get here.
+"""
+
+import random
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from itertools import accumulate, islice
+
+HASH_MAX_LISTPACK_ENTRIES = 128
+HASH_MAX_LISTPACK_VALUE = 64
+LIST_MAX_LISTPACK_SIZE = 128
+ZSET_MAX_LISTPACK_ENTRIES = 128
+ZSET_MAX_LISTPACK_VALUE = 64
+STREAM_NODE_MAX_ENTRIES = 100
+
+_getsizeof = sys.getsizeof
+
+
+class RedisCollection:
+    """Common interface of the collection types"""
+
+    __slots__ = ()
+
+    # Name reported by TYPE
+    type_name = None
+
+    @property
+    def encoding(self):
+        """Name of the current encoding, as reported by OBJECT ENCODING"""
+        raise NotImplementedError
+
+    def memory_usage(self):
+        """Approximate bytes used by the collection and its elements"""
+        raise NotImplementedError
+
+    def __getstate__(self):
+        raise NotImplementedError
+
+    def __setstate__(self, state):
+        raise NotImplementedError
+
+    def __reduce__(self):
+        # Pickled as plain element lists: a skiplist would recurse node by node
+        return self.__class__, (), self.__getstate__()
+
+    def copy(self):
+        clone = self.__class__()
+        clone.__setstate__(self.__getstate__())
+        return clone
+
+
+def _too_long(element, limit):
+    return isinstance(element, (bytes, str)) and len(element) > limit
+
+
+def _slice_bounds(start, stop, length):
+    """Redis inclusive start/stop indexes, negative from the end, as a range"""
+    if start < 0:
+        start = max(length + start, 0)
+    if stop < 0:
+        stop = length + stop
+    stop = min(stop, length - 1)
+    if start > stop or start >= length:
+        return 0, 0
+    return start, stop + 1
+
+
+class Listpack:
+    """
+    Byte strings packed end to end in one bytearray, with a list-like API
+
+    Lookups by position sum the lengths before it and index() searches
+    the buffer with bytes.find, so both run in C; inserts and deletes
+    move the bytes after them, which is cheap at listpack sizes.
+    """
+
+    __slots__ = ("_data", "_lengths")
+
+    def __init__(self, items=()):
+        self._data = bytearray()
+        self._lengths = array("I")
+        self.extend(items)
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def memory_usage(self):
+        return _getsizeof(self._data) + _getsizeof(self._lengths)
+
+    def _position(self, index):
+        length = len(self._lengths)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("listpack index out of range")
+        return index
+
+    def _start(self, index):
+        return sum(islice(self._lengths, index))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            first, end, step = index.indices(len(self._lengths))
+            if step != 1:
+                return [self[i] for i in range(first, end, step)]
+            offset = self._start(first)
+            data = self._data
+            items = []
+            for length in islice(self._lengths, first, end):
+                items.append(bytes(data[offset:offset + length]))
+                offset += length
+            return items
+        index = self._position(index)
+        start = self._start(index)
+        return bytes(self._data[start:start + self._lengths[index]])
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __setitem__(self, index, item):
+        index = self._position(index)
+        start = self._start(index)
+        self._data[start:start + self._lengths[index]] = item
+        self._lengths[index] = len(item)
+
+    def __delitem__(self, index):
+        index = self._position(index)
+        start = self._start(index)
+        del self._data[start:start + self._lengths[index]]
+        del self._lengths[index]
+
+    def insert(self, index, item):
+        length = len(self._lengths)
+        if index < 0:
+            index = max(length + index, 0)
+        index = min(index, length)
+        start = self._start(index)
+        self._data[start:start] = item
+        self._lengths.insert(index, len(item))
+
+    def append(self, item):
+        self._data += item
+        self._lengths.append(len(item))
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def pop(self, index=-1):
+        item = self[index]
+        del self[index]
+        return item
+
+    def index(self, item, parity=0, step=1):
+        """Position of the first item equal to item among positions parity, parity + step, ..."""
+        lengths = self._lengths
+        size = len(item)
+        if not size:
+            for position in range(parity, len(lengths), step):
+                if not lengths[position]:
+                    return position
+            raise ValueError("item not in listpack")
+        data = self._data
+        found = data.find(item)
+        if found >= 0:
+            starts = [0, *accumulate(lengths)]
+            while found >= 0:
+                # Empty items share their start with the item after them
+                position = bisect_left(starts, found)
+                while position < len(lengths) and starts[position] == found:
+                    if lengths[position] == size and position % step == parity:
+                        return position
+                    position += 1
+                found = data.find(item, found + 1)
+        raise ValueError("item not in listpack")
+
+
+class RedisHash(RedisCollection):
+    """Field-value map"""
+
+    __slots__ = ("_entries", "_table", "_data_bytes")
+
+    type_name = "hash"
+
+    def __init__(self):
+        # field, value, field, value, ...
+        self._entries = Listpack()
+        self._table = None
+        # What the fields and values cost as objects, once in a dict
+        self._data_bytes = 0
+
+    @property
+    def encoding(self):
+        return "listpack" if self._table is None else "hashtable"
+
+    def __len__(self):
+        return len(self._entries) // 2 if self._table is None else len(self._table)
+
+    def memory_usage(self):
+        if self._table is None:
+            return self._entries.memory_usage()
+        return _getsizeof(self._table) + self._data_bytes
+
+    def _find(self, field):
+        """Position of field in the listpack, or -1"""
+        try:
+            return self._entries.index(field, 0, 2)
+        except ValueError:
+            return -1
+
+    def _convert(self):
+        flat = self._entries[:]
+        self._table = dict(zip(flat[::2], flat[1::2]))
+        self._entries = None
+
+    def set(self, mapping):
+        """Set fields from mapping; returns how many were new"""
+        added = 0
+        for field, value in mapping.items():
+            added += self._set(field, value)
+        return added
+
+    def _set(self, field, value):
+        table = self._table
+        if table is None:
+            index = self._find(field)
+            if (
+                (index < 0 and len(self) >= HASH_MAX_LISTPACK_ENTRIES)
+                or _too_long(field, HASH_MAX_LISTPACK_VALUE)
+                or _too_long(value, HASH_MAX_LISTPACK_VALUE)
+            ):
+                self._convert()
+                return self._set(field, value)
+            if index >= 0:
+                old = self._entries[index + 1]
+                self._entries[index + 1] = value
+                self._data_bytes += _getsizeof(value) - _getsizeof(old)
+                return 0
+            self._entries.append(field)
+            self._entries.append(value)
+            self._data_bytes += _getsizeof(field) + _getsizeof(value)
+            return 1
+
+        old = table.get(field)
+        table[field] = value
+        if old is None:
+            self._data_bytes += _getsizeof(field) + _getsizeof(value)
+            return 1
+        self._data_bytes += _getsizeof(value) - _getsizeof(old)
+        return 0
+
+    def setnx(self, field, value):
+        if self.get(field) is not None:
+            return 0
+        return self._set(field, value)
+
+    def get(self, field):
+        if self._table is not None:
+            return self._table.get(field)
+        index = self._find(field)
+        return self._entries[index + 1] if index >= 0 else None
+
+    def delete(self, *fields):
+        """Remove fields; returns how many existed"""
+        removed = 0
+        for field in fields:
+            if self._table is not None:
+                value = self._table.pop(field, None)
+            else:
+                index = self._find(field)
+                if index < 0:
+                    continue
+                value = self._entries.pop(index + 1)
+                del self._entries[index]
+            if value is not None:
+                self._data_bytes -= _getsizeof(field) + _getsizeof(value)
+                removed += 1
+        return removed
+
+    def incrby(self, field, amount):
+        value = self.get(field)
+        try:
+            number = int(value) if value is not None else 0
+        except ValueError:
+            raise ValueError("hash value is not an integer") from None
+        number += amount
+        self._set(field, str(number).encode())
+        return number
+
+    def items(self):
+        if self._table is not None:
+            return list(self._table.items())
+        flat = self._entries[:]
+        return list(zip(flat[::2], flat[1::2]))
+
+    def keys(self):
+        return list(self._table) if self._table is not None else self._entries[::2]
+
+    def values(self):
+        return list(self._table.values()) if self._table is not None else self._entries[1::2]
+
+    def __getstate__(self):
+        return self.items()
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.set(dict(state))
+
+
+class RedisList(RedisCollection):
+    """Sequence with O(1) pushes and pops at both ends once it is a quicklist"""
+
+    __slots__ = ("_items", "_data_bytes")
+
+    type_name = "list"
+
+    def __init__(self):
+        self._items = Listpack()
+        # What the items cost as objects, once in a deque
+        self._data_bytes = 0
+
+    @property
+    def encoding(self):
+        return "listpack" if isinstance(self._items, Listpack) else "quicklist"
+
+    def __len__(self):
+        return len(self._items)
+
+    def memory_usage(self):
+        if isinstance(self._items, Listpack):
+            return self._items.memory_usage()
+        return _getsizeof(self._items) + self._data_bytes
+
+    def _grow(self, count):
+        items = self._items
+        if isinstance(items, Listpack) and len(items) + count > LIST_MAX_LISTPACK_SIZE:
+            self._items = deque(items)
+
+    def lpush(self, *values):
+        self._grow(len(values))
+        items = self._items
+        for value in values:
+            if isinstance(items, Listpack):
+                items.insert(0, value)
+            else:
+                items.appendleft(value)
+            self._data_bytes += _getsizeof(value)
+        return len(items)
+
+    def rpush(self, *values):
+        self._grow(len(values))
+        self._items.extend(values)
+        self._data_bytes += sum(_getsizeof(value) for value in values)
+        return len(self._items)
+
+    def _pop(self, count, left):
+        items = self._items
+        if not items:
+            return None if count is None else []
+        popped = []
+        for _ in range(1 if count is None else min(count, len(items))):
+            if left:
+                value = items.pop(0) if isinstance(items, Listpack) else items.popleft()
+            else:
+                value = items.pop()
+            self._data_bytes -= _getsizeof(value)
+            popped.append(value)
+        return popped[0] if count is None else popped
+
+    def lpop(self, count=None):
+        return self._pop(count, left=True)
+
+    def rpop(self, count=None):
+        return self._pop(count, left=False)
+
+    def range(self, start, stop):
+        """Items from start to stop inclusive, negative indexes from the end"""
+        items = self._items
+        first, end = _slice_bounds(start, stop, len(items))
+        if isinstance(items, Listpack):
+            return items[first:end]
+        if first > len(items) - end:
+            # Nearer the tail: walk in from that end
+            tail = list(islice(reversed(items), len(items) - end, len(items) - first))
+            tail.reverse()
+            return tail
+        return list(islice(items, first, end))
+
+    def index(self, position):
+        items = self._items
+        if position < 0:
+            position += len(items)
+        if not 0 <= position < len(items):
+            return None
+        return items[position]
+
+    def set(self, position, value):
+        items = self._items
+        if position < 0:
+            position += len(items)
+        if not 0 <= position < len(items):
+            raise IndexError("index out of range")
+        self._data_bytes += _getsizeof(value) - _getsizeof(items[position])
+        items[position] = value
+
+    def remove(self, count, value):
+        """Remove up to count occurrences (all when 0, from the tail when negative)"""
+        items = list(self._items)
+        if count < 0:
+            items.reverse()
+        kept = []
+        removed = 0
+        for item in items:
+            if item == value and (count == 0 or removed < abs(count)):
+                removed += 1
+            else:
+                kept.append(item)
+        if count < 0:
+            kept.reverse()
+        if removed:
+            self._replace(kept)
+        return removed
+
+    def trim(self, start, stop):
+        first, end = _slice_bounds(start, stop, len(self._items))
+        self._replace(self.range(first, end - 1) if end else [])
+
+    def _replace(self, items):
+        self._items = Listpack(items) if isinstance(self._items, Listpack) else deque(items)
+        self._data_bytes = sum(_getsizeof(item) for item in items)
+
+    def __getstate__(self):
+        return list(self._items)
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.rpush(*state)
+
+
+class _SkipNode:
+    __slots__ = ("member", "score", "backward", "forward", "span")
+
+    def __init__(self, level, score, member):
+        self.member = member
+        self.score = score
+        self.backward = None
+        self.forward = [None] * level
+        # Elements skipped by each forward pointer, for rank arithmetic
+        self.span = [0] * level
+
+
+class SkipList:
+    """
+    Indexable skiplist ordered by (score, member), as in Redis's zskiplist
+
+    Insert, delete, rank and lookup by rank are O(log n) on average.
+    """
+
+    MAX_LEVEL = 32
+    P = 0.25
+
+    def __init__(self):
+        self.header = _SkipNode(self.MAX_LEVEL, 0.0, None)
+        self.tail = None
+        self.length = 0
+        self.level = 1
+
+    def __len__(self):
+        return self.length
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def _predecessors(self, score, member):
+        """Last node before (score, member) on every level, and their ranks"""
+        update = [self.header] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        node = self.header
+        for i in range(self.level - 1, -1, -1):
+            rank[i] = 0 if i == self.level - 1 else rank[i + 1]
+            following = node.forward[i]
+            while following is not None and (
+                following.score < score
+                or (following.score == score and following.member < member)
+            ):
+                rank[i] += node.span[i]
+                node = following
+                following = node.forward[i]
+            update[i] = node
+        return update, rank
+
+    def insert(self, score, member):
+        update, rank = self._predecessors(score, member)
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                rank[i] = 0
+                update[i] = self.header
+                self.header.span[i] = self.length
+            self.level = level
+        node = _SkipNode(level, score, member)
+        for i in range(level):
+            node.forward[i] = update[i].forward[i]
+            update[i].forward[i] = node
+            node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self.level):
+            update[i].span[i] += 1
+        node.backward = None if update[0] is self.header else update[0]
+        if node.forward[0] is not None:
+            node.forward[0].backward = node
+        else:
+            self.tail = node
+        self.length += 1
+        return node
+
+    def delete(self, score, member):
+        update, _ = self._predecessors(score, member)
+        node = update[0].forward[0]
+        if node is None or node.score != score or node.member != member:
+            return False
+        for i in range(self.level):
+            if update[i].forward[i] is node:
+                update[i].span[i] += node.span[i] - 1
+                update[i].forward[i] = node.forward[i]
+            else:
+                update[i].span[i] -= 1
+        if node.forward[0] is not None:
+            node.forward[0].backward = node.backward
+        else:
+            self.tail = node.backward
+        while self.level > 1 and self.header.forward[self.level - 1] is None:
+            self.level -= 1
+        self.length -= 1
+        return True
+
+    def rank(self, score, member):
+        """0-based rank of (score, member), which must be present"""
+        _, rank = self._predecessors(score, member)
+        return rank[0]
+
+    def count_below(self, score, inclusive):
+        """Elements with a score below score, or at most score if inclusive"""
+        traversed = 0
+        node = self.header
+        for i in range(self.level - 1, -1, -1):
+            following = node.forward[i]
+            while following is not None and (
+                following.score < score or (inclusive and following.score == score)
+            ):
+                traversed += node.span[i]
+                node = following
+                following = node.forward[i]
+        return traversed
+
+    def by_rank(self, rank):
+        """Node at 0-based rank, or None"""
+        target = rank + 1
+        traversed = 0
+        node = self.header
+        for i in range(self.level - 1, -1, -1):
+            while node.forward[i] is not None and traversed + node.span[i] <= target:
+                traversed += node.span[i]
+                node = node.forward[i]
+            if traversed == target:
+                return node
+        return None
+
+
+# One level-1 node with its pointer lists and float score
+_SKIPLIST_NODE_BYTES = (
+    _getsizeof(_SkipNode(1, 0.0, None)) + 2 * _getsizeof([None]) + _getsizeof(0.0)
+)
+
+
+class RedisSortedSet(RedisCollection):
+    """Members ordered by score, ties broken by member"""
+
+    __slots__ = ("_scores", "_members", "_dict", "_skiplist", "_data_bytes")
+
+    type_name = "zset"
+
+    def __init__(self):
+        self._scores = array("d")
+        self._members = Listpack()
+        self._dict = None
+        self._skiplist = None
+        self._data_bytes = 0
+
+    @property
+    def encoding(self):
+        return "listpack" if self._dict is None else "skiplist"
+
+    def __len__(self):
+        return len(self._members) if self._dict is None else len(self._dict)
+
+    def memory_usage(self):
+        if self._dict is None:
+            return _getsizeof(self._scores) + self._members.memory_usage()
+        overhead = _getsizeof(self._dict) + len(self._dict) * _SKIPLIST_NODE_BYTES
+        return overhead + self._data_bytes
+
+    def _convert(self):
+        self._dict = {}
+        self._skiplist = SkipList()
+        for score, member in zip(self._scores, self._members):
+            self._dict[member] = score
+            self._skiplist.insert(score, member)
+        self._scores = self._members = None
+
+    # Encoding primitives
+
+    def score(self, member):
+        if self._dict is not None:
+            return self._dict.get(member)
+        try:
+            return self._scores[self._members.index(member)]
+        except ValueError:
+            return None
+
+    def _insert(self, member, score):
+        if self._dict is None:
+            if len(self._members) >= ZSET_MAX_LISTPACK_ENTRIES or _too_long(
+                member, ZSET_MAX_LISTPACK_VALUE
+            ):
+                self._convert()
+            else:
+                scores, members = self._scores, self._members
+                index = bisect_left(scores, score)
+                end = bisect_right(scores, score, index)
+                while index < end and members[index] < member:
+                    index += 1
+                scores.insert(index, score)
+                members.insert(index, member)
+                return
+        self._dict[member] = score
+        self._skiplist.insert(score, member)
+
+    def _delete(self, member, score):
+        if self._dict is None:
+            index = self._members.index(member)
+            del self._scores[index]
+            del self._members[index]
+        else:
+            del self._dict[member]
+            self._skiplist.delete(score, member)
+
+    def _rank(self, member, score):
+        if self._dict is None:
+            return self._members.index(member)
+        return self._skiplist.rank(score, member)
+
+    def _count_below(self, score, inclusive):
+        if self._dict is None:
+            return (bisect_right if inclusive else bisect_left)(self._scores, score)
+        return self._skiplist.count_below(score, inclusive)
+
+    def _slice(self, start, stop):
+        """(member, score) pairs at ranks start..stop-1"""
+        if start >= stop:
+            return []
+        if self._dict is None:
+            return list(zip(self._members[start:stop], self._scores[start:stop]))
+        pairs = []
+        node = self._skiplist.by_rank(start)
+        for _ in range(stop - start):
+            pairs.append((node.member, node.score))
+            node = node.forward[0]
+        return pairs
+
+    # Sorted set operations
+
+    def add(self, mapping, nx=False, xx=False, gt=False, lt=False, ch=False):
+        """ZADD; returns members added, or added and updated with ch"""
+        added = changed = 0
+        for member, score in mapping.items():
+            score = float(score)
+            current = self.score(member)
+            if current is None:
+                if xx:
+                    continue
+                self._insert(member, score)
+                self._data_bytes += _getsizeof(member)
+                added += 1
+            elif not nx and current != score:
+                if (gt and score <= current) or (lt and score >= current):
+                    continue
+                self._delete(member, current)
+                self._insert(member, score)
+                changed += 1
+        return added + changed if ch else added
+
+    def incrby(self, member, amount):
+        current = self.score(member)
+        score = (current or 0.0) + float(amount)
+        if current is not None:
+            self._delete(member, current)
+        else:
+            self._data_bytes += _getsizeof(member)
+        self._insert(member, score)
+        return score
+
+    def remove(self, *members):
+        removed = 0
+        for member in members:
+            score = self.score(member)
+            if score is not None:
+                self._delete(member, score)
+                self._data_bytes -= _getsizeof(member)
+                removed += 1
+        return removed
+
+    def rank(self, member, reverse=False):
+        score = self.score(member)
+        if score is None:
+            return None
+        rank = self._rank(member, score)
+        return len(self) - 1 - rank if reverse else rank
+
+    def range(self, start, stop, reverse=False):
+        """(member, score) pairs by rank, inclusive, negative from the end"""
+        length = len(self)
+        first, end = _slice_bounds(start, stop, length)
+        if not reverse:
+            return self._slice(first, end)
+        pairs = self._slice(length - end, length - first)
+        pairs.reverse()
+        return pairs
+
+    def range_by_score(
+        self, low, high, low_exclusive=False, high_exclusive=False,
+        reverse=False, offset=0, count=None
+    ):
+        """(member, score) pairs with low <= score <= high, then offset/count"""
+        start = self._count_below(low, inclusive=low_exclusive)
+        stop = self._count_below(high, inclusive=not high_exclusive)
+        if start >= stop:
+            return []
+        if reverse:
+            stop -= offset
+            first = stop - count if count is not None and count >= 0 else start
+            pairs = self._slice(max(first, start), stop)
+            pairs.reverse()
+            return pairs
+        start += offset
+        last = start + count if count is not None and count >= 0 else stop
+        return self._slice(start, min(last, stop))
+
+    def count(self, low, high, low_exclusive=False, high_exclusive=False):
+        start = self._count_below(low, inclusive=low_exclusive)
+        stop = self._count_below(high, inclusive=not high_exclusive)
+        return max(stop - start, 0)
+
+    def pop(self, count=1, highest=False):
+        length = len(self)
+        count = min(count, length)
+        pairs = self._slice(length - count, length) if highest else self._slice(0, count)
+        if highest:
+            pairs.reverse()
+        self.remove(*(member for member, _ in pairs))
+        return pairs
+
+    def __getstate__(self):
+        return self._slice(0, len(self))
+
+    def __setstate__(self, state):
+        self.__init__()
+        if len(state) > ZSET_MAX_LISTPACK_ENTRIES:
+            self._convert()
+        for member, score in state:
+            self._insert(member, score)
+            self._data_bytes += _getsizeof(member)
+
+
+def parse_stream_id(text, missing_seq=0):
+    """(ms, seq) from "ms-seq" or "ms"; missing_seq fills in a bare ms"""
+    if isinstance(text, bytes):
+        text = text.decode()
+    ms, _, seq = text.partition("-")
+    try:
+        return int(ms), int(seq) if seq else missing_seq
+    except ValueError:
+        raise ValueError("Invalid stream ID specified as stream command argument") from None
+
+
+def format_stream_id(entry_id):
+    return f"{entry_id[0]}-{entry_id[1]}"
+
+
+MAX_STREAM_ID = (2 ** 64 - 1, 2 ** 64 - 1)
+
+
+class _StreamNode:
+    __slots__ = ("ms", "seq", "fields", "sizes", "live")
+
+    def __init__(self):
+        self.ms = array("Q")
+        self.seq = array("Q")
+        # Fields and values of all entries, one after another
+        self.fields = Listpack()
+        # Items per entry; 0 marks a deleted entry
+        self.sizes = array("H")
+        self.live = 0
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def append(self, entry_id, fields):
+        self.ms.append(entry_id[0])
+        self.seq.append(entry_id[1])
+        self.fields.extend(fields)
+        self.sizes.append(len(fields))
+        self.live += 1
+
+    def delete(self, position):
+        """Delete the entry at position; returns its fields, or None if already gone"""
+        size = self.sizes[position]
+        if not size:
+            return None
+        start = sum(islice(self.sizes, position))
+        fields = tuple(self.fields[start:start + size])
+        for _ in range(size):
+            del self.fields[start]
+        self.sizes[position] = 0
+        self.live -= 1
+        return fields
+
+    def entries(self, position=0):
+        """(position, entry ID, fields) of live entries from position on"""
+        sizes = self.sizes
+        start = sum(islice(sizes, position))
+        flat = self.fields[start:]
+        offset = 0
+        for position in range(position, len(sizes)):
+            size = sizes[position]
+            if size:
+                entry_id = (self.ms[position], self.seq[position])
+                yield position, entry_id, tuple(flat[offset:offset + size])
+                offset += size
+
+    def first_at_or_after(self, entry_id):
+        """Index of the first entry with an ID >= entry_id"""
+        ms, seq = self.ms, self.seq
+        index = bisect_left(ms, entry_id[0])
+        while index < len(ms) and ms[index] == entry_id[0] and seq[index] < entry_id[1]:
+            index += 1
+        return index
+
+
+_STREAM_NODE_BYTES = (
+    _getsizeof(_StreamNode()) + 2 * _getsizeof(array("Q")) + _getsizeof(array("H"))
+    + Listpack().memory_usage()
+)
+
+
+def _entry_bytes(fields):
+    # Two IDs, an item count, and each item with its length
+    return 18 + sum(len(item) + 4 for item in fields)
+
+
+class RedisStream(RedisCollection):
+    """Append-only log of field-value entries with increasing (ms, seq) IDs"""
+
+    __slots__ = ("_nodes", "_first_ids", "last_id", "length", "_data_bytes")
+
+    type_name = "stream"
+
+    def __init__(self):
+        self._nodes = []
+        # First ID of every node, for bisection
+        self._first_ids = []
+        self.last_id = (0, 0)
+        self.length = 0
+        self._data_bytes = 0
+
+    @property
+    def encoding(self):
+        return "stream"
+
+    def __len__(self):
+        return self.length
+
+    def memory_usage(self):
+        return (
+            _getsizeof(self._nodes) + _getsizeof(self._first_ids)
+            + len(self._nodes) * _STREAM_NODE_BYTES + self._data_bytes
+        )
+
+    def next_id(self, spec, now_ms):
+        """The ID XADD assigns for spec ("*", "ms-*" or an explicit ID)"""
+        if isinstance(spec, bytes):
+            spec = spec.decode()
+        last_ms, last_seq = self.last_id
+        if spec == "*":
+            if now_ms > last_ms:
+                return now_ms, 0
+            return last_ms, last_seq + 1
+        if spec.endswith("-*"):
+            ms = parse_stream_id(spec[:-2])[0]
+            entry_id = (ms, last_seq + 1 if ms == last_ms else 0)
+        else:
+            entry_id = parse_stream_id(spec)
+        if entry_id <= self.last_id:
+            raise ValueError(
+                "The ID specified in XADD is equal or smaller than the target stream top item"
+            )
+        return entry_id
+
+    def add(self, entry_id, fields):
+        """Append an entry; entry_id must come from next_id"""
+        node = self._nodes[-1] if self._nodes else None
+        if node is None or len(node) >= STREAM_NODE_MAX_ENTRIES:
+            node = _StreamNode()
+            self._nodes.append(node)
+            self._first_ids.append(entry_id)
+        fields = tuple(fields)
+        node.append(entry_id, fields)
+        self.last_id = entry_id
+        self.length += 1
+        self._data_bytes += _entry_bytes(fields)
+        return entry_id
+
+    def _drop_node(self, index):
+        del self._nodes[index]
+        del self._first_ids[index]
+
+    def delete(self, *entry_ids):
+        deleted = 0
+        for entry_id in entry_ids:
+            index = bisect_right(self._first_ids, entry_id) - 1
+            if index < 0:
+                continue
+            node = self._nodes[index]
+            position = node.first_at_or_after(entry_id)
+            if position >= len(node) or (node.ms[position], node.seq[position]) != entry_id:
+                continue
+            fields = node.delete(position)
+            if fields is not None:
+                self._data_bytes -= _entry_bytes(fields)
+                self.length -= 1
+                deleted += 1
+                if not node.live:
+                    self._drop_node(index)
+        return deleted
+
+    def trim(self, maxlen):
+        """Drop the oldest entries until at most maxlen remain; returns how many"""
+        removed = 0
+        while self._nodes and self.length - self._nodes[0].live >= maxlen:
+            node = self._nodes[0]
+            self.length -= node.live
+            removed += node.live
+            self._data_bytes -= sum(_entry_bytes(fields) for _, _, fields in node.entries())
+            self._drop_node(0)
+        if self._nodes and self.length > maxlen:
+            node = self._nodes[0]
+            excess = self.length - maxlen
+            positions = [position for position, _, _ in islice(node.entries(), excess)]
+            for position in positions:
+                self._data_bytes -= _entry_bytes(node.delete(position))
+            self.length -= excess
+            removed += excess
+        return removed
+
+    def range(self, start=(0, 0), end=MAX_STREAM_ID, count=None, reverse=False):
+        """(id, fields) for entries with start <= id <= end, oldest first unless reverse"""
+        if count is not None and count <= 0:
+            return []
+        if reverse:
+            return self._range_reverse(start, end, count)
+        entries = []
+        index = max(bisect_right(self._first_ids, start) - 1, 0)
+        for node in self._nodes[index:]:
+            position = node.first_at_or_after(start) if not entries else 0
+            for _, entry_id, fields in node.entries(position):
+                if entry_id > end:
+                    return entries
+                entries.append((entry_id, fields))
+                if count is not None and len(entries) >= count:
+                    return entries
+        return entries
+
+    def _range_reverse(self, start, end, count):
+        entries = []
+        index = bisect_right(self._first_ids, end) - 1
+        for node_index in range(index, -1, -1):
+            node = self._nodes[node_index]
+            for _, entry_id, fields in reversed(list(node.entries())):
+                if entry_id > end:
+                    continue
+                if entry_id < start:
+                    return entries
+                entries.append((entry_id, fields))
+                if count is not None and len(entries) >= count:
+                    return entries
+        return entries
+
+    def after(self, entry_id, count=None):
+        """Entries with an ID greater than entry_id, as XREAD returns them"""
+        ms, seq = entry_id
+        start = (ms, seq + 1) if seq < MAX_STREAM_ID[1] else (ms + 1, 0)
+        return self.range(start, count=count)
+
+    def __getstate__(self):
+        return self.last_id, self.range()
+
+    def __setstate__(self, state):
+        self.__init__()
+        last_id, entries = state
+        for entry_id, fields in entries:
+            self.add(entry_id, fields)
+        self.last_id = last_id
+
+
+COLLECTION_TYPES = {
+    cls.type_name: cls for cls in (RedisHash, RedisList, RedisSortedSet, RedisStream)
+}
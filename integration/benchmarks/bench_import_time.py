@@ -0,0 +1,103 @@
+"""
+Import-time benchmark for the integration modules
+
+Each module is imported in a fresh interpreter under ``python -X
+importtime`` with XAGENT_HOME pointing at a directory that does not
+exist, so an import that touches the XAgent installation fails outright.
+The median cumulative import time is compared with the budget in
+import_time_budget.json, and the modules listed there as deferred must
+not be loaded by the import at all. Exits non-zero on any regression.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+INTEGRATION_DIR = Path(__file__).parent.parent
+DEFAULT_BUDGET = Path(__file__).parent / "import_time_budget.json"
+
+
+def import_once(module, deferred):
+    """Import module in a fresh interpreter; return (ms, deferred modules loaded)"""
+    probe = (
+        f"import json, sys, {module}; "
+        f"print(json.dumps([m for m in {deferred!r} if m in sys.modules]))"
+    )
+    env = dict(os.environ, XAGENT_HOME=os.path.join(tempfile.gettempdir(), "no-such-xagent"))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=INTEGRATION_DIR,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{completed.stderr[-2000:]}")
+
+    cumulative = None
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative = int(parts[1]) / 1000
+    if cumulative is None:
+        raise RuntimeError(f"no importtime record for {module}")
+    return cumulative, json.loads(completed.stdout)
+
+
+def measure(module, deferred, runs):
+    timings = []
+    loaded = []
+    for _ in range(runs):
+        ms, loaded = import_once(module, deferred)
+        timings.append(ms)
+    return {
+        "module": module,
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "deferred_loaded": loaded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--budget", default=str(DEFAULT_BUDGET), help="budget file")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    with open(args.budget) as f:
+        budget = json.load(f)
+    deferred = budget.get("deferred", [])
+
+    results = []
+    failures = []
+    print(f"{'module':<24} {'median ms':>10} {'min ms':>8} {'budget ms':>10}")
+    for module, limit in budget["modules"].items():
+        result = measure(module, deferred, args.runs)
+        result["budget_ms"] = limit
+        results.append(result)
+        print(
+            f"{module:<24} {result['median_ms']:>10.1f} {result['min_ms']:>8.1f} {limit:>10.1f}"
+        )
+        if result["median_ms"] > limit:
+            failures.append(f"{module} took {result['median_ms']:.1f} ms (budget {limit} ms)")
+        if result["deferred_loaded"]:
+            failures.append(f"{module} imports {', '.join(result['deferred_loaded'])} eagerly")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
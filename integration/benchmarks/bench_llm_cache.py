@@ -0,0 +1,133 @@
+"""
+Model calls saved by the LLM cache on a workload of repeated prompts
+
+--tasks tasks run on --concurrency threads. Each makes --steps chat
+completion calls to a fake OpenAI-compatible API (tests/fake_openai.py)
+that takes --latency seconds per call. A --repeat share of the calls are
+planning and reflection prompts drawn from a small shared pool, so
+different tasks send identical requests, often at the same time; the
+rest are unique to their task. The workload runs straight against the
+fake API and then through LLMCacheProxy.
+
+Reported per mode: upstream calls, p50 / p99 call latency and wall
+time; for the proxy also the hit and coalesced counts and the tokens
+and upstream seconds saved.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "tests"))
+
+from fake_openai import FakeOpenAI
+from llm_cache import LLMCacheProxy
+
+SHARED_PROMPTS = [
+    f"{kind} step {n}: review the plan and decide on the next tool call"
+    for kind in ("plan", "reflect") for n in range(8)
+]
+
+
+def _workload(tasks, steps, repeat, seed):
+    """One list of prompts per task; the same every time for a seed"""
+    rng = random.Random(seed)
+    return [
+        [
+            rng.choice(SHARED_PROMPTS) if rng.random() < repeat else f"task {task} step {step}"
+            for step in range(steps)
+        ]
+        for task in range(tasks)
+    ]
+
+
+def _call(base_url, prompt):
+    body = json.dumps({
+        "model": "gpt-4", "temperature": 0.1, "max_tokens": 2000,
+        "messages": [{"role": "user", "content": prompt}],
+    }).encode()
+    request = urllib.request.Request(
+        base_url + "/chat/completions", data=body, headers={"Content-Type": "application/json"}
+    )
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(base_url, workload, concurrency):
+    latencies = []
+    lock = threading.Lock()
+
+    def task(prompts):
+        for prompt in prompts:
+            latency = _call(base_url, prompt)
+            with lock:
+                latencies.append(latency)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(task, workload))
+    return {
+        "wall_s": time.perf_counter() - started,
+        "p50_ms": statistics.median(latencies) * 1e3,
+        "p99_ms": _percentile(latencies, 0.99) * 1e3,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=40)
+    parser.add_argument("--steps", type=int, default=10, help="model calls per task")
+    parser.add_argument("--repeat", type=float, default=0.6,
+                        help="share of calls using a shared prompt")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per upstream call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    workload = _workload(args.tasks, args.steps, args.repeat, args.seed)
+    results = {}
+
+    with FakeOpenAI(latency=args.latency) as upstream:
+        results["direct"] = run(upstream.base_url, workload, args.concurrency)
+        results["direct"]["upstream_calls"] = upstream.calls
+
+    with FakeOpenAI(latency=args.latency) as upstream, LLMCacheProxy(upstream.base_url) as proxy:
+        results["cached"] = run(proxy.base_url, workload, args.concurrency)
+        results["cached"]["upstream_calls"] = upstream.calls
+        stats = proxy.cache.get_stats()
+        results["cached"].update({
+            name: stats[name] for name in ("hits", "coalesced", "saved_tokens", "saved_seconds")
+        })
+
+    print(f"{'mode':<8} {'calls':>6} {'p50 ms':>8} {'p99 ms':>8} {'wall s':>7}")
+    for mode, result in results.items():
+        print(f"{mode:<8} {result['upstream_calls']:>6} {result['p50_ms']:>8.1f} "
+              f"{result['p99_ms']:>8.1f} {result['wall_s']:>7.2f}")
+    cached = results["cached"]
+    print(f"cache: {cached['hits']} hits, {cached['coalesced']} coalesced, "
+          f"{cached['upstream_calls']} upstream calls; saved {cached['saved_tokens']} tokens and "
+          f"{cached['saved_seconds']:.2f} upstream seconds")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
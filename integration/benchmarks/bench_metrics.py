@@ -0,0 +1,94 @@
+"""
+Recording cost of the metrics registry under thread contention
+
+Threads increment a counter and observe a histogram in a tight loop.
+The per-thread sharded metrics from metrics.py are compared with the
+same metrics kept behind one shared lock, which is how a plain
+registry would protect its values.
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from metrics import Counter, Histogram
+
+
+class LockedCounter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class LockedHistogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+
+def measure(counter, histogram, threads, ops):
+    start = threading.Barrier(threads + 1)
+
+    def worker():
+        start.wait()
+        for i in range(ops):
+            counter.inc()
+            histogram.observe(i % 100 / 1000)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    return threads * ops / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", default="1,4,16,64")
+    parser.add_argument("--ops", type=int, default=50000, help="updates per thread")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'threads':>8} {'locked ops/s':>14} {'sharded ops/s':>15} {'correct':>8}")
+    for threads in (int(n) for n in args.threads.split(",")):
+        histogram = Histogram("bench_seconds", "bench")
+        locked = measure(LockedCounter(), LockedHistogram(histogram.buckets), threads, args.ops)
+        counter = Counter("bench", "bench")
+        sharded = measure(counter, histogram, threads, args.ops)
+        correct = counter.value == threads * args.ops == histogram.snapshot()["count"]
+        results.append({
+            "threads": threads,
+            "locked_ops_per_second": locked,
+            "sharded_ops_per_second": sharded,
+            "correct": correct,
+        })
+        print(f"{threads:>8} {locked:>14.0f} {sharded:>15.0f} {str(correct):>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Throughput of a mock Redis cluster as shards are added
+
+For each shard count a LocalCluster is started and --workers client
+processes write and read --keys keys each through redis-py's
+RedisCluster, --batch keys per mset_nonatomic / mget_nonatomic (one
+pipeline per node). Every node is its own process, so throughput grows
+with the shard count until the clients or the host's cores run out.
+
+Reported per shard count: keys per second for writes and reads, and the
+speedup over one shard.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "XAgent" / "XAgentServer" / "exts"))
+
+from mock_redis_cluster import LocalCluster
+
+
+def _worker(addresses, worker, keys, batch, start, results):
+    from redis.cluster import ClusterNode, RedisCluster
+
+    client = RedisCluster(startup_nodes=[ClusterNode(host, port) for host, port in addresses])
+    names = [f"w{worker}:k{n}" for n in range(keys)]
+    payload = "x" * 64
+    start.wait()
+
+    began = time.perf_counter()
+    for offset in range(0, keys, batch):
+        client.mset_nonatomic({name: payload for name in names[offset:offset + batch]})
+    written = time.perf_counter()
+    for offset in range(0, keys, batch):
+        client.mget_nonatomic(names[offset:offset + batch])
+    read = time.perf_counter()
+
+    client.close()
+    results.put((written - began, read - written))
+
+
+def run(shards, workers, keys, batch):
+    with LocalCluster(shards) as cluster:
+        start = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=_worker, args=(cluster.addresses, n, keys, batch, start, results)
+            )
+            for n in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        start.set()
+        timings = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    # The slowest worker bounds the wall time of each phase
+    total = workers * keys
+    return {
+        "write_keys_per_s": total / max(write for write, _ in timings),
+        "read_keys_per_s": total / max(read for _, read in timings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--shards", default="1,2,4", help="comma separated shard counts")
+    parser.add_argument("--workers", type=int, default=4, help="client processes")
+    parser.add_argument("--keys", type=int, default=20000, help="keys per worker")
+    parser.add_argument("--batch", type=int, default=500, help="keys per mset/mget")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.workers} client processes")
+    results = {}
+    for shards in map(int, args.shards.split(",")):
+        results[shards] = run(shards, args.workers, args.keys, args.batch)
+
+    base = next(iter(results.values()))
+    print(f"{'shards':>6} {'write keys/s':>14} {'read keys/s':>14} {'speedup':>8}")
+    for shards, result in results.items():
+        speedup = result["write_keys_per_s"] / base["write_keys_per_s"]
+        print(f"{shards:>6} {result['write_keys_per_s']:>14,.0f} "
+              f"{result['read_keys_per_s']:>14,.0f} {speedup:>7.2f}x")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Event delivery latency of mock Redis pub/sub and BLPOP against polling
+
+A producer thread emits --events events, --interval seconds apart; a
+consumer records how long each took to arrive. Compared:
+
+* pubsub: PUBLISH to a channel the consumer is blocked on
+* blpop: RPUSH onto a list the consumer is blocked on with BLPOP
+* poll: the producer SETs a key, the consumer GETs it every --poll
+  seconds, as a listener without push delivery has to
+
+Reported per mode: p50 / p99 latency in microseconds, the share of
+events the consumer saw and how many store calls it made per event.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "XAgent" / "XAgentServer" / "exts"))
+
+from mock_redis import MockRedisClient
+
+
+def _produce(emit, events, interval):
+    for n in range(events):
+        time.sleep(interval)
+        emit(n, time.perf_counter())
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_pubsub(client, events, interval, poll):
+    pubsub = client.pubsub()
+    pubsub.subscribe("events")
+    producer = threading.Thread(
+        target=_produce, args=(lambda n, at: client.publish("events", at), events, interval)
+    )
+    producer.start()
+    latencies = []
+    calls = 0
+    while len(latencies) < events:
+        message = pubsub.get_message(timeout=None)
+        calls += 1
+        latencies.append(time.perf_counter() - message["data"])
+    producer.join()
+    pubsub.close()
+    return latencies, calls
+
+
+def run_blpop(client, events, interval, poll):
+    producer = threading.Thread(
+        target=_produce, args=(lambda n, at: client.rpush("jobs", repr(at)), events, interval)
+    )
+    producer.start()
+    latencies = []
+    calls = 0
+    while len(latencies) < events:
+        _, value = client.blpop("jobs")
+        calls += 1
+        latencies.append(time.perf_counter() - float(value))
+    producer.join()
+    return latencies, calls
+
+
+def run_poll(client, events, interval, poll):
+    producer = threading.Thread(
+        target=_produce,
+        args=(lambda n, at: client.set_key("progress", json.dumps([n, at])), events, interval)
+    )
+    producer.start()
+    latencies = []
+    calls = 0
+    seen = -1
+    # Events overwritten between two polls are never seen at all
+    while seen < events - 1:
+        value = client.get_key("progress")
+        calls += 1
+        if value is not None:
+            n, at = json.loads(value)
+            if n != seen:
+                seen = n
+                latencies.append(time.perf_counter() - at)
+                continue
+        time.sleep(poll)
+    producer.join()
+    return latencies, calls
+
+
+MODES = {"pubsub": run_pubsub, "blpop": run_blpop, "poll": run_poll}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=0.005,
+                        help="seconds between events")
+    parser.add_argument("--poll", type=float, default=0.01, help="polling period in seconds")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for mode, run in MODES.items():
+        client = MockRedisClient(sweep_interval=0)
+        latencies, calls = run(client, args.events, args.interval, args.poll)
+        results[mode] = {
+            "p50_us": statistics.median(latencies) * 1e6,
+            "p99_us": _percentile(latencies, 0.99) * 1e6,
+            "seen": len(latencies) / args.events,
+            "calls_per_event": calls / args.events,
+        }
+
+    print(f"{'mode':<8} {'p50 us':>10} {'p99 us':>10} {'seen':>6} {'calls/event':>12}")
+    for mode, run in results.items():
+        print(f"{mode:<8} {run['p50_us']:>10.1f} {run['p99_us']:>10.1f} {run['seen']:>6.0%} "
+              f"{run['calls_per_event']:>12.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
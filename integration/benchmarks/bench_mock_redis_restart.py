@@ -0,0 +1,94 @@
+"""
+Restart-time benchmark for the persistent mock Redis store
+
+For each key count the store is filled, snapshotted and reopened, and
+the time to reload it is measured. The same data is also reloaded from
+the append-only logs alone to show what the snapshot saves.
+"""
+
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "XAgent" / "XAgentServer" / "exts"))
+
+from mock_redis import MockRedisClient
+
+
+def fill(client, count, value_size):
+    value = "x" * value_size
+    batch = {}
+    for i in range(count):
+        batch[f"session:{i}"] = value
+        if len(batch) == 10000:
+            client.mset(batch)
+            batch = {}
+    if batch:
+        client.mset(batch)
+
+
+def measure(count, value_size, shards):
+    """Return snapshot and log-only reload timings for count keys"""
+    snapshot_dir = tempfile.mkdtemp(prefix="mock_redis_rdb_")
+    log_dir = tempfile.mkdtemp(prefix="mock_redis_aof_")
+    try:
+        for data_dir, snapshot in ((snapshot_dir, True), (log_dir, False)):
+            client = MockRedisClient(
+                sweep_interval=0, shards=shards, data_dir=data_dir, snapshot_interval=0
+            )
+            fill(client, count, value_size)
+            if snapshot:
+                client.save()
+            client.close()
+
+        started = time.perf_counter()
+        from_snapshot = MockRedisClient(
+            sweep_interval=0, shards=shards, data_dir=snapshot_dir, snapshot_interval=0
+        )
+        snapshot_seconds = time.perf_counter() - started
+        assert from_snapshot.dbsize() == count
+        from_snapshot.close()
+
+        started = time.perf_counter()
+        from_log = MockRedisClient(
+            sweep_interval=0, shards=shards, data_dir=log_dir, snapshot_interval=0
+        )
+        log_seconds = time.perf_counter() - started
+        assert from_log.dbsize() == count
+        from_log.close()
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+    return {"keys": count, "snapshot_load_seconds": snapshot_seconds, "log_replay_seconds": log_seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--keys", default="10000,100000,1000000")
+    parser.add_argument("--value-size", type=int, default=64)
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'keys':>10} {'snapshot load ms':>18} {'log replay ms':>15}")
+    for count in (int(n) for n in args.keys.split(",")):
+        result = measure(count, args.value_size, args.shards)
+        results.append(result)
+        print(
+            f"{count:>10,} {result['snapshot_load_seconds'] * 1000:>18.1f} "
+            f"{result['log_replay_seconds'] * 1000:>15.1f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Mock Redis over RESP2 compared with in-process access
+
+Starts mock_redis_server.py in a child process and measures the same
+get/set workload (one set per three gets) as:
+
+* in-process: MockRedisClient method calls in this process
+* sequential: one redis-py connection, one round trip per command
+* pipelined: one redis-py connection, --batch commands per round trip
+* concurrent: --connections redis.asyncio clients at once, reporting
+  aggregate throughput and per-command latency
+
+The network numbers include redis-py's own cost, which dominates on a
+small machine; they show what a worker process sharing the store pays,
+not the server's limit.
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+EXTS = Path(__file__).parent.parent / "XAgent" / "XAgentServer" / "exts"
+sys.path.insert(0, str(EXTS))
+
+import redis
+import redis.asyncio
+
+from mock_redis import MockRedisClient
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def start_server(max_clients):
+    """Run the server in a child process; return it and its port"""
+    process = subprocess.Popen(
+        [sys.executable, str(EXTS / "mock_redis_server.py"), "--port", "0",
+         "--max-clients", str(max_clients)],
+        stdout=subprocess.PIPE, text=True
+    )
+    for line in process.stdout:
+        if line.startswith("Mock Redis server listening on"):
+            return process, int(line.rsplit(":", 1)[1])
+    raise RuntimeError("mock Redis server did not start")
+
+
+def _ops(count, keyspace):
+    return [(i % 4 == 0, f"key:{i % keyspace}") for i in range(count)]
+
+
+def bench_in_process(ops):
+    client = MockRedisClient(sweep_interval=0)
+    started = time.perf_counter()
+    for is_set, key in ops:
+        if is_set:
+            client.set_key(key, b"value")
+        else:
+            client.get_key(key)
+    return len(ops) / (time.perf_counter() - started)
+
+
+def bench_sequential(port, ops):
+    r = redis.Redis(port=port)
+    try:
+        started = time.perf_counter()
+        for is_set, key in ops:
+            if is_set:
+                r.set(key, b"value")
+            else:
+                r.get(key)
+        return len(ops) / (time.perf_counter() - started)
+    finally:
+        r.close()
+
+
+def bench_pipelined(port, ops, batch):
+    r = redis.Redis(port=port)
+    try:
+        started = time.perf_counter()
+        for start in range(0, len(ops), batch):
+            pipe = r.pipeline(transaction=False)
+            for is_set, key in ops[start:start + batch]:
+                if is_set:
+                    pipe.set(key, b"value")
+                else:
+                    pipe.get(key)
+            pipe.execute()
+        return len(ops) / (time.perf_counter() - started)
+    finally:
+        r.close()
+
+
+async def bench_concurrent(port, ops, connections):
+    clients = [
+        redis.asyncio.Redis(port=port, single_connection_client=True) for _ in range(connections)
+    ]
+    await asyncio.gather(*(c.ping() for c in clients))
+    latencies = []
+    per_client = len(ops) // connections
+
+    async def work(n, c):
+        for is_set, key in ops[n * per_client:(n + 1) * per_client]:
+            call_started = time.perf_counter()
+            if is_set:
+                await c.set(key, b"value")
+            else:
+                await c.get(key)
+            latencies.append(time.perf_counter() - call_started)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(work(n, c) for n, c in enumerate(clients)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await asyncio.gather(*(c.aclose() for c in clients))
+    return {
+        "ops_per_second": len(latencies) / elapsed,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=100, help="commands per pipeline")
+    parser.add_argument("--connections", default="10,100,1000")
+    parser.add_argument("--keyspace", type=int, default=10000)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    ops = _ops(args.ops, args.keyspace)
+    connection_counts = [int(n) for n in args.connections.split(",")]
+    results = {"ops": args.ops, "in_process_ops_per_second": bench_in_process(ops)}
+
+    process, port = start_server(max(connection_counts) + 10)
+    try:
+        results["sequential_ops_per_second"] = bench_sequential(port, ops)
+        results["pipelined_ops_per_second"] = bench_pipelined(port, ops, args.batch)
+        results["concurrent"] = {
+            str(n): asyncio.run(bench_concurrent(port, ops, n)) for n in connection_counts
+        }
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(f"{'mode':<28} {'ops/s':>12} {'p50 ms':>8} {'p99 ms':>8}")
+    print(f"{'in-process':<28} {results['in_process_ops_per_second']:>12,.0f}")
+    print(f"{'sequential':<28} {results['sequential_ops_per_second']:>12,.0f}")
+    print(f"{f'pipelined (batch {args.batch})':<28} {results['pipelined_ops_per_second']:>12,.0f}")
+    for n, run in results["concurrent"].items():
+        print(f"{f'{n} connections':<28} {run['ops_per_second']:>12,.0f} "
+              f"{run['p50_ms']:>8.2f} {run['p99_ms']:>8.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
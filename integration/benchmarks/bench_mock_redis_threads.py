@@ -0,0 +1,72 @@
+"""
+Multi-threaded throughput benchmark for MockRedisClient
+
+Runs a mixed get/set workload from 1..N threads against a single-lock
+store (shards=1) and a lock-striped store, and reports operations per
+second. On a GIL build the striped store mainly avoids lock convoys;
+on a free-threaded build it is what lets throughput scale with threads.
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "XAgent" / "XAgentServer" / "exts"))
+
+from mock_redis import MockRedisClient
+
+
+def run_workload(client, threads, ops_per_thread, keyspace=10000):
+    """Return operations per second for the given thread count"""
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(thread_id):
+        barrier.wait()
+        for i in range(ops_per_thread):
+            key = f"key:{(thread_id * 7919 + i) % keyspace}"
+            if i % 4 == 0:
+                client.set_key(key, i)
+            else:
+                client.get_key(key)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return threads * ops_per_thread / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", default="1,2,4,8")
+    parser.add_argument("--ops", type=int, default=50000, help="operations per thread")
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    thread_counts = [int(n) for n in args.threads.split(",")]
+    results = {"gil_enabled": getattr(sys, "_is_gil_enabled", lambda: True)(), "runs": []}
+
+    print(f"{'threads':>8} {'shards=1 ops/s':>16} {f'shards={args.shards} ops/s':>18}")
+    for threads in thread_counts:
+        single = run_workload(MockRedisClient(shards=1, sweep_interval=0), threads, args.ops)
+        striped = run_workload(
+            MockRedisClient(shards=args.shards, sweep_interval=0), threads, args.ops
+        )
+        results["runs"].append({"threads": threads, "single_lock": single, "striped": striped})
+        print(f"{threads:>8} {single:>16,.0f} {striped:>18,.0f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Memory and update cost of the mock Redis collection types
+
+For hashes, lists, sorted sets and streams of --small and --large
+elements, measures:
+
+* memory per key: bytes allocated (tracemalloc) per key across --keys
+  keys, next to MEMORY USAGE as the store accounts it and to the same
+  data kept as a JSON string per key
+* partial update: one field, element or member changed in place,
+  against reading, decoding, changing, encoding and writing back the
+  JSON blob
+
+Small collections use the compact listpack encodings, large ones the
+hash table, deque and skiplist, so the two sizes show both.
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "XAgent" / "XAgentServer" / "exts"))
+
+from mock_redis import MockRedisClient
+
+
+def _fill(client, kind, key, size):
+    if kind == "hash":
+        client.hset(key, mapping={f"field:{i}": f"value:{i}" for i in range(size)})
+    elif kind == "list":
+        client.rpush(key, *(f"value:{i}" for i in range(size)))
+    elif kind == "zset":
+        client.zadd(key, {f"member:{i}": i for i in range(size)})
+    else:
+        for i in range(size):
+            client.xadd(key, {"value": i}, id=f"1-{i + 1}")
+
+
+def _blob(kind, size):
+    if kind == "hash":
+        return {f"field:{i}": f"value:{i}" for i in range(size)}
+    if kind == "zset":
+        return [[f"member:{i}", i] for i in range(size)]
+    if kind == "stream":
+        return [[f"1-{i + 1}", {"value": str(i)}] for i in range(size)]
+    return [f"value:{i}" for i in range(size)]
+
+
+def _update(client, kind, key, n):
+    """One O(1) or O(log n) change to the collection"""
+    if kind == "hash":
+        client.hset(key, "field:0", f"value:{n}")
+    elif kind == "list":
+        client.rpush(key, n)
+        client.lpop(key)
+    elif kind == "zset":
+        client.zincrby(key, 1, "member:0")
+    else:
+        client.xadd(key, {"value": n}, maxlen=None)
+
+
+def _update_blob(client, kind, key, n):
+    """The same change made by rewriting a JSON value"""
+    data = json.loads(client.get_key(key))
+    if kind == "hash":
+        data["field:0"] = f"value:{n}"
+    elif kind == "list":
+        data.append(str(n))
+        data.pop(0)
+    elif kind == "zset":
+        data[0][1] += 1
+        data.sort(key=lambda pair: (pair[1], pair[0]))
+    else:
+        data.append([f"2-{n}", {"value": str(n)}])
+    client.set_key(key, json.dumps(data))
+
+
+def measure_memory(kind, size, keys):
+    """Bytes per key: allocated natively, accounted by the store, and as JSON"""
+    client = MockRedisClient(sweep_interval=0)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for k in range(keys):
+        _fill(client, kind, f"{kind}:{k}", size)
+    native = (tracemalloc.get_traced_memory()[0] - before) / keys
+
+    blob_client = MockRedisClient(sweep_interval=0)
+    text = json.dumps(_blob(kind, size))
+    before = tracemalloc.get_traced_memory()[0]
+    for k in range(keys):
+        # A fresh string per key, as each would be after a read-modify-write
+        blob_client.set_key(f"{kind}:{k}", text.encode().decode())
+    blob = (tracemalloc.get_traced_memory()[0] - before) / keys
+    tracemalloc.stop()
+    return {
+        "encoding": client.object_encoding(f"{kind}:0"),
+        "native_bytes": native,
+        "memory_usage_bytes": client.memory_usage(f"{kind}:0"),
+        "json_bytes": blob,
+    }
+
+
+def measure_updates(kind, size, updates):
+    """Microseconds per partial update, in place and as a JSON rewrite"""
+    client = MockRedisClient(sweep_interval=0)
+    _fill(client, kind, "native", size)
+    client.set_key("blob", json.dumps(_blob(kind, size)))
+
+    started = time.perf_counter()
+    for n in range(updates):
+        _update(client, kind, "native", n)
+    native = (time.perf_counter() - started) / updates
+    started = time.perf_counter()
+    for n in range(updates):
+        _update_blob(client, kind, "blob", n)
+    blob = (time.perf_counter() - started) / updates
+    return {"native_us": native * 1e6, "json_us": blob * 1e6, "speedup": blob / native}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--small", type=int, default=16, help="elements per small collection")
+    parser.add_argument("--large", type=int, default=5000, help="elements per large collection")
+    parser.add_argument("--keys", type=int, default=200, help="keys per memory measurement")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for kind in ("hash", "list", "zset", "stream"):
+        for label, size in (("small", args.small), ("large", args.large)):
+            keys = max(1, args.keys * args.small // size)
+            results[f"{kind}_{label}"] = {
+                "elements": size,
+                **measure_memory(kind, size, keys),
+                **measure_updates(kind, size, args.updates),
+            }
+
+    print(f"{'type':<14} {'encoding':<10} {'bytes/key':>11} {'MEMORY USAGE':>13} "
+          f"{'JSON bytes':>11} {'update us':>10} {'JSON us':>9} {'speedup':>8}")
+    for name, run in results.items():
+        print(f"{name:<14} {run['encoding']:<10} {run['native_bytes']:>11,.0f} "
+              f"{run['memory_usage_bytes']:>13,} {run['json_bytes']:>11,.0f} "
+              f"{run['native_us']:>10.2f} {run['json_us']:>9.1f} {run['speedup']:>7.0f}x")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Output parser benchmark: legacy log parsing vs framed results
+
+Synthetic run.py outputs of increasing size (log lines with a JSON step
+every tenth line and a JSON answer near the end) are written to a file,
+standing in for the stdout pipe, and the answer is recovered with:
+
+* split: the original approach, reading the whole output, splitting it
+  into a list of lines and scanning it backwards
+* streaming: StreamingOutputParser fed one line at a time (legacy mode)
+* framed: the answer read from a length-prefixed result record, without
+  looking at the log
+
+For an output that is already in memory, split is also compared with
+parse_output_text, which scans backwards from the end without splitting.
+Times are the best of --repeat runs; peak memory is measured separately
+with tracemalloc.
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from result_channel import (
+    StreamingOutputParser, encode_record, parse_output_text, read_result_file
+)
+
+
+def make_output(size_mb):
+    lines = []
+    size = 0
+    i = 0
+    while size < size_mb * 1024 * 1024:
+        if i % 10 == 0:
+            line = json.dumps({"step": i, "thought": "considering the next tool call " * 3})
+        else:
+            line = f"2024-01-01 12:00:00 INFO subtask {i}: tool output " + "x" * 80
+        lines.append(line)
+        size += len(line) + 1
+        i += 1
+    answer = {"answer": "Paris", "steps": ["plan", "search", "answer"]}
+    lines.append(json.dumps(answer))
+    # A JSON object that is not the answer follows it in some real logs
+    lines.append("Run finished")
+    return "\n".join(lines), answer
+
+
+def parse_split(output):
+    lines = output.strip().split("\n")
+    for line in reversed(lines):
+        line = line.strip()
+        if line.startswith("{") and line.endswith("}"):
+            try:
+                return json.loads(line).get("answer")
+            except json.JSONDecodeError:
+                continue
+    return None
+
+
+def read_and_split(log_file):
+    log_file.seek(0)
+    return parse_split(log_file.read())
+
+
+def parse_streaming(log_file):
+    log_file.seek(0)
+    parser = StreamingOutputParser()
+    for line in log_file:
+        parser.feed(line)
+    return parser.result()["answer"]
+
+
+def parse_tail(output):
+    return parse_output_text(output.strip())["answer"]
+
+
+def parse_framed(result_file):
+    return read_result_file(result_file)["answer"]
+
+
+def best_time(fn, arg, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def peak_memory(fn, arg):
+    tracemalloc.start()
+    try:
+        fn(arg)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(size_mb, repeat):
+    output, answer = make_output(size_mb)
+    log_file = tempfile.TemporaryFile("w+")
+    log_file.write(output)
+    result_file = tempfile.TemporaryFile()
+    result_file.write(encode_record(answer))
+
+    methods = {
+        "split": (read_and_split, log_file),
+        "streaming": (parse_streaming, log_file),
+        "framed": (parse_framed, result_file),
+        "memory_split": (parse_split, output),
+        "memory_tail": (parse_tail, output),
+    }
+    result = {"size_mb": size_mb}
+    for name, (fn, arg) in methods.items():
+        assert fn(arg) == "Paris", name
+        result[f"{name}_ms"] = best_time(fn, arg, repeat) * 1000
+        result[f"{name}_peak_kb"] = peak_memory(fn, arg) / 1024
+    log_file.close()
+    result_file.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1,10,50", help="output sizes in MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    names = ["split", "streaming", "framed", "memory_split", "memory_tail"]
+    print(f"{'MB':>5}" + "".join(f" {name + ' ms':>16}" for name in names))
+    print(f"{'':>5}" + "".join(f" {name + ' KB':>16}" for name in names))
+    for size_mb in (int(n) for n in args.sizes.split(",")):
+        r = measure(size_mb, args.repeat)
+        results.append(r)
+        print(f"{size_mb:>5}" + "".join(f" {r[name + '_ms']:>16.3f}" for name in names))
+        print(f"{'':>5}" + "".join(f" {r[name + '_peak_kb']:>16.1f}" for name in names))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
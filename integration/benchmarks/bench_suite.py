@@ -0,0 +1,316 @@
+"""
+Benchmark suite for the integration hot paths
+
+Everything runs against the stub run.py from stub_xagent.py, so no
+XAgent installation, network or LLM is needed:
+
+* wrapper: XAgentWrapper.run throughput and latency at each --concurrency
+  level for each of --modes: the worker pool, a fresh run.py process per
+  call and the in-process engine; --latency-ms, --output-bytes and
+  --failure-rate configure the stub
+* spawn: median per-call cost with a stub that returns at once, as a bare
+  ``python run.py`` process and through run_xagent on each engine
+* parse: _parse_xagent_output on outputs of each --parse-sizes size
+* mock_redis: MockRedisClient set/get/delete operations per second
+
+The suite runs --rounds times and keeps each metric's best value, since
+a single round on a shared machine can easily be off by 30%. Results are
+written with --json. With --baseline they are compared with a stored
+result file and the run exits non-zero when a metric is worse than the
+baseline by more than --threshold percent; --save-baseline writes the
+current results as the new baseline. suite_baseline.json is only
+meaningful on the machine that produced it, so save a fresh one before
+comparing elsewhere.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "XAgent" / "XAgentServer" / "exts"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from stub_xagent import make_stub_xagent_home
+
+os.environ.setdefault("XAGENT_HOME", str(make_stub_xagent_home()))
+os.environ["XAGENT_CONFIG_POLL"] = "0"
+
+import langchain_replacement
+from mock_redis import MockRedisClient
+from scheduler import TaskScheduler
+from xagent_integration import XAgentIntegration
+
+DEFAULT_BASELINE = Path(__file__).parent / "suite_baseline.json"
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def _metric(value, better):
+    return {"value": value, "better": better}
+
+
+async def _drive(agent, concurrency, calls):
+    """Run calls through agent from concurrency callers; return latencies and errors"""
+    latencies = []
+    errors = 0
+    tasks = iter(range(calls))
+
+    async def caller():
+        nonlocal errors
+        for i in tasks:
+            started = time.perf_counter()
+            response = await agent.run(f"bench task {i}", use_cache=False)
+            latencies.append(time.perf_counter() - started)
+            errors += not response.success
+
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def _use_home(home):
+    """Make home's XAgent package the one the in-process engine imports"""
+    for name in [name for name in sys.modules if name.split(".")[0] == "XAgent"]:
+        del sys.modules[name]
+    sys.path[:] = [str(home)] + [path for path in sys.path if path != str(home)]
+
+
+def bench_wrapper(home, mode, concurrency, calls):
+    """XAgentWrapper.run end to end with concurrency callers"""
+    _use_home(home)
+    integration = XAgentIntegration(xagent_home=str(home), engine=mode, pool_size=concurrency)
+    original = langchain_replacement.xagent_integration, langchain_replacement.task_scheduler
+    langchain_replacement.xagent_integration = integration
+    langchain_replacement.task_scheduler = TaskScheduler(
+        max_concurrency=concurrency, max_queue_size=concurrency
+    )
+    try:
+        agent = langchain_replacement.XAgentWrapper()
+        # Warm up: starts the pool workers, which is not what is measured
+        asyncio.run(_drive(agent, concurrency, concurrency))
+        started = time.perf_counter()
+        latencies, errors = asyncio.run(_drive(agent, concurrency, calls))
+        elapsed = time.perf_counter() - started
+    finally:
+        integration.close()
+        langchain_replacement.xagent_integration, langchain_replacement.task_scheduler = original
+
+    prefix = f"wrapper.{mode}.c{concurrency}"
+    return {
+        f"{prefix}.calls_per_second": _metric(calls / elapsed, "higher"),
+        f"{prefix}.p50_ms": _metric(_percentile(latencies, 50) * 1000, "lower"),
+        f"{prefix}.p99_ms": _metric(_percentile(latencies, 99) * 1000, "lower"),
+        f"{prefix}.errors": _metric(errors, "info"),
+    }
+
+
+def bench_spawn(home, calls):
+    """Per-call cost of a run.py that does nothing"""
+    run_py = str(home / "run.py")
+    bare_latencies = []
+    for i in range(calls):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, run_py, "--task", f"bare {i}"],
+            cwd=home, stdout=subprocess.DEVNULL, check=True
+        )
+        bare_latencies.append(time.perf_counter() - started)
+    bare = statistics.median(bare_latencies)
+
+    results = {"spawn.bare_process_ms": _metric(bare * 1000, "lower")}
+    _use_home(home)
+    for mode in ("subprocess", "pool", "inprocess"):
+        integration = XAgentIntegration(xagent_home=str(home), engine=mode, pool_size=1)
+        try:
+            asyncio.run(integration.run_xagent("warm up"))
+            latencies = []
+            for i in range(calls):
+                call_started = time.perf_counter()
+                asyncio.run(integration.run_xagent(f"spawn {i}"))
+                latencies.append(time.perf_counter() - call_started)
+        finally:
+            integration.close()
+        results[f"spawn.{mode}_call_ms"] = _metric(statistics.median(latencies) * 1000, "lower")
+
+    results["spawn.wrapper_overhead_ms"] = _metric(
+        results["spawn.subprocess_call_ms"]["value"] - bare * 1000, "info"
+    )
+    # Per-call time the in-process engine saves over the other two
+    for mode in ("subprocess", "pool"):
+        results[f"spawn.inprocess_saves_vs_{mode}_ms"] = _metric(
+            results[f"spawn.{mode}_call_ms"]["value"] - results["spawn.inprocess_call_ms"]["value"],
+            "info"
+        )
+    return results
+
+
+def make_output(size):
+    """Log lines like the stub's followed by the JSON answer"""
+    line = "INFO stub tool output " + "x" * 100
+    answer = json.dumps({"answer": "done", "steps": ["plan", "act"]})
+    return "\n".join([line] * max(size // (len(line) + 1), 0) + [answer])
+
+
+def bench_parse(home, sizes, repeat):
+    """_parse_xagent_output cost for each output size"""
+    integration = XAgentIntegration(xagent_home=str(home), use_worker_pool=False)
+    results = {}
+    try:
+        for size in sizes:
+            output = make_output(size)
+            best = float("inf")
+            for _ in range(repeat):
+                started = time.perf_counter()
+                parsed = integration._parse_xagent_output(output)
+                best = min(best, time.perf_counter() - started)
+            assert parsed["answer"] == "done"
+            results[f"parse.{size}B_us"] = _metric(best * 1e6, "lower")
+    finally:
+        integration.close()
+    return results
+
+
+def bench_mock_redis(ops, repeat, keyspace=10000):
+    """Single-threaded MockRedisClient throughput per operation, best of repeat"""
+    client = MockRedisClient(sweep_interval=0)
+    keys = [f"key:{i % keyspace}" for i in range(ops)]
+    best = {}
+    try:
+        for _ in range(repeat):
+            for name, call in (
+                ("set", lambda key: client.set_key(key, "value")),
+                ("get", client.get_key),
+                ("delete", client.delete_key),
+            ):
+                started = time.perf_counter()
+                for key in keys:
+                    call(key)
+                best[name] = min(best.get(name, float("inf")), time.perf_counter() - started)
+    finally:
+        client.close()
+    return {
+        f"mock_redis.{name}_ops_per_second": _metric(ops / elapsed, "higher")
+        for name, elapsed in best.items()
+    }
+
+
+def merge_best(best, measured):
+    """Keep the better value of each metric across rounds"""
+    merged = dict(best)
+    for name, metric in measured.items():
+        previous = merged.get(name)
+        if (
+            previous is None
+            or metric["better"] == "higher" and metric["value"] > previous["value"]
+            or metric["better"] == "lower" and metric["value"] < previous["value"]
+        ):
+            merged[name] = metric
+    return merged
+
+
+def compare(results, baseline, threshold):
+    """Descriptions of the metrics that regressed by more than threshold percent"""
+    regressions = []
+    for name, base in baseline["metrics"].items():
+        current = results["metrics"].get(name)
+        if current is None or base["better"] not in ("higher", "lower") or not base["value"]:
+            continue
+        change = (current["value"] - base["value"]) / base["value"] * 100
+        if base["better"] == "higher":
+            change = -change
+        if change > threshold:
+            regressions.append(
+                f"{name}: {current['value']:.3f} vs baseline {base['value']:.3f} "
+                f"({change:.1f}% worse)"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--modes", default="pool,subprocess,inprocess")
+    parser.add_argument("--calls", type=int, default=64, help="wrapper calls per level")
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--output-bytes", type=int, default=4096)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--spawn-calls", type=int, default=20)
+    parser.add_argument("--parse-sizes", default="1024,65536,1048576,4194304")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--redis-ops", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=3, help="keep the best of this many rounds")
+    parser.add_argument("--only", help="comma-separated groups: wrapper,spawn,parse,mock_redis")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", nargs="?", const=str(DEFAULT_BASELINE),
+                        help="compare with this result file")
+    parser.add_argument("--save-baseline", nargs="?", const=str(DEFAULT_BASELINE),
+                        help="write the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=50.0, help="percent")
+    args = parser.parse_args()
+
+    groups = set(args.only.split(",")) if args.only else {"wrapper", "spawn", "parse", "mock_redis"}
+    workload = make_stub_xagent_home(args.latency_ms, args.output_bytes, args.failure_rate)
+    instant = make_stub_xagent_home()
+
+    metrics = {}
+    for _ in range(args.rounds):
+        measured = {}
+        if "wrapper" in groups:
+            for mode in args.modes.split(","):
+                for concurrency in (int(n) for n in args.concurrency.split(",")):
+                    measured.update(bench_wrapper(workload, mode, concurrency, args.calls))
+        if "spawn" in groups:
+            measured.update(bench_spawn(instant, args.spawn_calls))
+        if "parse" in groups:
+            sizes = [int(n) for n in args.parse_sizes.split(",")]
+            measured.update(bench_parse(instant, sizes, args.repeat))
+        if "mock_redis" in groups:
+            measured.update(bench_mock_redis(args.redis_ops, args.repeat))
+        metrics = merge_best(metrics, measured)
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "rounds": args.rounds,
+        "stub": {
+            "latency_ms": args.latency_ms,
+            "output_bytes": args.output_bytes,
+            "failure_rate": args.failure_rate,
+        },
+        "metrics": metrics,
+    }
+
+    print(f"{'metric':<42} {'value':>14}")
+    for name, metric in metrics.items():
+        print(f"{name:<42} {metric['value']:>14.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"FAIL: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions over {args.threshold}% against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Sync-call throughput of XAgentWrapper from many threads
+
+Each thread calls the wrapper synchronously in a loop, with run_xagent
+replaced by a coroutine that sleeps for --latency milliseconds to stand
+in for XAgent I/O. The background-loop __call__ is compared with the
+previous approach, where every calling thread drove its own event loop
+with run_until_complete. Open file descriptors are sampled while all
+threads are still alive, since each per-thread loop holds a selector and
+a self-pipe that are only released when its thread goes away.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("XAGENT_HOME", tempfile.mkdtemp(prefix="bench_xagent_"))
+
+import langchain_replacement
+from scheduler import TaskScheduler
+
+
+def legacy_call(agent, input_text):
+    """The sync entry point as it was before the background loop"""
+    try:
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+    return loop.run_until_complete(agent.run(input_text))
+
+
+def open_fds():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return -1
+
+
+def measure(mode, threads, calls, latency):
+    agent = langchain_replacement.XAgentWrapper.__new__(langchain_replacement.XAgentWrapper)
+    agent.tools = []
+    agent.config = {}
+    call = agent if mode == "background" else (lambda text: legacy_call(agent, text))
+
+    all_done = threading.Barrier(threads)
+    fds = {}
+
+    def worker(index):
+        for i in range(calls):
+            assert call(f"{index}:{i}").success
+        if all_done.wait() == 0:
+            fds["during"] = open_fds()
+
+    gc.collect()
+    fds_before = open_fds()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(threads)))
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "threads": threads,
+        "latency_ms": latency * 1000,
+        "calls_per_second": threads * calls / elapsed,
+        "extra_fds": fds["during"] - fds_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", default="1,4,16,64")
+    parser.add_argument("--calls", type=int, default=200, help="calls per thread")
+    parser.add_argument("--latency", type=float, default=5.0, help="simulated XAgent ms")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    latency = args.latency / 1000
+
+    async def fake_run(task, **kwargs):
+        if latency:
+            await asyncio.sleep(latency)
+        return {"answer": task, "steps": [], "success": True}
+
+    # Only the sync call path is measured, so admit everything and skip XAgent
+    langchain_replacement.xagent_integration = type("FakeXAgent", (), {"run_xagent": staticmethod(fake_run)})()
+    langchain_replacement.task_scheduler = TaskScheduler(max_concurrency=1024, max_queue_size=1024)
+    langchain_replacement.result_cache.enabled = False
+
+    results = []
+    print(
+        f"{'threads':>8} {'legacy calls/s':>16} {'background calls/s':>20} "
+        f"{'legacy fds':>12} {'background fds':>16}"
+    )
+    for threads in (int(n) for n in args.threads.split(",")):
+        background = measure("background", threads, args.calls, latency)
+        legacy = measure("legacy", threads, args.calls, latency)
+        results.extend([legacy, background])
+        print(
+            f"{threads:>8} {legacy['calls_per_second']:>16.0f} "
+            f"{background['calls_per_second']:>20.0f} "
+            f"{legacy['extra_fds']:>12} {background['extra_fds']:>16}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
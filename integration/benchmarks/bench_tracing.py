@@ -0,0 +1,125 @@
+"""
+Cost of tracing instrumentation on the XAgentWrapper call path
+
+Runs XAgentWrapper.run against the fake XAgent from tests/fake_xagent.py,
+in fresh run.py processes or with --pool on a warm worker, first with
+sampling off and then with every trace sampled. The per-call instrumentation cost with sampling off is the
+measured cost of an unsampled span times the number of spans a call
+makes, reported as a share of the mean call latency; the run fails if it
+exceeds --max-overhead percent. The per-stage histograms of the sampled
+runs are printed as well.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "tests"))
+
+from fake_xagent import make_fake_xagent_home
+
+os.environ.setdefault("XAGENT_HOME", str(make_fake_xagent_home()))
+os.environ["XAGENT_CONFIG_POLL"] = "0"
+
+import langchain_replacement
+import tracing
+from xagent_integration import XAgentIntegration
+
+
+def span_cost_ns(sample_rate, spans=200000):
+    """Mean ns for entering and leaving one span"""
+    tracer = tracing.Tracer(sample_rate=sample_rate, max_spans=1)
+    started = time.perf_counter_ns()
+    for _ in range(spans):
+        with tracer.span("bench"):
+            pass
+    return (time.perf_counter_ns() - started) / spans
+
+
+def run_calls(calls, use_pool):
+    agent = langchain_replacement.initialize_xagent()
+    langchain_replacement.xagent_integration = XAgentIntegration(use_worker_pool=use_pool, pool_size=1)
+
+    async def go():
+        latencies = []
+        for i in range(calls):
+            started = time.perf_counter()
+            response = await agent.run(f"bench {i}", use_cache=False)
+            assert response.success, response.error_message
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    try:
+        return asyncio.run(go())
+    finally:
+        langchain_replacement.xagent_integration.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=30)
+    parser.add_argument("--pool", action="store_true", help="use the worker pool")
+    parser.add_argument("--max-overhead", type=float, default=1.0, help="percent")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    noop_ns = span_cost_ns(0.0)
+    sampled_ns = span_cost_ns(1.0)
+
+    # The modules on the call path share tracing.tracer
+    tracer = tracing.tracer
+    tracer.sample_rate = 1.0
+    run_calls(2, args.pool)
+    spans_per_call = len(tracer.spans) // 2
+    tracer.reset()
+
+    results = {}
+    for name, sample_rate in (("off", 0.0), ("sampled", 1.0)):
+        tracer.sample_rate = sample_rate
+        latencies = run_calls(args.calls, args.pool)
+        # The first call of a pool run also starts the worker
+        latencies = latencies[1:] if args.pool else latencies
+        results[name] = sum(latencies) / len(latencies)
+
+    overhead = noop_ns * spans_per_call / (results["off"] * 1e9) * 100
+    summary = {
+        "mode": "pool" if args.pool else "subprocess",
+        "spans_per_call": spans_per_call,
+        "unsampled_span_ns": noop_ns,
+        "sampled_span_ns": sampled_ns,
+        "call_ms_sampling_off": results["off"] * 1000,
+        "call_ms_sampled": results["sampled"] * 1000,
+        "overhead_percent_sampling_off": overhead,
+        "stages": tracer.stage_latencies(),
+    }
+
+    print(f"spans per call: {spans_per_call}")
+    print(f"span cost: {noop_ns:.0f} ns unsampled, {sampled_ns:.0f} ns sampled")
+    print(
+        f"call latency: {summary['call_ms_sampling_off']:.2f} ms sampling off, "
+        f"{summary['call_ms_sampled']:.2f} ms sampled"
+    )
+    print(f"instrumentation cost with sampling off: {overhead:.4f}% of a call")
+    print(f"{'stage':<18} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, stats in summary["stages"].items():
+        print(
+            f"{stage:<18} {stats['count']:>6} {stats['p50_ms']:>9.3f} "
+            f"{stats['p95_ms']:>9.3f} {stats['p99_ms']:>9.3f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    if overhead > args.max_overhead:
+        print(f"FAIL: overhead {overhead:.4f}% exceeds {args.max_overhead}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Stub XAgent installation for benchmarks
+
+Like tests/fake_xagent.py, but run.py's behaviour is fixed when the home
+is created instead of being driven by task keywords: every run waits
+latency_ms, prints about output_bytes of log lines and then its JSON
+answer, and fails with exit status 2 for a failure_rate share of tasks.
+Whether a task fails is derived from the task text and seed, so the
+same tasks fail in every run of a benchmark. XAgent/core.py has a
+run_task entrypoint for the in-process engine that does the same,
+logging through the task context and raising instead of exiting. No
+network access or LLM is involved.
+"""
+
+import tempfile
+from pathlib import Path
+
+STUB_RUN_PY = '''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+LATENCY_MS = {latency_ms!r}
+OUTPUT_BYTES = {output_bytes!r}
+FAILURE_RATE = {failure_rate!r}
+SEED = {seed!r}
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--task", required=True)
+parser.add_argument("--config_file")
+args, _ = parser.parse_known_args()
+
+if LATENCY_MS:
+    time.sleep(LATENCY_MS / 1000)
+
+if FAILURE_RATE and random.Random(f"{{SEED}}:{{args.task}}").random() < FAILURE_RATE:
+    print("stub failure", file=sys.stderr)
+    sys.exit(2)
+
+line = "INFO stub tool output " + "x" * 100
+written = 0
+while written < OUTPUT_BYTES:
+    print(line)
+    written += len(line) + 1
+print(json.dumps({{"answer": "done: " + args.task, "steps": ["plan", "act"], "pid": os.getpid()}}))
+'''
+
+STUB_CORE_PY = '''
+import random
+import time
+
+LATENCY_MS = {latency_ms!r}
+OUTPUT_BYTES = {output_bytes!r}
+FAILURE_RATE = {failure_rate!r}
+SEED = {seed!r}
+
+
+def run_task(context):
+    if LATENCY_MS:
+        time.sleep(LATENCY_MS / 1000)
+    if FAILURE_RATE and random.Random(f"{{SEED}}:{{context.task}}").random() < FAILURE_RATE:
+        raise RuntimeError("stub failure")
+    line = "INFO stub tool output " + "x" * 100
+    written = 0
+    while written < OUTPUT_BYTES:
+        context.log(line)
+        written += len(line) + 1
+    return {{"answer": "done: " + context.task, "steps": ["plan", "act"]}}
+'''
+
+
+def make_stub_xagent_home(
+    latency_ms: float = 0,
+    output_bytes: int = 0,
+    failure_rate: float = 0.0,
+    seed: int = 0,
+    root=None
+) -> Path:
+    """Create an XAgent home whose run.py behaves as configured"""
+    home = Path(root or tempfile.mkdtemp(prefix="stub_xagent_"))
+    (home / "XAgent").mkdir(parents=True, exist_ok=True)
+    (home / "XAgent" / "__init__.py").write_text("")
+    settings = dict(
+        latency_ms=latency_ms,
+        output_bytes=output_bytes,
+        failure_rate=failure_rate,
+        seed=seed
+    )
+    (home / "XAgent" / "core.py").write_text(STUB_CORE_PY.format(**settings))
+    (home / "run.py").write_text(STUB_RUN_PY.format(**settings))
+    return home
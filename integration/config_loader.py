@@ -0,0 +1,375 @@
+"""
+Typed, validated XAgent configuration with hot reload
+
+``xagent_config.yaml`` is parsed once into frozen dataclasses. Each
+config carries a content hash of its parsed values, used as the result
+cache key, and a narrower hash of the sections a warm pool worker may
+have loaded (mode, model, tools), used to decide when workers must be
+recycled. Constraints and logging are read per task, so changing them
+leaves the workers alone.
+
+A ConfigStore polls the file and swaps in a new config object when it
+changes. The swap is a single reference assignment: a run that already
+took the old config keeps it, together with a snapshot file of the old
+contents for run.py to read. An edit that fails to parse or validate is
+ignored and the previous config stays in place.
+
+Settings this module does not know (say model.api_base) are not errors:
+they raise a ConfigWarning, count towards the hashes and reach run.py
+unchanged in the snapshot.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import warnings
+import weakref
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+MODES = ("auto", "manual")
+# How XAgentIntegration runs tasks: a fresh run.py, a warm worker or in-process
+ENGINES = ("subprocess", "pool", "inprocess")
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+# Seconds between checks of the config file; 0 turns the watcher off
+DEFAULT_POLL_INTERVAL = 2.0
+
+
+class ConfigError(ValueError):
+    """Raised when an XAgent config file is malformed or invalid"""
+
+
+class ConfigWarning(UserWarning):
+    """Issued for settings that are passed to XAgent without being checked"""
+
+
+@dataclass(frozen=True)
+class ModelConfig:
+    name: str = "gpt-4"
+    temperature: float = 0.1
+    max_tokens: int = 2000
+    # Unknown settings as sorted (key, JSON value) pairs
+    extra: Tuple[Tuple[str, str], ...] = ()
+
+
+@dataclass(frozen=True)
+class ToolConfig:
+    name: str
+    enabled: bool = True
+    extra: Tuple[Tuple[str, str], ...] = ()
+
+
+@dataclass(frozen=True)
+class ConstraintsConfig:
+    max_iterations: int = 5
+    # Seconds per run; 0 means no limit
+    timeout: float = 300
+    extra: Tuple[Tuple[str, str], ...] = ()
+
+
+@dataclass(frozen=True)
+class LoggingConfig:
+    level: str = "INFO"
+    save_log: bool = True
+    log_dir: str = "./logs"
+    extra: Tuple[Tuple[str, str], ...] = ()
+
+
+@dataclass(frozen=True)
+class XAgentConfig:
+    """One parsed and validated version of xagent_config.yaml"""
+    mode: str = "auto"
+    # None leaves the choice to XAgentIntegration
+    engine: Optional[str] = None
+    model: ModelConfig = ModelConfig()
+    tools: Tuple[ToolConfig, ...] = ()
+    constraints: ConstraintsConfig = ConstraintsConfig()
+    logging: LoggingConfig = LoggingConfig()
+    extra: Tuple[Tuple[str, str], ...] = ()
+    # Where it was loaded from and the exact text, for run.py snapshots
+    source: str = field(default="", compare=False)
+    text: str = field(default="", compare=False, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        del data["source"], data["text"]
+        return data
+
+    @property
+    def digest(self) -> str:
+        """Hash of every setting, ignoring comments and formatting"""
+        return _hash(self.to_dict())
+
+    @property
+    def worker_digest(self) -> str:
+        """Hash of the settings a pre-warmed worker depends on"""
+        data = self.to_dict()
+        return _hash({key: data[key] for key in ("mode", "model", "tools")})
+
+    @property
+    def enabled_tools(self) -> List[str]:
+        return [tool.name for tool in self.tools if tool.enabled]
+
+    @property
+    def timeout(self) -> Optional[float]:
+        return float(self.constraints.timeout) if self.constraints.timeout else None
+
+    def snapshot(self) -> str:
+        """
+        Path of a file holding this version's text
+
+        Files are named by digest and never rewritten, so a run.py started
+        with one keeps reading the same config after the source changes.
+        They live in a directory only this user can write to, so a file
+        found there was written by this process.
+        """
+        path = os.path.join(_snapshot_dir(), f"xagent-config-{self.digest[:16]}.yaml")
+        if not os.path.exists(path):
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".yaml")
+            with os.fdopen(fd, "w") as f:
+                f.write(self.text)
+            os.replace(tmp, path)
+        return path
+
+
+_snapshot_path: Optional[str] = None
+_snapshot_lock = threading.Lock()
+
+
+def _snapshot_dir() -> str:
+    """This process's private (0700) directory for config snapshots"""
+    global _snapshot_path
+    with _snapshot_lock:
+        if _snapshot_path is None or not os.path.isdir(_snapshot_path):
+            import atexit
+            import shutil
+
+            _snapshot_path = tempfile.mkdtemp(prefix="xagent-config-")
+            atexit.register(shutil.rmtree, _snapshot_path, True)
+        return _snapshot_path
+
+
+def _hash(data: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def _section(data: Any, path: str) -> Dict[str, Any]:
+    if data is None:
+        return {}
+    if not isinstance(data, dict):
+        raise ConfigError(f"{path} must be a mapping")
+    return data
+
+
+def _extra_keys(data: Dict[str, Any], cls, path: str) -> Tuple[Tuple[str, str], ...]:
+    """Settings of data that cls does not define, with a ConfigWarning about them"""
+    fields = {
+        name for name, f in cls.__dataclass_fields__.items() if f.compare and name != "extra"
+    }
+    unknown = sorted(set(data) - fields)
+    if unknown:
+        warnings.warn(
+            f"Unknown setting(s) in {path} passed to XAgent unchecked: {', '.join(unknown)}",
+            ConfigWarning
+        )
+    return tuple((key, json.dumps(data[key], sort_keys=True, default=str)) for key in unknown)
+
+
+def _build(cls, data: Any, path: str, rules: Dict[str, tuple]):
+    """
+    Instance of a section dataclass from its mapping
+
+    rules maps each key to (types, check, description); missing keys keep
+    the dataclass default.
+    """
+    data = _section(data, path)
+    values = {"extra": _extra_keys(data, cls, path)}
+    for key, (types, check, description) in rules.items():
+        if key not in data:
+            continue
+        value = data[key]
+        # bool is an int subclass but never a valid number here
+        valid = isinstance(value, types) and (bool in types or not isinstance(value, bool))
+        if not valid or (check is not None and not check(value)):
+            raise ConfigError(f"{path}.{key} must be {description}, got {value!r}")
+        values[key] = value
+    return cls(**values)
+
+
+def parse_config(text: str, source: str = "") -> XAgentConfig:
+    """Parse and validate the text of an xagent_config.yaml"""
+    import yaml
+
+    try:
+        document = yaml.safe_load(text)
+    except yaml.YAMLError as e:
+        raise ConfigError(f"Invalid YAML in {source or 'XAgent config'}: {e}") from e
+
+    root = _section(document, "config")
+    settings = _section(root.get("xagent"), "xagent")
+    extra = _extra_keys(settings, XAgentConfig, "xagent")
+
+    mode = settings.get("mode", "auto")
+    if mode not in MODES:
+        raise ConfigError(f"xagent.mode must be one of {', '.join(MODES)}, got {mode!r}")
+    engine = settings.get("engine")
+    if engine is not None and engine not in ENGINES:
+        raise ConfigError(f"xagent.engine must be one of {', '.join(ENGINES)}, got {engine!r}")
+
+    number = (int, float)
+    non_empty = lambda v: bool(v.strip())
+    model = _build(ModelConfig, settings.get("model"), "xagent.model", {
+        "name": ((str,), non_empty, "a non-empty string"),
+        "temperature": (number, lambda v: 0 <= v <= 2, "a number between 0 and 2"),
+        "max_tokens": ((int,), lambda v: v > 0, "a positive integer"),
+    })
+    constraints = _build(ConstraintsConfig, settings.get("constraints"), "xagent.constraints", {
+        "max_iterations": ((int,), lambda v: v > 0, "a positive integer"),
+        "timeout": (number, lambda v: v >= 0, "a non-negative number"),
+    })
+    logging = _build(LoggingConfig, settings.get("logging"), "xagent.logging", {
+        "level": ((str,), lambda v: v.upper() in LOG_LEVELS, "a log level name"),
+        "save_log": ((bool,), None, "true or false"),
+        "log_dir": ((str,), None, "a string"),
+    })
+
+    tools_data = settings.get("tools") or []
+    if not isinstance(tools_data, list):
+        raise ConfigError("xagent.tools must be a list")
+    tools = []
+    for index, item in enumerate(tools_data):
+        path = f"xagent.tools[{index}]"
+        if not isinstance(item, dict) or "name" not in item:
+            raise ConfigError(f"{path} must be a mapping with a name")
+        tools.append(_build(ToolConfig, item, path, {
+            "name": ((str,), non_empty, "a non-empty string"),
+            "enabled": ((bool,), None, "true or false"),
+        }))
+    names = [tool.name for tool in tools]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ConfigError(f"Duplicate tool(s) in xagent.tools: {', '.join(duplicates)}")
+
+    return XAgentConfig(
+        mode=mode,
+        engine=engine,
+        model=model,
+        tools=tuple(tools),
+        constraints=constraints,
+        logging=logging,
+        extra=extra,
+        source=source,
+        text=text
+    )
+
+
+def load_config(path: str) -> XAgentConfig:
+    """Read and validate an xagent_config.yaml"""
+    with open(path, "r") as f:
+        return parse_config(f.read(), str(path))
+
+
+def _file_signature(path: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class ConfigStore:
+    """
+    The current XAgentConfig for one file, reloaded when the file changes
+
+    ``current`` is always a complete, validated config. Listeners are
+    called as ``listener(old, new)`` after a swap, on the thread that
+    noticed the change.
+    """
+
+    def __init__(self, path: str, poll_interval: Optional[float] = None):
+        self.path = str(path)
+        if poll_interval is None:
+            poll_interval = float(os.getenv("XAGENT_CONFIG_POLL", str(DEFAULT_POLL_INTERVAL)))
+        self.poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[XAgentConfig, XAgentConfig], None]] = []
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_error: Optional[str] = None
+
+        # A broken config at startup is an error; later ones are skipped
+        self._signature = _file_signature(self.path)
+        self._current = load_config(self.path)
+
+    @property
+    def current(self) -> XAgentConfig:
+        return self._current
+
+    def subscribe(self, listener: Callable[[XAgentConfig, XAgentConfig], None]):
+        self._listeners.append(listener)
+
+    def reload(self) -> bool:
+        """Re-read the file if it changed; True if a new config was swapped in"""
+        with self._lock:
+            signature = _file_signature(self.path)
+            if signature is None or signature == self._signature:
+                return False
+            self._signature = signature
+            try:
+                config = load_config(self.path)
+            except (OSError, ConfigError) as e:
+                self.failed_reloads += 1
+                self.last_error = str(e)
+                return False
+            self.last_error = None
+
+            old = self._current
+            if config.digest == old.digest:
+                # Touched or reformatted only
+                return False
+            self._current = config
+            self.reloads += 1
+
+        for listener in list(self._listeners):
+            listener(old, config)
+        return True
+
+    def watch(self):
+        """Start polling the file in a daemon thread (no-op if disabled)"""
+        if self.poll_interval <= 0 or self._watcher is not None:
+            return
+        # The thread holds only a weak reference, so an unused store can
+        # still be collected
+        self._watcher = threading.Thread(
+            target=_watch,
+            args=(weakref.ref(self), self._stop, self.poll_interval),
+            name="xagent-config-watcher",
+            daemon=True
+        )
+        self._watcher.start()
+
+    def close(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+
+def _watch(store_ref: "weakref.ref[ConfigStore]", stop: threading.Event, interval: float):
+    while not stop.wait(interval):
+        store = store_ref()
+        if store is None:
+            return
+        try:
+            store.reload()
+        except Exception:
+            # A failing listener must not stop later reloads
+            pass
+        del store
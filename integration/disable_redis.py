@@ -3,9 +3,13 @@ Script to disable Redis requirements in XAgent
 """
 
 import os
+import shutil
 import sys
 from pathlib import Path
 
+# Mock Redis implementation maintained alongside this script
+MOCK_REDIS_SOURCE = Path(__file__).parent / "XAgent" / "XAgentServer" / "exts" / "mock_redis.py"
+
 def create_directories_if_needed():
     """Create necessary directories if they don't exist"""
     exts_dir = Path("XAgent/XAgentServer/exts")
@@ -13,56 +17,18 @@ def create_directories_if_needed():
     return exts_dir.exists()
 
 def create_mock_redis():
-    """Create a mock Redis client"""
+    """Install the mock Redis client shipped with the integration"""
     mock_redis_file = Path("XAgent/XAgentServer/exts/mock_redis.py")
     
-    mock_redis_content = '''
-"""
-Mock Redis client for development without Redis server
-"""
-
-class MockRedisClient:
-    """Mock Redis client that simulates Redis operations"""
-    
-    def __init__(self):
-        self.data = {}
-        print("Using Mock Redis Client (no Redis server required)")
-    
-    def delete_all_keys(self):
-        """Mock delete all keys"""
-        self.data.clear()
-        return True
-    
-    def set_key(self, key, value, ex=None):
-        """Mock set key"""
-        self.data[key] = value
-        return True
-    
-    def get_key(self, key):
-        """Mock get key"""
-        return self.data.get(key)
-    
-    def delete_key(self, key):
-        """Mock delete key"""
-        if key in self.data:
-            del self.data[key]
-            return True
+    if not MOCK_REDIS_SOURCE.exists():
+        print(f"Error: {MOCK_REDIS_SOURCE} not found")
         return False
     
-    def exists(self, key):
-        """Mock exists"""
-        return key in self.data
-    
-    def flushdb(self):
-        """Mock flushdb"""
-        self.data.clear()
-        return True
-
-# Create global instance
-mock_redis = MockRedisClient()
-'''
-    with open(mock_redis_file, 'w') as f:
-        f.write(mock_redis_content)
+    # Running from the integration directory the two paths are the same file
+    if mock_redis_file.resolve() != MOCK_REDIS_SOURCE.resolve():
+        # Copy the client together with its helper modules
+        for source in MOCK_REDIS_SOURCE.parent.glob("mock_redis*.py"):
+            shutil.copyfile(source, mock_redis_file.parent / source.name)
     
     return mock_redis_file.exists()
 
@@ -121,8 +87,8 @@ class RedisClient:
     def delete_all_keys(self):
         return self.client.delete_all_keys()
     
-    def set_key(self, key, value, ex=None):
-        return self.client.set_key(key, value, ex)
+    def set_key(self, key, value, ex=None, px=None):
+        return self.client.set_key(key, value, ex=ex, px=px)
     
     def get_key(self, key):
         return self.client.get_key(key)
@@ -135,6 +101,21 @@ class RedisClient:
     
     def flushdb(self):
         return self.client.flushdb()
+    
+    def mget(self, keys):
+        return self.client.mget(keys)
+    
+    def mset(self, mapping, ex=None, px=None):
+        return self.client.mset(mapping, ex=ex, px=px)
+    
+    def delete_many(self, *keys):
+        return self.client.delete_many(*keys)
+    
+    def pipeline(self, transaction=True):
+        return self.client.pipeline(transaction=transaction)
+    
+    def scan_iter(self, match=None, count=10):
+        return self.client.scan_iter(match=match, count=count)
 
 # Global instance
 redis_client = RedisClient()
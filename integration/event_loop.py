@@ -0,0 +1,107 @@
+"""
+Background event loop for synchronous callers
+
+All XAgent I/O started from sync code runs on one long-lived event loop
+in a daemon thread. Callers submit coroutines with submit(), which hands
+back a concurrent.futures.Future, or run(), which waits for the result.
+This works the same from plain threads, from threads that are already
+running their own loop (uvicorn, Jupyter) and from many web worker
+threads at once, and no loop is created per call.
+
+The thread is started on first use and restarted after a fork.
+"""
+
+import atexit
+import os
+import threading
+from typing import Any, Awaitable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import asyncio
+    import concurrent.futures
+
+
+class BackgroundLoop:
+    """An event loop running forever in its own daemon thread"""
+
+    def __init__(self, name: str = "xagent-loop"):
+        self.name = name
+        self._loop: Optional["asyncio.AbstractEventLoop"] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> "asyncio.AbstractEventLoop":
+        """The running loop, starting the thread if needed"""
+        if self._loop is None or self._pid != os.getpid():
+            self._start()
+        return self._loop
+
+    def _start(self):
+        import asyncio
+
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                return
+
+            # After a fork the loop object exists but its thread does not
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            thread = threading.Thread(target=run, name=self.name, daemon=True)
+            thread.start()
+            ready.wait()
+
+            self._loop = loop
+            self._thread = thread
+            self._pid = os.getpid()
+
+    def in_loop_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable[Any]) -> "concurrent.futures.Future":
+        """Schedule a coroutine on the loop and return its future"""
+        import asyncio
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the loop and wait for its result"""
+        if self.in_loop_thread():
+            # Blocking here would stop the loop that has to run coro
+            coro.close()
+            raise RuntimeError("Cannot wait for XAgent from the background loop thread; await it instead")
+        return self.submit(coro).result(timeout)
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the loop and join its thread"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None or self._pid != os.getpid():
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not thread.is_alive():
+            loop.close()
+
+
+_background_loop: Optional[BackgroundLoop] = None
+_background_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundLoop:
+    """Return the shared background loop, creating it on first call"""
+    global _background_loop
+    if _background_loop is None:
+        with _background_lock:
+            if _background_loop is None:
+                _background_loop = BackgroundLoop()
+                atexit.register(_background_loop.stop)
+    return _background_loop
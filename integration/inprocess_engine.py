@@ -0,0 +1,275 @@
+"""
+In-process XAgent engine
+
+Instead of starting run.py and reading its stdout, the in-process engine
+imports XAgent's entrypoint once and calls it directly, as a coroutine on
+the event loop if it is async and on a thread pool otherwise. The
+entrypoint gets a TaskContext and returns its result as a plain Python
+object; nothing is serialized and no log is parsed.
+
+The entrypoint is named by XAGENT_ENTRYPOINT as "module:function" and
+defaults to XAgent.core:run_task. It is called as ``entrypoint(context)``
+and returns a dict with at least an "answer" (other keys are passed
+through unchanged) or the answer itself.
+
+Each task has its own TaskContext, which is also the current one inside
+the task (current_context()), so code deep in XAgent can reach its task's
+state without module-level globals. Cancellation is cooperative: a
+stopped or timed-out task is marked cancelled and its caller returns at
+once, but a thread only stops when the entrypoint checks the context.
+Resource limits are not applied, since they would bind the host process.
+"""
+
+import contextvars
+import importlib
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable, AsyncIterator
+
+from resilience import RATE_LIMIT_PATTERN
+from resource_limits import thread_cpu
+
+DEFAULT_ENTRYPOINT = "XAgent.core:run_task"
+
+# Log lines kept per task, as raw_output
+LOG_LINES = 1000
+
+_current: "contextvars.ContextVar[Optional[TaskContext]]" = contextvars.ContextVar(
+    "xagent_task_context", default=None
+)
+
+
+class TaskCancelled(Exception):
+    """Raised by TaskContext.check_cancelled once the task has been stopped"""
+
+
+class XAgentTaskError(RuntimeError):
+    """
+    Raised when the entrypoint raises
+
+    ``error_class`` is "rate_limit" when the exception reports a model rate
+    limit or overload and "error" otherwise, as for run.py exits.
+    """
+
+    def __init__(self, error: BaseException):
+        message = f"{type(error).__name__}: {error}"
+        super().__init__(f"XAgent execution failed: {message}")
+        self.error_class = "rate_limit" if RATE_LIMIT_PATTERN.search(message) else "error"
+
+
+class TaskContext:
+    """State of one in-process task, handed to the entrypoint"""
+
+    def __init__(
+        self,
+        task: str,
+        config: Any,
+        options: Dict[str, Any],
+        emit: Callable[[Dict[str, Any]], None],
+        max_lines: int = LOG_LINES
+    ):
+        self.task_id = uuid.uuid4().hex
+        self.task = task
+        self.config = config
+        self.options = dict(options)
+        # Scratch space for the entrypoint, private to this task
+        self.state: Dict[str, Any] = {}
+        self.steps: List[Any] = []
+        self.lines: deque = deque(maxlen=max_lines)
+        self._emit = emit
+        self._cancelled = threading.Event()
+
+    def log(self, line: str):
+        """Record a log line and stream it as a "log" event"""
+        self.lines.append(line)
+        self._emit({"type": "log", "line": line})
+
+    def step(self, step: Any):
+        """Record an intermediate step and stream it as a "step" event"""
+        self.steps.append(step)
+        self._emit({"type": "step", "step": step})
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check_cancelled(self):
+        """Raise TaskCancelled if the task has been stopped"""
+        if self._cancelled.is_set():
+            raise TaskCancelled(self.task_id)
+
+    def partial_result(self) -> Dict[str, Any]:
+        """Result for a task that was stopped before it finished"""
+        return {
+            "raw_output": "\n".join(self.lines),
+            "answer": "",
+            "steps": list(self.steps),
+            "success": False,
+            "timed_out": True,
+        }
+
+
+def current_context() -> Optional[TaskContext]:
+    """The TaskContext of the in-process task running in this context"""
+    return _current.get()
+
+
+def _resolve(name: str) -> Callable:
+    module_name, _, attribute = name.partition(":")
+    if not attribute:
+        raise ValueError(f"XAgent entrypoint must be module:function, got {name!r}")
+    module = importlib.import_module(module_name)
+    try:
+        return getattr(module, attribute)
+    except AttributeError:
+        raise ImportError(f"{module_name} has no XAgent entrypoint {attribute}") from None
+
+
+def _call(entrypoint: Callable, context: TaskContext):
+    """Run a sync entrypoint with context current; returns (result, (user, system) CPU)"""
+    token = _current.set(context)
+    user, system = thread_cpu()
+    try:
+        result = entrypoint(context)
+        user_after, system_after = thread_cpu()
+        return result, (user_after - user, system_after - system)
+    finally:
+        _current.reset(token)
+
+
+class InProcessEngine:
+    """Runs XAgent tasks in this process through its Python entrypoint"""
+
+    def __init__(self, entrypoint: Optional[str] = None, max_workers: int = 4):
+        self.entrypoint_name = entrypoint or os.getenv("XAGENT_ENTRYPOINT", DEFAULT_ENTRYPOINT)
+        self.max_workers = max_workers
+        self._entrypoint: Optional[Callable] = None
+        self._is_async = False
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Callable:
+        """Import the entrypoint; only the first call does any work"""
+        if self._entrypoint is None:
+            import inspect
+
+            with self._lock:
+                if self._entrypoint is None:
+                    entrypoint = _resolve(self.entrypoint_name)
+                    self._is_async = inspect.iscoroutinefunction(entrypoint)
+                    self._entrypoint = entrypoint
+        return self._entrypoint
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="xagent-inprocess"
+                )
+            return self._executor
+
+    async def stream(
+        self,
+        task: str,
+        config: Any,
+        options: Dict[str, Any],
+        state: Dict[str, Any]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run one task, yielding its "log" and "step" events as they happen
+
+        Once the generator is exhausted ``state`` holds the ``result`` and
+        the task's ``usage``; ``state["context"]`` is its TaskContext.
+        ``state["abort"]`` stops the task, which also happens if the
+        generator is closed early.
+        """
+        import asyncio
+
+        entrypoint = self.load()
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        def emit(event: Dict[str, Any]):
+            # Async entrypoints emit on the loop, sync ones from a pool thread
+            try:
+                on_loop = asyncio.get_running_loop() is loop
+            except RuntimeError:
+                on_loop = False
+            if on_loop:
+                events.put_nowait(event)
+            else:
+                loop.call_soon_threadsafe(events.put_nowait, event)
+
+        context = TaskContext(task, config, options, emit)
+        state["context"] = context
+        started = time.monotonic()
+
+        if self._is_async:
+            async def run_async():
+                _current.set(context)
+                return await entrypoint(context), None
+            # A task of its own copies the context, so setting it is local
+            future = asyncio.ensure_future(run_async())
+        else:
+            future = loop.run_in_executor(
+                self._get_executor(), contextvars.copy_context().run, _call, entrypoint, context
+            )
+
+        def abort():
+            context.cancel()
+            events.put_nowait(done)
+
+        state["abort"] = abort
+        # Events are queued before the sentinel, as with the worker pool
+        future.add_done_callback(lambda _: loop.call_soon(events.put_nowait, done))
+
+        try:
+            while True:
+                event = await events.get()
+                if event is done:
+                    break
+                yield event
+        finally:
+            if not future.done():
+                # Stopped, timed out or abandoned: nobody reads the outcome
+                context.cancel()
+                if self._is_async:
+                    future.cancel()
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        if context.cancelled:
+            return
+        try:
+            value, cpu = future.result()
+        except TaskCancelled:
+            return
+        except Exception as e:
+            raise XAgentTaskError(e) from e
+
+        result = dict(value) if isinstance(value, dict) else {"answer": value}
+        result.setdefault("answer", "")
+        result.setdefault("steps", list(context.steps))
+        result.setdefault("success", True)
+        result.setdefault("raw_output", "\n".join(context.lines))
+        # The same keys as the subprocess and pool engines report
+        usage = {"wall_seconds": time.monotonic() - started}
+        if cpu is not None:
+            usage["user_cpu_seconds"], usage["system_cpu_seconds"] = cpu
+        result["usage"] = usage
+        state["result"] = result
+        state["usage"] = usage
+
+    def close(self):
+        """Stop the thread pool; running tasks finish in the background"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
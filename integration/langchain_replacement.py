@@ -3,8 +3,8 @@ Replacement module for LangChain ReAct Agent using XAgent
 """
 
 import os
-import asyncio
-from typing import Dict, Any, List, Optional
+import queue
+from typing import Dict, Any, List, Optional, AsyncIterator, Iterator, Iterable, Tuple, Union, TYPE_CHECKING
 from dataclasses import dataclass
 
 # Use absolute import instead of relative
@@ -16,7 +16,32 @@ current_dir = Path(__file__).parent
 if str(current_dir) not in sys.path:
     sys.path.insert(0, str(current_dir))
 
-from xagent_integration import xagent_integration
+from xagent_integration import xagent_integration, XAgentTimeoutError
+from scheduler import task_scheduler, DEFAULT_TENANT, PRIORITY_NORMAL
+from result_cache import result_cache
+from event_loop import get_background_loop
+from tracing import tracer
+import metrics
+
+if TYPE_CHECKING:
+    import concurrent.futures
+
+# RunnableConfig keys that are accepted by the batch methods but are not
+# XAgent arguments
+RUNNABLE_CONFIG_KEYS = {
+    "tags", "metadata", "callbacks", "run_name", "run_id",
+    "recursion_limit", "configurable", "max_concurrency"
+}
+
+# Read at scrape time, so they follow the shared scheduler and cache
+metrics.REGISTRY.gauge(
+    "xagent_scheduler_queue_depth", "Tasks waiting for a scheduler slot",
+    func=lambda: task_scheduler.queue_depth
+)
+metrics.REGISTRY.gauge(
+    "xagent_result_cache_entries", "Results held in the in-memory result cache",
+    func=lambda: len(result_cache.memory)
+)
 
 @dataclass
 class AgentResponse:
@@ -25,6 +50,9 @@ class AgentResponse:
     intermediate_steps: List[Any] = None
     success: bool = True
     error_message: Optional[str] = None
+    # Resource usage of the run; None when the result came from the cache
+    usage: Optional[Dict[str, Any]] = None
+    cached: bool = False
 
 class XAgentWrapper:
     """Wrapper class to replace LangChain's ReAct Agent"""
@@ -41,42 +69,247 @@ class XAgentWrapper:
     async def run(self, input_text: str, **kwargs) -> AgentResponse:
         """Execute XAgent with the given input"""
         try:
-            # Merge instance config with runtime kwargs
-            execution_config = {**self.config, **kwargs}
-            
-            # Run XAgent
-            result = await xagent_integration.run_xagent(input_text, **execution_config)
-            
-            return AgentResponse(
-                output=result.get("answer", ""),
-                intermediate_steps=result.get("steps", []),
-                success=result.get("success", True)
-            )
+            return await self._run(input_text, **kwargs)
+        except Exception as e:
+            return _error_response(e)
+    
+    async def _run(self, input_text: str, **kwargs) -> AgentResponse:
+        """run() without the error handling"""
+        # Merge instance config with runtime kwargs
+        execution_config = {**self.config, **kwargs}
+        
+        # Scheduling and caching options are not XAgent arguments
+        tenant = execution_config.pop("tenant", DEFAULT_TENANT)
+        priority = execution_config.pop("priority", PRIORITY_NORMAL)
+        use_cache = execution_config.pop("use_cache", True)
+        ran = False
+        
+        async def execute():
+            nonlocal ran
+            # Run XAgent once the scheduler admits the task
+            queued = tracer.start_span("scheduler.queue")
+            try:
+                async with task_scheduler.slot(tenant, priority):
+                    queued.end()
+                    ran = True
+                    return await xagent_integration.run_xagent(input_text, **execution_config)
+            finally:
+                queued.end()
+        
+        with tracer.span("agent.run", tenant=tenant):
+            if result_cache.enabled and use_cache:
+                key = result_cache.make_key(
+                    input_text, execution_config, xagent_integration.config.digest
+                )
+                result = await result_cache.get_or_compute(key, execute)
+            else:
+                result = await execute()
             
+            with tracer.span("agent.response"):
+                # A cached result's usage was spent by the run that produced it
+                return AgentResponse(
+                    output=result.get("answer", ""),
+                    intermediate_steps=result.get("steps", []),
+                    success=result.get("success", True),
+                    usage=result.get("usage") if ran else None,
+                    cached=not ran
+                )
+    
+    async def astream(self, input_text: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream XAgent events for the given input as they are produced
+        
+        Yields the events of XAgentIntegration.astream; the last one has
+        type "result". Errors are reported as a final "error" event, which
+        for a timeout also carries the partial "result".
+        """
+        execution_config = {**self.config, **kwargs}
+        tenant = execution_config.pop("tenant", DEFAULT_TENANT)
+        priority = execution_config.pop("priority", PRIORITY_NORMAL)
+        execution_config.pop("use_cache", None)
+        
+        try:
+            async with task_scheduler.slot(tenant, priority):
+                async for event in xagent_integration.astream(input_text, **execution_config):
+                    yield event
+        except XAgentTimeoutError as e:
+            yield {"type": "error", "error": str(e), "result": e.partial}
         except Exception as e:
-            return AgentResponse(
-                output=f"Error: {str(e)}",
-                success=False,
-                error_message=str(e)
-            )
+            yield {"type": "error", "error": str(e)}
+    
+    async def abatch(
+        self,
+        inputs: Iterable[Union[str, Dict[str, Any]]],
+        config: Optional[Union[Dict[str, Any], List[Dict[str, Any]]]] = None,
+        *,
+        max_concurrency: Optional[int] = None,
+        return_exceptions: bool = False,
+        **kwargs
+    ) -> List[Union[AgentResponse, Exception]]:
+        """
+        Run many inputs and return their responses in input order
+        
+        Args:
+            inputs: Task strings, or dicts with an "input" key
+            config: Options for every input, or a list with one dict per
+                input; "max_concurrency" and other RunnableConfig keys are
+                honoured or ignored, anything else is passed to run()
+            max_concurrency: Most inputs in flight at once; defaults to
+                the shared scheduler's concurrency and is capped at what
+                it can run or queue, so no input is rejected as queue full
+            return_exceptions: Put the exception of a failed input in its
+                place instead of a failed AgentResponse
+            **kwargs: Passed to run() for every input
+        """
+        inputs = list(inputs)
+        results: List[Union[AgentResponse, Exception, None]] = [None] * len(inputs)
+        async for index, response in self.abatch_as_completed(
+            inputs, config, max_concurrency=max_concurrency,
+            return_exceptions=return_exceptions, **kwargs
+        ):
+            results[index] = response
+        return results
+    
+    async def abatch_as_completed(
+        self,
+        inputs: Iterable[Union[str, Dict[str, Any]]],
+        config: Optional[Union[Dict[str, Any], List[Dict[str, Any]]]] = None,
+        *,
+        max_concurrency: Optional[int] = None,
+        return_exceptions: bool = False,
+        **kwargs
+    ) -> AsyncIterator[Tuple[int, Union[AgentResponse, Exception]]]:
+        """Like abatch, but yield (index, response) pairs as runs finish"""
+        import asyncio
+        
+        inputs = list(inputs)
+        configs = _batch_configs(config, len(inputs))
+        if max_concurrency is None:
+            max_concurrency = configs[0].get("max_concurrency") if configs else None
+        # Enough runs to fill the scheduler's slots, and never more than
+        # it can run or queue
+        limit = min(
+            max_concurrency or task_scheduler.max_concurrency,
+            task_scheduler.max_concurrency + task_scheduler.max_queue_size
+        )
+        
+        pending = iter(range(len(inputs)))
+        finished: asyncio.Queue = asyncio.Queue()
+        
+        async def worker():
+            for index in pending:
+                # Anything that fails here must still post a response, or
+                # the consumer below waits for it forever
+                try:
+                    options = {
+                        **kwargs,
+                        **{k: v for k, v in configs[index].items() if k not in RUNNABLE_CONFIG_KEYS}
+                    }
+                    response = await self._run(_input_text(inputs[index]), **options)
+                except Exception as e:
+                    response = e if return_exceptions else _error_response(e)
+                finished.put_nowait((index, response))
+        
+        workers = [asyncio.ensure_future(worker()) for _ in range(min(limit, len(inputs)))]
+        try:
+            for _ in range(len(inputs)):
+                yield await finished.get()
+        finally:
+            for task in workers:
+                task.cancel()
+    
+    def batch(
+        self,
+        inputs: Iterable[Union[str, Dict[str, Any]]],
+        config: Optional[Union[Dict[str, Any], List[Dict[str, Any]]]] = None,
+        **kwargs
+    ) -> List[Union[AgentResponse, Exception]]:
+        """Sync version of abatch, run on the background event loop"""
+        return get_background_loop().run(self.abatch(inputs, config, **kwargs))
+    
+    def batch_as_completed(
+        self,
+        inputs: Iterable[Union[str, Dict[str, Any]]],
+        config: Optional[Union[Dict[str, Any], List[Dict[str, Any]]]] = None,
+        **kwargs
+    ) -> Iterator[Tuple[int, Union[AgentResponse, Exception]]]:
+        """Sync version of abatch_as_completed"""
+        finished: "queue.Queue" = queue.Queue()
+        done = object()
+        
+        async def produce():
+            try:
+                async for item in self.abatch_as_completed(inputs, config, **kwargs):
+                    finished.put(item)
+            finally:
+                finished.put(done)
+        
+        future = get_background_loop().submit(produce())
+        try:
+            while True:
+                item = finished.get()
+                if item is done:
+                    break
+                yield item
+            future.result()
+        finally:
+            # Stop the remaining runs if the caller stops iterating
+            future.cancel()
+    
+    def submit(self, input_text: str, **kwargs) -> "concurrent.futures.Future":
+        """
+        Start a run from sync code without waiting for it
+        
+        The run executes on the shared background event loop; the returned
+        future resolves to an AgentResponse.
+        """
+        return get_background_loop().submit(self.run(input_text, **kwargs))
     
     def __call__(self, input_text: str, **kwargs) -> AgentResponse:
         """Sync call method for compatibility"""
         try:
-            # Create a new event loop if none exists
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
-            return loop.run_until_complete(self.run(input_text, **kwargs))
+            # Safe from any thread, including one running its own loop
+            return get_background_loop().run(self.run(input_text, **kwargs))
         except Exception as e:
-            return AgentResponse(
-                output=f"Error: {str(e)}",
-                success=False,
-                error_message=str(e)
-            )
+            return _error_response(e)
+
+def _error_response(e: Exception) -> AgentResponse:
+    if isinstance(e, XAgentTimeoutError):
+        # Keep whatever XAgent produced before it was stopped
+        return AgentResponse(
+            output=e.partial.get("answer", ""),
+            intermediate_steps=e.partial.get("steps", []),
+            success=False,
+            error_message=str(e),
+            usage=e.partial.get("usage")
+        )
+    return AgentResponse(
+        output=f"Error: {str(e)}",
+        success=False,
+        error_message=str(e)
+    )
+
+def _input_text(item: Union[str, Dict[str, Any]]) -> str:
+    """Task text of a batch input"""
+    if isinstance(item, dict):
+        return item["input"]
+    return item
+
+def _batch_configs(
+    config: Optional[Union[Dict[str, Any], List[Dict[str, Any]]]],
+    count: int
+) -> List[Dict[str, Any]]:
+    """One options dict per batch input"""
+    if config is None:
+        return [{}] * count
+    if isinstance(config, dict):
+        return [config] * count
+    if len(config) != count:
+        raise ValueError(f"Got {len(config)} configs for {count} inputs")
+    for index, options in enumerate(config):
+        if not isinstance(options, dict):
+            raise TypeError(f"Config {index} is a {type(options).__name__}, not a dict")
+    return list(config)
 
 # Factory function to replace LangChain's agent initialization
 def initialize_xagent(tools: List[Any] = None, **kwargs) -> XAgentWrapper:
@@ -84,4 +317,6 @@ def initialize_xagent(tools: List[Any] = None, **kwargs) -> XAgentWrapper:
     Factory function to create XAgent instances
     Replaces LangChain's initialize_agent function
     """
+    # Serves /metrics when XAGENT_METRICS_PORT is set
+    metrics.start_http_server_from_env()
     return XAgentWrapper(tools=tools, **kwargs)
\ No newline at end of file
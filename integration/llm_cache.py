@@ -0,0 +1,428 @@
+"""
+Completion cache for XAgent's model calls
+
+XAgent calls an OpenAI-compatible API itself, from run.py, pool workers
+or this process. With XAGENT_LLM_CACHE=1 the integration starts
+LLMCacheProxy, a small HTTP server on 127.0.0.1, and points
+OPENAI_BASE_URL / OPENAI_API_BASE at it, so model calls from every
+engine pass through it on their way to the real API (the previous value
+of those variables, or XAGENT_LLM_CACHE_UPSTREAM).
+
+Chat and text completions are keyed on a hash of the request: the model,
+every parameter and the exact message list. Only fields that cannot
+change the answer ("user", "stream") are left out. A hash of the
+Authorization header is part of the key too, so one API key's responses
+are never served to a caller using another. Responses are kept in
+the result cache's tiers (see result_cache.py): an in-memory LRU with a
+TTL and, with XAGENT_LLM_CACHE_PATH, an SQLite file read through mmap.
+
+Requests sampled above XAGENT_LLM_CACHE_MAX_TEMPERATURE (default 0.1, the
+temperature xagent_config.yaml pins) bypass the cache, as do streamed
+requests and those sent with "Cache-Control: no-cache". Identical
+requests arriving while one is in flight wait for its response instead
+of calling the API again. Error responses are passed on but not cached.
+
+Every request served without an upstream call is credited with the
+tokens in the response's usage and the upstream latency it originally
+took; get_stats() and the xagent_llm_cache_* metrics report them.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Any, Optional, Callable, Tuple
+
+from result_cache import ResultCache
+import metrics
+
+# Request paths, relative to the API base, whose responses are cached
+CACHED_PATHS = ("/chat/completions", "/completions")
+
+# Request fields that do not change the completion
+UNKEYED_FIELDS = ("user", "stream", "stream_options")
+
+# OpenAI samples at 1.0 when a request does not say
+DEFAULT_TEMPERATURE = 1.0
+
+DEFAULT_UPSTREAM = "https://api.openai.com/v1"
+
+# Upstream response headers worth passing on; the rest describe the
+# upstream connection, not the completion
+FORWARDED_HEADERS = ("content-type", "openai-model", "openai-organization", "openai-version",
+                     "openai-processing-ms", "x-request-id")
+
+cache_requests = metrics.REGISTRY.counter(
+    "xagent_llm_cache_requests", "Model calls seen by the LLM cache, by outcome", ["outcome"]
+)
+cache_saved_tokens = metrics.REGISTRY.counter(
+    "xagent_llm_cache_saved_tokens", "Tokens served from the LLM cache, by kind", ["kind"]
+)
+cache_saved_seconds = metrics.REGISTRY.counter(
+    "xagent_llm_cache_saved_seconds", "Upstream latency avoided by the LLM cache"
+)
+
+
+def completion_key(path: str, request: Dict[str, Any], credential: Optional[str] = None) -> str:
+    """
+    Stable hash of everything in a completion request that determines the
+    answer, and of the credential it was sent with
+    """
+    keyed = {field: value for field, value in request.items() if field not in UNKEYED_FIELDS}
+    if credential is not None:
+        credential = hashlib.sha256(credential.encode()).hexdigest()
+    payload = json.dumps(
+        {"path": path, "request": keyed, "credential": credential},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class UpstreamError(Exception):
+    """A non-200 upstream response, shared with coalesced callers but never cached"""
+
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        super().__init__(f"Upstream returned HTTP {status}")
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class LLMCache(ResultCache):
+    """ResultCache of model responses that counts the tokens and time it saves"""
+
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        ttl: Optional[float] = 86400.0,
+        sqlite_path: Optional[str] = None,
+        enabled: bool = True,
+        max_temperature: float = 0.1,
+        mmap_size: int = 0
+    ):
+        super().__init__(
+            max_entries=max_entries, ttl=ttl, sqlite_path=sqlite_path, enabled=enabled,
+            mmap_size=mmap_size
+        )
+        self.max_temperature = max_temperature
+        self._stats_lock = threading.Lock()
+        self.bypassed = 0
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+        self.saved_prompt_tokens = 0
+        self.saved_completion_tokens = 0
+        self.saved_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> "LLMCache":
+        """Build the cache from XAGENT_LLM_CACHE* environment variables"""
+        return cls(
+            max_entries=int(os.getenv("XAGENT_LLM_CACHE_SIZE", "4096")),
+            ttl=float(os.getenv("XAGENT_LLM_CACHE_TTL", "86400")),
+            sqlite_path=os.getenv("XAGENT_LLM_CACHE_PATH") or None,
+            enabled=os.getenv("XAGENT_LLM_CACHE", "0") == "1",
+            max_temperature=float(os.getenv("XAGENT_LLM_CACHE_MAX_TEMPERATURE", "0.1")),
+            mmap_size=int(os.getenv("XAGENT_LLM_CACHE_MMAP", str(256 * 1024 * 1024)))
+        )
+
+    def cacheable(self, path: str, request: Dict[str, Any]) -> bool:
+        """Whether a response to request may be served to another caller"""
+        if not self.enabled or path not in CACHED_PATHS or request.get("stream"):
+            return False
+        temperature = request.get("temperature")
+        if temperature is None:
+            temperature = DEFAULT_TEMPERATURE
+        try:
+            return float(temperature) <= self.max_temperature
+        except (TypeError, ValueError):
+            # Left for the upstream to reject
+            return False
+
+    def complete(
+        self,
+        path: str,
+        request: Dict[str, Any],
+        call: Callable[[Dict[str, Any]], Dict[str, Any]],
+        bypass: bool = False,
+        credential: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], str]:
+        """
+        The response to a completion request, calling call(request) at most
+        once for identical concurrent requests
+
+        Returns the response and how it was served: "hit", "coalesced",
+        "miss" or "bypass". Only callers with the same credential share
+        responses. UpstreamError and other exceptions from call reach every
+        caller waiting on it.
+        """
+        if bypass or not self.cacheable(path, request):
+            self._count("bypass")
+            return self._call(call, request)[0], "bypass"
+
+        key = completion_key(path, request, credential)
+        entry = self.get(key)
+        if entry is not None:
+            return self._served(entry, "hit"), "hit"
+
+        inflight, leader = self._claim(key)
+        if not leader:
+            return self._served(inflight.result(), "coalesced"), "coalesced"
+
+        try:
+            # Stored by a leader that finished since our lookup
+            entry = self.memory.get(key)
+            if entry is None:
+                response, latency = self._call(call, request)
+                entry = {"response": response, "latency": latency}
+                self.set(key, entry)
+                self._count("miss")
+                outcome = "miss"
+            else:
+                self._served(entry, "hit")
+                outcome = "hit"
+        except BaseException as e:
+            inflight.set_exception(e)
+            raise
+        else:
+            inflight.set_result(entry)
+            return entry["response"], outcome
+        finally:
+            self._release(key)
+
+    def _call(self, call, request) -> Tuple[Dict[str, Any], float]:
+        started = time.perf_counter()
+        try:
+            return call(request), time.perf_counter() - started
+        finally:
+            with self._stats_lock:
+                self.upstream_calls += 1
+                self.upstream_seconds += time.perf_counter() - started
+
+    def _count(self, outcome: str):
+        if outcome == "bypass":
+            with self._stats_lock:
+                self.bypassed += 1
+        cache_requests.labels(outcome=outcome).inc()
+
+    def _served(self, entry: Dict[str, Any], outcome: str) -> Dict[str, Any]:
+        """Credit a response served without an upstream call"""
+        usage = entry["response"].get("usage") or {}
+        prompt = usage.get("prompt_tokens") or 0
+        completion = usage.get("completion_tokens") or 0
+        with self._stats_lock:
+            self.saved_prompt_tokens += prompt
+            self.saved_completion_tokens += completion
+            self.saved_seconds += entry["latency"]
+        self._count(outcome)
+        cache_saved_tokens.labels(kind="prompt").inc(prompt)
+        cache_saved_tokens.labels(kind="completion").inc(completion)
+        cache_saved_seconds.inc(entry["latency"])
+        return entry["response"]
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        with self._stats_lock:
+            stats.update({
+                "bypassed": self.bypassed,
+                "upstream_calls": self.upstream_calls,
+                "upstream_seconds": self.upstream_seconds,
+                "saved_prompt_tokens": self.saved_prompt_tokens,
+                "saved_completion_tokens": self.saved_completion_tokens,
+                "saved_tokens": self.saved_prompt_tokens + self.saved_completion_tokens,
+                "saved_seconds": self.saved_seconds,
+            })
+        return stats
+
+
+class LLMCacheProxy:
+    """
+    OpenAI-compatible HTTP endpoint that answers completions through an LLMCache
+
+    Point clients at base_url; cached paths go through the cache and
+    everything else (models, embeddings, streamed completions) is
+    forwarded to upstream unchanged. Responses carry an X-Cache header
+    saying how they were served.
+    """
+
+    def __init__(
+        self,
+        upstream: str = DEFAULT_UPSTREAM,
+        cache: Optional[LLMCache] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        timeout: float = 600.0
+    ):
+        self.upstream = upstream.rstrip("/")
+        self.cache = cache if cache is not None else LLMCache()
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def __enter__(self) -> "LLMCacheProxy":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _request(self, method: str, path: str, headers, body: Optional[bytes]):
+        """An open upstream response; HTTPError for non-2xx statuses"""
+        import urllib.request
+
+        forwarded = {
+            name: value for name, value in headers.items()
+            if name.lower() not in ("host", "content-length", "connection", "accept-encoding")
+        }
+        request = urllib.request.Request(
+            self.upstream + path, data=body, headers=forwarded, method=method
+        )
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def _complete(self, path: str, headers, body: bytes) -> Dict[str, Any]:
+        """Call upstream for a completion; UpstreamError unless it answers 200"""
+        import urllib.error
+
+        try:
+            with self._request("POST", path, headers, body) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise UpstreamError(e.code, dict(e.headers), e.read()) from None
+
+    def start(self) -> "LLMCacheProxy":
+        """Serve from a daemon thread"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _path(self) -> str:
+                path = self.path
+                return path[len("/v1"):] if path.startswith("/v1/") else path
+
+            def _reply(self, status: int, headers: Dict[str, str], body: bytes, outcome: str):
+                self.send_response(status)
+                for name, value in headers.items():
+                    if name.lower() in FORWARDED_HEADERS:
+                        self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("X-Cache", outcome)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _error(self, status: int, message: str):
+                body = json.dumps({"error": {"message": message, "type": "proxy_error"}})
+                self._reply(status, {"Content-Type": "application/json"}, body.encode(), "error")
+
+            def _forward(self, body: Optional[bytes]):
+                """Relay the request upstream, streaming the response back as it arrives"""
+                import urllib.error
+
+                try:
+                    response = proxy._request(self.command, self._path(), self.headers, body)
+                except urllib.error.HTTPError as e:
+                    self._reply(e.code, dict(e.headers), e.read(), "bypass")
+                    return
+                except OSError as e:
+                    self._error(502, f"Upstream unreachable: {e}")
+                    return
+                with response:
+                    self.send_response(response.status)
+                    for name, value in response.headers.items():
+                        if name.lower() in FORWARDED_HEADERS:
+                            self.send_header(name, value)
+                    self.send_header("X-Cache", "bypass")
+                    self.end_headers()
+                    # HTTP/1.0: the body ends when the connection closes
+                    while True:
+                        chunk = response.read1(65536)
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+                        self.wfile.flush()
+
+            def do_GET(self):
+                self._forward(None)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                path = self._path()
+                try:
+                    request = json.loads(body) if path in CACHED_PATHS else None
+                except ValueError:
+                    request = None
+                if not isinstance(request, dict) or request.get("stream"):
+                    proxy.cache._count("bypass")
+                    self._forward(body)
+                    return
+
+                bypass = "no-cache" in (self.headers.get("Cache-Control") or "")
+                try:
+                    response, outcome = proxy.cache.complete(
+                        path, request, lambda _: proxy._complete(path, self.headers, body),
+                        bypass=bypass, credential=self.headers.get("Authorization")
+                    )
+                except UpstreamError as e:
+                    self._reply(e.status, e.headers, e.body, "error")
+                    return
+                except OSError as e:
+                    self._error(502, f"Upstream unreachable: {e}")
+                    return
+                self._reply(
+                    200, {"Content-Type": "application/json"}, json.dumps(response).encode(),
+                    outcome
+                )
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        thread = threading.Thread(
+            target=self._server.serve_forever, name="xagent-llm-cache", daemon=True
+        )
+        thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+_env_proxy: Optional[LLMCacheProxy] = None
+_env_lock = threading.Lock()
+
+
+def start_proxy_from_env() -> Optional[LLMCacheProxy]:
+    """
+    Start the proxy once if XAGENT_LLM_CACHE=1 and point OpenAI clients at it
+
+    Sets OPENAI_BASE_URL and OPENAI_API_BASE for this process and every
+    XAgent process it starts afterwards.
+    """
+    global _env_proxy
+    if os.getenv("XAGENT_LLM_CACHE", "0") != "1":
+        return None
+    with _env_lock:
+        if _env_proxy is None:
+            upstream = (
+                os.getenv("XAGENT_LLM_CACHE_UPSTREAM")
+                or os.getenv("OPENAI_BASE_URL")
+                or os.getenv("OPENAI_API_BASE")
+                or DEFAULT_UPSTREAM
+            )
+            _env_proxy = LLMCacheProxy(
+                upstream, LLMCache.from_env(),
+                port=int(os.getenv("XAGENT_LLM_CACHE_PORT", "0"))
+            ).start()
+            os.environ["OPENAI_BASE_URL"] = _env_proxy.base_url
+            os.environ["OPENAI_API_BASE"] = _env_proxy.base_url
+    return _env_proxy
@@ -0,0 +1,457 @@
+"""
+Prometheus-style metrics for the integration layer
+
+Counters, gauges and histograms live in a MetricsRegistry that renders
+the Prometheus text exposition format. The registry can be served by a
+small stdlib HTTP server (start_http_server, or XAGENT_METRICS_PORT), or
+mounted in the host application: asgi_app() for FastAPI/Starlette, or
+render() from any route.
+
+Updates are sharded per thread: each thread adds to its own cell and
+only a scrape reads across cells, so recording takes no lock and
+threads never contend on a shared value. Cells of threads that have
+exited are folded into a retired total when a new thread's cell is made
+or on the next scrape, whichever comes first.
+"""
+
+import os
+import sys
+import threading
+import weakref
+from bisect import bisect_left
+from typing import Dict, Any, List, Optional, Callable, Iterable, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; XAgent runs range from a warm worker's milliseconds to minutes
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Bytes of run.py output
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class _Cells:
+    """
+    Per-thread accumulators of a fixed width; a thread only writes its own
+
+    reset() never touches a cell another thread may be writing to: it
+    starts a new generation, and cells of older generations are dropped
+    from the totals and replaced on their thread's next write.
+    """
+
+    def __init__(self, width: int):
+        self.width = width
+        self._local = threading.local()
+        self._cells: List[Tuple[threading.Thread, List[float]]] = []
+        self._retired = [0] * width
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def cell(self) -> List[float]:
+        local = self._local
+        try:
+            if local.generation == self._generation:
+                return local.cell
+        except AttributeError:
+            pass
+        cell = [0] * self.width
+        with self._lock:
+            # Short-lived threads would otherwise pile up between scrapes
+            self._retire_dead()
+            self._cells.append((threading.current_thread(), cell))
+            local.generation = self._generation
+        local.cell = cell
+        return cell
+
+    def _retire_dead(self):
+        """Fold the cells of exited threads into the retired total; lock held"""
+        live = []
+        for thread, cell in self._cells:
+            if thread.is_alive():
+                live.append((thread, cell))
+            else:
+                for i, value in enumerate(cell):
+                    self._retired[i] += value
+        self._cells = live
+
+    def totals(self) -> List[float]:
+        with self._lock:
+            self._retire_dead()
+            totals = list(self._retired)
+            for _, cell in self._cells:
+                for i, value in enumerate(cell):
+                    totals[i] += value
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self._generation += 1
+            self._retired = [0] * self.width
+            self._cells = []
+
+
+class _Metric:
+    """Base for a metric family with optional labels"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs) -> "_Metric":
+        """The child metric for one combination of label values"""
+        if kwargs:
+            values = tuple(str(kwargs[name]) for name in self.labelnames)
+        else:
+            values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def _series(self) -> Iterable[Tuple[Dict[str, str], "_Metric"]]:
+        if not self.labelnames:
+            yield {}, self
+        for values, child in list(self._children.items()):
+            yield dict(zip(self.labelnames, values)), child
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []
+        for labels, metric in self._series():
+            samples.extend(metric._own_samples(labels))
+        return samples
+
+    def _own_samples(self, labels: Dict[str, str]):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._cells = _Cells(1)
+
+    def _new_child(self):
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        self._cells.cell()[0] += amount
+
+    @property
+    def value(self) -> float:
+        return self._cells.totals()[0]
+
+    def _own_samples(self, labels):
+        return [(self.name + "_total", labels, self.value)]
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down
+
+    With func the value is read from it at scrape time instead.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        func: Optional[Callable[[], float]] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+        self._base = 0.0
+        self._cells = _Cells(1)
+
+    def _new_child(self):
+        return Gauge(self.name, self.documentation)
+
+    def inc(self, amount: float = 1):
+        self._cells.cell()[0] += amount
+
+    def dec(self, amount: float = 1):
+        self._cells.cell()[0] -= amount
+
+    def set(self, value: float):
+        # Rare compared to inc/dec, so it may take the lock. An inc or dec
+        # racing with it lands either before it, in a dropped cell, or after
+        with self._lock:
+            self._cells.reset()
+            self._base = value
+
+    @property
+    def value(self) -> float:
+        if self.func is not None:
+            try:
+                return float(self.func())
+            except Exception:
+                return float("nan")
+        with self._lock:
+            return self._base + self._cells.totals()[0]
+
+    def _own_samples(self, labels):
+        return [(self.name, labels, self.value)]
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DURATION_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # One cell slot per bucket plus +Inf, then the sum
+        self._cells = _Cells(len(self.buckets) + 2)
+
+    def _new_child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float):
+        cell = self._cells.cell()
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        totals = self._cells.totals()
+        counts = totals[:-1]
+        return {"buckets": self.buckets, "counts": counts, "count": sum(counts), "sum": totals[-1]}
+
+    def _own_samples(self, labels):
+        snapshot = self.snapshot()
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), snapshot["counts"]):
+            cumulative += count
+            samples.append((self.name + "_bucket", dict(labels, le=_format_value(bound)), cumulative))
+        samples.append((self.name + "_sum", labels, snapshot["sum"]))
+        samples.append((self.name + "_count", labels, snapshot["count"]))
+        return samples
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == float("-inf"):
+        return "-Inf"
+    if value != value:
+        return "NaN"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """Named metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        func: Optional[Callable[[], float]] = None
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, func))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DURATION_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                if labels:
+                    rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                    name = f"{name}{{{rendered}}}"
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def asgi_app(registry: Optional[MetricsRegistry] = None):
+    """ASGI application serving the registry, for app.mount("/metrics", ...)"""
+    registry = registry or REGISTRY
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = registry.render().encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", CONTENT_TYPE.encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    return app
+
+
+def start_http_server(port: int, addr: str = "127.0.0.1", registry: Optional[MetricsRegistry] = None):
+    """Serve /metrics from a daemon thread; returns the server"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    registry = registry or REGISTRY
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="xagent-metrics", daemon=True)
+    thread.start()
+    return server
+
+
+_env_server = None
+_env_lock = threading.Lock()
+
+
+def start_http_server_from_env():
+    """Start the /metrics server once if XAGENT_METRICS_PORT is set"""
+    global _env_server
+    port = os.getenv("XAGENT_METRICS_PORT")
+    if not port:
+        return None
+    with _env_lock:
+        if _env_server is None:
+            addr = os.getenv("XAGENT_METRICS_ADDR", "127.0.0.1")
+            _env_server = start_http_server(int(port), addr)
+    return _env_server
+
+
+# Shared registry and the integration's own metrics
+REGISTRY = MetricsRegistry()
+
+tasks_started = REGISTRY.counter(
+    "xagent_tasks_started", "XAgent runs started"
+)
+tasks_succeeded = REGISTRY.counter(
+    "xagent_tasks_succeeded", "XAgent runs that produced a result"
+)
+tasks_failed = REGISTRY.counter(
+    "xagent_tasks_failed", "XAgent runs that failed, by error class", ["error"]
+)
+subprocesses_in_flight = REGISTRY.gauge(
+    "xagent_subprocesses_in_flight", "run.py executions in progress", ["mode"]
+)
+task_duration = REGISTRY.histogram(
+    "xagent_task_duration_seconds", "Wall time of XAgent runs"
+)
+task_output_size = REGISTRY.histogram(
+    "xagent_task_output_bytes", "Bytes of output written by XAgent runs", buckets=SIZE_BUCKETS
+)
+retries = REGISTRY.counter(
+    "xagent_retries", "XAgent runs retried, by error class", ["error"]
+)
+hedged_runs = REGISTRY.counter(
+    "xagent_hedged_runs", "Second attempts started for slow runs, by outcome", ["outcome"]
+)
+circuit_rejections = REGISTRY.counter(
+    "xagent_circuit_rejections", "Runs refused while a circuit breaker was open"
+)
+circuit_open = REGISTRY.gauge(
+    "xagent_circuit_breakers_open", "Circuit breakers currently open or half-open"
+)
+
+
+def record_task(duration: float, error: Optional[str], usage: Optional[Dict[str, Any]] = None):
+    """Count one finished XAgent run; error is its exception class name, if any"""
+    if error is None:
+        tasks_succeeded.inc()
+    else:
+        tasks_failed.labels(error=error).inc()
+    task_duration.observe(duration)
+    if usage and usage.get("output_bytes") is not None:
+        task_output_size.observe(usage["output_bytes"])
+
+
+_mock_redis_clients: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def _mock_redis_keys() -> int:
+    clients = set(_mock_redis_clients)
+    # The shared store XAgent uses counts once anything has imported it;
+    # importing it here would cost every process that never does
+    for name in ("XAgentServer.exts.mock_redis", "mock_redis"):
+        shared = getattr(sys.modules.get(name), "mock_redis", None)
+        if shared is not None:
+            clients.add(shared)
+    return sum(client.dbsize() for client in clients)
+
+
+REGISTRY.gauge(
+    "xagent_mock_redis_keys",
+    "Keys held by the shared mock Redis store and registered clients",
+    func=_mock_redis_keys
+)
+
+
+def register_mock_redis(client):
+    """Count a MockRedisClient's keys in xagent_mock_redis_keys"""
+    _mock_redis_clients.add(client)
@@ -0,0 +1,106 @@
+"""
+Process-group helpers for stopping XAgent runs
+
+run.py processes and pool workers are started in a session of their own,
+so everything they spawn shares their process group. Stopping a run
+signals the whole group: SIGTERM first, then SIGKILL for anything still
+alive after a grace period. The direct child is always waited for, so no
+zombie is left behind; grandchildren are killed by the group signal and
+reaped by init.
+"""
+
+import os
+import signal
+import subprocess
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Seconds between SIGTERM and SIGKILL
+DEFAULT_KILL_GRACE = 5.0
+
+_POSIX = os.name == "posix"
+
+
+def kill_grace() -> float:
+    return float(os.getenv("XAGENT_KILL_GRACE", str(DEFAULT_KILL_GRACE)))
+
+
+def new_group_kwargs() -> Dict[str, Any]:
+    """Popen/create_subprocess_exec arguments that start a new process group"""
+    if _POSIX:
+        return {"start_new_session": True}
+    return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+
+
+def signal_group(process, sig: int):
+    """Send sig to the process group led by process, ignoring dead groups"""
+    if process.returncode is not None:
+        return
+    try:
+        if _POSIX:
+            os.killpg(process.pid, sig)
+        elif sig == signal.SIGTERM:
+            process.terminate()
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def terminate_group(process: subprocess.Popen, grace: Optional[float] = None):
+    """Stop a Popen process group, blocking until the leader is reaped"""
+    grace = kill_grace() if grace is None else grace
+    signal_group(process, signal.SIGTERM)
+    try:
+        process.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        pass
+    # Children that outlived the leader go too
+    _kill_group(process)
+    process.wait()
+
+
+def terminate_group_later(process: subprocess.Popen, grace: Optional[float] = None):
+    """terminate_group in a background thread, for callers that cannot block"""
+    thread = threading.Thread(
+        target=terminate_group, args=(process, grace), name="xagent-terminate", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+async def aterminate_group(
+    process,
+    grace: Optional[float] = None,
+    wait: Optional[Callable[[], Awaitable[Any]]] = None
+):
+    """
+    Stop a process group from async code and wait for the leader
+
+    wait returns an awaitable that completes once the leader has been
+    reaped; it defaults to process.wait() for asyncio subprocesses.
+    """
+    import asyncio
+
+    grace = kill_grace() if grace is None else grace
+    wait = wait or process.wait
+    signal_group(process, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(wait(), grace)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        # Runs even if this coroutine is itself cancelled
+        _kill_group(process)
+    await wait()
+
+
+def _kill_group(process):
+    if not _POSIX:
+        if process.returncode is None:
+            process.kill()
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
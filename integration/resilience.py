@@ -0,0 +1,295 @@
+"""
+Retries, hedged requests and a circuit breaker for XAgent runs
+
+A failed run is classified by the error_class attribute of its exception
+(see classify); only classes listed in RetryPolicy.retry_on are retried,
+after a jittered exponential backoff. By default those are "crash" (a
+worker died, or run.py was killed by a signal) and "rate_limit" (run.py
+exited reporting a model rate limit or overload). Timeouts, runs stopped
+by a resource limit ("limit") and ordinary task failures are not retried
+unless configured.
+
+Hedging starts a second attempt when the first has run longer than the
+p95 of recent successful runs, keeps whichever finishes first and
+cancels the other. It is off by default since a hedged run executes the
+task twice.
+
+The circuit breaker opens after a number of consecutive infrastructure
+failures (see CircuitBreaker.counts) and refuses runs with
+CircuitOpenError until its reset timeout has passed; then a single
+probe run decides whether it closes again. A task that fails on its
+own merits says nothing about the infrastructure and does not count.
+
+Configuration: XAGENT_RETRY_*, XAGENT_HEDGE* and XAGENT_BREAKER_*
+environment variables (see the from_env methods).
+"""
+
+import os
+import random
+import re
+import signal
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, FrozenSet, Optional
+
+import metrics
+
+# What run.py prints when the model API pushes back
+RATE_LIMIT_PATTERN = re.compile(
+    r"rate.?limit|too many requests|\b429\b|overloaded|\b503\b|temporarily unavailable",
+    re.IGNORECASE
+)
+
+RETRYABLE_DEFAULT = frozenset({"crash", "rate_limit"})
+
+# Error classes that count towards opening the circuit breaker
+BREAKER_DEFAULT = frozenset({"crash", "rate_limit", "timeout"})
+
+# Signals sent for exceeding an rlimit; the run would hit it again
+LIMIT_SIGNALS = frozenset(
+    getattr(signal, name) for name in ("SIGXCPU", "SIGXFSZ") if hasattr(signal, name)
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of starting a run while the circuit breaker is open"""
+
+    error_class = "circuit_open"
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"XAgent circuit breaker is open; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def classify(error: BaseException) -> str:
+    """
+    Error class of a failed run
+
+    One of crash, limit, rate_limit, timeout, circuit_open or error.
+    """
+    return getattr(error, "error_class", "error")
+
+
+def crash_class(returncode: Optional[int]) -> str:
+    """Error class of a process that died: limit for rlimit signals, else crash"""
+    if returncode is not None and -returncode in LIMIT_SIGNALS:
+        return "limit"
+    return "crash"
+
+
+def classify_exit(returncode: int, output: str) -> str:
+    """Error class of a run.py process that exited with returncode"""
+    if returncode < 0:
+        return crash_class(returncode)
+    if RATE_LIMIT_PATTERN.search(output):
+        return "rate_limit"
+    return "error"
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How often and after which errors a run is retried"""
+    attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    multiplier: float = 2.0
+    # Share of each delay that is randomised; 1 is "full jitter"
+    jitter: float = 1.0
+    retry_on: FrozenSet[str] = RETRYABLE_DEFAULT
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        """Build the policy from XAGENT_RETRY_* environment variables"""
+        retry_on = os.getenv("XAGENT_RETRY_ON")
+        return cls(
+            attempts=int(os.getenv("XAGENT_RETRY_ATTEMPTS", "3")),
+            base_delay=_env_float("XAGENT_RETRY_BASE_DELAY", 0.5),
+            max_delay=_env_float("XAGENT_RETRY_MAX_DELAY", 30.0),
+            jitter=_env_float("XAGENT_RETRY_JITTER", 1.0),
+            retry_on=(
+                frozenset(name.strip() for name in retry_on.split(",") if name.strip())
+                if retry_on is not None else RETRYABLE_DEFAULT
+            )
+        )
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "RetryPolicy":
+        data = dict(data or {})
+        if "retry_on" in data:
+            data["retry_on"] = frozenset(data["retry_on"])
+        return cls(**data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["retry_on"] = sorted(self.retry_on)
+        return data
+
+    def should_retry(self, error: BaseException, attempt: int) -> bool:
+        """Whether a run that failed with error on attempt (from 1) is retried"""
+        return attempt < self.attempts and classify(error) in self.retry_on
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before retrying after attempt (from 1)"""
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+
+@dataclass(frozen=True)
+class HedgePolicy:
+    """When a second attempt of a slow run is started"""
+    enabled: bool = False
+    quantile: float = 95.0
+    # Successful runs needed before the quantile is trusted
+    min_samples: int = 20
+    window: int = 256
+    # Fixed hedge delay in seconds instead of the observed quantile
+    delay: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> "HedgePolicy":
+        """Build the policy from XAGENT_HEDGE* environment variables"""
+        delay = os.getenv("XAGENT_HEDGE_DELAY")
+        return cls(
+            enabled=os.getenv("XAGENT_HEDGE", "0") == "1",
+            quantile=_env_float("XAGENT_HEDGE_QUANTILE", 95.0),
+            min_samples=int(os.getenv("XAGENT_HEDGE_MIN_SAMPLES", "20")),
+            delay=float(delay) if delay else None
+        )
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "HedgePolicy":
+        return cls(**(data or {}))
+
+
+class LatencyBudget:
+    """Durations of recent successful runs and the hedge delay they imply"""
+
+    def __init__(self, policy: HedgePolicy):
+        self.policy = policy
+        self._samples: deque = deque(maxlen=policy.window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def hedge_delay(self, policy: Optional[HedgePolicy] = None) -> Optional[float]:
+        """Seconds after which to hedge, or None while there is too little data"""
+        policy = policy or self.policy
+        if policy.delay is not None:
+            return policy.delay
+        samples = sorted(self._samples)
+        if len(samples) < policy.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(policy.quantile / 100 * len(samples)))]
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock=time.monotonic,
+        trip_on: FrozenSet[str] = BREAKER_DEFAULT
+    ):
+        # A threshold of 0 disables the breaker
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.trip_on = trip_on
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # Token of the caller running the half-open probe, if any
+        self._probe: Optional[object] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        """Build a breaker from XAGENT_BREAKER_FAILURES / XAGENT_BREAKER_RESET"""
+        return cls(
+            failure_threshold=int(os.getenv("XAGENT_BREAKER_FAILURES", "5")),
+            reset_timeout=_env_float("XAGENT_BREAKER_RESET", 30.0)
+        )
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if self._probe is not None or self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> Optional[object]:
+        """
+        Admit a run, or raise CircuitOpenError
+
+        Returns a token when the run is the half-open probe, else None; a
+        cancelled run hands it back to release().
+        """
+        if not self.failure_threshold:
+            return None
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return None
+            if state == self.HALF_OPEN and self._probe is None:
+                self._probe = object()
+                return self._probe
+            retry_after = max(self.opened_at + self.reset_timeout - self.clock(), 0.0)
+        metrics.circuit_rejections.inc()
+        raise CircuitOpenError(retry_after)
+
+    def counts(self, error: BaseException) -> bool:
+        """
+        Whether a failed run counts towards opening the breaker
+
+        Classified errors count when their class is in trip_on; of the
+        unclassified ones only OS errors (spawning run.py, talking to a
+        worker) do.
+        """
+        if hasattr(error, "error_class"):
+            return classify(error) in self.trip_on
+        return isinstance(error, OSError)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe = None
+            if self.opened_at is not None:
+                self.opened_at = None
+                metrics.circuit_open.dec()
+
+    def record_failure(self):
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            self.failures += 1
+            tripped = self.opened_at is None and self.failures >= self.failure_threshold
+            if self._probe is not None or tripped:
+                if self.opened_at is None:
+                    metrics.circuit_open.inc()
+                self.opened_at = self.clock()
+                self._probe = None
+
+    def release(self, probe: Optional[object]):
+        """Give back the half-open probe if probe, from allow(), is its token"""
+        if probe is None:
+            return
+        with self._lock:
+            if self._probe is probe:
+                self._probe = None
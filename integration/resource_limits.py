@@ -0,0 +1,257 @@
+"""
+Resource limits and usage accounting for XAgent runs
+
+Limits are plain rlimits (address space, CPU seconds, open files) applied
+to the run.py process, plus optional placement in a cgroup v2 group that
+caps the memory of the whole process tree. Usage is measured per run:
+wall time, user/system CPU, peak RSS and the bytes of output collected.
+
+Everything here is best effort: on platforms without the resource module
+or cgroup v2 the limits are skipped and only what can be measured is
+reported.
+"""
+
+import os
+import sys
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+_RLIMITS = {
+    "memory_bytes": "RLIMIT_AS",
+    "cpu_seconds": "RLIMIT_CPU",
+    "open_files": "RLIMIT_NOFILE",
+}
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+@dataclass(frozen=True)
+class ResourceLimits:
+    """Per-run limits; None leaves a limit unset"""
+    memory_bytes: Optional[int] = None
+    cpu_seconds: Optional[int] = None
+    open_files: Optional[int] = None
+    cgroup_parent: Optional[str] = None
+
+    @classmethod
+    def from_env(cls) -> "ResourceLimits":
+        """Build limits from XAGENT_LIMIT_* and XAGENT_CGROUP"""
+        return cls(
+            memory_bytes=_env_int("XAGENT_LIMIT_AS"),
+            cpu_seconds=_env_int("XAGENT_LIMIT_CPU"),
+            open_files=_env_int("XAGENT_LIMIT_NOFILE"),
+            cgroup_parent=os.getenv("XAGENT_CGROUP") or None
+        )
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "ResourceLimits":
+        return cls(**(data or {}))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @property
+    def enabled(self) -> bool:
+        return any(value is not None for value in asdict(self).values())
+
+    def rlimits(self):
+        """(resource, value) for every configured rlimit"""
+        if resource is None:
+            return []
+        limits = []
+        for field, name in _RLIMITS.items():
+            value = getattr(self, field)
+            if value is not None and hasattr(resource, name):
+                limits.append((getattr(resource, name), value))
+        return limits
+
+    def apply_to(self, pid: int):
+        """Set the rlimits of a running process (Linux prlimit)"""
+        for which, value in self.rlimits():
+            _, hard = resource.prlimit(pid, which)
+            limit = value
+            if which == getattr(resource, "RLIMIT_CPU", None):
+                # A second of headroom, so the run gets SIGXCPU (and can be
+                # told apart from a crash) before the SIGKILL at the hard limit
+                limit += 1
+            resource.prlimit(pid, which, (_clamp(value, hard), _clamp(limit, hard)))
+
+    def apply_to_self(self) -> list:
+        """Lower this process's soft limits; returns what restore() needs"""
+        saved = []
+        for which, value in self.rlimits():
+            soft, hard = resource.getrlimit(which)
+            if which == getattr(resource, "RLIMIT_CPU", None):
+                # RLIMIT_CPU counts the whole process lifetime, so a
+                # per-run budget starts from what has been used so far
+                used = resource.getrusage(resource.RUSAGE_SELF)
+                value += int(used.ru_utime + used.ru_stime) + 1
+            resource.setrlimit(which, (_clamp(value, hard), hard))
+            saved.append((which, soft, hard))
+        return saved
+
+
+def restore(saved: list):
+    """Undo ResourceLimits.apply_to_self"""
+    for which, soft, hard in saved:
+        resource.setrlimit(which, (soft, hard))
+
+
+def _clamp(value: int, hard: int) -> int:
+    if resource is not None and hard != resource.RLIM_INFINITY:
+        return min(value, hard)
+    return value
+
+
+def cgroup_v2_available(parent: str) -> bool:
+    return (
+        os.path.exists(os.path.join(CGROUP_ROOT, "cgroup.controllers"))
+        and os.path.isdir(parent)
+        and os.access(parent, os.W_OK)
+    )
+
+
+class Cgroup:
+    """A cgroup v2 group created for one run or worker"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @classmethod
+    def create(cls, parent: str, name: str, limits: ResourceLimits) -> Optional["Cgroup"]:
+        """Create parent/name with the memory limit, or None if unsupported"""
+        if not cgroup_v2_available(parent):
+            return None
+        path = os.path.join(parent, name)
+        try:
+            os.makedirs(path, exist_ok=True)
+            if limits.memory_bytes is not None:
+                cls._write(path, "memory.max", str(limits.memory_bytes))
+        except OSError:
+            return None
+        return cls(path)
+
+    @staticmethod
+    def _write(path: str, name: str, value: str):
+        with open(os.path.join(path, name), "w") as f:
+            f.write(value)
+
+    def add(self, pid: int) -> bool:
+        try:
+            self._write(self.path, "cgroup.procs", str(pid))
+            return True
+        except OSError:
+            return False
+
+    def memory_peak(self) -> Optional[int]:
+        """Peak memory of the whole group (kernel 5.19+)"""
+        try:
+            with open(os.path.join(self.path, "memory.peak")) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def remove(self):
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
+
+
+def rusage_usage(ru, wall_seconds: float) -> Dict[str, Any]:
+    """Usage dict from a struct_rusage"""
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "wall_seconds": wall_seconds,
+        "user_cpu_seconds": ru.ru_utime,
+        "system_cpu_seconds": ru.ru_stime,
+        "peak_rss_bytes": ru.ru_maxrss * scale,
+    }
+
+
+def thread_cpu():
+    """
+    (user, system) CPU seconds of the calling thread
+
+    Without RUSAGE_THREAD (outside Linux) the thread's total CPU time is
+    reported as user time.
+    """
+    if resource is not None and hasattr(resource, "RUSAGE_THREAD"):
+        ru = resource.getrusage(resource.RUSAGE_THREAD)
+        return ru.ru_utime, ru.ru_stime
+    return time.thread_time(), 0.0
+
+
+def wait4(pid: int):
+    """Reap pid; return (returncode, struct_rusage)"""
+    _, status, ru = os.wait4(pid, 0)
+    return os.waitstatus_to_exitcode(status), ru
+
+
+class UsageMeter:
+    """
+    Usage of one task run inside a long-lived process
+
+    CPU comes from getrusage deltas of the process and its reaped
+    children. Peak RSS is reset before the task through
+    /proc/self/clear_refs where Linux allows it, so it covers this task
+    only; elsewhere it is the process's lifetime peak.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        _reset_peak_rss()
+        self.before = self._cpu()
+
+    @staticmethod
+    def _cpu():
+        if resource is None:
+            return 0.0, 0.0
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return own.ru_utime + children.ru_utime, own.ru_stime + children.ru_stime
+
+    def finish(self) -> Dict[str, Any]:
+        user, system = self._cpu()
+        peak = _peak_rss()
+        if peak is None and resource is not None:
+            peak = rusage_usage(resource.getrusage(resource.RUSAGE_SELF), 0)["peak_rss_bytes"]
+        return {
+            "wall_seconds": time.monotonic() - self.started,
+            "user_cpu_seconds": user - self.before[0],
+            "system_cpu_seconds": system - self.before[1],
+            "peak_rss_bytes": peak,
+        }
+
+
+def _reset_peak_rss() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss() -> Optional[int]:
+    """VmHWM of this process in bytes, if /proc has it"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
@@ -0,0 +1,306 @@
+"""
+Result cache for repeated XAgent tasks
+
+Results are keyed on a hash of the normalized task text, the execution
+config and the content hash of the parsed XAgent config (see
+config_loader.py). Lookups go through an in-memory LRU tier with a TTL
+and, optionally, an SQLite tier that survives restarts. Concurrent
+requests for the same key share a single in-flight run.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, Awaitable, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import concurrent.futures
+
+
+def normalize_task(task: str) -> str:
+    """Collapse whitespace so trivially different prompts share a key"""
+    return " ".join(task.split())
+
+
+def make_cache_key(task: str, execution_config: Dict[str, Any], config_digest: str = "") -> str:
+    """Stable hash of everything that determines an XAgent result"""
+    payload = json.dumps(
+        {
+            "task": normalize_task(task),
+            "config": execution_config,
+            "xagent_config": config_digest,
+        },
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU with per-entry expiry"""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at and expires_at <= time.time():
+                del self._data[key]
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else 0.0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Persistent cache tier backed by an SQLite file"""
+
+    def __init__(self, path: str, ttl: Optional[float] = 3600.0, mmap_size: int = 0):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        
+        # sqlite3 is only imported when a disk tier is configured
+        import sqlite3
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        if mmap_size:
+            # Reads come straight from the mapped file instead of read() calls
+            self._conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at and expires_at <= time.time():
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.expirations += 1
+                return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else 0.0
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        """Drop expired rows and return how many were removed"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM results WHERE expires_at > 0 AND expires_at <= ?", (time.time(),)
+            )
+            return cursor.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResultCache:
+    """Two-tier result cache with single-flight de-duplication"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = 3600.0,
+        sqlite_path: Optional[str] = None,
+        enabled: bool = True,
+        mmap_size: int = 0
+    ):
+        self.enabled = enabled
+        self.memory = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.disk = SQLiteCache(sqlite_path, ttl=ttl, mmap_size=mmap_size) if sqlite_path else None
+
+        # In-flight computations, shared across threads and event loops
+        self._inflight: Dict[str, "concurrent.futures.Future"] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        """Build the cache from XAGENT_RESULT_CACHE* environment variables"""
+        return cls(
+            max_entries=int(os.getenv("XAGENT_RESULT_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("XAGENT_RESULT_CACHE_TTL", "3600")),
+            sqlite_path=os.getenv("XAGENT_RESULT_CACHE_PATH") or None,
+            enabled=os.getenv("XAGENT_RESULT_CACHE", "0") == "1"
+        )
+
+    def make_key(self, task: str, execution_config: Dict[str, Any], config_digest: str) -> str:
+        return make_cache_key(task, execution_config, config_digest)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Look a key up in memory, then on disk"""
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self.memory.set(key, value)
+                return value
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value for key, computing it at most once
+
+        Callers that arrive while the same key is being computed wait for
+        that run instead of starting their own. Exceptions are shared with
+        the waiters but never cached. Everyone but the caller that computed
+        the value gets a deep copy, so mutating a result cannot change what
+        later callers are served.
+        """
+        import asyncio
+        
+        value = self.get(key)
+        if value is not None:
+            return copy.deepcopy(value)
+
+        inflight, leader = self._claim(key)
+        if not leader:
+            # Shielded: a waiter that is cancelled must not cancel the
+            # shared future under the leader and the other waiters
+            return copy.deepcopy(await asyncio.shield(asyncio.wrap_future(inflight)))
+
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            # Waiters were not cancelled themselves, so fail them explicitly
+            if not inflight.done():
+                inflight.set_exception(RuntimeError("Shared XAgent run was cancelled"))
+            raise
+        except BaseException as e:
+            if not inflight.done():
+                inflight.set_exception(e)
+            raise
+        else:
+            # The leader keeps its own object; the cache and waiters share a copy
+            shared = copy.deepcopy(value)
+            if shared is not None:
+                self.set(key, shared)
+            if not inflight.done():
+                inflight.set_result(shared)
+            return value
+        finally:
+            self._release(key)
+
+    def _claim(self, key: str) -> Tuple["concurrent.futures.Future", bool]:
+        """
+        The in-flight future for key and whether the caller must compute it
+
+        The leader settles the future and then calls _release(); everyone
+        else waits on it.
+        """
+        import concurrent.futures
+
+        with self._lock:
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self.coalesced += 1
+                return inflight, False
+            inflight = concurrent.futures.Future()
+            self._inflight[key] = inflight
+            return inflight, True
+
+    def _release(self, key: str):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Counters for monitoring"""
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.memory.evictions,
+            "expirations": self.memory.expirations + (self.disk.expirations if self.disk else 0),
+            "memory_entries": len(self.memory),
+            "disk_entries": len(self.disk) if self.disk is not None else 0,
+            "inflight": len(self._inflight),
+        }
+
+
+# Shared cache for all XAgentWrapper instances
+result_cache = ResultCache.from_env()
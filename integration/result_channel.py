@@ -0,0 +1,182 @@
+"""
+Framed result channel between run.py and the integration
+
+run.py can hand its final result over without it having to be fished out
+of the log. Two framings are understood:
+
+* File descriptor: when ``XAGENT_RESULT_FD`` is set, run.py writes one or
+  more records to that descriptor, each a 4-byte little-endian length
+  followed by that many bytes of UTF-8 JSON. The last complete record wins.
+* Sentinel line: a stdout line starting with the ASCII record separator
+  (0x1E, as in RFC 7464 JSON text sequences) carries a JSON result.
+
+Output that uses neither is parsed in legacy text mode: StreamingOutputParser
+looks at each line of a live stream once and keeps a fixed amount of
+state however long the log is, and parse_output_text scans an output
+that is already in memory backwards from its end without splitting it.
+"""
+
+import json
+import os
+import struct
+from collections import deque
+from itertools import islice
+from typing import Dict, Any, Iterable, Iterator, Optional, BinaryIO
+
+RESULT_FD_ENV = "XAGENT_RESULT_FD"
+RECORD_SEPARATOR = "\x1e"
+_LENGTH = struct.Struct("<I")
+
+# Legacy mode: recent JSON-looking lines kept in case the newest is invalid
+JSON_CANDIDATES = 8
+
+# Legacy mode: trailing lines used as the answer when no JSON is found
+FALLBACK_LINES = 5
+
+
+def encode_record(result: Dict[str, Any]) -> bytes:
+    """Length-prefixed JSON record for the result descriptor"""
+    payload = json.dumps(result).encode()
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def write_result(result: Dict[str, Any], fd: Optional[int] = None):
+    """
+    Report a final result from run.py
+
+    Writes a record to ``XAGENT_RESULT_FD`` when it is set, otherwise
+    prints a sentinel line on stdout.
+    """
+    if fd is None and os.getenv(RESULT_FD_ENV):
+        fd = int(os.environ[RESULT_FD_ENV])
+
+    if fd is None:
+        print(RECORD_SEPARATOR + json.dumps(result), flush=True)
+        return
+
+    view = memoryview(encode_record(result))
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def decode_records(data: bytes) -> Optional[Dict[str, Any]]:
+    """Last complete record in data, ignoring a torn trailing record"""
+    result = None
+    position = 0
+    while position + _LENGTH.size <= len(data):
+        (length,) = _LENGTH.unpack_from(data, position)
+        start = position + _LENGTH.size
+        if start + length > len(data):
+            break
+        try:
+            record = json.loads(data[start:start + length])
+        except ValueError:
+            record = None
+        if isinstance(record, dict):
+            result = record
+        position = start + length
+    return result
+
+
+def read_result_file(f: BinaryIO) -> Optional[Dict[str, Any]]:
+    """Read the records written to a result file from its start"""
+    f.seek(0)
+    return decode_records(f.read())
+
+
+def parse_sentinel_line(line: str) -> Optional[Dict[str, Any]]:
+    """Result carried by a sentinel line, or None for an ordinary line"""
+    if not line.startswith(RECORD_SEPARATOR):
+        return None
+    try:
+        record = json.loads(line[1:])
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) else None
+
+
+class StreamingOutputParser:
+    """
+    Legacy text-mode parser that sees each line once
+
+    The newest line that parses as a JSON object wins, as it always has.
+    JSON is only decoded when the result is asked for, and only for the
+    last few candidate lines, so memory stays constant and a long log
+    costs one pass of string checks.
+    """
+
+    def __init__(self):
+        self.candidates = deque(maxlen=JSON_CANDIDATES)
+        self.last_lines = deque(maxlen=FALLBACK_LINES)
+        self.line_count = 0
+
+    def feed(self, line: str):
+        line = line.rstrip("\r\n")
+        self.last_lines.append(line)
+        stripped = line.strip()
+        self.line_count += 1
+        if stripped.startswith('{') and stripped.endswith('}'):
+            self.candidates.append(stripped)
+
+    def feed_lines(self, lines: Iterable[str]) -> "StreamingOutputParser":
+        for line in lines:
+            self.feed(line)
+        return self
+
+    def final_json(self) -> Optional[Dict[str, Any]]:
+        """Newest candidate line that decodes to a JSON object"""
+        for candidate in reversed(self.candidates):
+            try:
+                data = json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict):
+                return data
+        return None
+
+    def result(self) -> Dict[str, Any]:
+        data = self.final_json() or {}
+        return {
+            "answer": data.get("answer", ""),
+            "steps": data.get("steps", []),
+            "fallback": "\n".join(self.last_lines),
+            "line_count": self.line_count,
+        }
+
+
+def _reversed_lines(text: str) -> Iterator[str]:
+    """Lines of text from last to first, without building a list"""
+    end = len(text)
+    while end >= 0:
+        start = text.rfind("\n", 0, end) + 1
+        yield text[start:end]
+        end = start - 1
+
+
+def parse_output_text(text: str) -> Dict[str, Any]:
+    """
+    Legacy text-mode parse of a complete output
+
+    Same result as feeding every line to StreamingOutputParser, but only
+    the lines after the final JSON object are looked at.
+    """
+    data: Dict[str, Any] = {}
+    for line in _reversed_lines(text):
+        stripped = line.strip()
+        if stripped.startswith('{') and stripped.endswith('}'):
+            try:
+                candidate = json.loads(stripped)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(candidate, dict):
+                data = candidate
+                break
+
+    last_lines = list(islice(_reversed_lines(text), FALLBACK_LINES))
+    return {
+        "answer": data.get("answer", ""),
+        "steps": data.get("steps", []),
+        "fallback": "\n".join(reversed(last_lines)),
+        "line_count": text.count("\n") + 1,
+    }
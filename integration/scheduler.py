@@ -0,0 +1,239 @@
+"""
+Bounded-concurrency scheduler for XAgent runs
+
+Caps how many XAgent tasks execute at once, keeps a bounded wait queue
+and rejects new work immediately once that queue is full. Waiting tasks
+are served by priority level and, within a level, round-robin across
+tenants so one busy tenant cannot starve the others.
+
+The scheduler is guarded by a thread lock and wakes waiters through their
+own event loop, so one instance can be shared by several loops/threads.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+
+# Lower values run first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 10
+
+DEFAULT_TENANT = "default"
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a task is rejected because the wait queue is full"""
+
+
+class _Waiter:
+    """A queued task waiting for a slot"""
+
+    __slots__ = ("loop", "future", "tenant", "priority", "enqueued_at", "granted")
+
+    def __init__(self, loop, future, tenant, priority):
+        self.loop = loop
+        self.future = future
+        self.tenant = tenant
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class TaskScheduler:
+    """Global concurrency cap with a fair, bounded wait queue"""
+
+    def __init__(self, max_concurrency: int = 4, max_queue_size: int = 64):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+
+        self._lock = threading.Lock()
+        self._running = 0
+        # priority -> tenant -> waiters, tenants kept in round-robin order
+        self._queues: Dict[int, "OrderedDict[str, deque]"] = {}
+        self._queued = 0
+
+        self._admitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_samples: deque = deque(maxlen=1024)
+
+    @classmethod
+    def from_env(cls) -> "TaskScheduler":
+        """Build a scheduler from XAGENT_MAX_CONCURRENCY / XAGENT_MAX_QUEUE"""
+        return cls(
+            max_concurrency=int(os.getenv("XAGENT_MAX_CONCURRENCY", "4")),
+            max_queue_size=int(os.getenv("XAGENT_MAX_QUEUE", "64"))
+        )
+
+    async def acquire(self, tenant: str = DEFAULT_TENANT, priority: int = PRIORITY_NORMAL):
+        """Wait for an execution slot, or raise QueueFullError"""
+        import asyncio
+        
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            if self._running < self.max_concurrency and self._queued == 0:
+                self._running += 1
+                self._record_wait(0.0)
+                return
+
+            if self._queued >= self.max_queue_size:
+                self._rejected += 1
+                raise QueueFullError(
+                    f"XAgent queue full: {self._queued} tasks waiting, "
+                    f"{self._running} running"
+                )
+
+            waiter = _Waiter(loop, loop.create_future(), tenant, priority)
+            tenants = self._queues.setdefault(priority, OrderedDict())
+            tenants.setdefault(tenant, deque()).append(waiter)
+            self._queued += 1
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if not waiter.granted:
+                    self._remove(waiter)
+                    raise
+            # Granted before the cancel landed: hand the slot on, unless
+            # _wake is going to do it because the future itself was cancelled
+            if not waiter.future.cancelled():
+                self._hand_off()
+            raise
+
+        with self._lock:
+            self._record_wait(time.monotonic() - waiter.enqueued_at)
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free and nobody is waiting for it"""
+        with self._lock:
+            if self._running < self.max_concurrency and self._queued == 0:
+                self._running += 1
+                self._record_wait(0.0)
+                return True
+            return False
+
+    def release(self):
+        """Free a slot and hand it to the next waiter, if any"""
+        with self._lock:
+            self._completed += 1
+        self._hand_off()
+
+    def _hand_off(self):
+        with self._lock:
+            waiter = self._next_waiter()
+            if waiter is None:
+                self._running -= 1
+                return
+            # The slot passes straight to the waiter; _running is unchanged
+            waiter.granted = True
+
+        try:
+            waiter.loop.call_soon_threadsafe(self._wake, waiter)
+        except RuntimeError:
+            # The waiter's loop is gone
+            self._hand_off()
+
+    def _wake(self, waiter: _Waiter):
+        if waiter.future.cancelled():
+            # Nobody is left to use the slot
+            self._hand_off()
+        else:
+            waiter.future.set_result(None)
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        """Pop the next waiter: best priority, then round-robin by tenant"""
+        for priority in sorted(self._queues):
+            tenants = self._queues[priority]
+            tenant, waiters = next(iter(tenants.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                tenants.move_to_end(tenant)
+            else:
+                del tenants[tenant]
+            if not tenants:
+                del self._queues[priority]
+            self._queued -= 1
+            return waiter
+        return None
+
+    def _remove(self, waiter: _Waiter):
+        tenants = self._queues.get(waiter.priority)
+        if not tenants or waiter.tenant not in tenants:
+            return
+        waiters = tenants[waiter.tenant]
+        try:
+            waiters.remove(waiter)
+        except ValueError:
+            return
+        self._queued -= 1
+        if not waiters:
+            del tenants[waiter.tenant]
+        if not tenants:
+            del self._queues[waiter.priority]
+
+    def _record_wait(self, seconds: float):
+        self._admitted += 1
+        self._wait_total += seconds
+        self._wait_max = max(self._wait_max, seconds)
+        self._wait_samples.append(seconds)
+
+    @asynccontextmanager
+    async def slot(self, tenant: str = DEFAULT_TENANT, priority: int = PRIORITY_NORMAL):
+        """Hold an execution slot for the duration of the block"""
+        await self.acquire(tenant, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Snapshot of queue depth, throughput counters and wait times"""
+        with self._lock:
+            samples = sorted(self._wait_samples)
+            tenant_depth: Dict[str, int] = {}
+            for tenants in self._queues.values():
+                for tenant, waiters in tenants.items():
+                    tenant_depth[tenant] = tenant_depth.get(tenant, 0) + len(waiters)
+
+            def percentile(p):
+                if not samples:
+                    return 0.0
+                return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+            return {
+                "running": self._running,
+                "queue_depth": self._queued,
+                "queue_depth_by_tenant": tenant_depth,
+                "max_concurrency": self.max_concurrency,
+                "max_queue_size": self.max_queue_size,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "completed": self._completed,
+                "wait_time_avg": self._wait_total / self._admitted if self._admitted else 0.0,
+                "wait_time_max": self._wait_max,
+                "wait_time_p50": percentile(0.50),
+                "wait_time_p95": percentile(0.95),
+            }
+
+
+# Shared scheduler for all XAgentWrapper instances
+task_scheduler = TaskScheduler.from_env()
@@ -0,0 +1,121 @@
+"""
+Fake OpenAI-compatible API for running the LLM cache without network access
+
+FakeOpenAI serves /v1/chat/completions, /v1/completions and /v1/models
+on 127.0.0.1. A completion waits latency seconds, then answers with the
+last message reversed word by word; usage counts one token per word. A
+prompt containing "fail" gets HTTP 500 and one containing "ratelimit"
+HTTP 429. With "stream": true the answer comes as server-sent events.
+calls counts completion requests and requests keeps their bodies.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _prompt(request):
+    if "messages" in request:
+        return request["messages"][-1]["content"]
+    return request.get("prompt", "")
+
+
+class FakeOpenAI:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = None
+        self.port = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def completion(self, path, request):
+        prompt = _prompt(request)
+        answer = " ".join(reversed(prompt.split()))
+        usage = {
+            "prompt_tokens": len(prompt.split()),
+            "completion_tokens": len(answer.split()),
+            "total_tokens": len(prompt.split()) + len(answer.split()),
+        }
+        if path == "/v1/completions":
+            choice = {"index": 0, "text": answer, "finish_reason": "stop"}
+        else:
+            choice = {
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": answer},
+            }
+        return {
+            "id": f"chatcmpl-{self.calls}", "object": "chat.completion", "created": int(time.time()),
+            "model": request.get("model"), "choices": [choice], "usage": usage,
+        }
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/v1/models":
+                    self._send(200, {"object": "list", "data": [{"id": "gpt-4", "object": "model"}]})
+                else:
+                    self._send(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with fake._lock:
+                    fake.calls += 1
+                    fake.requests.append(request)
+                time.sleep(fake.latency)
+                prompt = _prompt(request)
+                if "ratelimit" in prompt:
+                    self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}})
+                    return
+                if "fail" in prompt:
+                    self._send(500, {"error": {"message": "The server had an error"}})
+                    return
+                response = fake.completion(self.path, request)
+                if not request.get("stream"):
+                    self._send(200, response)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for word in reversed(prompt.split()):
+                    chunk = {"choices": [{"index": 0, "delta": {"content": word}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
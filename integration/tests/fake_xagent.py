@@ -0,0 +1,179 @@
+"""
+Fake XAgent installation for running the integration without XAgent
+
+The fake run.py understands a few task keywords so tests can drive it:
+"fail" exits non-zero, "crash" kills the interpreter outright,
+"sleep:<seconds>" waits before starting, "pause:<seconds>" waits between
+the first step and the answer and "lines:<n>" prints extra log lines.
+"framed" also reports the answer on the XAGENT_RESULT_FD descriptor and
+"sentinel" as a record-separator line; the JSON answer in the log then
+says "legacy" so tests can tell which one was used. "spawn" starts a
+long-lived child process and prints its pid, and "stubborn" ignores
+SIGTERM. "alloc:<mb>" holds that much memory and "burn:<seconds>" spins
+the CPU before the answer, and "showconfig" prints the --config_file
+path. "ratelimit:<file>:<n>" fails its first n runs with a rate-limit
+message and "slowfirst:<file>:<seconds>" waits that long in its first
+run only; both count runs in file. Every answer includes the pid of the
+process that produced it.
+
+XAgent/core.py has in-process entrypoints for the same tasks: run_task,
+which runs on a thread, and the coroutine arun_task. They understand
+"fail", "pause:<seconds>" (checking for cancellation while waiting) and
+"lines:<n>", and also return the task's context and whether it was the
+current one.
+"""
+
+import tempfile
+from pathlib import Path
+
+FAKE_RUN_PY = '''
+import argparse
+import json
+import os
+import signal
+import struct
+import subprocess
+import sys
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--task", required=True)
+parser.add_argument("--config_file")
+args, _ = parser.parse_known_args()
+task = args.task
+
+if "stubborn" in task:
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+if "spawn" in task:
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    print("child", child.pid, flush=True)
+
+def run_number(path):
+    """How many runs have counted themselves in path, including this one"""
+    with open(path, "a+") as f:
+        f.write(".")
+        f.seek(0)
+        return len(f.read())
+
+for word in task.split():
+    if word.startswith("sleep:"):
+        time.sleep(float(word.split(":", 1)[1]))
+    elif word.startswith("ratelimit:"):
+        _, path, failures = word.split(":")
+        if run_number(path) <= int(failures):
+            print("Error: 429 Too Many Requests (rate limit exceeded)", file=sys.stderr)
+            sys.exit(1)
+    elif word.startswith("slowfirst:"):
+        _, path, seconds = word.split(":")
+        if run_number(path) == 1:
+            time.sleep(float(seconds))
+
+if "crash" in task:
+    os._exit(3)
+
+if "fail" in task:
+    print("task failed on purpose", file=sys.stderr)
+    sys.exit(2)
+
+print("Starting XAgent")
+if "showconfig" in task:
+    print("config_file", args.config_file, flush=True)
+for word in task.split():
+    if word.startswith("lines:"):
+        for i in range(int(word.split(":", 1)[1])):
+            print("log line", i)
+print(json.dumps({"step": "plan", "task": task}), flush=True)
+
+held = []
+for word in task.split():
+    if word.startswith("alloc:"):
+        held.append(b"x" * (int(word.split(":", 1)[1]) << 20))
+    elif word.startswith("burn:"):
+        deadline = time.process_time() + float(word.split(":", 1)[1])
+        while time.process_time() < deadline:
+            pass
+
+for word in task.split():
+    if word.startswith("pause:"):
+        time.sleep(float(word.split(":", 1)[1]))
+
+answer = {
+    "answer": "done: " + task,
+    "steps": ["plan", "act"],
+    "pid": os.getpid()
+}
+
+if "framed" in task or "sentinel" in task:
+    print(json.dumps({"answer": "legacy", "steps": []}))
+    if "framed" in task:
+        payload = json.dumps(answer).encode()
+        with os.fdopen(int(os.environ["XAGENT_RESULT_FD"]), "wb") as channel:
+            channel.write(struct.pack("<I", len(payload)) + payload)
+    else:
+        print("\x1e" + json.dumps(answer))
+else:
+    print(json.dumps(answer))
+'''
+
+
+FAKE_CORE_PY = '''
+import asyncio
+import os
+import threading
+import time
+
+
+def _pauses(task):
+    return [float(word.split(":", 1)[1]) for word in task.split() if word.startswith("pause:")]
+
+
+def _start(context):
+    if "fail" in context.task:
+        raise RuntimeError("task failed on purpose")
+    context.log("Starting XAgent")
+    for word in context.task.split():
+        if word.startswith("lines:"):
+            for i in range(int(word.split(":", 1)[1])):
+                context.log(f"log line {i}")
+    context.step({"step": "plan", "task": context.task})
+
+
+def _answer(context):
+    from inprocess_engine import current_context
+    return {
+        "answer": "done: " + context.task,
+        "steps": ["plan", "act"],
+        "pid": os.getpid(),
+        "thread": threading.get_ident(),
+        "context": context,
+        "is_current": current_context() is context,
+    }
+
+
+def run_task(context):
+    _start(context)
+    for seconds in _pauses(context.task):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            context.check_cancelled()
+            time.sleep(0.01)
+    return _answer(context)
+
+
+async def arun_task(context):
+    _start(context)
+    for seconds in _pauses(context.task):
+        await asyncio.sleep(seconds)
+    return _answer(context)
+'''
+
+
+def make_fake_xagent_home(root=None) -> Path:
+    """Create a directory that passes XAgent installation checks"""
+    home = Path(root or tempfile.mkdtemp(prefix="fake_xagent_"))
+    (home / "XAgent").mkdir(parents=True, exist_ok=True)
+    (home / "XAgent" / "__init__.py").write_text("")
+    (home / "XAgent" / "core.py").write_text(FAKE_CORE_PY)
+    (home / "run.py").write_text(FAKE_RUN_PY)
+    return home
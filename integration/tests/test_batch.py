@@ -0,0 +1,166 @@
+"""
+Tests for the XAgentWrapper batch API
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_xagent import make_fake_xagent_home
+
+os.environ.setdefault("XAGENT_HOME", str(make_fake_xagent_home()))
+
+import langchain_replacement
+from scheduler import TaskScheduler
+
+IN_FLIGHT = {"now": 0, "peak": 0}
+
+
+async def stub_run(task, **kwargs):
+    """Stand-in for run_xagent: "fail" raises, "delay" sleeps first"""
+    IN_FLIGHT["now"] += 1
+    IN_FLIGHT["peak"] = max(IN_FLIGHT["peak"], IN_FLIGHT["now"])
+    try:
+        await asyncio.sleep(float(kwargs.get("delay", 0.01)))
+        if "fail" in task:
+            raise RuntimeError(f"failed: {task}")
+        return {"answer": f"{task} {kwargs.get('style', '')}".strip(), "steps": [], "success": True}
+    finally:
+        IN_FLIGHT["now"] -= 1
+
+
+def _patched(max_concurrency=4):
+    """Run a test with a stubbed XAgent and a fresh scheduler"""
+    def decorate(test):
+        def wrapper():
+            original_scheduler = langchain_replacement.task_scheduler
+            original_run = langchain_replacement.xagent_integration.run_xagent
+            langchain_replacement.task_scheduler = TaskScheduler(
+                max_concurrency=max_concurrency, max_queue_size=4
+            )
+            langchain_replacement.xagent_integration.run_xagent = stub_run
+            IN_FLIGHT.update(now=0, peak=0)
+            try:
+                test()
+            finally:
+                langchain_replacement.task_scheduler = original_scheduler
+                langchain_replacement.xagent_integration.run_xagent = original_run
+        wrapper.__name__ = test.__name__
+        wrapper.__doc__ = test.__doc__
+        return wrapper
+    return decorate
+
+
+@_patched()
+def test_results_in_input_order():
+    """Responses line up with inputs even when later ones finish first"""
+    agent = langchain_replacement.initialize_xagent()
+    inputs = [f"task {i}" for i in range(10)]
+    configs = [{"delay": 0.05 - i * 0.005} for i in range(10)]
+
+    responses = asyncio.run(agent.abatch(inputs, configs))
+    assert [r.output for r in responses] == inputs
+
+
+@_patched()
+def test_failures_are_isolated():
+    """One failing input does not affect the others"""
+    agent = langchain_replacement.initialize_xagent()
+    inputs = ["ok 1", "fail 2", {"input": "ok 3"}]
+
+    responses = agent.batch(inputs)
+    assert [r.success for r in responses] == [True, False, True]
+    assert "failed: fail 2" in responses[1].error_message
+
+    responses = agent.batch(inputs, return_exceptions=True)
+    assert isinstance(responses[1], RuntimeError)
+    assert responses[2].output == "ok 3"
+
+
+@_patched(max_concurrency=3)
+def test_concurrency_follows_scheduler():
+    """A large batch fills the scheduler's slots without overflowing its queue"""
+    agent = langchain_replacement.initialize_xagent()
+    responses = agent.batch([f"task {i}" for i in range(40)])
+
+    # 40 inputs with a queue of 4 would be rejected if all were submitted
+    assert all(r.success for r in responses)
+    assert IN_FLIGHT["peak"] == 3
+
+    IN_FLIGHT.update(peak=0)
+    agent.batch([f"task {i}" for i in range(10)], {"max_concurrency": 2})
+    assert IN_FLIGHT["peak"] == 2
+
+    # More than the scheduler can run or queue is capped, not rejected
+    responses = agent.batch([f"task {i}" for i in range(40)], max_concurrency=20)
+    assert all(r.success for r in responses)
+    assert IN_FLIGHT["peak"] == 3
+
+
+@_patched()
+def test_as_completed_and_options():
+    """Completion-order results carry their index; options reach run()"""
+    agent = langchain_replacement.initialize_xagent()
+    inputs = ["slow", "fast"]
+    configs = [{"delay": 0.1, "tags": ["ignored"]}, {"delay": 0.01}]
+
+    order = [index for index, _ in agent.batch_as_completed(inputs, configs)]
+    assert order == [1, 0]
+
+    async def collect():
+        return [item async for item in agent.abatch_as_completed(inputs, style="terse")]
+
+    results = dict(asyncio.run(collect()))
+    assert results[0].output == "slow terse"
+    assert results[1].output == "fast terse"
+
+
+@_patched()
+def test_bad_config_is_reported():
+    """A config entry that is not a dict fails the batch up front instead of hanging"""
+    agent = langchain_replacement.initialize_xagent()
+
+    async def run():
+        return await asyncio.wait_for(agent.abatch(["a", "b"], [{}, "style=terse"]), 5)
+
+    try:
+        asyncio.run(run())
+        assert False, "bad config was accepted"
+    except TypeError as e:
+        assert "Config 1 is a str" in str(e)
+
+
+def main():
+    """Run all batch tests"""
+    print("BATCH TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_results_in_input_order,
+        test_failures_are_isolated,
+        test_concurrency_follows_scheduler,
+        test_as_completed_and_options,
+        test_bad_config_is_reported,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,235 @@
+"""
+Tests for the typed XAgent config, its hot reload and worker recycling
+"""
+
+import asyncio
+import dataclasses
+import os
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_xagent import make_fake_xagent_home
+
+FAKE_HOME = make_fake_xagent_home()
+os.environ.setdefault("XAGENT_HOME", str(FAKE_HOME))
+
+from config_loader import ConfigError, ConfigStore, ConfigWarning, load_config, parse_config
+from result_cache import make_cache_key
+from xagent_integration import DEFAULT_CONFIG_PATH, XAgentIntegration
+
+BASE_CONFIG = DEFAULT_CONFIG_PATH.read_text()
+
+
+def _config_file(text=BASE_CONFIG):
+    fd, path = tempfile.mkstemp(suffix=".yaml")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    return path
+
+
+def _rewrite(path, old, new):
+    with open(path) as f:
+        text = f.read()
+    assert old in text
+    with open(path, "w") as f:
+        f.write(text.replace(old, new))
+
+
+def test_parse_typed_and_immutable():
+    """The shipped config parses into frozen, typed sections"""
+    config = load_config(str(DEFAULT_CONFIG_PATH))
+    assert config.model.name == "gpt-4" and config.model.max_tokens == 2000
+    assert config.enabled_tools == ["web_search", "code_execution", "file_operation"]
+    assert config.timeout == 300
+    try:
+        config.model = None
+    except dataclasses.FrozenInstanceError:
+        pass
+    else:
+        raise AssertionError("config is mutable")
+
+    # Comments and formatting do not change the content hash
+    reformatted = parse_config("# a comment\n" + BASE_CONFIG.replace('"gpt-4"', "gpt-4"))
+    assert reformatted.digest == config.digest
+
+
+def test_validation_errors():
+    """Bad values and duplicate tools are rejected with their path"""
+    cases = {
+        "xagent: {model: {temperature: 3}}": "xagent.model.temperature",
+        "xagent: {model: {max_tokens: true}}": "xagent.model.max_tokens",
+        "xagent: {tools: [{name: a}, {name: a}]}": "Duplicate tool",
+        "xagent: {tools: [web_search]}": "xagent.tools[0]",
+        "xagent: {mode: fast}": "xagent.mode",
+        "xagent: [": "Invalid YAML",
+    }
+    for text, message in cases.items():
+        try:
+            parse_config(text)
+        except ConfigError as e:
+            assert message in str(e), (text, str(e))
+        else:
+            raise AssertionError(f"accepted {text!r}")
+
+
+def test_unknown_settings_pass_through():
+    """Unknown keys warn, count towards the hashes and reach run.py's snapshot"""
+    text = BASE_CONFIG.replace(
+        'name: "gpt-4"', 'name: "gpt-4"\n    api_base: "http://127.0.0.1:8000/v1"'
+    ) + "\n  memory: {kind: local}\n"
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        config = parse_config(text)
+    messages = [str(w.message) for w in caught if issubclass(w.category, ConfigWarning)]
+    assert any("xagent.model" in m and "api_base" in m for m in messages), messages
+    assert any("in xagent passed" in m and "memory" in m for m in messages), messages
+
+    plain = load_config(str(DEFAULT_CONFIG_PATH))
+    assert dict(config.model.extra) == {"api_base": '"http://127.0.0.1:8000/v1"'}
+    assert config.digest != plain.digest
+    assert config.worker_digest != plain.worker_digest
+
+    with open(config.snapshot()) as f:
+        assert "api_base" in f.read()
+
+
+def test_snapshots_are_private():
+    """Snapshots are written to a directory no other user can write to"""
+    path = load_config(str(DEFAULT_CONFIG_PATH)).snapshot()
+    directory = os.path.dirname(path)
+    assert directory != tempfile.gettempdir()
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+    assert os.stat(directory).st_uid == os.getuid()
+
+
+def test_store_swaps_and_keeps_last_good():
+    """Edits swap in a new object, old references are untouched, bad edits are skipped"""
+    path = _config_file()
+    store = ConfigStore(path, poll_interval=0)
+    changes = []
+    store.subscribe(lambda old, new: changes.append((old.model.name, new.model.name)))
+    in_flight = store.current
+
+    _rewrite(path, 'name: "gpt-4"', 'name: "gpt-4o"')
+    assert store.reload()
+    assert store.current.model.name == "gpt-4o"
+    assert in_flight.model.name == "gpt-4"
+    assert changes == [("gpt-4", "gpt-4o")]
+
+    _rewrite(path, "temperature: 0.1", "temperature: hot")
+    assert not store.reload()
+    assert store.current.model.name == "gpt-4o"
+    assert "temperature" in store.last_error and store.failed_reloads == 1
+    os.remove(path)
+
+
+def test_watcher_reloads():
+    """The watcher picks up a change without an explicit reload"""
+    path = _config_file()
+    store = ConfigStore(path, poll_interval=0.05)
+    store.watch()
+    try:
+        _rewrite(path, "timeout: 300", "timeout: 42")
+        deadline = time.monotonic() + 5
+        while store.current.timeout != 42 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert store.current.timeout == 42
+    finally:
+        store.close()
+        os.remove(path)
+
+
+def test_run_keeps_its_config_snapshot():
+    """run.py reads the config as it was when the run started"""
+    path = _config_file()
+    xagent = XAgentIntegration(config_path=path, xagent_home=str(FAKE_HOME), use_worker_pool=False)
+
+    async def run_with_edit():
+        config_file = None
+        async for event in xagent.astream("showconfig pause:0.5"):
+            if event["type"] == "log" and event["line"].startswith("config_file"):
+                config_file = event["line"].split(" ", 1)[1]
+                _rewrite(path, 'name: "gpt-4"', 'name: "gpt-4o"')
+                xagent.config_store.reload()
+            elif event["type"] == "result":
+                assert event["result"]["success"]
+        return config_file
+
+    try:
+        config_file = asyncio.run(run_with_edit())
+        with open(config_file) as f:
+            assert 'name: "gpt-4"' in f.read()
+        assert xagent.config.model.name == "gpt-4o"
+        assert xagent.config.snapshot() != config_file
+    finally:
+        xagent.close()
+        os.remove(path)
+
+
+def test_workers_recycled_only_for_relevant_changes():
+    """Constraint edits keep warm workers; model edits replace them"""
+    path = _config_file()
+    xagent = XAgentIntegration(
+        config_path=path, xagent_home=str(FAKE_HOME), use_worker_pool=True, pool_size=1
+    )
+    try:
+        first = asyncio.run(xagent.run_xagent("one"))["answer"]
+        digest = xagent.config.digest
+
+        _rewrite(path, "max_iterations: 5", "max_iterations: 6")
+        assert xagent.config_store.reload()
+        assert xagent.config.digest != digest
+        assert make_cache_key("one", {}, digest) != make_cache_key("one", {}, xagent.config.digest)
+        second = asyncio.run(xagent.run_xagent("one"))["answer"]
+        assert xagent.get_worker_pool().stats["recycled"] == 0
+        assert first == second
+
+        _rewrite(path, 'name: "gpt-4"', 'name: "gpt-4o"')
+        assert xagent.config_store.reload()
+        third = asyncio.run(xagent.run_xagent("one"))["answer"]
+        assert xagent.get_worker_pool().stats["recycled"] == 1
+        assert asyncio.run(xagent.run_xagent("one"))["answer"] == third
+    finally:
+        xagent.close()
+        os.remove(path)
+
+
+def main():
+    """Run all config loader tests"""
+    print("CONFIG LOADER TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_parse_typed_and_immutable,
+        test_validation_errors,
+        test_unknown_settings_pass_through,
+        test_snapshots_are_private,
+        test_store_swaps_and_keeps_last_good,
+        test_watcher_reloads,
+        test_run_keeps_its_config_snapshot,
+        test_workers_recycled_only_for_relevant_changes,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,177 @@
+"""
+Tests for the in-process engine that calls XAgent's entrypoint directly
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_xagent import make_fake_xagent_home
+
+FAKE_HOME = make_fake_xagent_home()
+os.environ.setdefault("XAGENT_HOME", str(FAKE_HOME))
+
+from config_loader import ConfigError, parse_config
+from inprocess_engine import InProcessEngine, TaskContext
+from xagent_integration import DEFAULT_CONFIG_PATH, XAgentIntegration, XAgentTimeoutError
+
+
+def _inprocess(**kwargs):
+    return XAgentIntegration(xagent_home=str(FAKE_HOME), engine="inprocess", **kwargs)
+
+
+def test_native_result():
+    """The entrypoint's return value comes back as is, with no serialization"""
+    xagent = _inprocess()
+    try:
+        result = asyncio.run(xagent.run_xagent("hello"))
+    finally:
+        xagent.close()
+    assert result["answer"] == "done: hello"
+    assert result["success"] and result["pid"] == os.getpid()
+    assert isinstance(result["context"], TaskContext)
+    assert result["context"].task == "hello"
+    assert result["raw_output"] == "Starting XAgent"
+    assert result["usage"]["wall_seconds"] >= 0
+    # Same usage keys as a run.py process or pool worker reports
+    assert result["usage"]["user_cpu_seconds"] >= 0
+    assert result["usage"]["system_cpu_seconds"] >= 0
+
+
+def test_contexts_are_isolated():
+    """Concurrent tasks run on the thread pool, each with its own current context"""
+    xagent = _inprocess(pool_size=4)
+
+    async def run_all():
+        return await asyncio.gather(*(xagent.run_xagent(f"task {i} pause:0.3") for i in range(4)))
+
+    started = time.monotonic()
+    try:
+        results = asyncio.run(run_all())
+    finally:
+        xagent.close()
+    assert time.monotonic() - started < 1.0
+    assert [r["context"].task for r in results] == [f"task {i} pause:0.3" for i in range(4)]
+    assert len({r["context"].task_id for r in results}) == 4
+    assert all(r["is_current"] for r in results)
+    assert all(r["thread"] != threading.get_ident() for r in results)
+
+
+def test_async_entrypoint():
+    """A coroutine entrypoint runs on the event loop itself"""
+    xagent = _inprocess()
+    xagent._inprocess = InProcessEngine("XAgent.core:arun_task")
+    try:
+        result = asyncio.run(xagent.run_xagent("async"))
+    finally:
+        xagent.close()
+    assert result["answer"] == "done: async"
+    assert result["thread"] == threading.get_ident()
+    assert result["is_current"]
+
+
+def test_stream_events():
+    """Log lines and steps are streamed as they are reported"""
+    xagent = _inprocess()
+
+    async def collect():
+        return [event async for event in xagent.astream("streamed lines:2")]
+
+    try:
+        events = asyncio.run(collect())
+    finally:
+        xagent.close()
+    assert [e["type"] for e in events] == ["log", "log", "log", "step", "result"]
+    assert events[3]["step"] == {"step": "plan", "task": "streamed lines:2"}
+    assert events[-1]["result"]["answer"] == "done: streamed lines:2"
+
+
+def test_failure_and_timeout():
+    """Exceptions fail the run; a timeout returns the steps so far and stops the task"""
+    xagent = _inprocess()
+    try:
+        try:
+            asyncio.run(xagent.run_xagent("fail"))
+            assert False, "failed run did not raise"
+        except RuntimeError as e:
+            assert "task failed on purpose" in str(e)
+
+        started = time.monotonic()
+        try:
+            asyncio.run(xagent.run_xagent("slow pause:30", timeout=0.3))
+            assert False, "run did not time out"
+        except XAgentTimeoutError as e:
+            assert e.partial["steps"] == [{"step": "plan", "task": "slow pause:30"}]
+        assert time.monotonic() - started < 5
+
+        # The cancelled thread checks its context and frees its slot
+        result = asyncio.run(xagent.run_xagent("after timeout"))
+        assert result["answer"] == "done: after timeout"
+    finally:
+        xagent.close()
+
+
+def test_engine_from_config():
+    """xagent.engine in the config file picks the engine unless one is given"""
+    text = DEFAULT_CONFIG_PATH.read_text().replace('mode: "auto"', 'mode: "auto"\n  engine: "inprocess"')
+    fd, path = tempfile.mkstemp(suffix=".yaml")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    try:
+        xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), config_path=path, use_worker_pool=True)
+        try:
+            assert xagent.engine_for() == "inprocess"
+            assert asyncio.run(xagent.run_xagent("configured"))["pid"] == os.getpid()
+        finally:
+            xagent.close()
+        override = XAgentIntegration(xagent_home=str(FAKE_HOME), config_path=path, engine="subprocess")
+        assert override.engine_for() == "subprocess"
+        override.close()
+    finally:
+        os.remove(path)
+
+    try:
+        parse_config(text.replace('"inprocess"', '"threads"'))
+        assert False, "unknown engine accepted"
+    except ConfigError as e:
+        assert "xagent.engine" in str(e)
+
+
+def main():
+    """Run all in-process engine tests"""
+    print("IN-PROCESS ENGINE TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_native_result,
+        test_contexts_are_isolated,
+        test_async_entrypoint,
+        test_stream_events,
+        test_failure_and_timeout,
+        test_engine_from_config,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
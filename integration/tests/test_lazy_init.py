@@ -0,0 +1,124 @@
+"""
+Tests for lazy initialization of the shared XAgentIntegration
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+INTEGRATION_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(INTEGRATION_DIR))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_xagent import make_fake_xagent_home
+
+os.environ.setdefault("XAGENT_HOME", str(make_fake_xagent_home()))
+
+import xagent_integration as integration_module
+from xagent_integration import XAgentIntegration
+
+
+def _run_isolated(code: str, xagent_home: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, XAGENT_HOME=xagent_home)
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=INTEGRATION_DIR,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+
+
+def test_import_without_xagent():
+    """Importing the wrapper neither checks the install nor touches sys.path"""
+    missing = os.path.join(tempfile.mkdtemp(), "missing")
+    completed = _run_isolated(
+        "import json, sys, os\n"
+        "import langchain_replacement\n"
+        "print(json.dumps({\n"
+        "    'on_path': os.environ['XAGENT_HOME'] in sys.path,\n"
+        "    'asyncio': 'asyncio' in sys.modules,\n"
+        "    'worker_pool': 'worker_pool' in sys.modules,\n"
+        "}))\n",
+        missing
+    )
+
+    assert completed.returncode == 0, completed.stderr
+    assert json.loads(completed.stdout) == {"on_path": False, "asyncio": False, "worker_pool": False}
+
+
+def test_first_use_raises():
+    """A missing installation is reported when the singleton is first used"""
+    missing = os.path.join(tempfile.mkdtemp(), "missing")
+    completed = _run_isolated(
+        "from xagent_integration import xagent_integration\n"
+        "try:\n"
+        "    xagent_integration.get_capabilities()\n"
+        "except FileNotFoundError:\n"
+        "    print('missing')\n",
+        missing
+    )
+
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout.strip() == "missing"
+
+
+def test_singleton_is_shared():
+    """The proxy and get_xagent_integration resolve to one instance"""
+    instance = integration_module.get_xagent_integration()
+    assert instance is integration_module.get_xagent_integration()
+    assert integration_module.xagent_integration.xagent_home == instance.xagent_home
+    assert str(instance.xagent_home) in sys.path
+
+
+def test_verification_is_cached():
+    """A home is only checked on the filesystem the first time"""
+    home = make_fake_xagent_home()
+    XAgentIntegration(xagent_home=str(home))
+
+    # Later instances for the same home skip the checks
+    (home / "XAgent" / "core.py").unlink()
+    XAgentIntegration(xagent_home=str(home))
+
+    other = make_fake_xagent_home()
+    (other / "run.py").unlink()
+    try:
+        XAgentIntegration(xagent_home=str(other))
+    except FileNotFoundError:
+        pass
+    else:
+        raise AssertionError("an unverified home must still be checked")
+
+
+def main():
+    """Run all lazy initialization tests"""
+    print("LAZY INITIALIZATION TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_import_without_xagent,
+        test_first_use_raises,
+        test_singleton_is_shared,
+        test_verification_is_cached,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,271 @@
+"""
+Tests for the LLM completion cache and its OpenAI-compatible proxy
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_openai import FakeOpenAI
+
+import llm_cache
+import metrics
+from llm_cache import LLMCache, LLMCacheProxy, completion_key
+
+PLANNING = {
+    "model": "gpt-4",
+    "temperature": 0.1,
+    "max_tokens": 2000,
+    "messages": [
+        {"role": "system", "content": "You are a planning agent"},
+        {"role": "user", "content": "plan the next three steps"},
+    ],
+}
+
+
+def _post(base_url, request, path="/chat/completions", headers=None):
+    """(status, X-Cache header, parsed or raw body) of one request"""
+    body = request if isinstance(request, bytes) else json.dumps(request).encode()
+    http_request = urllib.request.Request(
+        base_url + path, data=body,
+        headers={"Content-Type": "application/json", "Authorization": "Bearer test",
+                 **(headers or {})}
+    )
+    try:
+        with urllib.request.urlopen(http_request, timeout=10) as response:
+            status, outcome, raw = response.status, response.headers["X-Cache"], response.read()
+    except urllib.error.HTTPError as e:
+        status, outcome, raw = e.code, e.headers["X-Cache"], e.read()
+    try:
+        return status, outcome, json.loads(raw)
+    except ValueError:
+        return status, outcome, raw
+
+
+def test_completion_key():
+    """Keys cover the model, every parameter and the exact messages"""
+    base = completion_key("/chat/completions", PLANNING)
+    assert base == completion_key("/chat/completions", dict(reversed(list(PLANNING.items()))))
+    assert base == completion_key("/chat/completions", {**PLANNING, "user": "a", "stream": False})
+    assert base != completion_key("/completions", PLANNING)
+    assert base != completion_key("/chat/completions", {**PLANNING, "model": "gpt-3.5-turbo"})
+    assert base != completion_key("/chat/completions", {**PLANNING, "max_tokens": 100})
+    spaced = [PLANNING["messages"][0], {"role": "user", "content": "plan the next  three steps"}]
+    assert base != completion_key("/chat/completions", {**PLANNING, "messages": spaced})
+    keyed = completion_key("/chat/completions", PLANNING, "Bearer a")
+    assert keyed == completion_key("/chat/completions", PLANNING, "Bearer a")
+    assert keyed not in (base, completion_key("/chat/completions", PLANNING, "Bearer b"))
+
+
+def test_temperature_bypass():
+    """Only requests sampled at or below max_temperature are cacheable"""
+    cache = LLMCache(max_temperature=0.2)
+    assert cache.cacheable("/chat/completions", PLANNING)
+    assert cache.cacheable("/chat/completions", {**PLANNING, "temperature": 0})
+    assert not cache.cacheable("/chat/completions", {**PLANNING, "temperature": 0.7})
+    # OpenAI samples at 1.0 when no temperature is given
+    assert not cache.cacheable("/chat/completions", {"model": "gpt-4", "messages": []})
+    assert not cache.cacheable("/chat/completions", {**PLANNING, "stream": True})
+    assert not cache.cacheable("/chat/completions", {**PLANNING, "temperature": "cold"})
+    assert not cache.cacheable("/chat/completions", {**PLANNING, "temperature": [0]})
+    assert not cache.cacheable("/embeddings", PLANNING)
+    assert not LLMCache(enabled=False).cacheable("/chat/completions", PLANNING)
+
+    calls = []
+    hot = {**PLANNING, "temperature": 0.9}
+    for _ in range(2):
+        response, outcome = cache.complete("/chat/completions", hot, lambda r: calls.append(r) or {})
+        assert outcome == "bypass"
+    assert len(calls) == 2 and cache.get_stats()["bypassed"] == 2
+
+
+def test_proxy_caches_and_reports_savings():
+    """A repeated prompt is answered from the cache with its tokens and latency saved"""
+    with FakeOpenAI(latency=0.05) as upstream, LLMCacheProxy(upstream.base_url) as proxy:
+        status, outcome, first = _post(proxy.base_url, PLANNING)
+        assert status == 200 and outcome == "miss"
+        assert first["choices"][0]["message"]["content"] == "steps three next the plan"
+
+        started = time.perf_counter()
+        status, outcome, second = _post(proxy.base_url, PLANNING)
+        assert time.perf_counter() - started < 0.05
+        assert status == 200 and outcome == "hit" and second == first
+        status, outcome, _ = _post(proxy.base_url, {"model": "gpt-4", "prompt": "a b",
+                                                    "temperature": 0}, "/completions")
+        assert outcome == "miss"
+        # Another API key does not get the first key's response
+        assert _post(proxy.base_url, PLANNING, headers={"Authorization": "Bearer other"})[1] == "miss"
+        assert upstream.calls == 3
+        # The upstream saw the client's own request and credentials
+        assert upstream.requests[0] == PLANNING
+
+        stats = proxy.cache.get_stats()
+        assert stats["hits"] == 1 and stats["upstream_calls"] == 3
+        assert stats["saved_prompt_tokens"] == 5 and stats["saved_completion_tokens"] == 5
+        assert stats["saved_tokens"] == 10
+        assert 0.05 <= stats["saved_seconds"] < 1
+        assert "xagent_llm_cache_saved_tokens" in metrics.REGISTRY.render()
+
+
+def test_concurrent_identical_requests_coalesce():
+    """Identical prompts in flight together make a single upstream call"""
+    with FakeOpenAI(latency=0.2) as upstream, LLMCacheProxy(upstream.base_url) as proxy:
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(_post(proxy.base_url, PLANNING)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        assert upstream.calls == 1
+        assert all(status == 200 for status, _, _ in results)
+        assert len({json.dumps(body) for _, _, body in results}) == 1
+        outcomes = sorted(outcome for _, outcome, _ in results)
+        assert outcomes.count("miss") == 1
+        assert set(outcomes) <= {"miss", "coalesced", "hit"}
+        assert proxy.cache.get_stats()["saved_tokens"] == 7 * 10
+
+
+def test_bypassed_requests_are_forwarded():
+    """Hot sampling, no-cache, streams and other endpoints go straight upstream"""
+    with FakeOpenAI() as upstream, LLMCacheProxy(upstream.base_url) as proxy:
+        hot = {**PLANNING, "temperature": 0.9}
+        assert [_post(proxy.base_url, hot)[1] for _ in range(2)] == ["bypass", "bypass"]
+        _post(proxy.base_url, PLANNING)
+        assert _post(proxy.base_url, PLANNING, headers={"Cache-Control": "no-cache"})[1] == "bypass"
+        assert upstream.calls == 4
+
+        status, outcome, body = _post(proxy.base_url, {**PLANNING, "stream": True})
+        assert status == 200 and outcome == "bypass"
+        assert body.count(b"data: ") == 6 and body.endswith(b"data: [DONE]\n\n")
+
+        with urllib.request.urlopen(proxy.base_url + "/models", timeout=5) as response:
+            assert json.loads(response.read())["data"][0]["id"] == "gpt-4"
+
+
+def test_errors_are_relayed_not_cached():
+    """Upstream errors reach every waiting caller and are retried next time"""
+    with FakeOpenAI(latency=0.1) as upstream, LLMCacheProxy(upstream.base_url) as proxy:
+        failing = {**PLANNING, "messages": [{"role": "user", "content": "please fail"}]}
+        for _ in range(2):
+            status, outcome, body = _post(proxy.base_url, failing)
+            assert status == 500 and outcome == "error"
+            assert body["error"]["message"] == "The server had an error"
+        assert upstream.calls == 2
+
+        limited = {**PLANNING, "messages": [{"role": "user", "content": "ratelimit"}]}
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(_post(proxy.base_url, limited)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        assert [status for status, _, _ in results] == [429] * 4
+        assert upstream.calls == 3
+        assert proxy.cache.get_stats()["memory_entries"] == 0
+
+    with LLMCacheProxy(upstream.base_url) as proxy:
+        status, _, body = _post(proxy.base_url, PLANNING)
+        assert status == 502 and "Upstream unreachable" in body["error"]["message"]
+
+
+def test_sqlite_tier_survives_restart():
+    """Responses kept on disk are served by a new cache on the same file"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "llm.db")
+        calls = []
+
+        def call(request):
+            calls.append(request)
+            return {"choices": [], "usage": {"prompt_tokens": 3, "completion_tokens": 4}}
+
+        first = LLMCache(sqlite_path=path, mmap_size=1 << 20)
+        assert first.complete("/chat/completions", PLANNING, call)[1] == "miss"
+        first.disk.close()
+
+        second = LLMCache(sqlite_path=path, mmap_size=1 << 20)
+        response, outcome = second.complete("/chat/completions", PLANNING, call)
+        assert outcome == "hit" and response["usage"]["completion_tokens"] == 4
+        assert len(calls) == 1
+        stats = second.get_stats()
+        assert stats["disk_hits"] == 1 and stats["saved_tokens"] == 7
+        second.disk.close()
+
+
+def test_proxy_from_env():
+    """XAGENT_LLM_CACHE=1 starts one proxy and points OpenAI clients at it"""
+    names = ("XAGENT_LLM_CACHE", "XAGENT_LLM_CACHE_UPSTREAM", "OPENAI_BASE_URL", "OPENAI_API_BASE")
+    saved = {name: os.environ.get(name) for name in names}
+    with FakeOpenAI() as upstream:
+        try:
+            os.environ.pop("XAGENT_LLM_CACHE", None)
+            assert llm_cache.start_proxy_from_env() is None
+
+            os.environ["XAGENT_LLM_CACHE"] = "1"
+            os.environ["XAGENT_LLM_CACHE_UPSTREAM"] = upstream.base_url
+            proxy = llm_cache.start_proxy_from_env()
+            assert llm_cache.start_proxy_from_env() is proxy
+            assert os.environ["OPENAI_BASE_URL"] == os.environ["OPENAI_API_BASE"] == proxy.base_url
+            assert proxy.upstream == upstream.base_url and proxy.cache.enabled
+
+            for _ in range(2):
+                _post(os.environ["OPENAI_BASE_URL"], PLANNING)
+            assert upstream.calls == 1
+        finally:
+            if llm_cache._env_proxy is not None:
+                llm_cache._env_proxy.stop()
+                llm_cache._env_proxy = None
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+
+def main():
+    print("LLM CACHE TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_completion_key,
+        test_temperature_bypass,
+        test_proxy_caches_and_reports_savings,
+        test_concurrent_identical_requests_coalesce,
+        test_bypassed_requests_are_forwarded,
+        test_errors_are_relayed_not_cached,
+        test_sqlite_tier_survives_restart,
+        test_proxy_from_env,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,228 @@
+"""
+Tests for the metrics registry, its exposition format and /metrics endpoint
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "XAgent" / "XAgentServer" / "exts"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_xagent import make_fake_xagent_home
+
+FAKE_HOME = make_fake_xagent_home()
+os.environ.setdefault("XAGENT_HOME", str(FAKE_HOME))
+
+import metrics
+from metrics import Counter, Gauge, MetricsRegistry, asgi_app, start_http_server
+from mock_redis import MockRedisClient, mock_redis as shared_mock_redis
+from xagent_integration import XAgentIntegration
+
+
+def _sample(text, name):
+    """Value of the sample line starting with name, or None"""
+    for line in text.splitlines():
+        if line.startswith(name + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def test_exposition_format():
+    """Counters, labelled counters, gauges and histograms render as Prometheus text"""
+    registry = MetricsRegistry()
+    runs = registry.counter("runs", "Runs started")
+    errors = registry.counter("errors", "Errors by class", ["error"])
+    depth = registry.gauge("depth", "Queue depth", func=lambda: 7)
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+
+    runs.inc(3)
+    errors.labels(error="Timeout").inc()
+    errors.labels("Quoted \"x\"").inc(2)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+    assert depth.value == 7
+
+    text = registry.render()
+    assert "# TYPE runs counter" in text
+    assert _sample(text, "runs_total") == 3
+    assert _sample(text, 'errors_total{error="Timeout"}') == 1
+    assert _sample(text, 'errors_total{error="Quoted \\"x\\""}') == 2
+    assert _sample(text, "depth") == 7
+    assert _sample(text, 'latency_seconds_bucket{le="0.1"}') == 1
+    assert _sample(text, 'latency_seconds_bucket{le="1"}') == 2
+    assert _sample(text, 'latency_seconds_bucket{le="+Inf"}') == 3
+    assert _sample(text, "latency_seconds_count") == 3
+    assert abs(_sample(text, "latency_seconds_sum") - 5.55) < 1e-9
+
+    try:
+        registry.counter("runs", "again")
+        assert False, "duplicate name accepted"
+    except ValueError:
+        pass
+
+
+def test_sharded_updates_are_exact():
+    """Concurrent increments are all counted, including those of exited threads"""
+    counter = Counter("sharded", "test")
+    start = threading.Barrier(8)
+
+    def work():
+        start.wait()
+        for _ in range(10000):
+            counter.inc()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.value == 80000
+    # The dead threads' cells are now retired; the total must not change
+    assert counter.value == 80000
+    counter.inc()
+    assert counter.value == 80001
+
+
+def test_exited_threads_do_not_pile_up():
+    """Cells of finished threads are folded away without waiting for a scrape"""
+    counter = Counter("short_lived", "Incremented from short-lived threads")
+    for _ in range(200):
+        thread = threading.Thread(target=counter.inc)
+        thread.start()
+        thread.join()
+    assert len(counter._cells._cells) <= 2
+    assert counter.value == 200
+
+
+def test_gauge_set_leaves_other_threads_cells_alone():
+    """set() replaces the running total without writing into live threads' cells"""
+    gauge = Gauge("in_use", "test")
+    ready = threading.Event()
+    step = threading.Event()
+    done = threading.Event()
+    cells = []
+
+    def work():
+        gauge.inc(3)
+        cells.append(gauge._cells.cell())
+        ready.set()
+        step.wait()
+        gauge.inc(2)
+        done.set()
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    ready.wait()
+    gauge.inc()
+    assert gauge.value == 4
+
+    gauge.set(1)
+    assert gauge.value == 1
+    # The worker's old cell is dropped, not zeroed under it
+    assert cells[0] == [3]
+    step.set()
+    done.wait()
+    thread.join()
+    gauge.dec()
+    assert gauge.value == 2
+
+
+def test_runs_are_counted():
+    """Successful and failed runs update the counters and histograms"""
+    integration = XAgentIntegration(xagent_home=str(FAKE_HOME), use_worker_pool=False)
+    started = metrics.tasks_started.value
+    succeeded = metrics.tasks_succeeded.value
+    failed = metrics.tasks_failed.labels(error="XAgentExecutionError").value
+    durations = metrics.task_duration.snapshot()["count"]
+    sizes = metrics.task_output_size.snapshot()["count"]
+    try:
+        assert asyncio.run(integration.run_xagent("ok"))["success"]
+        try:
+            asyncio.run(integration.run_xagent("fail"))
+            assert False, "failed run did not raise"
+        except RuntimeError:
+            pass
+    finally:
+        integration.close()
+
+    assert metrics.tasks_started.value == started + 2
+    assert metrics.tasks_succeeded.value == succeeded + 1
+    assert metrics.tasks_failed.labels(error="XAgentExecutionError").value == failed + 1
+    assert metrics.task_duration.snapshot()["count"] == durations + 2
+    assert metrics.task_output_size.snapshot()["count"] > sizes
+    assert metrics.subprocesses_in_flight.labels(mode="subprocess").value == 0
+
+
+def test_http_endpoint():
+    """start_http_server serves the registry on /metrics"""
+    registry = MetricsRegistry()
+    registry.counter("served", "test").inc(5)
+    server = start_http_server(0, registry=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+            assert _sample(response.read().decode(), "served_total") == 5
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_asgi_app_and_mock_redis_keys():
+    """The ASGI app renders the shared registry, including mock Redis keys"""
+    client = MockRedisClient(sweep_interval=0)
+    for i in range(4):
+        client.set_key(f"key:{i}", i)
+    metrics.register_mock_redis(client)
+    # The shared store is counted without being registered
+    shared_mock_redis.set_key("metrics:shared", 1)
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app()({"type": "http", "path": "/metrics"}, None, send))
+    assert sent[0]["status"] == 200
+    assert _sample(sent[1]["body"].decode(), "xagent_mock_redis_keys") >= 5
+    shared_mock_redis.delete_key("metrics:shared")
+
+
+def main():
+    """Run all metrics tests"""
+    print("METRICS TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_exposition_format,
+        test_sharded_updates_are_exact,
+        test_exited_threads_do_not_pile_up,
+        test_gauge_set_leaves_other_threads_cells_alone,
+        test_runs_are_counted,
+        test_http_endpoint,
+        test_asgi_app_and_mock_redis_keys,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
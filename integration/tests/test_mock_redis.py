@@ -0,0 +1,490 @@
+"""
+Tests for the mock Redis store used when no Redis server is available
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "XAgent" / "XAgentServer" / "exts"))
+
+import mock_redis
+from mock_redis import MockRedisClient, MockRedisOOMError, AsyncMockRedisClient
+
+
+def test_ex_and_px_expire_lazily():
+    """Expired keys disappear on read"""
+    client = MockRedisClient(sweep_interval=0)
+    client.set_key("seconds", "a", ex=0.02)
+    client.set_key("millis", "b", px=20)
+    client.set_key("forever", "c")
+
+    assert client.get_key("seconds") == "a"
+    time.sleep(0.03)
+    assert client.get_key("seconds") is None
+    assert not client.exists("millis")
+    assert client.get_key("forever") == "c"
+    assert client.info()["expired_keys"] == 2
+
+
+def test_background_sweep():
+    """Expired keys are removed without being read"""
+    client = MockRedisClient(sweep_interval=0.01)
+    for i in range(100):
+        client.set_key(f"key:{i}", i, px=10)
+    client.set_key("kept", "x", ex=60)
+
+    time.sleep(0.1)
+    assert len(client.data) == 1
+    assert client.info()["expired_keys"] == 100
+    assert client.used_memory == client.info()["used_memory"] > 0
+
+
+def test_ttl_commands():
+    """ttl/pttl/expire/persist follow Redis conventions"""
+    client = MockRedisClient(sweep_interval=0)
+    client.set_key("k", "v")
+
+    assert client.ttl("k") == -1
+    assert client.ttl("missing") == -2
+    assert client.expire("k", 10)
+    assert 9 <= client.ttl("k") <= 10
+    assert client.persist("k")
+    assert client.pttl("k") == -1
+    client.set_key("k", "v", ex=10)
+    client.set_key("k", "v2")
+    assert client.ttl("k") == -1
+
+
+def test_lru_eviction():
+    """Least recently used keys are evicted over max_memory"""
+    probe = MockRedisClient(sweep_interval=0)
+    probe.set_key("key:0", "x" * 100)
+    entry_size = probe.used_memory
+
+    client = MockRedisClient(max_memory=entry_size * 3, eviction_policy="allkeys-lru", shards=1)
+    for i in range(3):
+        client.set_key(f"key:{i}", "x" * 100)
+    client.get_key("key:0")
+    client.set_key("key:3", "x" * 100)
+
+    assert not client.exists("key:1")
+    assert client.exists("key:0") and client.exists("key:3")
+    assert client.used_memory <= client.max_memory
+    assert client.info()["keys_evicted"] == 1
+
+
+def test_lfu_eviction():
+    """Least frequently used keys are evicted over max_memory"""
+    probe = MockRedisClient(sweep_interval=0)
+    probe.set_key("key:0", "x" * 100)
+    entry_size = probe.used_memory
+
+    client = MockRedisClient(max_memory=entry_size * 3, eviction_policy="allkeys-lfu", shards=1)
+    for i in range(3):
+        client.set_key(f"key:{i}", "x" * 100)
+    for _ in range(5):
+        client.get_key("key:0")
+        client.get_key("key:2")
+    client.set_key("key:3", "x" * 100)
+
+    assert not client.exists("key:1")
+    assert client.exists("key:0") and client.exists("key:2") and client.exists("key:3")
+
+
+def test_noeviction_rejects_writes():
+    """With noeviction, writes over max_memory fail instead of evicting"""
+    client = MockRedisClient(max_memory=300, eviction_policy="noeviction", shards=1)
+    client.set_key("small", "x")
+    try:
+        client.set_key("big", "x" * 1000)
+        rejected = False
+    except MockRedisOOMError:
+        rejected = True
+
+    assert rejected
+    assert client.exists("small") and not client.exists("big")
+
+
+def test_concurrent_delete_is_atomic():
+    """Exactly one of many racing deletes of the same key succeeds"""
+    client = MockRedisClient(sweep_interval=0)
+    for round_number in range(50):
+        client.set_key("contested", round_number)
+        results = []
+        barrier = threading.Barrier(8)
+
+        def delete():
+            barrier.wait()
+            results.append(client.delete_key("contested"))
+
+        threads = [threading.Thread(target=delete) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results.count(True) == 1
+
+
+def test_threads_on_different_keys():
+    """Concurrent writers never lose updates or corrupt accounting"""
+    client = MockRedisClient(sweep_interval=0)
+
+    def writer(thread_id):
+        for i in range(2000):
+            client.set_key(f"t{thread_id}:{i % 100}", i)
+            client.get_key(f"t{thread_id}:{(i * 7) % 100}")
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert client.dbsize() == 800
+    assert client.get_key("t3:99") == 1999
+    expected = sum(shard.used_memory for shard in client._shards)
+    assert client.info()["used_memory"] == expected
+
+
+def test_async_client():
+    """AsyncMockRedisClient mirrors the sync API"""
+    client = AsyncMockRedisClient(sweep_interval=0)
+
+    async def scenario():
+        await client.set_key("k", "v", ex=10)
+        value = await client.get_key("k")
+        ttl = await client.ttl("k")
+        existed = await client.delete_key("k")
+        size = await client.dbsize()
+        return value, ttl, existed, size
+
+    value, ttl, existed, size = asyncio.run(scenario())
+    assert value == "v"
+    assert 9 <= ttl <= 10
+    assert existed
+    assert size == 0
+
+
+def test_async_client_does_not_block_on_held_lock():
+    """A shard locked by another thread is handled off the event loop"""
+    client = AsyncMockRedisClient(sweep_interval=0)
+    shard = client.client._shard("busy")
+    locked = threading.Event()
+    ticks = 0
+
+    def hold_lock():
+        with shard.lock:
+            locked.set()
+            time.sleep(0.1)
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.005)
+
+    async def scenario():
+        task = asyncio.ensure_future(ticker())
+        threading.Thread(target=hold_lock).start()
+        locked.wait()
+        await client.set_key("busy", 1)
+        task.cancel()
+        return await client.get_key("busy")
+
+    assert asyncio.run(scenario()) == 1
+    assert ticks >= 5
+
+
+def test_mget_mset_delete_many():
+    """Multi-key commands work across shards"""
+    client = MockRedisClient(sweep_interval=0)
+    client.mset({f"k{i}": i for i in range(50)}, ex=60)
+
+    assert client.mget(["k0", "missing", "k49"]) == [0, None, 49]
+    assert 59 <= client.ttl("k10") <= 60
+    assert client.delete_many("k0", "k1", "missing") == 2
+    assert client.dbsize() == 48
+
+
+def test_pipeline_is_atomic():
+    """Pipelined commands run in order while other threads are locked out"""
+    client = MockRedisClient(sweep_interval=0)
+    client.set_key("balance:a", 100)
+    client.set_key("balance:b", 0)
+    seen = []
+    stop = threading.Event()
+
+    def observer():
+        while not stop.is_set():
+            a, b = client.mget(["balance:a", "balance:b"])
+            seen.append(a + b)
+
+    thread = threading.Thread(target=observer)
+    thread.start()
+    for _ in range(200):
+        a, b = client.mget(["balance:a", "balance:b"])
+        with client.pipeline() as pipe:
+            pipe.set_key("balance:a", a - 1).set_key("balance:b", b + 1)
+            pipe.execute()
+    stop.set()
+    thread.join()
+
+    with client.pipeline() as pipe:
+        results = pipe.get_key("balance:a").get_key("balance:b").exists("nope").execute()
+
+    assert results == [-100, 200, False]
+    assert set(seen) == {100}
+
+
+def test_scan_iter_and_cursor():
+    """Keys can be walked incrementally and filtered by pattern"""
+    client = MockRedisClient(sweep_interval=0, shards=4)
+    for i in range(100):
+        client.set_key(f"session:{i}", i)
+        client.set_key(f"other:{i}", i)
+
+    sessions = set(client.scan_iter(match="session:*", count=7))
+    assert sessions == {f"session:{i}" for i in range(100)}
+
+    cursor, walked = 0, []
+    while True:
+        cursor, keys = client.scan(cursor, match="other:1*", count=9)
+        walked.extend(keys)
+        if cursor == 0:
+            break
+    assert sorted(walked) == sorted(f"other:{i}" for i in range(100) if str(i).startswith("1"))
+
+
+def test_async_client_fsyncs_off_the_loop():
+    """With appendfsync="always" even uncontended writes run in a thread"""
+    loop_thread = threading.get_ident()
+    writers = []
+    data_dir = tempfile.mkdtemp()
+    client = AsyncMockRedisClient(sweep_interval=0, data_dir=data_dir, appendfsync="always")
+    set_key = client.client.set_key
+
+    def recording_set_key(*args, **kwargs):
+        writers.append(threading.get_ident())
+        return set_key(*args, **kwargs)
+
+    client.client.set_key = recording_set_key
+    asyncio.run(client.set_key("k", "v"))
+    assert writers and loop_thread not in writers
+
+    client.client.appendfsync = "everysec"
+    asyncio.run(client.set_key("k", "w"))
+    assert writers[-1] == loop_thread
+    client.client.close()
+
+
+def test_async_batch_commands():
+    """The async client offers the same batch commands"""
+    client = AsyncMockRedisClient(sweep_interval=0)
+
+    async def scenario():
+        await client.mset({"a": 1, "b": 2})
+        values = await client.mget(["a", "b", "c"])
+        pipe = client.pipeline()
+        pipe.set_key("c", 3).get_key("c")
+        results = await pipe.execute()
+        keys = [key async for key in client.scan_iter(match="*")]
+        return values, results, sorted(keys)
+
+    values, results, keys = asyncio.run(scenario())
+    assert values == [1, 2, None]
+    assert results == [True, 3]
+    assert keys == ["a", "b", "c"]
+
+
+def test_scan_survives_deletes():
+    """Deleting keys mid-scan does not make the cursor skip surviving keys"""
+    client = AsyncMockRedisClient(sweep_interval=0, shards=4)
+
+    async def scenario():
+        await client.mset({f"keep:{i}": i for i in range(200)})
+        await client.mset({f"drop:{i}": i for i in range(200)})
+        seen = set()
+        async for key in client.scan_iter(count=10):
+            seen.add(key)
+            if key.startswith("drop:"):
+                # Drop this key and one that may not have been visited yet
+                await client.delete_many(key, f"drop:{199 - int(key[5:])}")
+        return seen
+
+    seen = asyncio.run(scenario())
+    assert {f"keep:{i}" for i in range(200)} <= seen
+    assert client.client.dbsize() == 200
+
+
+def test_scan_survives_resizes():
+    """Growing and shrinking a shard's SCAN buckets mid-scan skips no key"""
+    client = MockRedisClient(sweep_interval=0, shards=2)
+    client.mset({f"keep:{i}": i for i in range(500)})
+    cursor, seen, calls = 0, set(), 0
+    while True:
+        cursor, keys = client.scan(cursor, count=10)
+        assert len(keys) < 60
+        seen.update(keys)
+        calls += 1
+        if calls == 5:
+            client.mset({f"grow:{i}": i for i in range(20000)})
+        elif calls == 30:
+            client.delete_many(*(f"grow:{i}" for i in range(20000)))
+        if cursor == 0:
+            break
+    assert {f"keep:{i}" for i in range(500)} <= seen
+
+
+def test_restart_replays_append_only_log():
+    """Writes survive a restart through the append-only log alone"""
+    data_dir = tempfile.mkdtemp()
+    client = MockRedisClient(sweep_interval=0, data_dir=data_dir)
+    client.set_key("session:1", {"user": "a"})
+    client.set_key("session:2", "b", ex=60)
+    client.set_key("gone", "x")
+    client.delete_key("gone")
+    client.persist("session:2")
+    client.expire("session:2", 120)
+    client.close()
+
+    restarted = MockRedisClient(sweep_interval=0, data_dir=data_dir)
+    assert restarted.get_key("session:1") == {"user": "a"}
+    assert 119 <= restarted.ttl("session:2") <= 120
+    assert not restarted.exists("gone")
+    assert restarted.load_stats["replayed_records"] > 0
+
+
+def test_snapshot_plus_log():
+    """A snapshot compacts the logs and later writes are replayed on top"""
+    data_dir = tempfile.mkdtemp()
+    client = MockRedisClient(sweep_interval=0, data_dir=data_dir)
+    client.mset({f"k{i}": i for i in range(1000)})
+    client.save()
+    client.set_key("after", "snapshot")
+    client.delete_key("k0")
+    client.close()
+
+    assert os.path.exists(os.path.join(data_dir, "dump.rdb"))
+    restarted = MockRedisClient(sweep_interval=0, data_dir=data_dir)
+    assert restarted.dbsize() == 1000
+    assert restarted.get_key("k999") == 999
+    assert restarted.get_key("after") == "snapshot"
+    assert restarted.load_stats["replayed_records"] == 2
+    assert restarted.used_memory > 0
+
+
+def test_failed_snapshot_releases_save():
+    """A snapshot that fails to write does not block the next one"""
+    data_dir = tempfile.mkdtemp()
+    client = MockRedisClient(sweep_interval=0, data_dir=data_dir)
+    client.set_key("k", "v")
+    write_snapshot = mock_redis.write_snapshot
+
+    def broken(*args):
+        raise OSError("disk full")
+
+    mock_redis.write_snapshot = broken
+    try:
+        client.bgsave(wait=True)
+        assert False, "failed snapshot was not reported"
+    except OSError:
+        pass
+    finally:
+        mock_redis.write_snapshot = write_snapshot
+    assert client.bgsave(wait=True)
+    client.close()
+    assert MockRedisClient(sweep_interval=0, data_dir=data_dir).get_key("k") == "v"
+
+
+def test_restart_with_different_shard_count():
+    """Keys are redistributed when the shard layout changes"""
+    data_dir = tempfile.mkdtemp()
+    client = MockRedisClient(sweep_interval=0, data_dir=data_dir, shards=4)
+    client.mset({f"k{i}": i for i in range(100)})
+    client.save()
+    client.close()
+
+    restarted = MockRedisClient(sweep_interval=0, data_dir=data_dir, shards=8)
+    assert restarted.mget([f"k{i}" for i in range(100)]) == list(range(100))
+
+
+def test_torn_log_record_is_ignored():
+    """A partially written final record does not break recovery"""
+    data_dir = tempfile.mkdtemp()
+    client = MockRedisClient(sweep_interval=0, data_dir=data_dir, shards=1)
+    client.set_key("complete", 1)
+    client.close()
+    log = [name for name in os.listdir(data_dir) if name.endswith(".aof")][0]
+    with open(os.path.join(data_dir, log), "ab") as f:
+        f.write(b"\x40\x00\x00\x00partial")
+
+    restarted = MockRedisClient(sweep_interval=0, data_dir=data_dir, shards=1)
+    assert restarted.get_key("complete") == 1
+
+
+def test_flushdb_is_persisted():
+    """Flushed keys do not come back after a restart"""
+    data_dir = tempfile.mkdtemp()
+    client = MockRedisClient(sweep_interval=0, data_dir=data_dir)
+    client.set_key("old", 1)
+    client.flushdb()
+    client.set_key("new", 2)
+    client.close()
+
+    restarted = MockRedisClient(sweep_interval=0, data_dir=data_dir)
+    assert restarted.mget(["old", "new"]) == [None, 2]
+
+
+def main():
+    """Run all mock Redis tests"""
+    print("MOCK REDIS TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_ex_and_px_expire_lazily,
+        test_background_sweep,
+        test_ttl_commands,
+        test_lru_eviction,
+        test_lfu_eviction,
+        test_noeviction_rejects_writes,
+        test_concurrent_delete_is_atomic,
+        test_threads_on_different_keys,
+        test_async_client,
+        test_async_client_does_not_block_on_held_lock,
+        test_async_client_fsyncs_off_the_loop,
+        test_mget_mset_delete_many,
+        test_pipeline_is_atomic,
+        test_scan_iter_and_cursor,
+        test_scan_survives_deletes,
+        test_scan_survives_resizes,
+        test_async_batch_commands,
+        test_restart_replays_append_only_log,
+        test_snapshot_plus_log,
+        test_failed_snapshot_releases_save,
+        test_restart_with_different_shard_count,
+        test_torn_log_record_is_ignored,
+        test_flushdb_is_persisted,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,314 @@
+"""
+Tests for Redis Cluster mode of the mock Redis store
+"""
+
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+EXTS = Path(__file__).parent.parent / "XAgent" / "XAgentServer" / "exts"
+sys.path.insert(0, str(EXTS))
+
+import redis
+from redis.cluster import ClusterNode, RedisCluster
+
+from mock_redis import MockRedisBusyKeyError, MockRedisClient
+from mock_redis_cluster import (
+    HASH_SLOTS, ClusterAdmin, ClusterClient, LocalCluster, create_cluster, key_slot
+)
+from mock_redis_persistence import DUMP_MAGIC, dump_payload
+from mock_redis_server import MockRedisServer
+
+
+def _client(**kwargs):
+    return MockRedisClient(sweep_interval=0, **kwargs)
+
+
+def _nodes(count):
+    return [
+        MockRedisServer(_client(), port=0, cluster=True).run_in_thread() for _ in range(count)
+    ]
+
+
+def _stop(servers):
+    for server in servers:
+        server.stop()
+
+
+def _addresses(servers):
+    return [(server.host, server.port) for server in servers]
+
+
+def _error(call, *args):
+    try:
+        call(*args)
+    except redis.ResponseError as e:
+        return str(e)
+    raise AssertionError(f"{args} did not fail")
+
+
+def test_key_slot():
+    """Slots match Redis Cluster's, including its hashtag rules"""
+    assert key_slot("123456789") == 0x31C3
+    assert key_slot("foo") == 12182
+    assert key_slot(b"foo") == key_slot("foo")
+    assert key_slot("{user1000}.following") == key_slot("{user1000}.followers")
+    assert key_slot("{user1000}.following") == key_slot("user1000")
+    # Empty tags hash the whole key; only the first tag counts
+    assert key_slot("foo{}{bar}") != key_slot("bar")
+    assert key_slot("foo{{bar}}zap") == key_slot("{bar")
+    assert key_slot("foo{bar}{zap}") == key_slot("bar")
+    assert all(0 <= key_slot(f"k{n}") < HASH_SLOTS for n in range(1000))
+
+
+def test_dump_and_restore():
+    """Every value type survives dump/restore; damaged payloads are refused"""
+    source = _client()
+    source.set_key("string", "value")
+    source.hset("hash", mapping={"a": 1, "b": 2})
+    source.rpush("list", "x", "y", "z")
+    source.zadd("zset", {"m": 1.5, "n": 2})
+    source.xadd("stream", {"f": "v"}, id="1-1")
+    target = _client()
+    for key in ("string", "hash", "list", "zset", "stream"):
+        target.restore(key, 0, source.dump(key))
+        assert target.type(key) == source.type(key)
+    assert target.get_key("string") == source.get_key("string")
+    assert target.hgetall("hash") == source.hgetall("hash")
+    assert target.lrange("list", 0, -1) == [b"x", b"y", b"z"]
+    assert target.zrange("zset", 0, -1, withscores=True) == source.zrange("zset", 0, -1, withscores=True)
+    assert target.xrange("stream") == source.xrange("stream")
+    assert source.dump("missing") is None
+
+    try:
+        target.restore("list", 0, source.dump("string"))
+        assert False, "existing key replaced"
+    except MockRedisBusyKeyError:
+        pass
+    target.restore("list", 5000, source.dump("string"), replace=True)
+    assert target.get_key("list") == source.get_key("string")
+    assert 0 < target.pttl("list") <= 5000
+
+    payload = source.dump("string")
+    for damaged in (payload[:-1] + bytes([payload[-1] ^ 1]), b"junk"):
+        try:
+            target.restore("x", 0, damaged)
+            assert False, "damaged payload accepted"
+        except ValueError:
+            pass
+    # A well-formed payload naming a class must not import or call anything
+    try:
+        target.restore("x", 0, dump_payload((None, MockRedisClient)))
+        assert False, "pickled global accepted"
+    except ValueError as e:
+        assert "Bad data format" in str(e)
+    assert payload.startswith(DUMP_MAGIC) and not target.exists("x")
+
+
+def test_redirects():
+    """Nodes answer MOVED, CROSSSLOT, ASK and TRYAGAIN as Redis Cluster does"""
+    servers = _nodes(2)
+    try:
+        assert _error(redis.Redis(port=servers[0].port).set, "foo", 1).startswith(
+            "CLUSTERDOWN"
+        )
+        nodes = create_cluster(_addresses(servers))
+        first, second = (redis.Redis(port=server.port) for server in servers)
+        first_id, second_id = nodes
+        assert first.execute_command("CLUSTER", "INFO").find(b"cluster_state:ok") != -1
+        assert first.execute_command("CLUSTER", "KEYSLOT", "foo") == 12182
+
+        # "foo" is in the upper half, served by the second node
+        assert _error(first.get, "foo") == f"MOVED 12182 127.0.0.1:{servers[1].port}"
+        assert second.set("foo", "bar") and second.get("foo") == b"bar"
+        assert _error(second.mget, "foo", "bar").startswith("CROSSSLOT")
+        assert second.mget("{foo}a", "{foo}b") == [None, None]
+
+        # Migrate slot 12182 by hand, one of its two keys at a time
+        second.set("{foo}moved", 1)
+        first.execute_command("CLUSTER", "SETSLOT", 12182, "IMPORTING", second_id)
+        second.execute_command("CLUSTER", "SETSLOT", 12182, "MIGRATING", first_id)
+        assert second.execute_command("CLUSTER", "COUNTKEYSINSLOT", 12182) == 2
+        assert second.execute_command(
+            "MIGRATE", "127.0.0.1", servers[0].port, "{foo}moved", 0, 5000
+        ) == b"OK"
+        # Keys still on the migrating node are served there, moved ones get ASK
+        assert second.get("foo") == b"bar"
+        assert _error(second.get, "{foo}moved") == f"ASK 12182 127.0.0.1:{servers[0].port}"
+        assert _error(second.mget, "foo", "{foo}moved").startswith("TRYAGAIN")
+        # The importing node serves the slot only right after ASKING
+        assert _error(first.get, "{foo}moved").startswith("MOVED")
+        pipe = first.pipeline(transaction=False)
+        pipe.execute_command("ASKING")
+        pipe.get("{foo}moved")
+        pipe.get("{foo}moved")
+        results = pipe.execute(raise_on_error=False)
+        assert results[:2] == [True, b"1"] and isinstance(results[2], redis.ResponseError)
+
+        assert second.execute_command(
+            "MIGRATE", "127.0.0.1", servers[0].port, "", 0, 5000, "KEYS", "foo"
+        ) == b"OK"
+        assert second.execute_command("MIGRATE", "127.0.0.1", servers[0].port, "foo", 0, 5000) \
+            == b"NOKEY"
+        for node in (first, second):
+            node.execute_command("CLUSTER", "SETSLOT", 12182, "NODE", first_id)
+        assert first.get("foo") == b"bar" and first.get("{foo}moved") == b"1"
+        assert _error(second.get, "foo") == f"MOVED 12182 127.0.0.1:{servers[0].port}"
+    finally:
+        _stop(servers)
+
+
+def test_stock_cluster_client():
+    """redis-py's RedisCluster and ClusterClient spread keys across the nodes"""
+    servers = _nodes(3)
+    try:
+        create_cluster(_addresses(servers))
+        cluster = RedisCluster(
+            startup_nodes=[ClusterNode(host, port) for host, port in _addresses(servers)]
+        )
+        for n in range(300):
+            cluster.set(f"k{n}", n)
+        assert cluster.get("k7") == b"7"
+        assert cluster.dbsize(target_nodes=RedisCluster.PRIMARIES) == 300
+        assert all(server.client.dbsize() > 50 for server in servers)
+        cluster.close()
+
+        client = ClusterClient(_addresses(servers))
+        keys = [f"k{n}" for n in range(300)]
+        assert client.mget(keys) == [str(n).encode() for n in range(300)]
+        assert client.mset({f"t{n}": n for n in range(50)}, ex=100)
+        assert 0 < client.ttl("t3") <= 100
+        assert client.delete_many(keys + ["missing"]) == 300
+        assert client.dbsize() == 50
+        assert client.set_key("x", "y") and client.get_key("x") == b"y"
+        assert client.flushdb() and client.dbsize() == 0
+        client.close()
+    finally:
+        _stop(servers)
+
+
+def test_reshard_while_writing():
+    """Slots move while a client keeps writing; nothing is lost or refused"""
+    servers = _nodes(3)
+    try:
+        create_cluster(_addresses(servers))
+        startup = [ClusterNode(host, port) for host, port in _addresses(servers)]
+        cluster = RedisCluster(startup_nodes=startup)
+        cluster.mset_nonatomic({f"k{n}": n for n in range(2000)})
+
+        stop = threading.Event()
+        written = []
+        errors = []
+
+        def write():
+            writer = RedisCluster(startup_nodes=startup)
+            while not stop.is_set():
+                key = f"w{len(written)}"
+                try:
+                    writer.set(key, 1)
+                    written.append(key)
+                except Exception as e:
+                    errors.append(e)
+                    return
+            writer.close()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        with ClusterAdmin(_addresses(servers)) as admin:
+            target = list(admin.connections)[2]
+            assert admin.reshard(range(300), target) == 300
+            owners = admin.owners()
+        stop.set()
+        writer.join(10)
+
+        assert errors == [] and written
+        assert all(owners[slot] == target for slot in range(300))
+        assert sum(key_slot(key) < 300 for key in written + [f"k{n}" for n in range(2000)]) > 0
+        values = cluster.mget_nonatomic([f"k{n}" for n in range(2000)] + written)
+        assert None not in values
+        assert cluster.dbsize(target_nodes=RedisCluster.PRIMARIES) == 2000 + len(written)
+        cluster.close()
+    finally:
+        _stop(servers)
+
+
+def test_add_node_and_rebalance():
+    """A node joining with no slots gets an even share of them"""
+    servers = _nodes(3)
+    try:
+        create_cluster(_addresses(servers[:2]))
+        cluster = RedisCluster(
+            startup_nodes=[ClusterNode(servers[0].host, servers[0].port)]
+        )
+        cluster.mset_nonatomic({f"k{n}": n for n in range(1000)})
+        with ClusterAdmin(_addresses(servers)) as admin:
+            admin.meet_all()
+            assert admin.rebalance() == HASH_SLOTS // 3
+            counts = {}
+            for owner in admin.owners().values():
+                counts[owner] = counts.get(owner, 0) + 1
+        assert sorted(counts.values()) == [5461, 5461, 5462]
+        assert servers[2].client.dbsize() > 0
+        assert cluster.mget_nonatomic([f"k{n}" for n in range(1000)]) == [
+            str(n).encode() for n in range(1000)
+        ]
+        cluster.close()
+    finally:
+        _stop(servers)
+
+
+def test_local_cluster_processes():
+    """LocalCluster runs each node in its own process, keeping data on restart"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        with LocalCluster(2, data_dir=data_dir) as cluster:
+            assert len(cluster.nodes) == 2
+            client = cluster.client()
+            client.mset_nonatomic({f"k{n}": n for n in range(200)})
+            node_id = cluster.add_node()
+            assert cluster.reshard(range(10), node_id) == 10
+            assert client.mget_nonatomic([f"k{n}" for n in range(200)]) == [
+                str(n).encode() for n in range(200)
+            ]
+            client.close()
+        assert cluster.processes == []
+
+        with LocalCluster(2, data_dir=data_dir) as cluster:
+            client = cluster.client()
+            # Keys of slots that moved to the third node stay behind with it
+            kept = [f"k{n}" for n in range(200) if key_slot(f"k{n}") >= 10]
+            assert None not in client.mget_nonatomic(kept)
+            client.close()
+
+
+def main():
+    print("MOCK REDIS CLUSTER TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_key_slot,
+        test_dump_and_restore,
+        test_redirects,
+        test_stock_cluster_client,
+        test_reshard_while_writing,
+        test_add_node_and_rebalance,
+        test_local_cluster_processes,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,319 @@
+"""
+Tests for pub/sub and blocking list pops in the mock Redis store
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+EXTS = Path(__file__).parent.parent / "XAgent" / "XAgentServer" / "exts"
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(EXTS))
+
+from fake_xagent import make_fake_xagent_home
+
+FAKE_HOME = make_fake_xagent_home()
+os.environ.setdefault("XAGENT_HOME", str(FAKE_HOME))
+
+import redis
+
+from mock_redis import AsyncMockRedisClient, MockRedisClient
+from mock_redis_server import MockRedisServer
+from xagent_integration import XAgentIntegration
+
+
+def _client(**kwargs):
+    return MockRedisClient(sweep_interval=0, **kwargs)
+
+
+def test_publish_reaches_channel_and_pattern_subscribers():
+    """Messages go to channel and glob subscribers; counts match PUBSUB"""
+    client = _client()
+    with client.pubsub() as exact, client.pubsub() as pattern:
+        exact.subscribe("task:1")
+        pattern.psubscribe("task:*")
+        assert client.publish("task:1", "started") == 2
+        assert client.publish("other", "ignored") == 0
+
+        assert exact.get_message() == {
+            "type": "message", "pattern": None, "channel": "task:1", "data": "started"
+        }
+        message = pattern.get_message()
+        assert message["type"] == "pmessage" and message["pattern"] == "task:*"
+        assert exact.get_message() is None
+
+        assert client.pubsub_channels() == ["task:1"]
+        assert client.pubsub_numsub("task:1", "other") == [("task:1", 1), ("other", 0)]
+        assert client.pubsub_numpat() == 1
+    assert client.pubsub_channels() == [] and client.pubsub_numpat() == 0
+    assert client.publish("task:1", "late") == 0
+
+
+def test_listener_is_woken_by_publisher():
+    """A blocked get_message returns as soon as another thread publishes"""
+    client = _client()
+    pubsub = client.pubsub()
+    pubsub.subscribe("events")
+    threading.Timer(0.05, client.publish, ("events", "ping")).start()
+    started = time.monotonic()
+    message = pubsub.get_message(timeout=5)
+    assert message["data"] == "ping"
+    assert time.monotonic() - started < 1
+
+    # listen() ends when the subscriptions do
+    threading.Timer(0.05, pubsub.unsubscribe).start()
+    assert list(pubsub.listen()) == []
+
+
+def test_overflow_policies():
+    """A full subscriber blocks, drops or is closed, as configured"""
+    client = _client()
+    dropping = client.pubsub(max_pending=2, overflow="drop")
+    closing = client.pubsub(max_pending=2, overflow="close")
+    dropping.subscribe("c")
+    closing.subscribe("c")
+    for n in range(3):
+        client.publish("c", n)
+    assert [dropping.get_message()["data"] for _ in range(2)] == [0, 1]
+    assert dropping.dropped == 1 and not dropping.closed
+    assert closing.closed and closing.dropped == 1
+
+    blocking = client.pubsub(max_pending=1, overflow="block")
+    blocking.subscribe("b")
+    client.publish("b", "first")
+    publisher = threading.Thread(target=client.publish, args=("b", "second"))
+    publisher.start()
+    publisher.join(0.1)
+    # The publisher waits for room instead of losing the message
+    assert publisher.is_alive()
+    assert blocking.get_message()["data"] == "first"
+    publisher.join(5)
+    assert not publisher.is_alive()
+    assert blocking.get_message()["data"] == "second"
+
+
+def test_async_pubsub_and_backpressure():
+    """Async listeners and publishers wait without blocking the loop"""
+    async def run():
+        async_client = AsyncMockRedisClient(_client())
+        pubsub = async_client.pubsub(max_pending=1)
+        await pubsub.psubscribe("job:*")
+        assert await pubsub.get_message(timeout=0.01) is None
+
+        async def slow_reader():
+            received = []
+            async for message in pubsub.listen():
+                received.append(message["data"])
+                await asyncio.sleep(0.01)
+                if len(received) == 5:
+                    await pubsub.punsubscribe()
+            return received
+
+        reader = asyncio.ensure_future(slow_reader())
+        for n in range(5):
+            assert await async_client.publish(f"job:{n}", n) == 1
+        assert await asyncio.wait_for(reader, 5) == [0, 1, 2, 3, 4]
+
+    asyncio.run(run())
+
+
+def test_blpop_waits_for_push():
+    """blpop returns at once, after a push from another thread, or on timeout"""
+    client = _client()
+    client.rpush("jobs", "a")
+    assert client.blpop("jobs", timeout=1) == ("jobs", b"a")
+
+    threading.Timer(0.05, client.rpush, ("jobs", "b")).start()
+    started = time.monotonic()
+    assert client.blpop(["empty", "jobs"], timeout=5) == ("jobs", b"b")
+    assert time.monotonic() - started < 1
+
+    assert client.brpop("jobs", timeout=0.05) is None
+    assert client._shard("jobs").waiters == {}
+
+    # The oldest blocked caller is served first, one element each
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(client.blpop("q", timeout=5)))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    assert client.rpush("q", "x", "y") == 2
+    for thread in threads:
+        thread.join(5)
+    assert results == [("q", b"x"), ("q", b"y")]
+    assert client.llen("q") == 0
+
+
+def test_async_blpop_and_cancellation():
+    """A cancelled async blpop does not lose an element handed to it"""
+    async def run():
+        client = _client()
+        async_client = AsyncMockRedisClient(client)
+
+        waiting = asyncio.ensure_future(async_client.blpop("q", timeout=5))
+        await asyncio.sleep(0.01)
+        client.lpush("q", "job")
+        assert await waiting == ("q", b"job")
+
+        waiting = asyncio.ensure_future(async_client.brpop("q"))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        client.lpush("q", "kept")
+        try:
+            await waiting
+        except asyncio.CancelledError:
+            pass
+        assert client.lrange("q", 0, -1) == [b"kept"]
+        assert client._shard("q").waiters == {}
+
+    asyncio.run(run())
+
+
+def test_popped_elements_are_persisted():
+    """Elements handed to blocked callers stay popped after a restart"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        client = _client(data_dir=data_dir)
+        threading.Timer(0.05, client.rpush, ("q", "a", "b")).start()
+        assert client.blpop("q", timeout=5) == ("q", b"a")
+        client.close()
+
+        reopened = _client(data_dir=data_dir)
+        try:
+            assert reopened.lrange("q", 0, -1) == [b"b"]
+        finally:
+            reopened.close()
+
+
+def test_server_pubsub_and_blocking_pops():
+    """redis-py subscribes and blocks on the server as on a real Redis"""
+    client = _client()
+    server = MockRedisServer(client, port=0).run_in_thread()
+    r = redis.Redis(port=server.port)
+    listener = r.pubsub()
+    try:
+        listener.subscribe("ch")
+        listener.psubscribe("task:*")
+        assert listener.get_message(timeout=1)["type"] == "subscribe"
+        assert listener.get_message(timeout=1)["data"] == 2
+        assert r.publish("ch", "over the wire") == 1
+        # Published in this process, delivered to the network subscriber
+        assert client.publish("task:7", "in process") == 1
+        assert listener.get_message(timeout=1)["data"] == b"over the wire"
+        message = listener.get_message(timeout=1)
+        assert message["channel"] == b"task:7" and message["pattern"] == b"task:*"
+        assert r.pubsub_numpat() == 1 and r.pubsub_numsub("ch") == [(b"ch", 1)]
+
+        listener.execute_command("GET", "k")
+        try:
+            listener.parse_response(timeout=1)
+            assert False, "GET allowed while subscribed"
+        except redis.ResponseError:
+            pass
+
+        # Requests pipelined behind a blocked BLPOP wait for it
+        threading.Timer(0.1, client.rpush, ("jobs", "job")).start()
+        pipe = r.pipeline(transaction=False)
+        pipe.blpop("jobs", timeout=5)
+        pipe.llen("jobs")
+        assert pipe.execute() == [(b"jobs", b"job"), 0]
+
+        assert r.brpop("jobs", timeout=0.05) is None
+        # Inside MULTI a blocking pop does not block
+        pipe = r.pipeline()
+        pipe.blpop("jobs", timeout=0)
+        pipe.set("after", "1")
+        assert pipe.execute() == [None, True]
+        try:
+            r.blpop("jobs", timeout=-1)
+            assert False, "negative timeout accepted"
+        except redis.ResponseError:
+            pass
+    finally:
+        listener.close()
+        server.stop()
+
+
+def test_server_closes_overflowing_subscribers():
+    """A subscriber that stops reading is disconnected, not buffered forever"""
+    client = _client()
+    server = MockRedisServer(client, port=0, pubsub_max_pending=10).run_in_thread()
+    listener = redis.Redis(port=server.port).pubsub()
+    try:
+        listener.subscribe("flood")
+        listener.get_message(timeout=1)
+        payload = "x" * 65536
+        for _ in range(2000):
+            if client.publish("flood", payload) == 0:
+                break
+        deadline = time.monotonic() + 5
+        while client.pubsub_numsub("flood") != [("flood", 0)] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert client.pubsub_numsub("flood") == [("flood", 0)]
+    finally:
+        listener.close()
+        server.stop()
+
+
+def test_progress_channel():
+    """run_xagent publishes each event of the run as it happens"""
+    client = _client()
+    xagent = XAgentIntegration(
+        xagent_home=str(FAKE_HOME), use_worker_pool=False,
+        progress_client=AsyncMockRedisClient(client)
+    )
+    pubsub = client.pubsub()
+    pubsub.subscribe("progress:1")
+    try:
+        result = asyncio.run(xagent.run_xagent("stream", progress_channel="progress:1"))
+    finally:
+        xagent.close()
+
+    events = [json.loads(message["data"]) for message in iter(pubsub.get_message, None)]
+    assert [event["type"] for event in events] == ["log", "step", "answer", "result"]
+    assert events[-1]["result"]["answer"] == result["answer"]
+
+
+def main():
+    print("MOCK REDIS PUB/SUB TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_publish_reaches_channel_and_pattern_subscribers,
+        test_listener_is_woken_by_publisher,
+        test_overflow_policies,
+        test_async_pubsub_and_backpressure,
+        test_blpop_waits_for_push,
+        test_async_blpop_and_cancellation,
+        test_popped_elements_are_persisted,
+        test_server_pubsub_and_blocking_pops,
+        test_server_closes_overflowing_subscribers,
+        test_progress_channel,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
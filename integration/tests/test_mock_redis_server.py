@@ -0,0 +1,237 @@
+"""
+Tests for the RESP2 server in front of the mock Redis store
+"""
+
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+
+EXTS = Path(__file__).parent.parent / "XAgent" / "XAgentServer" / "exts"
+sys.path.insert(0, str(EXTS))
+
+import redis
+import redis.asyncio
+
+from mock_redis import MockRedisClient
+from mock_redis_server import MockRedisServer, RespParser, ProtocolError
+
+
+def _serve(**kwargs):
+    client = MockRedisClient(sweep_interval=0)
+    return client, MockRedisServer(client, port=0, **kwargs).run_in_thread()
+
+
+def test_parser_handles_split_and_inline_requests():
+    """Requests arriving a byte at a time, pipelined or inline, parse the same"""
+    stream = b"*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$5\r\nv\r\nxy\r\n*1\r\n$4\r\nPING\r\nPING hi\r\n"
+    parser = RespParser()
+    commands = []
+    for i in range(len(stream)):
+        parser.feed(stream[i:i + 1])
+        commands.extend(parser.commands())
+    assert commands == [[b"SET", b"k", b"v\r\nxy"], [b"PING"], [b"PING", b"hi"]]
+
+    parser = RespParser()
+    parser.feed(stream * 3)
+    assert len(parser.commands()) == 9
+
+    parser.feed(b"*1\r\n+PING\r\n")
+    try:
+        parser.commands()
+        assert False, "malformed request parsed"
+    except ProtocolError:
+        pass
+
+
+def test_string_commands():
+    """redis-py talks to the server as to a real Redis"""
+    client, server = _serve()
+    r = redis.Redis(port=server.port)
+    try:
+        assert r.ping()
+        assert r.set("k", "v") and r.get("k") == b"v"
+        assert r.set("k", "other", nx=True) is None
+        assert r.set("missing", "x", xx=True) is None
+        assert r.set("k", "w", get=True) == b"v"
+        assert r.mset({"a": "1", "b": "2"}) and r.mget("a", "b", "c") == [b"1", b"2", None]
+        assert r.incr("a") == 2 and r.decrby("a", 5) == -3
+        assert r.exists("a", "b", "c") == 2 and r.delete("a", "b", "c") == 2
+
+        r.set("t", "v", ex=100)
+        assert 99 <= r.ttl("t") <= 100
+        assert r.incr("counter") == 1 and r.expire("counter", 50) and r.incr("counter") == 2
+        assert r.ttl("counter") > 0, "INCR dropped the time to live"
+        assert r.persist("t") and r.ttl("t") == -1
+        assert r.ttl("nothing") == -2
+
+        assert sorted(r.keys("*")) == [b"counter", b"k", b"t"]
+        assert sorted(r.scan_iter(match="c*", count=2)) == [b"counter"]
+        assert r.dbsize() == 3 and r.info()["connected_clients"] == 1
+        try:
+            r.incr("k")
+            assert False, "INCR of a non-integer succeeded"
+        except redis.ResponseError as e:
+            assert "not an integer" in str(e)
+        try:
+            r.execute_command("LPOS", "k", "v")
+            assert False, "unknown command succeeded"
+        except redis.ResponseError as e:
+            assert "unknown command" in str(e)
+    finally:
+        r.close()
+        server.stop()
+
+
+def test_keys_shared_with_in_process_client():
+    """Keys written over the network are visible in process and the other way round"""
+    client, server = _serve()
+    r = redis.Redis(port=server.port)
+    try:
+        client.set_key("session:1", "in process")
+        assert r.get("session:1") == b"in process"
+        r.set("session:2", b"\xffbinary")
+        assert client.get_key("session:2") == b"\xffbinary"
+        r.set(b"\xfe\xff", "odd key")
+        assert r.get(b"\xfe\xff") == b"odd key"
+        assert b"\xfe\xff" in r.keys()
+    finally:
+        r.close()
+        server.stop()
+
+
+def test_pipelines_and_transactions():
+    """Pipelined commands reply in order; MULTI/EXEC queues and aborts like Redis"""
+    client, server = _serve()
+    r = redis.Redis(port=server.port)
+    try:
+        pipe = r.pipeline(transaction=False)
+        for i in range(1000):
+            pipe.set(f"key:{i}", i)
+        pipe.get("key:999")
+        assert pipe.execute()[-1] == b"999"
+
+        pipe = r.pipeline()
+        pipe.incr("n").incr("n").get("n")
+        assert pipe.execute() == [1, 2, b"2"]
+
+        # A runtime error fails its own command only
+        pipe = r.pipeline()
+        pipe.set("s", "text").incr("s").set("after", "1")
+        results = pipe.execute(raise_on_error=False)
+        assert isinstance(results[1], redis.ResponseError) and results[2] is True
+
+        # A command rejected while queueing discards the transaction
+        raw = redis.Redis(port=server.port, single_connection_client=True)
+        raw.execute_command("MULTI")
+        raw.execute_command("SET", "x", "1")
+        try:
+            raw.execute_command("SET", "x")
+        except redis.ResponseError:
+            pass
+        try:
+            raw.execute_command("EXEC")
+            assert False, "aborted transaction ran"
+        except redis.exceptions.ExecAbortError:
+            pass
+        assert r.get("x") is None
+        raw.close()
+    finally:
+        r.close()
+        server.stop()
+
+
+def test_many_concurrent_connections():
+    """A thousand clients share one event loop and every increment lands"""
+    client, server = _serve()
+    connections, increments = 1000, 3
+
+    async def run():
+        clients = [
+            redis.asyncio.Redis(port=server.port, single_connection_client=True)
+            for _ in range(connections)
+        ]
+
+        async def work(c):
+            for _ in range(increments):
+                await c.incr("hits")
+
+        try:
+            await asyncio.gather(*(work(c) for c in clients))
+            assert len(server.connections) == connections
+        finally:
+            await asyncio.gather(*(c.aclose() for c in clients))
+
+    try:
+        asyncio.run(run())
+        assert client.get_key("hits") == str(connections * increments).encode()
+    finally:
+        server.stop()
+
+
+def test_other_processes_share_the_store():
+    """A separate Python process reads and writes the same keys"""
+    client, server = _serve()
+    script = (
+        "import redis, sys\n"
+        "r = redis.Redis(port=int(sys.argv[1]))\n"
+        "r.set('from_child', r.get('from_parent') + b'!')\n"
+    )
+    try:
+        client.set_key("from_parent", "hello")
+        subprocess.run([sys.executable, "-c", script, str(server.port)], check=True, timeout=30)
+        assert client.get_key("from_child") == b"hello!"
+    finally:
+        server.stop()
+
+
+def test_max_clients():
+    """Connections beyond max_clients are refused with an error"""
+    client, server = _serve(max_clients=1)
+    first = redis.Redis(port=server.port)
+    second = redis.Redis(port=server.port)
+    try:
+        assert first.ping()
+        try:
+            second.ping()
+            assert False, "connection over max_clients served"
+        except (redis.ConnectionError, redis.ResponseError) as e:
+            assert "max number of clients" in str(e)
+    finally:
+        first.close()
+        second.close()
+        server.stop()
+
+
+def main():
+    """Run all mock Redis server tests"""
+    print("MOCK REDIS SERVER TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_parser_handles_split_and_inline_requests,
+        test_string_commands,
+        test_keys_shared_with_in_process_client,
+        test_pipelines_and_transactions,
+        test_many_concurrent_connections,
+        test_other_processes_share_the_store,
+        test_max_clients,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
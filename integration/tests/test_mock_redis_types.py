@@ -0,0 +1,287 @@
+"""
+Tests for the hash, list, sorted set and stream types of the mock Redis store
+"""
+
+import asyncio
+import pickle
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+EXTS = Path(__file__).parent.parent / "XAgent" / "XAgentServer" / "exts"
+sys.path.insert(0, str(EXTS))
+
+import redis
+
+from mock_redis import AsyncMockRedisClient, MockRedisClient, MockRedisWrongTypeError
+from mock_redis_server import MockRedisServer
+from mock_redis_types import (
+    HASH_MAX_LISTPACK_ENTRIES, HASH_MAX_LISTPACK_VALUE, LIST_MAX_LISTPACK_SIZE,
+    ZSET_MAX_LISTPACK_ENTRIES, RedisSortedSet
+)
+
+
+def test_hash_switches_encoding():
+    """Small hashes are listpacks and become hash tables past the limits"""
+    client = MockRedisClient(sweep_interval=0)
+    assert client.hset("h", mapping={"a": "1", "b": 2}) == 2
+    assert client.object_encoding("h") == "listpack"
+    assert client.hget("h", "b") == b"2" and client.hget("h", b"a") == b"1"
+    assert client.hincrby("h", "b", 5) == 7 and client.hsetnx("h", "a", "x") == 0
+    small = client.memory_usage("h")
+
+    client.hset("h", "long", "v" * (HASH_MAX_LISTPACK_VALUE + 1))
+    assert client.object_encoding("h") == "hashtable"
+    client.hset("many", mapping={f"f{i}": i for i in range(HASH_MAX_LISTPACK_ENTRIES + 1)})
+    assert client.object_encoding("many") == "hashtable"
+    assert client.hlen("many") == HASH_MAX_LISTPACK_ENTRIES + 1
+    assert client.memory_usage("h") > small
+
+    assert client.hdel("h", "a", "b", "long", "missing") == 3
+    assert not client.exists("h"), "empty hash kept"
+
+
+def test_list_operations():
+    """Pushes, pops and ranges match Redis, before and after the switch to a deque"""
+    client = MockRedisClient(sweep_interval=0)
+    model = []
+    for n in range(LIST_MAX_LISTPACK_SIZE * 2):
+        if n % 3:
+            client.rpush("l", n)
+            model.append(str(n).encode())
+        else:
+            client.lpush("l", n)
+            model.insert(0, str(n).encode())
+    assert client.object_encoding("l") == "quicklist"
+    assert client.lrange("l", 0, -1) == model
+    assert client.lrange("l", -5, -2) == model[-5:-1] and client.lindex("l", -1) == model[-1]
+    assert client.lpop("l", 2) == model[:2] and client.rpop("l") == model[-1]
+    del model[:2], model[-1]
+    client.lset("l", 0, "x")
+    model[0] = b"x"
+    assert client.lrem("l", 0, "x") == 1
+    model.remove(b"x")
+    client.ltrim("l", 1, 10)
+    assert client.lrange("l", 0, -1) == model[1:11]
+    try:
+        client.lset("nothing", 0, "x")
+        assert False, "LSET of a missing key succeeded"
+    except IndexError:
+        pass
+
+
+def test_sorted_set_matches_model():
+    """Random adds, increments and removals agree with a sorted Python list"""
+    rng = random.Random(7)
+    client = MockRedisClient(sweep_interval=0)
+    scores = {}
+    for _ in range(2000):
+        member = f"m{rng.randrange(300)}".encode()
+        roll = rng.random()
+        if roll < 0.6:
+            score = float(rng.randrange(50))
+            client.zadd("z", {member: score})
+            scores[member] = score
+        elif roll < 0.8:
+            scores[member] = client.zincrby("z", 1.5, member)
+        else:
+            client.zrem("z", member)
+            scores.pop(member, None)
+    ordered = sorted(scores.items(), key=lambda pair: (pair[1], pair[0]))
+
+    assert len(scores) > ZSET_MAX_LISTPACK_ENTRIES and client.object_encoding("z") == "skiplist"
+    assert client.zrange("z", 0, -1, withscores=True) == ordered
+    assert client.zrange("z", 0, 9, desc=True) == [m for m, _ in reversed(ordered)][:10]
+    member = ordered[42][0]
+    assert client.zrank("z", member) == 42
+    assert client.zrevrank("z", member) == len(ordered) - 43
+    in_range = [pair for pair in ordered if 10 < pair[1] <= 20]
+    assert client.zrangebyscore("z", "(10", 20, withscores=True) == in_range
+    assert client.zrangebyscore("z", "(10", 20, start=3, num=4) == [m for m, _ in in_range[3:7]]
+    assert client.zrevrangebyscore("z", 20, "(10") == [m for m, _ in reversed(in_range)]
+    assert client.zcount("z", "(10", 20) == len(in_range)
+    assert client.zpopmin("z", 2) == ordered[:2] and client.zpopmax("z") == ordered[-1:]
+    assert client.zadd("z", {member: 1000}, nx=True) == 0
+    assert client.zadd("z", {member: -1}, gt=True, ch=True) == 0
+
+
+def test_skiplist_survives_pickling():
+    """A large sorted set pickles flat, without deep recursion"""
+    zset = RedisSortedSet()
+    zset.add({str(i).encode(): float(i) for i in range(50000)})
+    restored = pickle.loads(pickle.dumps(zset))
+    assert len(restored) == 50000 and restored.encoding == "skiplist"
+    assert restored.range(0, 2) == zset.range(0, 2) and restored.rank(b"49999") == 49999
+
+
+def test_streams():
+    """XADD assigns increasing IDs; ranges, deletes, trims and reads follow them"""
+    client = MockRedisClient(sweep_interval=0)
+    ids = [client.xadd("s", {"n": i}) for i in range(250)]
+    assert ids == sorted(ids, key=lambda entry_id: tuple(map(int, entry_id.split("-"))))
+    assert client.xlen("s") == 250
+    assert client.xrange("s", count=2) == [(ids[0], {b"n": b"0"}), (ids[1], {b"n": b"1"})]
+    assert [i for i, _ in client.xrevrange("s", count=3)] == ids[:-4:-1]
+    assert [i for i, _ in client.xrange("s", ids[10], f"({ids[13]}")] == ids[10:13]
+    assert client.xdel("s", ids[0], ids[1], "0-1") == 2 and client.xlen("s") == 248
+    assert client.xtrim("s", 100) == 148 and client.xrange("s", count=1)[0][0] == ids[150]
+
+    (key, entries), = client.xread({"s": ids[-3]})
+    assert key == "s" and [i for i, _ in entries] == ids[-2:]
+    assert client.xread({"s": "$"}) == []
+
+    assert client.xadd("explicit", {"a": 1}, id="5-1") == "5-1"
+    assert client.xadd("explicit", {"a": 2}, id="5-*") == "5-2"
+    try:
+        client.xadd("explicit", {"a": 3}, id="5-0")
+        assert False, "smaller stream ID accepted"
+    except ValueError:
+        pass
+    client.xadd("capped", {"a": 1}, maxlen=1)
+    client.xadd("capped", {"a": 2}, maxlen=1)
+    assert client.xlen("capped") == 1
+
+
+def test_wrong_type():
+    """Commands on a key of another type fail with WRONGTYPE"""
+    client = MockRedisClient(sweep_interval=0)
+    client.set_key("text", "v")
+    client.rpush("list", "a")
+    for call in (
+        lambda: client.hset("text", "f", "v"),
+        lambda: client.zadd("list", {"m": 1}),
+        lambda: client.get_key("list"),
+        lambda: client.xlen("list"),
+    ):
+        try:
+            call()
+            assert False, "command on the wrong type succeeded"
+        except MockRedisWrongTypeError as e:
+            assert str(e).startswith("WRONGTYPE")
+    assert client.mget(["text", "list"]) == ["v", None]
+    assert [client.type(k) for k in ("text", "list", "none")] == ["string", "list", "none"]
+
+
+def test_collections_persist():
+    """Partial updates replay from the log, on their own and on top of a snapshot"""
+    for snapshot in (False, True):
+        data_dir = tempfile.mkdtemp()
+        client = MockRedisClient(sweep_interval=0, data_dir=data_dir)
+        client.hset("h", mapping={"a": 1, "b": 2})
+        client.rpush("l", *range(200))
+        client.zadd("z", {f"m{i}": i for i in range(200)})
+        stream_id = client.xadd("s", {"f": "v"})
+        if snapshot:
+            client.save()
+        client.hincrby("h", "a", 10)
+        client.lpop("l", 5)
+        client.zrem("z", "m0")
+        client.xadd("s", {"f": "w"})
+        client.close()
+
+        restarted = MockRedisClient(sweep_interval=0, data_dir=data_dir)
+        assert restarted.hgetall("h") == {b"a": b"11", b"b": b"2"}
+        assert restarted.lrange("l", 0, 1) == [b"5", b"6"] and restarted.llen("l") == 195
+        assert restarted.zcard("z") == 199 and restarted.object_encoding("z") == "skiplist"
+        assert restarted.xrange("s", count=1) == [(stream_id, {b"f": b"v"})]
+        assert restarted.xlen("s") == 2
+        if snapshot:
+            assert restarted.load_stats["replayed_records"] == 4
+        restarted.close()
+
+
+def test_pipeline_and_async_commands():
+    """Collection commands are available in pipelines and on the async client"""
+    client = MockRedisClient(sweep_interval=0)
+    pipe = client.pipeline()
+    pipe.hset("h", "f", "v").rpush("l", "a", "b").zadd("z", {"m": 2}).hgetall("h")
+    assert pipe.execute() == [1, 2, 1, {b"f": b"v"}]
+
+    async def run():
+        async_client = AsyncMockRedisClient(sweep_interval=0)
+        assert await async_client.rpush("queue", "job") == 1
+        assert await async_client.xadd("events", {"type": "start"}, id="1-1") == "1-1"
+        assert await async_client.lpop("queue") == b"job"
+        assert await async_client.xlen("events") == 1
+
+    asyncio.run(run())
+
+
+def test_server_commands():
+    """redis-py's hash, list, sorted set and stream commands work over RESP"""
+    client = MockRedisClient(sweep_interval=0)
+    server = MockRedisServer(client, port=0).run_in_thread()
+    r = redis.Redis(port=server.port)
+    try:
+        assert r.hset("h", mapping={"a": 1, "b": 2}) == 2
+        assert r.hgetall("h") == {b"a": b"1", b"b": b"2"} and r.hmget("h", ["a", "z"]) == [b"1", None]
+        client.hset("h", "in_process", "yes")
+        assert r.hget("h", "in_process") == b"yes" and r.type("h") == b"hash"
+        assert r.object("encoding", "h") == b"listpack" and r.memory_usage("h") > 0
+
+        assert r.rpush("l", 1, 2, 3) == 3 and r.lpop("l", 2) == [b"1", b"2"]
+        assert client.lrange("l", 0, -1) == [b"3"]
+
+        assert r.zadd("z", {"a": 1, "b": 2.5}) == 2
+        assert r.zrange("z", 0, -1, withscores=True) == [(b"a", 1.0), (b"b", 2.5)]
+        assert r.zadd("z", {"a": 2}, incr=True) == 3.0
+        assert r.zrevrangebyscore("z", "+inf", "(2.5") == [b"a"]
+        assert r.zrange("z", 10, 0, byscore=True, desc=True, offset=0, num=1) == [b"a"]
+        assert r.zpopmin("z") == [(b"b", 2.5)]
+
+        first = r.xadd("s", {"f": "v"})
+        r.xadd("s", {"f": "w"}, maxlen=5)
+        assert r.xlen("s") == 2 and r.xrange("s", count=1) == [(first, {b"f": b"v"})]
+        assert r.xread({"s": first}) == [[b"s", [(r.xrevrange("s")[0][0], {b"f": b"w"})]]]
+        assert r.xadd("missing", {"f": "v"}, nomkstream=True) is None
+
+        assert sorted(r.scan_iter(_type="zset")) == [b"z"]
+        try:
+            r.get("h")
+            assert False, "GET of a hash succeeded"
+        except redis.ResponseError as e:
+            assert str(e).startswith("WRONGTYPE")
+
+        pipe = r.pipeline()
+        pipe.hincrby("h", "a", 1).zcard("z").llen("l")
+        assert pipe.execute() == [2, 1, 1]
+    finally:
+        r.close()
+        server.stop()
+
+
+def main():
+    """Run all mock Redis data type tests"""
+    print("MOCK REDIS DATA TYPE TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_hash_switches_encoding,
+        test_list_operations,
+        test_sorted_set_matches_model,
+        test_skiplist_survives_pickling,
+        test_streams,
+        test_wrong_type,
+        test_collections_persist,
+        test_pipeline_and_async_commands,
+        test_server_commands,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
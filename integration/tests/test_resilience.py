@@ -0,0 +1,283 @@
+"""
+Tests for retries, hedged runs and the circuit breaker around run_xagent
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_xagent import make_fake_xagent_home
+
+FAKE_HOME = make_fake_xagent_home()
+os.environ.setdefault("XAGENT_HOME", str(FAKE_HOME))
+
+import metrics
+from resilience import CircuitBreaker, CircuitOpenError, HedgePolicy, LatencyBudget, RetryPolicy
+from xagent_integration import XAgentIntegration
+
+FAST_RETRY = RetryPolicy(base_delay=0.01)
+
+
+def _counter_file():
+    fd, path = tempfile.mkstemp(prefix="runs_")
+    os.close(fd)
+    return path
+
+
+def test_backoff_delays():
+    """Delays grow exponentially up to max_delay, and jitter only shortens them"""
+    policy = RetryPolicy(base_delay=1, multiplier=2, max_delay=5, jitter=0)
+    assert [policy.delay(attempt) for attempt in (1, 2, 3, 4)] == [1, 2, 4, 5]
+
+    jittered = RetryPolicy(base_delay=1, multiplier=2, max_delay=5, jitter=1)
+    delays = [jittered.delay(3) for _ in range(200)]
+    assert all(0 <= delay <= 4 for delay in delays)
+    assert len(set(delays)) > 1
+
+    os.environ.update(XAGENT_RETRY_ATTEMPTS="5", XAGENT_RETRY_ON="crash, timeout")
+    try:
+        policy = RetryPolicy.from_env()
+    finally:
+        del os.environ["XAGENT_RETRY_ATTEMPTS"], os.environ["XAGENT_RETRY_ON"]
+    assert policy.attempts == 5 and policy.retry_on == {"crash", "timeout"}
+
+
+def test_rate_limit_is_retried():
+    """Rate-limited runs are retried until one succeeds, on both execution paths"""
+    for use_pool in (False, True):
+        counter = _counter_file()
+        xagent = XAgentIntegration(
+            xagent_home=str(FAKE_HOME), use_worker_pool=use_pool, pool_size=1, retry=FAST_RETRY
+        )
+        retried = metrics.retries.labels(error="rate_limit").value
+        try:
+            result = asyncio.run(xagent.run_xagent(f"ratelimit:{counter}:2"))
+        finally:
+            xagent.close()
+            os.remove(counter)
+        assert result["success"], use_pool
+        assert metrics.retries.labels(error="rate_limit").value == retried + 2
+
+
+def test_task_errors_are_not_retried():
+    """An ordinary failure is reported after a single attempt"""
+    xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), use_worker_pool=False, retry=FAST_RETRY)
+    started = metrics.tasks_started.value
+    try:
+        asyncio.run(xagent.run_xagent("fail"))
+        assert False, "failed run did not raise"
+    except RuntimeError as e:
+        assert "task failed on purpose" in str(e)
+    finally:
+        xagent.close()
+    assert metrics.tasks_started.value == started + 1
+
+
+def test_hedge_beats_slow_attempt():
+    """A second attempt starts after the hedge delay and the slow one is stopped"""
+    counter = _counter_file()
+    xagent = XAgentIntegration(
+        xagent_home=str(FAKE_HOME), use_worker_pool=False, hedge=HedgePolicy(enabled=True, delay=1.0)
+    )
+    won = metrics.hedged_runs.labels(outcome="won").value
+    started = time.monotonic()
+    try:
+        result = asyncio.run(xagent.run_xagent(f"slowfirst:{counter}:30"))
+    finally:
+        xagent.close()
+        os.remove(counter)
+
+    assert result["success"]
+    assert time.monotonic() - started < 10
+    assert metrics.hedged_runs.labels(outcome="won").value == won + 1
+    # The reap thread of the stopped attempt updates the gauge last
+    in_flight = metrics.subprocesses_in_flight.labels(mode="subprocess")
+    deadline = time.monotonic() + 5
+    while in_flight.value and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert in_flight.value == 0
+
+
+def test_hedge_delay_from_recent_runs():
+    """Without a fixed delay, hedging waits for enough samples and uses their p95"""
+    budget = LatencyBudget(HedgePolicy(enabled=True, min_samples=10))
+    for ms in range(1, 10):
+        budget.record(ms / 1000)
+    assert budget.hedge_delay() is None
+    for ms in range(10, 101):
+        budget.record(ms / 1000)
+    assert abs(budget.hedge_delay() - 0.096) < 0.002
+
+
+def test_circuit_breaker_states():
+    """Consecutive failures open the breaker; one probe after the reset closes it"""
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+    breaker.allow()
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    try:
+        breaker.allow()
+        assert False, "open breaker admitted a run"
+    except CircuitOpenError as e:
+        assert e.retry_after == 10
+
+    now[0] = 10
+    breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    try:
+        breaker.allow()
+        assert False, "second probe admitted"
+    except CircuitOpenError:
+        pass
+    # A failed probe opens it again for another reset_timeout
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] = 20
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_only_the_probe_releases_the_probe():
+    """A cancelled run that was not the half-open probe does not free it"""
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    early = breaker.allow()
+    assert early is None
+    breaker.allow()
+    breaker.record_failure()
+
+    now[0] = 10
+    probe = breaker.allow()
+    assert probe is not None
+    # The run admitted before the breaker opened is cancelled
+    breaker.release(early)
+    try:
+        breaker.allow()
+        assert False, "second probe admitted"
+    except CircuitOpenError:
+        pass
+
+    breaker.release(probe)
+    assert breaker.allow() is not None
+
+
+def test_open_breaker_sheds_load():
+    """While the breaker is open no run is started"""
+    xagent = XAgentIntegration(
+        xagent_home=str(FAKE_HOME),
+        use_worker_pool=False,
+        breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    )
+    try:
+        for _ in range(2):
+            try:
+                asyncio.run(xagent.run_xagent("sleep:5", timeout=0.2))
+            except RuntimeError:
+                pass
+        started = metrics.tasks_started.value
+        rejected = metrics.circuit_rejections.value
+        try:
+            asyncio.run(xagent.run_xagent("ok"))
+            assert False, "open breaker admitted a run"
+        except CircuitOpenError as e:
+            assert "circuit breaker is open" in str(e)
+    finally:
+        xagent.close()
+    assert metrics.tasks_started.value == started
+    assert metrics.circuit_rejections.value == rejected + 1
+
+
+def test_task_errors_do_not_open_breaker():
+    """Ordinary task failures leave the breaker closed and reset its count"""
+    xagent = XAgentIntegration(
+        xagent_home=str(FAKE_HOME),
+        use_worker_pool=False,
+        breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    )
+    try:
+        for task in ("fail", "fail", "fail"):
+            try:
+                asyncio.run(xagent.run_xagent(task))
+            except RuntimeError:
+                pass
+        assert xagent.breaker.state == CircuitBreaker.CLOSED
+        assert xagent.breaker.failures == 0
+        assert asyncio.run(xagent.run_xagent("ok"))["success"]
+    finally:
+        xagent.close()
+
+
+def test_hedge_needs_a_scheduler_slot():
+    """No second attempt is started while the scheduler is full"""
+    from scheduler import task_scheduler
+
+    counter = _counter_file()
+    xagent = XAgentIntegration(
+        xagent_home=str(FAKE_HOME), use_worker_pool=False, hedge=HedgePolicy(enabled=True, delay=0.2)
+    )
+    held = 0
+    while task_scheduler.try_acquire():
+        held += 1
+    launched = metrics.hedged_runs.labels(outcome="launched").value
+    skipped = metrics.hedged_runs.labels(outcome="skipped").value
+    try:
+        result = asyncio.run(xagent.run_xagent(f"slowfirst:{counter}:1"))
+    finally:
+        for _ in range(held):
+            task_scheduler.release()
+        xagent.close()
+        os.remove(counter)
+
+    assert result["success"]
+    assert metrics.hedged_runs.labels(outcome="launched").value == launched
+    assert metrics.hedged_runs.labels(outcome="skipped").value == skipped + 1
+    assert task_scheduler.running == 0
+
+
+def main():
+    """Run all resilience tests"""
+    print("RESILIENCE TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_backoff_delays,
+        test_rate_limit_is_retried,
+        test_task_errors_are_not_retried,
+        test_hedge_beats_slow_attempt,
+        test_hedge_delay_from_recent_runs,
+        test_circuit_breaker_states,
+        test_only_the_probe_releases_the_probe,
+        test_open_breaker_sheds_load,
+        test_task_errors_do_not_open_breaker,
+        test_hedge_needs_a_scheduler_slot,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
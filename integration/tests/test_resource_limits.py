@@ -0,0 +1,139 @@
+"""
+Tests for XAgent resource limits and usage accounting
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_xagent import make_fake_xagent_home
+
+FAKE_HOME = make_fake_xagent_home()
+os.environ.setdefault("XAGENT_HOME", str(FAKE_HOME))
+
+import langchain_replacement
+from resource_limits import Cgroup, ResourceLimits
+from xagent_integration import XAgentIntegration
+
+MB = 1 << 20
+
+
+def _run_both(task, **kwargs):
+    """Run task in a fresh process and on a pool worker"""
+    results = []
+    for use_pool in (False, True):
+        xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), use_worker_pool=use_pool, pool_size=1)
+        try:
+            try:
+                results.append(asyncio.run(xagent.run_xagent(task, **kwargs)))
+            except RuntimeError as e:
+                results.append(e)
+        finally:
+            xagent.close()
+    return results
+
+
+def test_usage_reported():
+    """Both execution modes report CPU, wall time, peak RSS and output size"""
+    for result in _run_both("alloc:64 burn:0.2"):
+        usage = result["usage"]
+        assert usage["peak_rss_bytes"] >= 64 * MB, usage
+        assert usage["user_cpu_seconds"] + usage["system_cpu_seconds"] >= 0.1, usage
+        assert usage["wall_seconds"] >= usage["user_cpu_seconds"] * 0.5, usage
+        assert usage["output_bytes"] > len("Starting XAgent"), usage
+
+
+def test_memory_limit_fails_run():
+    """A run that allocates past RLIMIT_AS fails; the next one is unaffected"""
+    limits = ResourceLimits(memory_bytes=512 * MB)
+    for result in _run_both("alloc:1024", limits=limits):
+        assert isinstance(result, RuntimeError), result
+
+    # The worker restores its own limit after the task
+    xagent = XAgentIntegration(
+        xagent_home=str(FAKE_HOME), use_worker_pool=True, pool_size=1, limits=limits
+    )
+    try:
+        try:
+            asyncio.run(xagent.run_xagent("alloc:1024"))
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("limit was not applied")
+        result = asyncio.run(xagent.run_xagent("alloc:1024", limits={}))
+        assert result["success"]
+    finally:
+        xagent.close()
+
+
+def test_cpu_limit_fails_run():
+    """A run that spins past RLIMIT_CPU is stopped"""
+    for result in _run_both("burn:5", limits={"cpu_seconds": 1}):
+        assert isinstance(result, RuntimeError), result
+
+
+def test_limits_from_env_and_missing_cgroup():
+    """XAGENT_LIMIT_* configure limits; an unusable cgroup parent is skipped"""
+    os.environ.update(XAGENT_LIMIT_NOFILE="256", XAGENT_CGROUP="/nonexistent/xagent")
+    try:
+        limits = ResourceLimits.from_env()
+    finally:
+        del os.environ["XAGENT_LIMIT_NOFILE"], os.environ["XAGENT_CGROUP"]
+    assert limits.open_files == 256 and limits.memory_bytes is None
+    assert Cgroup.create(limits.cgroup_parent, "run", limits) is None
+
+    xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), use_worker_pool=False, limits=limits)
+    result = asyncio.run(xagent.run_xagent("limited"))
+    assert result["answer"] == "done: limited"
+
+
+def test_wrapper_response_usage():
+    """AgentResponse carries the run's usage"""
+    xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), use_worker_pool=False)
+    original = langchain_replacement.xagent_integration
+    langchain_replacement.xagent_integration = xagent
+    try:
+        agent = langchain_replacement.initialize_xagent()
+        response = agent("usage please")
+        stopped = agent("pause:30", timeout=0.5)
+    finally:
+        langchain_replacement.xagent_integration = original
+
+    assert response.success and response.usage["output_bytes"] > 0
+    assert not stopped.success and stopped.usage["wall_seconds"] >= 0.5
+
+
+def main():
+    """Run all resource limit tests"""
+    print("RESOURCE LIMIT TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_usage_reported,
+        test_memory_limit_fails_run,
+        test_cpu_limit_fails_run,
+        test_limits_from_env_and_missing_cgroup,
+        test_wrapper_response_usage,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
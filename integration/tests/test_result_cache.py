@@ -0,0 +1,202 @@
+"""
+Tests for the XAgent result cache
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_xagent import make_fake_xagent_home
+
+os.environ.setdefault("XAGENT_HOME", str(make_fake_xagent_home()))
+
+import langchain_replacement
+from result_cache import ResultCache, LRUCache, make_cache_key
+
+
+def test_key_normalization():
+    """Whitespace does not matter, config and config file contents do"""
+    base = make_cache_key("What is  2+2?", {"mode": "auto"}, "model: gpt-4")
+    assert base == make_cache_key(" What is 2+2? ", {"mode": "auto"}, "model: gpt-4")
+    assert base != make_cache_key("What is 2+2?", {"mode": "manual"}, "model: gpt-4")
+    assert base != make_cache_key("What is 2+2?", {"mode": "auto"}, "model: gpt-3.5")
+
+
+def test_lru_eviction_and_ttl():
+    """Least recently used entries go first and expired entries vanish"""
+    cache = LRUCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.evictions == 1
+
+    cache.set("short", 4, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("short") is None
+    assert cache.expirations == 1
+
+
+def test_sqlite_tier_survives_restart():
+    """A new cache instance finds results written by the previous one"""
+    path = os.path.join(tempfile.mkdtemp(), "results.db")
+    first = ResultCache(sqlite_path=path)
+    first.set("key", {"answer": "42"})
+    first.disk.close()
+
+    second = ResultCache(sqlite_path=path)
+    assert second.get("key") == {"answer": "42"}
+    assert second.get_stats()["disk_hits"] == 1
+
+
+def test_single_flight():
+    """Concurrent identical requests share one computation"""
+    cache = ResultCache()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return {"answer": "shared"}
+
+    async def run_all():
+        return await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(10)))
+
+    results = asyncio.run(run_all())
+    stats = cache.get_stats()
+
+    assert calls == 1
+    assert all(result == {"answer": "shared"} for result in results)
+    assert stats["coalesced"] == 9
+    assert stats["misses"] == 10
+
+
+def test_cancelled_waiter_does_not_cancel_others():
+    """A waiter giving up leaves the leader and the other waiters their result"""
+    cache = ResultCache()
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return {"answer": "shared"}
+
+    async def run_all():
+        leader = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        impatient = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        patient = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        return await asyncio.gather(leader, impatient, patient, return_exceptions=True)
+
+    leader, impatient, patient = asyncio.run(run_all())
+    assert isinstance(impatient, asyncio.CancelledError)
+    assert leader == {"answer": "shared"}
+    assert patient == {"answer": "shared"}
+    assert cache.get("k") == {"answer": "shared"}
+
+
+def test_failures_are_not_cached():
+    """Errors reach every waiter but the next call runs again"""
+    cache = ResultCache()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        raise RuntimeError("boom")
+
+    async def run_twice():
+        for _ in range(2):
+            try:
+                await cache.get_or_compute("k", compute)
+            except RuntimeError:
+                pass
+
+    asyncio.run(run_twice())
+    assert calls == 2
+
+
+def test_wrapper_uses_cache():
+    """Repeated XAgentWrapper.run calls hit the cache"""
+    original_cache = langchain_replacement.result_cache
+    original_run = langchain_replacement.xagent_integration.run_xagent
+    langchain_replacement.result_cache = ResultCache()
+    calls = 0
+
+    async def counting_run(task, **kwargs):
+        nonlocal calls
+        calls += 1
+        return {
+            "answer": f"answer to {task}", "steps": ["search"], "success": True,
+            "usage": {"wall_seconds": 1.0}
+        }
+
+    langchain_replacement.xagent_integration.run_xagent = counting_run
+    try:
+        agent = langchain_replacement.initialize_xagent()
+
+        async def run_all():
+            first = await agent.run("same task")
+            first.intermediate_steps.append("changed by the caller")
+            second = await agent.run("same   task")
+            second.intermediate_steps.clear()
+            third = await agent.run("same task")
+            bypass = await agent.run("same task", use_cache=False)
+            return first, second, third, bypass
+
+        first, second, third, bypass = asyncio.run(run_all())
+    finally:
+        langchain_replacement.result_cache = original_cache
+        langchain_replacement.xagent_integration.run_xagent = original_run
+
+    assert first.output == second.output == bypass.output == "answer to same task"
+    assert calls == 2
+    # Hits are copies, marked as cached and without the original run's usage
+    assert third.intermediate_steps == ["search"]
+    assert not first.cached and first.usage == {"wall_seconds": 1.0}
+    assert second.cached and third.cached and second.usage is None
+    assert not bypass.cached and bypass.usage is not None
+
+
+def main():
+    """Run all result cache tests"""
+    print("RESULT CACHE TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_key_normalization,
+        test_lru_eviction_and_ttl,
+        test_sqlite_tier_survives_restart,
+        test_single_flight,
+        test_cancelled_waiter_does_not_cancel_others,
+        test_failures_are_not_cached,
+        test_wrapper_uses_cache,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,147 @@
+"""
+Tests for framed XAgent results and the legacy output parsers
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_xagent import make_fake_xagent_home
+
+FAKE_HOME = make_fake_xagent_home()
+os.environ.setdefault("XAGENT_HOME", str(FAKE_HOME))
+
+from xagent_integration import XAgentIntegration
+from result_channel import (
+    StreamingOutputParser, decode_records, encode_record, parse_output_text, write_result
+)
+
+SAMPLE_OUTPUTS = [
+    "no json at all",
+    "a\nb\nc\nd\ne\nf\ng",
+    '{"step": 1}\nlog\n{"answer": "42", "steps": ["x"]}\ntrailing',
+    '{"answer": "old"}\n{"broken": \nlog',
+    '{"answer": "first"}\n{"steps": ["only"]}\n1\n2\n3\n4\n5\n6',
+]
+
+
+def test_record_round_trip():
+    """The last complete record wins and a torn record is ignored"""
+    data = encode_record({"answer": "one"}) + encode_record({"answer": "two"})
+    assert decode_records(data) == {"answer": "two"}
+    assert decode_records(data + encode_record({"answer": "three"})[:-2]) == {"answer": "two"}
+    assert decode_records(b"") is None
+
+    with tempfile.TemporaryFile() as f:
+        write_result({"answer": "fd"}, fd=f.fileno())
+        f.seek(0)
+        assert decode_records(f.read()) == {"answer": "fd"}
+
+
+def test_parsers_match_legacy():
+    """Both legacy-mode parsers agree with the original line scan"""
+    xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), use_worker_pool=False)
+    for output in SAMPLE_OUTPUTS:
+        lines = output.strip().split("\n")
+        expected = {"answer": "", "steps": []}
+        for line in reversed(lines):
+            if line.startswith("{") and line.endswith("}"):
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                expected = {"answer": data.get("answer", ""), "steps": data.get("steps", [])}
+                break
+
+        streamed = StreamingOutputParser().feed_lines(lines).result()
+        scanned = parse_output_text(output.strip())
+        for parsed in (streamed, scanned):
+            assert parsed["answer"] == expected["answer"], output
+            assert parsed["steps"] == expected["steps"], output
+            assert parsed["fallback"] == "\n".join(lines[-5:])
+            assert parsed["line_count"] == len(lines)
+
+        legacy = xagent._parse_xagent_output(output)
+        assert legacy["answer"] == (expected["answer"] or (
+            "\n".join(lines[-5:]) if len(lines) > 5 else output
+        ))
+
+
+def test_streaming_parser_memory_is_bounded():
+    """Only a fixed number of lines is retained however long the log is"""
+    parser = StreamingOutputParser()
+    for i in range(10000):
+        parser.feed(json.dumps({"step": i}) if i % 2 else f"log {i}")
+    assert len(parser.candidates) <= 8
+    assert len(parser.last_lines) <= 5
+    assert parser.result()["line_count"] == 10000
+
+
+def test_framed_results_override_log():
+    """Descriptor and sentinel results win over the JSON in the log"""
+    for use_pool in (False, True):
+        xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), use_worker_pool=use_pool, pool_size=1)
+        try:
+            for task in ("framed task", "sentinel task"):
+                result = asyncio.run(xagent.run_xagent(task))
+                assert result["answer"] == f"done: {task}", (use_pool, result)
+                assert result["steps"] == ["plan", "act"]
+                assert "\x1e" not in result["raw_output"]
+        finally:
+            xagent.close()
+
+
+def test_framed_mode_skips_log():
+    """In framed mode JSON lines in the log are plain log events"""
+    xagent = XAgentIntegration(
+        xagent_home=str(FAKE_HOME), use_worker_pool=False, result_mode="framed"
+    )
+
+    async def collect(task):
+        return [event async for event in xagent.astream(task)]
+
+    events = asyncio.run(collect("plain task"))
+    assert {event["type"] for event in events} == {"log", "result"}
+    assert events[-1]["result"]["answer"] != "done: plain task"
+
+    events = asyncio.run(collect("framed task"))
+    assert [e["answer"] for e in events if e["type"] == "answer"] == ["done: framed task"]
+    assert events[-1]["result"]["answer"] == "done: framed task"
+
+
+def main():
+    """Run all result channel tests"""
+    print("RESULT CHANNEL TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_record_round_trip,
+        test_parsers_match_legacy,
+        test_streaming_parser_memory_is_bounded,
+        test_framed_results_override_log,
+        test_framed_mode_skips_log,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,169 @@
+"""
+Tests for the bounded-concurrency task scheduler
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_xagent import make_fake_xagent_home
+
+os.environ.setdefault("XAGENT_HOME", str(make_fake_xagent_home()))
+
+import langchain_replacement
+from scheduler import TaskScheduler, QueueFullError, PRIORITY_HIGH, PRIORITY_LOW
+
+
+def test_concurrency_cap():
+    """No more than max_concurrency tasks hold a slot at once"""
+    scheduler = TaskScheduler(max_concurrency=2, max_queue_size=10)
+    peak = 0
+
+    async def task():
+        nonlocal peak
+        async with scheduler.slot():
+            peak = max(peak, scheduler.running)
+            await asyncio.sleep(0.01)
+
+    async def run_all():
+        await asyncio.gather(*(task() for _ in range(8)))
+
+    asyncio.run(run_all())
+    metrics = scheduler.get_metrics()
+
+    assert peak == 2
+    assert metrics["running"] == 0
+    assert metrics["completed"] == 8
+    assert metrics["wait_time_max"] > 0
+
+
+def test_rejects_when_queue_full():
+    """Tasks beyond the queue bound fail fast"""
+    scheduler = TaskScheduler(max_concurrency=1, max_queue_size=1)
+
+    async def hold(seconds):
+        async with scheduler.slot():
+            await asyncio.sleep(seconds)
+
+    async def run_all():
+        first = asyncio.ensure_future(hold(0.05))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(hold(0))
+        await asyncio.sleep(0)
+        try:
+            await scheduler.acquire()
+            rejected = False
+        except QueueFullError:
+            rejected = True
+        await asyncio.gather(first, second)
+        return rejected
+
+    assert asyncio.run(run_all())
+    assert scheduler.get_metrics()["rejected"] == 1
+
+
+def test_priority_and_tenant_order():
+    """Higher priority goes first, then tenants alternate"""
+    scheduler = TaskScheduler(max_concurrency=1, max_queue_size=10)
+    order = []
+
+    async def task(name, tenant, priority):
+        async with scheduler.slot(tenant, priority):
+            order.append(name)
+
+    async def run_all():
+        await scheduler.acquire()
+        tasks = [
+            asyncio.ensure_future(task("a1", "a", PRIORITY_LOW)),
+            asyncio.ensure_future(task("a2", "a", PRIORITY_LOW)),
+            asyncio.ensure_future(task("a3", "a", PRIORITY_LOW)),
+            asyncio.ensure_future(task("b1", "b", PRIORITY_LOW)),
+            asyncio.ensure_future(task("urgent", "c", PRIORITY_HIGH)),
+        ]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run_all())
+    assert order == ["urgent", "a1", "b1", "a2", "a3"]
+
+
+def test_cancelled_waiter_leaves_queue():
+    """Cancelling a queued task frees its place"""
+    scheduler = TaskScheduler(max_concurrency=1, max_queue_size=5)
+
+    async def run_all():
+        await scheduler.acquire()
+        waiter = asyncio.ensure_future(scheduler.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        depth = scheduler.queue_depth
+        scheduler.release()
+        return depth
+
+    assert asyncio.run(run_all()) == 0
+    assert scheduler.running == 0
+
+
+def test_wrapper_returns_queue_full_response():
+    """XAgentWrapper.run turns a rejection into a failed AgentResponse"""
+    original_scheduler = langchain_replacement.task_scheduler
+    original_run = langchain_replacement.xagent_integration.run_xagent
+    langchain_replacement.task_scheduler = TaskScheduler(max_concurrency=1, max_queue_size=0)
+
+    async def slow_run(task, **kwargs):
+        await asyncio.sleep(0.05)
+        return {"answer": task, "steps": [], "success": True}
+
+    langchain_replacement.xagent_integration.run_xagent = slow_run
+    try:
+        agent = langchain_replacement.initialize_xagent()
+
+        async def run_all():
+            return await asyncio.gather(agent.run("first"), agent.run("second", tenant="t2"))
+
+        first, second = asyncio.run(run_all())
+    finally:
+        langchain_replacement.task_scheduler = original_scheduler
+        langchain_replacement.xagent_integration.run_xagent = original_run
+
+    assert first.success and first.output == "first"
+    assert not second.success
+    assert "queue full" in second.error_message
+
+
+def main():
+    """Run all scheduler tests"""
+    print("SCHEDULER TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_concurrency_cap,
+        test_rejects_when_queue_full,
+        test_priority_and_tenant_order,
+        test_cancelled_waiter_leaves_queue,
+        test_wrapper_returns_queue_full_response,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
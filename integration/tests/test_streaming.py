@@ -0,0 +1,116 @@
+"""
+Tests for streaming XAgent output through astream
+"""
+
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_xagent import make_fake_xagent_home
+
+FAKE_HOME = make_fake_xagent_home()
+os.environ.setdefault("XAGENT_HOME", str(FAKE_HOME))
+
+from xagent_integration import XAgentIntegration
+from langchain_replacement import XAgentWrapper
+import langchain_replacement
+
+
+async def _collect(stream):
+    events = []
+    first_event_at = None
+    async for event in stream:
+        if first_event_at is None:
+            first_event_at = time.monotonic()
+        events.append(event)
+    return events, first_event_at
+
+
+def _check_stream(use_worker_pool):
+    xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), use_worker_pool=use_worker_pool)
+    try:
+        started = time.monotonic()
+        events, first_event_at = asyncio.run(_collect(xagent.astream("stream pause:0.5")))
+        finished = time.monotonic()
+    finally:
+        xagent.close()
+
+    types = [event["type"] for event in events]
+    assert types == ["log", "step", "answer", "result"], types
+    assert events[1]["step"]["step"] == "plan"
+    assert events[-1]["result"]["answer"] == "done: stream pause:0.5"
+    # The first step is delivered well before the run finishes
+    assert finished - first_event_at >= 0.4
+    assert first_event_at - started < finished - started
+
+
+def test_subprocess_stream():
+    """Events arrive while a one-shot run.py process is still running"""
+    _check_stream(use_worker_pool=False)
+
+
+def test_pool_stream():
+    """Events arrive while a pooled worker is still running the task"""
+    _check_stream(use_worker_pool=True)
+
+
+def test_raw_output_is_bounded():
+    """Only the configured number of trailing lines is kept"""
+    xagent = XAgentIntegration(
+        xagent_home=str(FAKE_HOME), use_worker_pool=False, raw_output_lines=3
+    )
+    result = asyncio.run(xagent.run_xagent("bounded lines:500"))
+
+    assert len(result["raw_output"].split("\n")) == 3
+    assert result["answer"] == "done: bounded lines:500"
+
+
+def test_wrapper_stream_reports_errors():
+    """XAgentWrapper.astream ends with an error event on failure"""
+    original = langchain_replacement.xagent_integration
+    langchain_replacement.xagent_integration = XAgentIntegration(
+        xagent_home=str(FAKE_HOME), use_worker_pool=False
+    )
+    try:
+        events, _ = asyncio.run(_collect(XAgentWrapper().astream("fail now")))
+    finally:
+        langchain_replacement.xagent_integration = original
+
+    assert events[-1]["type"] == "error"
+    assert "task failed on purpose" in events[-1]["error"]
+
+
+def main():
+    """Run all streaming tests"""
+    print("STREAMING TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_subprocess_stream,
+        test_pool_stream,
+        test_raw_output_is_bounded,
+        test_wrapper_stream_reports_errors,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,135 @@
+"""
+Tests for the synchronous XAgentWrapper entry points
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_xagent import make_fake_xagent_home
+
+os.environ.setdefault("XAGENT_HOME", str(make_fake_xagent_home()))
+
+import langchain_replacement
+from event_loop import get_background_loop
+from scheduler import TaskScheduler
+
+LOOP_THREADS = []
+
+
+async def recording_run(task, **kwargs):
+    """Stand-in for run_xagent that notes which thread it ran on"""
+    LOOP_THREADS.append(threading.current_thread().name)
+    await asyncio.sleep(float(kwargs.get("delay", 0)))
+    return {"answer": task, "steps": [], "success": True}
+
+
+def _patched(test):
+    """Run test with a stubbed XAgent and a roomy scheduler"""
+    def wrapper():
+        original_scheduler = langchain_replacement.task_scheduler
+        original_run = langchain_replacement.xagent_integration.run_xagent
+        langchain_replacement.task_scheduler = TaskScheduler(max_concurrency=16, max_queue_size=64)
+        langchain_replacement.xagent_integration.run_xagent = recording_run
+        LOOP_THREADS.clear()
+        try:
+            test()
+        finally:
+            langchain_replacement.task_scheduler = original_scheduler
+            langchain_replacement.xagent_integration.run_xagent = original_run
+    wrapper.__name__ = test.__name__
+    wrapper.__doc__ = test.__doc__
+    return wrapper
+
+
+@_patched
+def test_call_inside_running_loop():
+    """Calling the wrapper from a thread that runs a loop does not fail"""
+    agent = langchain_replacement.initialize_xagent()
+
+    async def handler():
+        return agent("inside a loop")
+
+    response = asyncio.run(handler())
+    assert response.success, response.error_message
+    assert response.output == "inside a loop"
+    assert LOOP_THREADS == ["xagent-loop"]
+
+
+@_patched
+def test_threads_share_one_loop():
+    """Sync calls from many threads overlap on the single background loop"""
+    agent = langchain_replacement.initialize_xagent()
+    threads_before = threading.active_count()
+
+    started = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(lambda i: agent(f"task {i}", delay=0.2), range(8)))
+    elapsed = time.monotonic() - started
+
+    assert all(r.success for r in responses)
+    assert sorted(r.output for r in responses) == sorted(f"task {i}" for i in range(8))
+    assert set(LOOP_THREADS) == {"xagent-loop"}
+    # Eight 0.2s runs in parallel, not one after another
+    assert elapsed < 0.8, elapsed
+    assert threading.active_count() <= threads_before + 1
+
+
+@_patched
+def test_submit_returns_future():
+    """submit hands back a concurrent future resolving to an AgentResponse"""
+    agent = langchain_replacement.initialize_xagent()
+    futures = [agent.submit(f"task {i}") for i in range(3)]
+    assert all(isinstance(f, concurrent.futures.Future) for f in futures)
+    assert [f.result(5).output for f in futures] == ["task 0", "task 1", "task 2"]
+
+
+@_patched
+def test_call_from_loop_thread_is_rejected():
+    """A sync call made on the background loop thread errors instead of hanging"""
+    agent = langchain_replacement.initialize_xagent()
+
+    async def nested():
+        return agent("nested")
+
+    response = get_background_loop().run(nested(), timeout=5)
+    assert not response.success
+    assert "background loop thread" in response.error_message
+
+
+def main():
+    """Run all sync call tests"""
+    print("SYNC CALL TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_call_inside_running_loop,
+        test_threads_share_one_loop,
+        test_submit_returns_future,
+        test_call_from_loop_thread_is_rejected,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,163 @@
+"""
+Tests for XAgent run timeouts, cancellation and process cleanup
+"""
+
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_xagent import make_fake_xagent_home
+
+FAKE_HOME = make_fake_xagent_home()
+os.environ.setdefault("XAGENT_HOME", str(FAKE_HOME))
+
+import langchain_replacement
+from xagent_integration import XAgentIntegration, XAgentTimeoutError
+
+
+def _alive(pid: int) -> bool:
+    """True while pid exists and is not a zombie"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split()[2] != "Z"
+    except OSError:
+        return False
+
+
+def _wait_gone(pid: int, seconds: float = 5.0) -> bool:
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if not _alive(pid):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def _child_pid(output: str) -> int:
+    for line in output.splitlines():
+        if line.startswith("child "):
+            return int(line.split()[1])
+    raise AssertionError(f"no child pid in {output!r}")
+
+
+def test_timeout_returns_partial_and_kills_group():
+    """A hung run is stopped with its children and keeps its partial output"""
+    for use_pool in (False, True):
+        xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), use_worker_pool=use_pool, pool_size=1)
+        try:
+            started = time.monotonic()
+            try:
+                asyncio.run(xagent.run_xagent("spawn pause:30", timeout=0.5))
+            except XAgentTimeoutError as e:
+                partial = e.partial
+            else:
+                raise AssertionError("run did not time out")
+            assert time.monotonic() - started < 5
+
+            assert partial["timed_out"] and not partial["success"]
+            assert "Starting XAgent" in partial["raw_output"]
+            assert _wait_gone(_child_pid(partial["raw_output"])), "grandchild survived"
+
+            # The pool replaces the killed worker
+            result = asyncio.run(xagent.run_xagent("after timeout"))
+            assert result["answer"] == "done: after timeout"
+        finally:
+            xagent.close()
+
+
+def test_sigkill_after_grace():
+    """A run that ignores SIGTERM is killed once the grace period ends"""
+    os.environ["XAGENT_KILL_GRACE"] = "0.3"
+    try:
+        xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), use_worker_pool=False)
+        started = time.monotonic()
+        try:
+            asyncio.run(xagent.run_xagent("stubborn spawn pause:30", timeout=0.3))
+        except XAgentTimeoutError as e:
+            child = _child_pid(e.partial["raw_output"])
+        else:
+            raise AssertionError("run did not time out")
+        assert time.monotonic() - started < 5
+        assert _wait_gone(child)
+    finally:
+        del os.environ["XAGENT_KILL_GRACE"]
+
+
+def test_cancellation_leaves_no_processes():
+    """Cancelling the awaiting task stops the run and its children"""
+    xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), use_worker_pool=False)
+    child = {}
+
+    async def run_and_cancel():
+        async def consume():
+            async for event in xagent.astream("spawn pause:30"):
+                if event["type"] == "log" and event["line"].startswith("child "):
+                    child["pid"] = int(event["line"].split()[1])
+
+        task = asyncio.ensure_future(consume())
+        while "pid" not in child:
+            await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run_and_cancel())
+    assert _wait_gone(child["pid"])
+
+
+def test_config_and_wrapper_timeout():
+    """constraints.timeout is the default; the wrapper returns a partial response"""
+    xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), use_worker_pool=False)
+    assert xagent._resolve_timeout(None) == 300
+    assert xagent._resolve_timeout(0) is None
+    assert XAgentIntegration(xagent_home=str(FAKE_HOME), timeout=7)._resolve_timeout(None) == 7
+
+    original = langchain_replacement.xagent_integration
+    langchain_replacement.xagent_integration = xagent
+    try:
+        agent = langchain_replacement.initialize_xagent()
+        response = agent("pause:30", timeout=0.5)
+    finally:
+        langchain_replacement.xagent_integration = original
+
+    assert not response.success
+    assert "timed out" in response.error_message
+    assert response.output
+
+
+def main():
+    """Run all timeout tests"""
+    print("TIMEOUT TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_timeout_returns_partial_and_kills_group,
+        test_sigkill_after_grace,
+        test_cancellation_leaves_no_processes,
+        test_config_and_wrapper_timeout,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,159 @@
+"""
+Tests for tracing spans, OTLP export and latency histograms
+"""
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_xagent import make_fake_xagent_home
+
+FAKE_HOME = make_fake_xagent_home()
+os.environ.setdefault("XAGENT_HOME", str(FAKE_HOME))
+
+import langchain_replacement
+import tracing
+from tracing import LatencyHistogram, NOOP_SPAN, Tracer
+from xagent_integration import XAgentIntegration
+
+
+def _traced(test):
+    """Run test with every trace sampled and the real fake XAgent"""
+    def wrapper():
+        original = langchain_replacement.xagent_integration
+        langchain_replacement.xagent_integration = XAgentIntegration(
+            xagent_home=str(FAKE_HOME), use_worker_pool=False
+        )
+        tracing.tracer.reset()
+        tracing.tracer.sample_rate = 1.0
+        try:
+            test()
+        finally:
+            tracing.tracer.sample_rate = 0.0
+            tracing.tracer.sink_path = None
+            tracing.tracer.reset()
+            langchain_replacement.xagent_integration.close()
+            langchain_replacement.xagent_integration = original
+    wrapper.__name__ = test.__name__
+    wrapper.__doc__ = test.__doc__
+    return wrapper
+
+
+def _spans():
+    return tracing.tracer.export()["resourceSpans"][0]["scopeSpans"][0]["spans"]
+
+
+def test_histogram_percentiles():
+    """Percentiles stay within the bucket resolution"""
+    histogram = LatencyHistogram()
+    for micros in range(1, 100001):
+        histogram.record(micros)
+    for q in (50, 95, 99):
+        expected = q * 1000
+        assert abs(histogram.percentile(q) - expected) <= expected / 32, q
+    assert histogram.summary()["count"] == 100000
+    assert histogram.percentile(100) == 100000
+
+
+def test_sampling_off_is_noop():
+    """Without sampling no span is recorded, nested or not"""
+    tracer = Tracer(sample_rate=0.0)
+    with tracer.span("root") as root:
+        assert root is NOOP_SPAN
+        assert tracer.start_span("child") is NOOP_SPAN
+
+    # An unsampled root keeps its children from starting traces of their own
+    tracer = Tracer(sample_rate=1e-30)
+    with tracer.span("root") as root:
+        assert not root.recording
+        assert tracer.start_span("child") is NOOP_SPAN
+    assert not tracer.spans and not tracer.histograms
+
+
+@_traced
+def test_call_path_spans():
+    """A wrapper call produces one linked trace covering every stage"""
+    agent = langchain_replacement.initialize_xagent()
+    response = agent("traced task")
+    assert response.success
+
+    spans = {span["name"]: span for span in _spans()}
+    assert set(spans) == {
+        "agent.run", "scheduler.queue", "xagent.run", "xagent.startup",
+        "xagent.spawn", "xagent.output", "xagent.parse", "agent.response",
+    }
+    assert len({span["traceId"] for span in spans.values()}) == 1
+
+    def parent(name):
+        return next(s["name"] for s in spans.values() if s["spanId"] == spans[name]["parentSpanId"])
+
+    assert "parentSpanId" not in spans["agent.run"]
+    assert parent("xagent.run") == "agent.run"
+    assert parent("xagent.spawn") == "xagent.startup"
+    assert parent("xagent.parse") == "xagent.run"
+    assert parent("agent.response") == "agent.run"
+
+    latencies = tracing.tracer.stage_latencies()
+    assert latencies["xagent.startup"]["count"] == 1
+    assert latencies["agent.run"]["p99_ms"] >= latencies["xagent.output"]["p99_ms"]
+
+
+@_traced
+def test_errors_and_file_sink():
+    """Failed runs are marked as errors and each trace is one OTLP/JSON line"""
+    fd, sink = tempfile.mkstemp(suffix=".jsonl")
+    os.close(fd)
+    tracing.tracer.sink_path = sink
+    agent = langchain_replacement.initialize_xagent()
+    try:
+        assert agent("ok").success
+        assert not agent("fail").success
+
+        with open(sink) as f:
+            traces = [json.loads(line) for line in f]
+    finally:
+        os.remove(sink)
+
+    assert len(traces) == 2
+    failed = {s["name"]: s for s in traces[1]["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+    assert failed["xagent.run"]["status"]["code"] == tracing.STATUS_ERROR
+    assert failed["agent.run"]["status"]["code"] == tracing.STATUS_ERROR
+    assert "XAgent execution failed" in failed["xagent.run"]["status"]["message"]
+    resource = traces[0]["resourceSpans"][0]["resource"]["attributes"]
+    assert resource == [{"key": "service.name", "value": {"stringValue": "xagent-integration"}}]
+
+
+def main():
+    """Run all tracing tests"""
+    print("TRACING TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_histogram_percentiles,
+        test_sampling_off_is_noop,
+        test_call_path_spans,
+        test_errors_and_file_sink,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
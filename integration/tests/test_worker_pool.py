@@ -0,0 +1,124 @@
+"""
+Tests for the pre-warmed XAgent worker pool
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_xagent import make_fake_xagent_home
+
+FAKE_HOME = make_fake_xagent_home()
+os.environ.setdefault("XAGENT_HOME", str(FAKE_HOME))
+
+from xagent_integration import XAgentIntegration
+from worker_pool import XAgentWorkerPool
+
+
+def test_pool_reuses_warm_workers():
+    """Consecutive tasks run on the same worker process"""
+    xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), pool_size=1)
+    try:
+        first = asyncio.run(xagent.run_xagent("first task"))
+        second = asyncio.run(xagent.run_xagent("second task"))
+    finally:
+        xagent.close()
+
+    assert first["answer"] == "done: first task"
+    assert second["answer"] == "done: second task"
+    assert '"pid"' in first["raw_output"]
+    assert first["raw_output"].split('"pid": ')[1] == second["raw_output"].split('"pid": ')[1]
+
+
+def test_pool_recycles_after_max_tasks():
+    """Workers are replaced once they reach their task budget"""
+    pool = XAgentWorkerPool(FAKE_HOME, size=1, max_tasks_per_worker=2)
+
+    async def run_three():
+        return [await pool.run(["--task", f"task {i}"]) for i in range(3)]
+
+    try:
+        frames = asyncio.run(run_three())
+    finally:
+        pool.close()
+
+    assert all(frame["returncode"] == 0 for frame in frames)
+    assert pool.stats["recycled"] == 1
+    assert pool.stats["spawned"] == 2
+
+
+def test_pool_respawns_after_crash():
+    """A crashed worker fails its task and is replaced for the next one"""
+    xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), pool_size=1)
+    try:
+        try:
+            asyncio.run(xagent.run_xagent("crash now"))
+            crashed = False
+        except RuntimeError as e:
+            crashed = "exited" in str(e)
+        result = asyncio.run(xagent.run_xagent("after restart"))
+    finally:
+        xagent.close()
+
+    assert crashed
+    assert result["answer"] == "done: after restart"
+
+
+def test_failed_task_keeps_worker():
+    """A non-zero exit from run.py is reported without killing the worker"""
+    xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), pool_size=1)
+    try:
+        try:
+            asyncio.run(xagent.run_xagent("fail please"))
+            message = ""
+        except RuntimeError as e:
+            message = str(e)
+        stats = dict(xagent.get_worker_pool().stats)
+    finally:
+        xagent.close()
+
+    assert "task failed on purpose" in message
+    assert stats["crashed"] == 0
+
+
+def test_subprocess_mode_still_available():
+    """The pool can be switched off to run one process per task"""
+    xagent = XAgentIntegration(xagent_home=str(FAKE_HOME), use_worker_pool=False)
+    result = asyncio.run(xagent.run_xagent("one shot"))
+    assert result["answer"] == "done: one shot"
+
+
+def main():
+    """Run all worker pool tests"""
+    print("WORKER POOL TESTS")
+    print("=" * 40)
+
+    tests = [
+        test_pool_reuses_warm_workers,
+        test_pool_recycles_after_max_tasks,
+        test_pool_respawns_after_crash,
+        test_failed_task_keeps_worker,
+        test_subprocess_mode_still_available,
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"{test.__name__}: PASS")
+            passed += 1
+        except Exception as e:
+            print(f"{test.__name__}: FAIL - {e}")
+
+    print("=" * 40)
+    print(f"Overall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,367 @@
+"""
+In-process tracing and latency histograms for the agent call path
+
+Spans cover each stage of a call, from XAgentWrapper.run through
+scheduling, run.py startup and output, to parsing and building the
+AgentResponse. A trace is sampled when it starts, with OpenTelemetry's
+trace-id ratio rule; every span of an unsampled trace is a shared no-op
+object, so with sampling off (the default) instrumentation costs a
+context-variable lookup per span.
+
+Finished spans of sampled traces are kept in a bounded buffer, fed into
+an HDR-style histogram per span name (p50/p95/p99 within about 3%) and,
+if a file sink is configured, appended to it as one OTLP/JSON document
+per trace.
+
+Configuration: XAGENT_TRACE_SAMPLE (0 to 1), XAGENT_TRACE_FILE and
+XAGENT_TRACE_BUFFER (spans kept in memory).
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+# Sub-buckets per power of two; 32 bounds the relative error to 1/32
+HISTOGRAM_SUB_BITS = 5
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar(
+    "xagent_span", default=None
+)
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of durations in microseconds
+
+    Values below 2 * 2**HISTOGRAM_SUB_BITS are counted exactly; above
+    that every power of two is split into 2**HISTOGRAM_SUB_BITS buckets,
+    like HdrHistogram with two significant digits.
+    """
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def bucket(value: int) -> int:
+        shift = value.bit_length() - HISTOGRAM_SUB_BITS - 1
+        if shift <= 0:
+            return value
+        return (shift << HISTOGRAM_SUB_BITS) + (value >> shift)
+
+    @staticmethod
+    def bucket_bounds(bucket: int):
+        """[low, high) of the values counted in bucket"""
+        shift = (bucket >> HISTOGRAM_SUB_BITS) - 1
+        if shift <= 0:
+            return bucket, bucket + 1
+        mantissa = bucket - (shift << HISTOGRAM_SUB_BITS)
+        return mantissa << shift, (mantissa + 1) << shift
+
+    def record(self, micros: int):
+        bucket = self.bucket(max(micros, 0))
+        with self._lock:
+            self.counts[bucket] = self.counts.get(bucket, 0) + 1
+            self.count += 1
+            self.total += micros
+            self.max = max(self.max, micros)
+            self.min = micros if self.min is None else min(self.min, micros)
+
+    def percentile(self, q: float) -> int:
+        """Upper bound of the bucket holding the q-th percentile, in microseconds"""
+        with self._lock:
+            if not self.count:
+                return 0
+            rank = max(1, int(q / 100 * self.count + 0.5))
+            seen = 0
+            for bucket in sorted(self.counts):
+                seen += self.counts[bucket]
+                if seen >= rank:
+                    return min(self.bucket_bounds(bucket)[1] - 1, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        """Count and p50/p95/p99/max/mean in milliseconds"""
+        return {
+            "count": self.count,
+            "p50_ms": self.percentile(50) / 1000,
+            "p95_ms": self.percentile(95) / 1000,
+            "p99_ms": self.percentile(99) / 1000,
+            "max_ms": self.max / 1000,
+            "mean_ms": self.total / self.count / 1000 if self.count else 0.0,
+        }
+
+
+class Span:
+    """A timed stage of one traced call"""
+
+    __slots__ = (
+        "tracer", "name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+        "_started", "attributes", "events", "status", "status_message", "_token"
+    )
+
+    recording = True
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: int,
+        parent_id: Optional[int],
+        attributes: Dict[str, Any]
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = int.from_bytes(os.urandom(8), "big") or 1
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.events: List[tuple] = []
+        self.status = STATUS_UNSET
+        self.status_message = ""
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        self.events.append((time.time_ns(), name, attributes))
+
+    def record_exception(self, error: BaseException):
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+        self.add_event("exception", type=type(error).__name__, message=str(error))
+
+    def end(self):
+        """Finish the span; later calls do nothing"""
+        if self.end_ns is not None:
+            return
+        elapsed = time.perf_counter_ns() - self._started
+        self.end_ns = self.start_ns + elapsed
+        self.tracer._finish(self, elapsed // 1000)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if exc is not None:
+            self.record_exception(exc)
+        self.end()
+        return False
+
+
+class _NonRecordingSpan:
+    """Stand-in for spans of unsampled traces; every method is a no-op"""
+
+    __slots__ = ("_token",)
+
+    recording = False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name, **attributes):
+        pass
+
+    def record_exception(self, error):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _UnsampledRoot(_NonRecordingSpan):
+    """Root of an unsampled trace; marks the context so children skip sampling"""
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        return False
+
+
+NOOP_SPAN = _NonRecordingSpan()
+
+
+class Tracer:
+    """Creates spans, samples traces and keeps their histograms"""
+
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        max_spans: int = 10000,
+        sink_path: Optional[str] = None,
+        service_name: str = "xagent-integration"
+    ):
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self.service_name = service_name
+        self.sink_path = sink_path
+        self.spans: "deque[Span]" = deque(maxlen=max_spans)
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        # Finished spans of traces whose root is still open
+        self._pending: Dict[int, List[Span]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        """Build the tracer from XAGENT_TRACE_* environment variables"""
+        return cls(
+            sample_rate=float(os.getenv("XAGENT_TRACE_SAMPLE", "0")),
+            max_spans=int(os.getenv("XAGENT_TRACE_BUFFER", "10000")),
+            sink_path=os.getenv("XAGENT_TRACE_FILE") or None
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def start_span(self, name: str, parent=None, **attributes):
+        """
+        Start a span without making it current; call end() when done
+
+        parent defaults to the current span. Without one, a new trace is
+        started and sampled.
+        """
+        if parent is None:
+            parent = _current.get()
+        if parent is not None:
+            if not parent.recording:
+                return NOOP_SPAN
+            return Span(self, name, parent.trace_id, parent.span_id, attributes)
+
+        if self.sample_rate <= 0:
+            return NOOP_SPAN
+        trace_id = int.from_bytes(os.urandom(16), "big") or 1
+        # OpenTelemetry's TraceIdRatioBased rule: the low 64 bits decide
+        if (trace_id & 0xFFFFFFFFFFFFFFFF) >= self.sample_rate * 2 ** 64:
+            return _UnsampledRoot()
+        with self._lock:
+            self._pending[trace_id] = []
+        return Span(self, name, trace_id, None, attributes)
+
+    def span(self, name: str, **attributes):
+        """Context manager for a span that is current inside the block"""
+        if self.sample_rate <= 0 and _current.get() is None:
+            return NOOP_SPAN
+        return self.start_span(name, **attributes)
+
+    def _finish(self, span: Span, micros: int):
+        histogram = self.histograms.get(span.name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(span.name, LatencyHistogram())
+        histogram.record(micros)
+
+        with self._lock:
+            if span.parent_id is None:
+                batch = self._pending.pop(span.trace_id, []) + [span]
+            elif span.trace_id in self._pending:
+                self._pending[span.trace_id].append(span)
+                return
+            else:
+                # The root already ended, so this span is exported alone
+                batch = [span]
+            self.spans.extend(batch)
+
+        if self.sink_path:
+            self._write(batch)
+
+    def _write(self, batch: List[Span]):
+        line = json.dumps(to_otlp_json(batch, self.service_name))
+        with self._lock, open(self.sink_path, "a") as f:
+            f.write(line + "\n")
+
+    def export(self, clear: bool = True) -> Dict[str, Any]:
+        """Finished spans as an OTLP/JSON ExportTraceServiceRequest"""
+        with self._lock:
+            spans = list(self.spans)
+            if clear:
+                self.spans.clear()
+        return to_otlp_json(spans, self.service_name)
+
+    def stage_latencies(self) -> Dict[str, Dict[str, Any]]:
+        """Histogram summary per span name"""
+        return {name: h.summary() for name, h in sorted(self.histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+            self._pending.clear()
+            self.histograms = {}
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+def to_otlp_json(spans: List[Span], service_name: str = "xagent-integration") -> Dict[str, Any]:
+    """Spans in the OTLP/JSON trace format understood by OpenTelemetry collectors"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": service_name})},
+            "scopeSpans": [{
+                "scope": {"name": "xagent_integration.tracing"},
+                "spans": [_otlp_span(span) for span in spans],
+            }],
+        }]
+    }
+
+
+def _otlp_span(span: Span) -> Dict[str, Any]:
+    data = {
+        "traceId": f"{span.trace_id:032x}",
+        "spanId": f"{span.span_id:016x}",
+        "name": span.name,
+        "kind": 1,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns or span.start_ns),
+        "attributes": _otlp_attributes(span.attributes),
+        "events": [
+            {"timeUnixNano": str(at), "name": name, "attributes": _otlp_attributes(attributes)}
+            for at, name, attributes in span.events
+        ],
+        "status": {"code": span.status},
+    }
+    if span.parent_id is not None:
+        data["parentSpanId"] = f"{span.parent_id:016x}"
+    if span.status_message:
+        data["status"]["message"] = span.status_message
+    return data
+
+
+# Shared tracer for the integration
+tracer = Tracer.from_env()
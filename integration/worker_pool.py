@@ -0,0 +1,464 @@
+"""
+Pool of pre-warmed XAgent worker processes
+
+Each worker is a long-lived ``xagent_worker.py`` process that has already
+imported XAgent, so a task only pays for its own execution instead of a
+full interpreter start. Workers talk JSON lines over stdin/stdout, are
+health-checked before reuse, recycled after a fixed number of tasks or
+when the XAgent config they were warmed under changes, and respawned
+when they crash. A run that is cancelled or times out is
+stopped by killing its worker's process group.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Callable, AsyncIterator
+
+from process_group import new_group_kwargs, terminate_group, terminate_group_later
+from tracing import NOOP_SPAN, tracer
+import metrics
+
+if TYPE_CHECKING:
+    from resource_limits import ResourceLimits
+
+WORKER_SCRIPT = Path(__file__).parent / "xagent_worker.py"
+
+
+class WorkerCrashedError(RuntimeError):
+    """Raised when a worker process dies while handling a request"""
+
+    def __init__(self, message: str, returncode: Optional[int] = None):
+        super().__init__(message)
+        self.returncode = returncode
+
+    @property
+    def error_class(self) -> str:
+        from resilience import crash_class
+        return crash_class(self.returncode)
+
+
+class RunAbortedError(RuntimeError):
+    """Raised when a run is stopped from the awaiting side"""
+
+
+class XAgentWorker:
+    """A single pre-warmed XAgent worker process"""
+
+    def __init__(self, xagent_home: Path, env: Optional[Dict[str, str]] = None):
+        self.xagent_home = Path(xagent_home)
+        self.env = env
+        self.process: Optional[subprocess.Popen] = None
+        self.tasks_completed = 0
+        self.last_used = time.monotonic()
+        # worker_digest of the config current when this worker was spawned
+        self.config_key: Optional[str] = None
+        self._frames: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._next_id = 0
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.process else None
+
+    def start(self, timeout: float = 60.0):
+        """Spawn the worker and wait until it reports it is warm"""
+        self.process = subprocess.Popen(
+            [sys.executable, str(WORKER_SCRIPT), "--xagent_home", str(self.xagent_home)],
+            cwd=self.xagent_home,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=self.env,
+            text=True,
+            **new_group_kwargs()
+        )
+        reader = threading.Thread(target=self._read_frames, daemon=True)
+        reader.start()
+
+        frame = self._next_frame(timeout)
+        if frame.get("type") != "ready":
+            self.stop()
+            raise RuntimeError(f"Unexpected worker handshake: {frame}")
+
+    def _read_frames(self):
+        """Forward frames from the worker's stdout to the frame queue"""
+        for line in self.process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                self._frames.put(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        # EOF: the worker exited
+        self._frames.put(None)
+
+    def _next_frame(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        try:
+            frame = self._frames.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"XAgent worker {self.pid} did not respond")
+        if frame is None:
+            returncode = self.process.wait()
+            raise WorkerCrashedError(
+                f"XAgent worker {self.pid} exited with code {returncode}", returncode
+            )
+        return frame
+
+    def _request(self, op: str, **payload) -> int:
+        self._next_id += 1
+        message = {"id": self._next_id, "op": op, **payload}
+        try:
+            self.process.stdin.write(json.dumps(message) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            raise WorkerCrashedError(f"XAgent worker {self.pid} is not accepting requests")
+        return self._next_id
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def ping(self, timeout: float = 5.0) -> bool:
+        """Health check: the worker must answer a ping within the timeout"""
+        if not self.is_alive():
+            return False
+        try:
+            request_id = self._request("ping")
+            frame = self._next_frame(timeout)
+        except (TimeoutError, WorkerCrashedError):
+            return False
+        return frame.get("type") == "pong" and frame.get("id") == request_id
+
+    def execute(
+        self,
+        argv: List[str],
+        on_line: Optional[Callable[[str], None]] = None,
+        limits: Optional["ResourceLimits"] = None
+    ) -> Dict[str, Any]:
+        """Run one task and return the worker's result frame"""
+        if limits is not None and limits.enabled:
+            request_id = self._request("run", argv=argv, limits=limits.to_dict())
+        else:
+            request_id = self._request("run", argv=argv)
+        while True:
+            frame = self._next_frame()
+            if frame.get("id") != request_id:
+                continue
+            if frame.get("type") == "line":
+                if on_line is not None:
+                    on_line(frame["data"])
+            elif frame.get("type") == "result":
+                break
+
+        self.tasks_completed += 1
+        self.last_used = time.monotonic()
+        return frame
+
+    def abort(self):
+        """Stop the worker's process group; a blocked execute() then fails"""
+        if self.process is not None:
+            terminate_group_later(self.process)
+
+    def stop(self, timeout: float = 5.0):
+        """Ask the worker to exit, killing it if it does not"""
+        if self.process is None:
+            return
+        if self.is_alive():
+            try:
+                self._request("exit")
+            except WorkerCrashedError:
+                pass
+            try:
+                self.process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                terminate_group(self.process, grace=0)
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+
+class _RunControl:
+    """Lets the awaiting side stop a run that a pool thread is executing"""
+
+    def __init__(self):
+        self.worker: Optional[XAgentWorker] = None
+        self.aborted = False
+        self._lock = threading.Lock()
+
+    def attach(self, worker: XAgentWorker) -> bool:
+        """Record the worker running this request; False if already aborted"""
+        with self._lock:
+            if self.aborted:
+                return False
+            self.worker = worker
+            return True
+
+    def abort(self):
+        with self._lock:
+            self.aborted = True
+            worker = self.worker
+        if worker is not None:
+            worker.abort()
+
+
+class XAgentWorkerPool:
+    """Fixed-size pool of warm XAgent workers"""
+
+    def __init__(
+        self,
+        xagent_home: Path,
+        size: int = 2,
+        max_tasks_per_worker: int = 50,
+        health_check_interval: float = 30.0,
+        startup_timeout: float = 60.0,
+        env: Optional[Dict[str, str]] = None,
+        config_key: Optional[str] = None
+    ):
+        if size < 1:
+            raise ValueError("Worker pool size must be at least 1")
+
+        self.xagent_home = Path(xagent_home)
+        self.size = size
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.health_check_interval = health_check_interval
+        self.startup_timeout = startup_timeout
+        self.env = env
+        self.config_key = config_key
+
+        # Idle slots hold a warm worker or None for a slot that needs a respawn
+        self._idle: "queue.Queue[Optional[XAgentWorker]]" = queue.Queue()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"spawned": 0, "recycled": 0, "crashed": 0, "killed": 0, "tasks": 0}
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    def start(self):
+        """Spawn and warm all workers"""
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.size, thread_name_prefix="xagent-pool"
+            )
+
+        warmed = list(self._executor.map(lambda _: self._spawn_or_none(), range(self.size)))
+        for worker in warmed:
+            self._idle.put(worker)
+
+    def _count(self, name: str):
+        # Dispatch threads update these concurrently
+        with self._lock:
+            self.stats[name] += 1
+
+    def _spawn(self) -> XAgentWorker:
+        worker = XAgentWorker(self.xagent_home, env=self.env)
+        worker.config_key = self.config_key
+        worker.start(timeout=self.startup_timeout)
+        self._count("spawned")
+        return worker
+
+    def _spawn_or_none(self) -> Optional[XAgentWorker]:
+        try:
+            return self._spawn()
+        except Exception:
+            return None
+
+    def _checkout(self) -> XAgentWorker:
+        worker = self._idle.get()
+        try:
+            if worker is not None and worker.config_key != self.config_key:
+                self._count("recycled")
+                worker.stop()
+                worker = None
+            elif worker is not None and not worker.is_alive():
+                self._count("crashed")
+                worker.stop()
+                worker = None
+            elif worker is not None and \
+                    time.monotonic() - worker.last_used > self.health_check_interval:
+                if not worker.ping():
+                    self._count("crashed")
+                    worker.stop()
+                    worker = None
+            if worker is None:
+                worker = self._spawn()
+        except Exception:
+            # Give the slot back so a later request can retry the spawn
+            self._idle.put(None)
+            raise
+        return worker
+
+    def _is_stale(self, worker: XAgentWorker) -> bool:
+        return (
+            worker.tasks_completed >= self.max_tasks_per_worker
+            or worker.config_key != self.config_key
+        )
+
+    def _checkin(self, worker: Optional[XAgentWorker]):
+        if worker is not None and self._is_stale(worker):
+            self._count("recycled")
+            worker.stop()
+            worker = self._spawn_or_none()
+        self._idle.put(worker)
+
+    def reconfigure(self, config_key: str):
+        """
+        Replace workers warmed under a different config
+
+        Idle workers are respawned right away, on the calling thread;
+        busy ones are replaced when their current task finishes.
+        """
+        with self._lock:
+            if config_key == self.config_key:
+                return
+            self.config_key = config_key
+
+        drained = []
+        while True:
+            try:
+                drained.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+        # Current workers and empty slots go straight back
+        stale = []
+        for worker in drained:
+            if worker is not None and worker.config_key != config_key:
+                stale.append(worker)
+            else:
+                self._idle.put(worker)
+        for worker in stale:
+            self._count("recycled")
+            worker.stop()
+            self._idle.put(self._spawn_or_none())
+
+    def _execute_blocking(
+        self,
+        argv: List[str],
+        on_line: Optional[Callable[[str], None]] = None,
+        control: Optional[_RunControl] = None,
+        limits: Optional["ResourceLimits"] = None,
+        parent_span=None
+    ) -> Dict[str, Any]:
+        if control is not None and control.aborted:
+            raise RunAbortedError("XAgent run was stopped before it started")
+
+        # Runs on a dispatch thread, so the parent span is passed in
+        checkout = NOOP_SPAN
+        if parent_span is not None:
+            checkout = tracer.start_span("pool.checkout", parent=parent_span)
+        try:
+            worker = self._checkout()
+        finally:
+            checkout.end()
+        if control is not None and not control.attach(worker):
+            self._checkin(worker)
+            raise RunAbortedError("XAgent run was stopped before it started")
+
+        in_flight = metrics.subprocesses_in_flight.labels(mode="pool")
+        in_flight.inc()
+        try:
+            frame = worker.execute(argv, on_line, limits)
+        except WorkerCrashedError:
+            if control is not None and control.aborted:
+                self._count("killed")
+            else:
+                self._count("crashed")
+            worker.stop()
+            worker = None
+            raise
+        finally:
+            in_flight.dec()
+            self._checkin(worker)
+
+        self._count("tasks")
+        return frame
+
+    async def _ensure_started(self):
+        if self._closed:
+            raise RuntimeError("XAgent worker pool is closed")
+        if not self.started:
+            await asyncio.get_running_loop().run_in_executor(None, self.start)
+
+    async def run(self, argv: List[str]) -> Dict[str, Any]:
+        """Run run.py with the given arguments on a warm worker"""
+        await self._ensure_started()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._execute_blocking, argv)
+
+    async def stream(
+        self,
+        argv: List[str],
+        state: Dict[str, Any],
+        limits: Optional["ResourceLimits"] = None
+    ) -> AsyncIterator[str]:
+        """
+        Run run.py on a warm worker, yielding output lines as they arrive
+
+        Once the generator is exhausted ``state`` holds the run's
+        ``returncode``, the tail of its ``stderr``, any framed ``result``
+        record and the task's resource ``usage``; ``limits`` are applied
+        by the worker for this task only. ``state["abort"]`` stops the run
+        by killing its worker, which also happens if the generator is
+        closed early.
+        """
+        control = _RunControl()
+        state["abort"] = control.abort
+        await self._ensure_started()
+        loop = asyncio.get_running_loop()
+        lines: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        def on_line(line: str):
+            loop.call_soon_threadsafe(lines.put_nowait, line)
+
+        future = loop.run_in_executor(
+            self._executor, self._execute_blocking, argv, on_line, control, limits,
+            state.get("span")
+        )
+        # Lines are queued with call_soon_threadsafe before the result, so
+        # the sentinel always arrives after the last line
+        future.add_done_callback(lambda _: lines.put_nowait(done))
+
+        try:
+            while True:
+                line = await lines.get()
+                if line is done:
+                    break
+                yield line
+        finally:
+            if not future.done():
+                # Cancelled or abandoned: nobody will read the outcome
+                control.abort()
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        frame = future.result()
+        state["returncode"] = frame["returncode"]
+        state["stderr"] = frame["stderr"]
+        state["result"] = frame.get("result")
+        state["usage"] = frame.get("usage")
+
+    def close(self):
+        """Stop all idle workers and the dispatch threads"""
+        self._closed = True
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker is not None:
+                worker.stop()
@@ -1,29 +1,185 @@
 import os
 import sys
-import subprocess
 import json
-import asyncio
-from typing import Dict, Any, List, Optional
+import atexit
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, AsyncIterator, TYPE_CHECKING
 from pathlib import Path
 
-# Add XAgent to Python path
-XAGENT_PATH = Path(__file__).parent.parent / "XAgent"
-sys.path.append(str(XAGENT_PATH))
+# Default XAgent location; nothing is checked or added to sys.path until
+# an XAgentIntegration is actually created
+XAGENT_PATH = Path(os.getenv("XAGENT_HOME", Path(__file__).parent.parent / "XAgent"))
+
+# Add the current directory to path for imports
+current_dir = Path(__file__).parent
+if str(current_dir) not in sys.path:
+    sys.path.insert(0, str(current_dir))
+
+from result_channel import (
+    RESULT_FD_ENV, FALLBACK_LINES, StreamingOutputParser,
+    parse_output_text, parse_sentinel_line, read_result_file
+)
+from process_group import new_group_kwargs, aterminate_group
+from tracing import tracer
+import metrics
+
+# asyncio, the worker pool, the in-process engine, resource limits and the
+# retry machinery are imported where they are used so that importing this
+# module stays cheap
+if TYPE_CHECKING:
+    import asyncio
+    from config_loader import ConfigStore, XAgentConfig
+    from inprocess_engine import InProcessEngine
+    from resilience import CircuitBreaker, HedgePolicy, RetryPolicy
+    from resource_limits import Cgroup, ResourceLimits
+    from worker_pool import XAgentWorkerPool
+    from XAgentServer.exts.mock_redis import AsyncMockRedisClient
+
+# Number of trailing output lines kept as raw_output
+RAW_OUTPUT_LINES = 1000
+
+# Longer run.py output lines are split into chunks of this size
+MAX_LINE_BYTES = 8 * 1024 * 1024
+
+# "auto" also looks for a JSON answer in the log, "framed" trusts only the
+# result channel (see result_channel.py) and never parses log lines
+RESULT_MODES = ("auto", "framed")
+
+# Used when xagent_home has no config of its own
+DEFAULT_CONFIG_PATH = current_dir / "config" / "xagent_config.yaml"
+
+
+class XAgentTimeoutError(RuntimeError):
+    """
+    Raised when a run exceeds its timeout
+    
+    ``partial`` holds the result built from the output seen before the
+    run was stopped.
+    """
+    
+    error_class = "timeout"
+    
+    def __init__(self, timeout: float, partial: Dict[str, Any]):
+        super().__init__(f"XAgent timed out after {timeout:g}s")
+        self.timeout = timeout
+        self.partial = partial
+
+
+class XAgentExecutionError(RuntimeError):
+    """
+    Raised when run.py exits with a non-zero status
+    
+    ``error_class`` tells retryable failures apart: "limit" when run.py
+    was killed for exceeding an rlimit, "crash" for any other signal,
+    "rate_limit" when its output reports a model rate limit or overload
+    and "error" otherwise.
+    """
+    
+    def __init__(self, returncode: int, output: str):
+        super().__init__(f"XAgent execution failed: {output}")
+        from resilience import classify_exit
+        
+        self.returncode = returncode
+        self.error_class = classify_exit(returncode, output)
+
 
 class XAgentIntegration:
     """Integration class to replace LangChain ReAct Agent with XAgent"""
     
-    def __init__(self, config_path: Optional[str] = None):
-        self.xagent_home = XAGENT_PATH
+    def __init__(
+        self,
+        config_path: Optional[str] = None,
+        xagent_home: Optional[str] = None,
+        use_worker_pool: Optional[bool] = None,
+        pool_size: Optional[int] = None,
+        max_tasks_per_worker: Optional[int] = None,
+        raw_output_lines: int = RAW_OUTPUT_LINES,
+        result_mode: Optional[str] = None,
+        timeout: Optional[float] = None,
+        limits: Optional["ResourceLimits"] = None,
+        retry: Optional["RetryPolicy"] = None,
+        hedge: Optional["HedgePolicy"] = None,
+        breaker: Optional["CircuitBreaker"] = None,
+        engine: Optional[str] = None,
+        progress_client: Optional["AsyncMockRedisClient"] = None
+    ):
+        # XAGENT_HOME is read here rather than at import so that it can be
+        # set after this module has been loaded
+        self.xagent_home = Path(xagent_home or os.getenv("XAGENT_HOME", XAGENT_PATH))
         self.config_path = config_path or os.path.join(
             self.xagent_home, "config", "xagent_config.yaml"
         )
+        # Parsed on first use, then reloaded when the file changes
+        self._config_store: Optional["ConfigStore"] = None
+        
+        # Worker pool settings; the pool itself starts on first use
+        if use_worker_pool is None:
+            use_worker_pool = os.getenv("XAGENT_WORKER_POOL", "1") != "0"
+        self.use_worker_pool = use_worker_pool
+        self.pool_size = pool_size or int(os.getenv("XAGENT_POOL_SIZE", "2"))
+        self.max_tasks_per_worker = max_tasks_per_worker or int(
+            os.getenv("XAGENT_WORKER_MAX_TASKS", "50")
+        )
+        self._pool: Optional["XAgentWorkerPool"] = None
+        
+        # "subprocess", "pool" or "inprocess"; None defers to xagent.engine
+        # in the config file, then to use_worker_pool
+        engine = engine or os.getenv("XAGENT_ENGINE") or None
+        if engine is not None:
+            from config_loader import ENGINES
+            if engine not in ENGINES:
+                raise ValueError(f"Unknown XAgent engine: {engine}")
+        self.engine = engine
+        self._inprocess: Optional["InProcessEngine"] = None
         
-        # Verify XAgent installation
+        # Where progress_channel events are published; defaults to the
+        # mock Redis store XAgent itself uses
+        self._progress_client = progress_client
+        
+        # Only the tail of XAgent's output is kept in memory
+        self.raw_output_lines = raw_output_lines
+        
+        self.result_mode = result_mode or os.getenv("XAGENT_RESULT_MODE", "auto")
+        if self.result_mode not in RESULT_MODES:
+            raise ValueError(f"Unknown XAgent result mode: {self.result_mode}")
+        
+        # Seconds per run; None falls back to constraints.timeout in the config
+        if timeout is None and os.getenv("XAGENT_TIMEOUT"):
+            timeout = float(os.environ["XAGENT_TIMEOUT"])
+        self.timeout = timeout
+        
+        # rlimits / cgroup for run.py; pool workers apply them per task
+        if limits is None:
+            from resource_limits import ResourceLimits
+            limits = ResourceLimits.from_env()
+        self.limits = limits
+        
+        # Retries, hedging and the circuit breaker around run_xagent
+        from resilience import CircuitBreaker, HedgePolicy, LatencyBudget, RetryPolicy
+        self.retry = retry or RetryPolicy.from_env()
+        self.hedge = hedge or HedgePolicy.from_env()
+        self.breaker = breaker or CircuitBreaker.from_env()
+        self._latency = LatencyBudget(self.hedge)
+        
+        # With XAGENT_LLM_CACHE=1 XAgent's model calls go through a local
+        # caching proxy; it must be running before any XAgent process starts
+        from llm_cache import start_proxy_from_env
+        start_proxy_from_env()
+        
+        # Verify XAgent installation and make it importable
         self._verify_xagent_installation()
+        if str(self.xagent_home) not in sys.path:
+            sys.path.append(str(self.xagent_home))
     
     def _verify_xagent_installation(self):
         """Verify that XAgent is properly installed and accessible"""
+        # A home that passed once is not checked again
+        home = str(self.xagent_home)
+        if home in _verified_homes:
+            return
+        
         required_files = [
             "run.py",
             "XAgent/__init__.py",
@@ -36,6 +192,8 @@ class XAgentIntegration:
                     f"XAgent file not found: {file}. "
                     f"Please ensure XAgent is properly cloned at {self.xagent_home}"
                 )
+        
+        _verified_homes.add(home)
     
     async def run_xagent(self, task: str, **kwargs) -> Dict[str, Any]:
         """
@@ -43,45 +201,586 @@ class XAgentIntegration:
         
         Args:
             task: The task description for XAgent
-            **kwargs: Additional parameters for XAgent
+            **kwargs: Additional parameters for XAgent; ``timeout`` (seconds,
+                0 for none), ``limits`` (ResourceLimits or a dict of its
+                fields), ``retry`` (RetryPolicy or dict) and ``hedge``
+                (bool, HedgePolicy or dict) override the configured ones;
+                ``progress_channel`` publishes each event of the run to
+                that pub/sub channel as JSON
             
         Returns:
-            Dictionary containing XAgent's response
+            Dictionary containing XAgent's response, including the run's
+            resource ``usage``
+            
+        Raises:
+            XAgentTimeoutError: The run timed out and was stopped
+            CircuitOpenError: Runs are refused after repeated failures
         """
+        from resilience import CircuitOpenError
+        
         try:
-            # Prepare command
-            cmd = [
-                sys.executable,
-                str(self.xagent_home / "run.py"),
-                "--task", task,
-                "--config_file", self.config_path
-            ]
-            
-            # Add additional parameters
-            for key, value in kwargs.items():
-                if value is not None:
-                    cmd.extend([f"--{key}", str(value)])
-            
-            # Run XAgent
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                cwd=self.xagent_home,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            return await self._run_with_retries(task, kwargs)
+            
+        except (XAgentTimeoutError, CircuitOpenError):
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Error running XAgent: {str(e)}")
+    
+    async def _run_with_retries(self, task: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Run until an attempt succeeds or the retry policy gives up"""
+        import asyncio
+        from dataclasses import replace
+        from resilience import HedgePolicy, RetryPolicy, classify
+        
+        kwargs = dict(kwargs)
+        retry = kwargs.pop("retry", None)
+        if retry is None:
+            retry = self.retry
+        elif isinstance(retry, dict):
+            retry = RetryPolicy.from_dict(retry)
+        hedge = kwargs.pop("hedge", None)
+        if hedge is None:
+            hedge = self.hedge
+        elif isinstance(hedge, bool):
+            hedge = replace(self.hedge, enabled=hedge)
+        elif isinstance(hedge, dict):
+            hedge = HedgePolicy.from_dict(hedge)
+        
+        attempt = 1
+        while True:
+            probe = self.breaker.allow()
+            try:
+                result = await self._run_hedged(task, kwargs, hedge)
+            except asyncio.CancelledError:
+                self.breaker.release(probe)
+                raise
+            except Exception as e:
+                self._record_outcome(e)
+                if not retry.should_retry(e, attempt):
+                    raise
+                metrics.retries.labels(error=classify(e)).inc()
+                await asyncio.sleep(retry.delay(attempt))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+    
+    def _record_outcome(self, error: Exception):
+        """Tell the breaker about a failed run"""
+        if self.breaker.counts(error):
+            self.breaker.record_failure()
+        else:
+            # run.py ran and the task itself failed, so the path is healthy
+            self.breaker.record_success()
+    
+    async def _run_hedged(
+        self,
+        task: str,
+        kwargs: Dict[str, Any],
+        hedge: "HedgePolicy"
+    ) -> Dict[str, Any]:
+        """
+        One attempt, with a second one started if the first is slow
+        
+        The second attempt takes a slot of the shared scheduler, so hedging
+        never exceeds its concurrency; when no slot is free it is skipped.
+        """
+        import asyncio
+        from scheduler import task_scheduler
+        
+        delay = self._latency.hedge_delay(hedge) if hedge.enabled else None
+        if delay is None:
+            return await self._run_once(task, kwargs)
+        
+        first = asyncio.ensure_future(self._run_once(task, kwargs))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+            
+            if not task_scheduler.try_acquire():
+                metrics.hedged_runs.labels(outcome="skipped").inc()
+                return await first
+            metrics.hedged_runs.labels(outcome="launched").inc()
+            second = asyncio.ensure_future(self._run_once(task, kwargs))
+            # Released even if the attempt is cancelled before it starts
+            second.add_done_callback(lambda _: task_scheduler.release())
+            pending.add(second)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        if attempt is second:
+                            metrics.hedged_runs.labels(outcome="won").inc()
+                        return attempt.result()
+                    error = error or attempt.exception()
+            raise error
+        finally:
+            # The loser stops its run.py or worker task in the background
+            for attempt in pending:
+                attempt.cancel()
+    
+    async def _run_once(self, task: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.monotonic()
+        # Only the final result is needed, so step lines are not decoded
+        result = None
+        async for event in self._run_events(task, kwargs, step_events=False):
+            if event["type"] == "result":
+                result = event["result"]
+        self._latency.record(time.monotonic() - started)
+        return result
+    
+    async def astream(self, task: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run XAgent and yield events as its output arrives
+        
+        Streamed runs are not retried or hedged, since their events have
+        already been delivered, but they do go through the circuit
+        breaker.
+        
+        Args:
+            task: The task description for XAgent
+            **kwargs: Additional parameters for XAgent; ``progress_channel``
+                also publishes each event to that pub/sub channel
+            
+        Yields:
+            Event dictionaries with a "type" of "log", "step", "steps" or
+            "answer" while XAgent runs, then a final "result" event holding
+            the same dictionary run_xagent returns
+            
+        Raises:
+            XAgentTimeoutError: The run timed out and was stopped
+            CircuitOpenError: Runs are refused after repeated failures
+        """
+        probe = self.breaker.allow()
+        try:
+            async for event in self._run_events(task, kwargs, step_events=True):
+                yield event
+        except Exception as e:
+            self._record_outcome(e)
+            raise
+        except BaseException:
+            # The consumer stopped early or was cancelled
+            self.breaker.release(probe)
+            raise
+        self.breaker.record_success()
+    
+    async def _run_events(
+        self,
+        task: str,
+        kwargs: Dict[str, Any],
+        step_events: bool
+    ) -> AsyncIterator[Dict[str, Any]]:
+        kwargs = dict(kwargs)
+        channel = kwargs.pop("progress_channel", None)
+        if channel is None:
+            async for event in self._engine_events(task, kwargs, step_events):
+                yield event
+            return
+        
+        # Subscribers get every step, so they are decoded even for run_xagent
+        client = self.progress_client
+        try:
+            async for event in self._engine_events(task, kwargs, step_events=True):
+                await client.publish(channel, json.dumps(event, default=str))
+                yield event
+        except Exception as e:
+            await client.publish(
+                channel, json.dumps({"type": "error", "error": type(e).__name__, "message": str(e)})
             )
+            raise
+    
+    @property
+    def progress_client(self) -> "AsyncMockRedisClient":
+        """Client that progress_channel events are published with"""
+        if self._progress_client is None:
+            from XAgentServer.exts.mock_redis import AsyncMockRedisClient, mock_redis
+            
+            self._progress_client = AsyncMockRedisClient(mock_redis)
+        return self._progress_client
+    
+    async def _engine_events(
+        self,
+        task: str,
+        kwargs: Dict[str, Any],
+        step_events: bool
+    ) -> AsyncIterator[Dict[str, Any]]:
+        import asyncio
+        
+        # The whole run uses the config current when it started
+        config = self.config
+        kwargs = dict(kwargs)
+        timeout = self._resolve_timeout(kwargs.pop("timeout", None), config)
+        engine = self.engine_for(config)
+        if engine == "inprocess":
+            kwargs.pop("limits", None)
+            async for event in self._run_inprocess(task, kwargs, config, timeout, step_events):
+                yield event
+            return
+        
+        limits = kwargs.pop("limits", None)
+        if limits is None:
+            limits = self.limits
+        elif isinstance(limits, dict):
+            from resource_limits import ResourceLimits
+            limits = ResourceLimits.from_dict(limits)
+        argv = self._build_args(task, kwargs, config)
+        collector = _OutputCollector(
+            self.raw_output_lines,
+            parse_log=self.result_mode == "auto",
+            step_events=step_events
+        )
+        
+        # Spans are ended explicitly: a generator cannot hold one current
+        # across its yields
+        run_span = tracer.start_span("xagent.run", pool=engine == "pool")
+        startup = tracer.start_span("xagent.startup", parent=run_span)
+        started = time.monotonic()
+        metrics.tasks_started.inc()
+        # Stays set if the consumer stops the run before it finishes
+        error = "Cancelled"
+        output = None
+        state: Dict[str, Any] = {"span": startup}
+        
+        # Run XAgent on a warm worker, or in a fresh process
+        if engine == "pool":
+            lines = self.get_worker_pool().stream(argv, state, limits)
+        else:
+            lines = self._stream_subprocess(argv, state, limits)
+        
+        # The watchdog stops the run; its output so far is kept
+        watchdog = None
+        if timeout:
+            watchdog = asyncio.get_running_loop().call_later(timeout, _expire, state)
+        
+        try:
+            try:
+                async for line in lines:
+                    if output is None:
+                        startup.end()
+                        output = tracer.start_span("xagent.output", parent=run_span)
+                    event = collector.feed(line)
+                    if event is not None:
+                        yield event
+            except Exception as e:
+                if state.get("timed_out"):
+                    raise XAgentTimeoutError(timeout, collector.partial_result()) from e
+                raise
+            finally:
+                if watchdog is not None:
+                    watchdog.cancel()
+                # Stops the run if the consumer went away early
+                await lines.aclose()
+                startup.end()
+                if output is not None:
+                    output.end()
             
-            stdout, stderr = await process.communicate()
+            collector.usage = state.get("usage")
+            if state.get("timed_out"):
+                raise XAgentTimeoutError(timeout, collector.partial_result())
             
-            if process.returncode != 0:
-                error_msg = stderr.decode().strip() or stdout.decode().strip()
-                raise RuntimeError(f"XAgent execution failed: {error_msg}")
+            if state["returncode"] != 0:
+                error_msg = state["stderr"].strip() or collector.tail().strip()
+                raise XAgentExecutionError(state["returncode"], error_msg)
             
-            # Parse XAgent output
-            result = self._parse_xagent_output(stdout.decode())
-            return result
+            # A record on the result descriptor overrides anything in the log
+            if state.get("result") is not None:
+                yield collector.set_result(state["result"])
             
+            parse = tracer.start_span("xagent.parse", parent=run_span)
+            result = collector.result()
+            parse.end()
+            error = None
         except Exception as e:
-            raise RuntimeError(f"Error running XAgent: {str(e)}")
+            run_span.record_exception(e)
+            error = type(e).__name__
+            raise
+        finally:
+            if "returncode" in state:
+                run_span.set_attribute("returncode", state["returncode"])
+            run_span.end()
+            metrics.record_task(time.monotonic() - started, error, state.get("usage"))
+        
+        yield {"type": "result", "result": result}
+    
+    async def _run_inprocess(
+        self,
+        task: str,
+        kwargs: Dict[str, Any],
+        config: "XAgentConfig",
+        timeout: Optional[float],
+        step_events: bool
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """_run_events for the in-process engine; its result needs no parsing"""
+        import asyncio
+        
+        run_span = tracer.start_span("xagent.run", engine="inprocess")
+        started = time.monotonic()
+        metrics.tasks_started.inc()
+        error = "Cancelled"
+        state: Dict[str, Any] = {"span": run_span}
+        events = self.get_inprocess_engine().stream(task, config, kwargs, state)
+        
+        watchdog = None
+        if timeout:
+            watchdog = asyncio.get_running_loop().call_later(timeout, _expire, state)
+        
+        try:
+            try:
+                async for event in events:
+                    if step_events:
+                        yield event
+            finally:
+                if watchdog is not None:
+                    watchdog.cancel()
+                await events.aclose()
+            
+            if state.get("timed_out"):
+                raise XAgentTimeoutError(timeout, state["context"].partial_result())
+            result = state["result"]
+            error = None
+        except Exception as e:
+            run_span.record_exception(e)
+            error = type(e).__name__
+            raise
+        finally:
+            run_span.end()
+            metrics.record_task(time.monotonic() - started, error, state.get("usage"))
+        
+        yield {"type": "result", "result": result}
+    
+    def engine_for(self, config: Optional["XAgentConfig"] = None) -> str:
+        """Engine for a run: the constructor or XAGENT_ENGINE, then the config file"""
+        if self.engine is not None:
+            return self.engine
+        engine = (config or self.config).engine
+        if engine is not None:
+            return engine
+        return "pool" if self.use_worker_pool else "subprocess"
+    
+    def _resolve_timeout(
+        self,
+        call_timeout: Optional[float],
+        config: Optional["XAgentConfig"] = None
+    ) -> Optional[float]:
+        """Timeout for one run: per call, then instance, then config file"""
+        if call_timeout is not None:
+            timeout = call_timeout
+        elif self.timeout is not None:
+            timeout = self.timeout
+        else:
+            timeout = (config or self.config).timeout
+        return float(timeout) if timeout and float(timeout) > 0 else None
+    
+    @property
+    def config_store(self) -> "ConfigStore":
+        """The config store, loading the config and starting its watcher on first use"""
+        if self._config_store is None:
+            from config_loader import ConfigStore
+            
+            path = self.config_path if os.path.exists(self.config_path) else DEFAULT_CONFIG_PATH
+            store = ConfigStore(path)
+            store.subscribe(self._on_config_change)
+            store.watch()
+            self._config_store = store
+        return self._config_store
+    
+    @property
+    def config(self) -> "XAgentConfig":
+        """The current validated XAgent config"""
+        return self.config_store.current
+    
+    def _on_config_change(self, old: "XAgentConfig", new: "XAgentConfig"):
+        # Warm workers only need replacing when what they loaded changed
+        if self._pool is not None and old.worker_digest != new.worker_digest:
+            self._pool.reconfigure(new.worker_digest)
+    
+    def _build_args(
+        self,
+        task: str,
+        kwargs: Dict[str, Any],
+        config: Optional["XAgentConfig"] = None
+    ) -> List[str]:
+        """Build the run.py command line arguments for a task"""
+        # run.py reads a snapshot, so edits to the file cannot reach it mid-run
+        config_file = (config or self.config).snapshot()
+        args = ["--task", task, "--config_file", config_file]
+        
+        # Add additional parameters
+        for key, value in kwargs.items():
+            if value is not None:
+                args.extend([f"--{key}", str(value)])
+        
+        return args
+    
+    async def _stream_subprocess(
+        self,
+        argv: List[str],
+        state: Dict[str, Any],
+        limits: Optional["ResourceLimits"] = None
+    ) -> AsyncIterator[str]:
+        """Run XAgent in a fresh run.py process, yielding stdout lines"""
+        import asyncio
+        import subprocess
+        import tempfile
+        from resource_limits import rusage_usage, wait4
+        
+        loop = asyncio.get_running_loop()
+        cmd = [sys.executable, str(self.xagent_home / "run.py"), *argv]
+        
+        # run.py may write framed result records to this file's descriptor
+        result_file = tempfile.TemporaryFile()
+        result_fd = result_file.fileno()
+        started = time.monotonic()
+        spawn = tracer.start_span("xagent.spawn", parent=state.get("span"))
+        try:
+            process = subprocess.Popen(
+                cmd,
+                cwd=self.xagent_home,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env=dict(os.environ, **{RESULT_FD_ENV: str(result_fd)}),
+                pass_fds=(result_fd,),
+                **new_group_kwargs()
+            )
+        except BaseException as e:
+            spawn.record_exception(e)
+            spawn.end()
+            result_file.close()
+            raise
+        
+        cgroup = _apply_limits(process.pid, limits)
+        spawn.end()
+        in_flight = metrics.subprocesses_in_flight.labels(mode="subprocess")
+        in_flight.inc()
+        
+        # Pipes are read and the child reaped (with wait4, for its rusage)
+        # on threads, so the run does not depend on the loop's child watcher
+        lines: asyncio.Queue = asyncio.Queue()
+        done = object()
+        stderr_tail = deque(maxlen=self.raw_output_lines)
+        output_bytes = {"stdout": 0, "stderr": 0}
+        stderr_done = loop.create_future()
+        reaped = loop.create_future()
+        
+        def post(callback, *args):
+            try:
+                loop.call_soon_threadsafe(callback, *args)
+            except RuntimeError:
+                pass  # loop already closed
+        
+        def read_stdout():
+            try:
+                for raw in iter(lambda: process.stdout.readline(MAX_LINE_BYTES), b""):
+                    output_bytes["stdout"] += len(raw)
+                    post(lines.put_nowait, raw.decode(errors="replace").rstrip("\r\n"))
+            finally:
+                post(lines.put_nowait, done)
+        
+        def read_stderr():
+            try:
+                for raw in iter(lambda: process.stderr.readline(MAX_LINE_BYTES), b""):
+                    output_bytes["stderr"] += len(raw)
+                    stderr_tail.append(raw.decode(errors="replace").rstrip("\r\n"))
+            finally:
+                post(_set_result, stderr_done, None)
+        
+        def reap():
+            try:
+                if hasattr(os, "wait4"):
+                    returncode, ru = wait4(process.pid)
+                    process.returncode = returncode
+                else:
+                    returncode, ru = process.wait(), None
+            except BaseException as e:
+                post(_set_exception, reaped, e)
+            else:
+                post(_set_result, reaped, (returncode, ru))
+            finally:
+                in_flight.dec()
+        
+        for target in (read_stdout, read_stderr, reap):
+            threading.Thread(target=target, name="xagent-run", daemon=True).start()
+        
+        # Stopping a run takes down everything run.py started
+        def wait_reaped():
+            return asyncio.shield(reaped)
+        
+        stopping = []
+        state["abort"] = lambda: stopping.append(
+            asyncio.ensure_future(aterminate_group(process, wait=wait_reaped))
+        )
+        if state.get("timed_out"):
+            state["abort"]()
+        
+        try:
+            while True:
+                line = await lines.get()
+                if line is done:
+                    break
+                yield line
+            returncode, ru = await reaped
+            await stderr_done
+            
+            state["returncode"] = returncode
+            state["stderr"] = "\n".join(stderr_tail)
+            state["result"] = read_result_file(result_file)
+            usage = rusage_usage(ru, time.monotonic() - started) if ru else {
+                "wall_seconds": time.monotonic() - started
+            }
+            usage["output_bytes"] = output_bytes["stdout"]
+            usage["stderr_bytes"] = output_bytes["stderr"]
+            if cgroup is not None and cgroup.memory_peak() is not None:
+                usage["cgroup_peak_bytes"] = cgroup.memory_peak()
+            state["usage"] = usage
+        finally:
+            result_file.close()
+            if process.returncode is None:
+                await aterminate_group(process, wait=wait_reaped)
+            if cgroup is not None:
+                cgroup.remove()
+            for stream in (process.stdout, process.stderr):
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+
+    def get_worker_pool(self) -> "XAgentWorkerPool":
+        """Return the worker pool, creating it on first use"""
+        if self._pool is None:
+            from worker_pool import XAgentWorkerPool
+            
+            self._pool = XAgentWorkerPool(
+                self.xagent_home,
+                size=self.pool_size,
+                max_tasks_per_worker=self.max_tasks_per_worker,
+                config_key=self.config.worker_digest
+            )
+            atexit.register(self._pool.close)
+        return self._pool
+    
+    def get_inprocess_engine(self) -> "InProcessEngine":
+        """Return the in-process engine, creating it on first use"""
+        if self._inprocess is None:
+            from inprocess_engine import InProcessEngine
+            
+            self._inprocess = InProcessEngine(max_workers=self.pool_size)
+        return self._inprocess
+    
+    def close(self):
+        """Shut down the worker pool, in-process engine and config watcher if started"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        if self._inprocess is not None:
+            self._inprocess.close()
+            self._inprocess = None
+        if self._config_store is not None:
+            self._config_store.close()
+            self._config_store = None
     
     def _parse_xagent_output(self, output: str) -> Dict[str, Any]:
         """
@@ -96,31 +795,18 @@ class XAgentIntegration:
         # XAgent typically outputs JSON or structured text
         # This parsing might need adjustment based on XAgent's actual output format
         
-        lines = output.strip().split('\n')
+        with tracer.span("xagent.parse"):
+            parsed = parse_output_text(output.strip())
         result = {
             "raw_output": output,
-            "answer": "",
-            "steps": [],
+            "answer": parsed["answer"],
+            "steps": parsed["steps"],
             "success": True
         }
         
-        # Try to find JSON output
-        for line in reversed(lines):
-            line = line.strip()
-            if line.startswith('{') and line.endswith('}'):
-                try:
-                    json_data = json.loads(line)
-                    if "answer" in json_data:
-                        result["answer"] = json_data["answer"]
-                    if "steps" in json_data:
-                        result["steps"] = json_data["steps"]
-                    break
-                except json.JSONDecodeError:
-                    continue
-        
         # If no JSON found, use the last few lines as answer
         if not result["answer"]:
-            result["answer"] = "\n".join(lines[-5:]) if len(lines) > 5 else output
+            result["answer"] = parsed["fallback"] if parsed["line_count"] > FALLBACK_LINES else output
         
         return result
     
@@ -134,5 +820,179 @@ class XAgentIntegration:
             "problem_solving"
         ]
 
+class _OutputCollector:
+    """
+    Incremental parser for XAgent's stdout
+    
+    Turns each line into an event and tracks the final answer the same
+    way _parse_xagent_output does, while only keeping a ring buffer of the
+    most recent lines instead of the whole output. A framed result, from a
+    sentinel line or the result descriptor, takes precedence over JSON
+    found in the log; with parse_log off the log is not parsed at all.
+    Without step_events JSON lines are left to a StreamingOutputParser,
+    which only decodes the last few of them at the end.
+    """
+    
+    def __init__(
+        self,
+        max_lines: int = RAW_OUTPUT_LINES,
+        parse_log: bool = True,
+        step_events: bool = True
+    ):
+        self.lines = deque(maxlen=max_lines)
+        self.parse_log = parse_log and step_events
+        self.legacy = StreamingOutputParser() if parse_log and not step_events else None
+        self.answer = ""
+        self.steps: List[Any] = []
+        self.framed: Optional[Dict[str, Any]] = None
+        self.usage: Optional[Dict[str, Any]] = None
+    
+    def set_result(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Take a framed result record and return its answer event"""
+        self.framed = record
+        return {"type": "answer", "answer": record.get("answer", ""), "data": record}
+    
+    def feed(self, line: str) -> Optional[Dict[str, Any]]:
+        """Record one output line and return the event it represents"""
+        record = parse_sentinel_line(line)
+        if record is not None:
+            return self.set_result(record)
+        
+        self.lines.append(line)
+        if self.legacy is not None:
+            self.legacy.feed(line)
+        stripped = line.strip()
+        if not stripped:
+            return None
+        
+        if self.parse_log and stripped.startswith('{') and stripped.endswith('}'):
+            try:
+                json_data = json.loads(stripped)
+            except json.JSONDecodeError:
+                json_data = None
+            
+            if isinstance(json_data, dict):
+                # The last JSON line wins, as in _parse_xagent_output
+                self.answer = json_data.get("answer", "")
+                self.steps = json_data.get("steps", [])
+                
+                if "answer" in json_data:
+                    return {"type": "answer", "answer": json_data["answer"], "data": json_data}
+                if "steps" in json_data:
+                    return {"type": "steps", "steps": json_data["steps"], "data": json_data}
+                return {"type": "step", "step": json_data}
+        
+        return {"type": "log", "line": line}
+    
+    def tail(self) -> str:
+        return "\n".join(self.lines)
+    
+    def partial_result(self) -> Dict[str, Any]:
+        """result() for a run that was stopped before it finished"""
+        return {**self.result(), "success": False, "timed_out": True}
+    
+    def result(self) -> Dict[str, Any]:
+        raw_output = self.tail()
+        answer = self.answer
+        steps = self.steps
+        if self.framed is not None:
+            answer = self.framed.get("answer", "")
+            steps = self.framed.get("steps", [])
+        elif self.legacy is not None:
+            parsed = self.legacy.result()
+            answer = parsed["answer"]
+            steps = parsed["steps"]
+        
+        # If no JSON found, use the last few lines as answer
+        if not answer:
+            lines = list(self.lines)
+            answer = "\n".join(lines[-5:]) if len(lines) > 5 else raw_output
+        
+        return {
+            "raw_output": raw_output,
+            "answer": answer,
+            "steps": steps,
+            "success": True,
+            "usage": self.usage
+        }
+
+
+def _apply_limits(pid: int, limits: Optional["ResourceLimits"]) -> Optional["Cgroup"]:
+    """Apply rlimits to a fresh run.py and place it in a cgroup if configured"""
+    if limits is None or not limits.enabled:
+        return None
+    from resource_limits import Cgroup
+    
+    try:
+        limits.apply_to(pid)
+    except (AttributeError, OSError):
+        pass  # no prlimit on this platform, or the process already exited
+    if limits.cgroup_parent:
+        cgroup = Cgroup.create(limits.cgroup_parent, f"xagent-run-{pid}", limits)
+        if cgroup is not None:
+            if cgroup.add(pid):
+                return cgroup
+            cgroup.remove()
+    return None
+
+
+def _set_result(future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+def _set_exception(future, exc):
+    if not future.done():
+        future.set_exception(exc)
+
+
+def _expire(state: Dict[str, Any]):
+    """Watchdog callback: mark the run as timed out and stop it"""
+    state["timed_out"] = True
+    abort = state.get("abort")
+    if abort is not None:
+        abort()
+
+
+class _LazyXAgentIntegration:
+    """
+    Stand-in for the shared XAgentIntegration
+    
+    The real instance is built on first attribute access, so importing
+    this module never touches the XAgent installation.
+    """
+    
+    def __getattr__(self, name: str):
+        return getattr(get_xagent_integration(), name)
+    
+    def __setattr__(self, name: str, value: Any):
+        setattr(get_xagent_integration(), name, value)
+    
+    def __delattr__(self, name: str):
+        delattr(get_xagent_integration(), name)
+    
+    def __repr__(self) -> str:
+        if _instance is None:
+            return "<XAgentIntegration (not initialized)>"
+        return repr(_instance)
+
+
+# XAgent homes that passed _verify_xagent_installation
+_verified_homes = set()
+
+_instance: Optional[XAgentIntegration] = None
+_instance_lock = threading.Lock()
+
+
+def get_xagent_integration() -> XAgentIntegration:
+    """Return the shared XAgentIntegration, creating it on first call"""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = XAgentIntegration()
+    return _instance
+
+
 # Singleton instance for easy access
-xagent_integration = XAgentIntegration()
\ No newline at end of file
+xagent_integration = _LazyXAgentIntegration()
\ No newline at end of file
@@ -0,0 +1,197 @@
+"""
+Long-lived XAgent worker process used by the worker pool
+
+The worker imports XAgent and compiles run.py once, then executes tasks
+received as JSON lines on stdin. Output lines and the final result,
+including any framed result record run.py wrote, are written back as
+JSON frames on a private copy of stdout; anything else printed to fd 1
+goes to stderr so it cannot corrupt the protocol.
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import sys
+import tempfile
+import traceback
+from collections import deque
+
+from resource_limits import ResourceLimits, UsageMeter, restore
+from result_channel import RESULT_FD_ENV, read_result_file
+
+# Trailing stderr lines returned with each result
+STDERR_TAIL_LINES = 200
+
+
+def _send(channel, frame):
+    """Write a single protocol frame"""
+    channel.write(json.dumps(frame) + "\n")
+    channel.flush()
+
+
+class _LineWriter(io.TextIOBase):
+    """Text stream that forwards every complete line as a protocol frame"""
+
+    def __init__(self, channel, request_id):
+        self.channel = channel
+        self.request_id = request_id
+        self.bytes_written = 0
+        self._partial = ""
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self.bytes_written += len(text)
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            _send(self.channel, {"id": self.request_id, "type": "line", "data": line})
+        return len(text)
+
+    def close_line(self):
+        if self._partial:
+            self.write("\n")
+
+
+class _TailWriter(io.TextIOBase):
+    """Text stream that keeps only its last few lines"""
+
+    def __init__(self, max_lines=STDERR_TAIL_LINES):
+        self.lines = deque(maxlen=max_lines)
+        self._partial = ""
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        self.lines.extend(lines)
+        return len(text)
+
+    def getvalue(self):
+        return "\n".join(list(self.lines) + ([self._partial] if self._partial else []))
+
+
+def _warm_up(xagent_home):
+    """Import XAgent and compile run.py so tasks skip the startup cost"""
+    if xagent_home not in sys.path:
+        sys.path.insert(0, xagent_home)
+
+    try:
+        importlib.import_module("XAgent")
+    except Exception:
+        # A broken import surfaces again when a task runs run.py
+        pass
+
+    run_script = os.path.join(xagent_home, "run.py")
+    with open(run_script, "r") as f:
+        return compile(f.read(), run_script, "exec")
+
+
+def _close_if_same_file(fd, original_fd):
+    """Close fd unless run.py already closed it and the number was reused"""
+    try:
+        stat, original = os.fstat(fd), os.fstat(original_fd)
+    except OSError:
+        return
+    if (stat.st_dev, stat.st_ino) == (original.st_dev, original.st_ino):
+        os.close(fd)
+
+
+def _run_task(code, run_script, argv, channel, request_id, limits=None):
+    """Execute run.py in-process, streaming what it prints"""
+    output = _LineWriter(channel, request_id)
+    errors = _TailWriter()
+    returncode = 0
+
+    # Limits hold for this task only; the worker gets its own back after
+    limits = ResourceLimits.from_dict(limits)
+    saved_limits = limits.apply_to_self()
+    meter = UsageMeter()
+
+    # run.py gets its own descriptor for the result file, so closing it
+    # does not lose what was written
+    result_file = tempfile.TemporaryFile()
+    result_fd = os.dup(result_file.fileno())
+    saved_result_fd = os.environ.get(RESULT_FD_ENV)
+    os.environ[RESULT_FD_ENV] = str(result_fd)
+
+    saved_argv = sys.argv
+    sys.argv = [run_script] + list(argv)
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(errors):
+            try:
+                exec(code, {"__name__": "__main__", "__file__": run_script})
+            except SystemExit as e:
+                if isinstance(e.code, int):
+                    returncode = e.code
+                elif e.code is not None:
+                    print(e.code, file=sys.stderr)
+                    returncode = 1
+            except Exception:
+                traceback.print_exc()
+                returncode = 1
+    finally:
+        usage = meter.finish()
+        restore(saved_limits)
+        sys.argv = saved_argv
+        output.close_line()
+        if saved_result_fd is None:
+            os.environ.pop(RESULT_FD_ENV, None)
+        else:
+            os.environ[RESULT_FD_ENV] = saved_result_fd
+        _close_if_same_file(result_fd, result_file.fileno())
+
+    with result_file:
+        result = read_result_file(result_file)
+    usage["output_bytes"] = output.bytes_written
+    return returncode, errors.getvalue(), result, usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="XAgent pool worker")
+    parser.add_argument("--xagent_home", required=True)
+    args = parser.parse_args()
+
+    # Keep the real stdout for frames and point fd 1 at stderr
+    channel = os.fdopen(os.dup(1), "w")
+    os.dup2(2, 1)
+
+    run_script = os.path.join(args.xagent_home, "run.py")
+    code = _warm_up(args.xagent_home)
+    _send(channel, {"type": "ready", "pid": os.getpid()})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        request = json.loads(line)
+        op = request.get("op")
+
+        if op == "ping":
+            _send(channel, {"id": request.get("id"), "type": "pong"})
+        elif op == "run":
+            returncode, stderr, result, usage = _run_task(
+                code, run_script, request["argv"], channel, request.get("id"),
+                request.get("limits")
+            )
+            _send(channel, {
+                "id": request.get("id"),
+                "type": "result",
+                "returncode": returncode,
+                "stderr": stderr,
+                "result": result,
+                "usage": usage
+            })
+        elif op == "exit":
+            break
+
+
+if __name__ == "__main__":
+    main()